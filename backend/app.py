@@ -11,6 +11,7 @@ import os
 from dotenv import load_dotenv
 
 from database import db, init_db
+from commands import register_commands
 from routes.auth import auth_bp
 from routes.users import users_bp
 from routes.exploitations import exploitations_bp
@@ -39,6 +40,7 @@ db.init_app(app)
 CORS(app)
 jwt = JWTManager(app)
 api = Api(app)
+register_commands(app)
 
 # Configuration Swagger
 SWAGGER_URL = '/api/docs'
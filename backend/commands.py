@@ -0,0 +1,153 @@
+"""
+Commandes CLI Flask pour les tâches d'exploitation (maintenance, jobs planifiés)
+Utilisation: flask --app app <groupe> <commande>
+"""
+import click
+from datetime import datetime, timedelta
+from flask.cli import AppGroup
+
+capteurs_cli = AppGroup('capteurs', help='Maintenance des données de capteurs')
+meteo_cli = AppGroup('meteo', help='Jobs de données météo')
+recommandations_cli = AppGroup('recommandations', help='Jobs de génération des recommandations')
+statistiques_cli = AppGroup('statistiques', help='Maintenance des statistiques agrégées')
+base_cli = AppGroup('base', help='Maintenance du schéma de la base de données')
+
+
+@capteurs_cli.command('archiver')
+@click.option('--jours-retention', default=90, show_default=True,
+              help='Nombre de jours conservés dans la table chaude')
+def archiver_capteurs(jours_retention):
+    """Archive les mois révolus de sensor_data dans des partitions mensuelles"""
+    from services.sensor_storage_service import archive_sensor_data
+
+    archives = archive_sensor_data(datetime.utcnow() - timedelta(days=jours_retention))
+    if not archives:
+        click.echo('Aucune donnée à archiver')
+    for key, count in sorted(archives.items()):
+        click.echo(f'{key}: {count} mesures archivées')
+
+
+@capteurs_cli.command('partitions')
+def lister_partitions():
+    """Liste les partitions mensuelles existantes"""
+    from services.sensor_storage_service import list_partitions
+
+    for key in list_partitions():
+        click.echo(key)
+
+
+@capteurs_cli.command('supprimer-partition')
+@click.argument('mois')
+def supprimer_partition(mois):
+    """Supprime la partition d'un mois (format AAAAMM)"""
+    from services.sensor_storage_service import drop_partition
+
+    if drop_partition(mois):
+        click.echo(f'Partition {mois} supprimée')
+    else:
+        raise click.ClickException(f'Partition {mois} introuvable')
+
+
+@capteurs_cli.command('recalculer-agregats')
+@click.option('--sensor-id', default=None, help='Limiter le recalcul à un capteur')
+def recalculer_agregats(sensor_id):
+    """Recalcule les agrégats 1m/1h/1d à partir des mesures brutes"""
+    from services.sensor_service import rebuild_rollups
+
+    total = rebuild_rollups(sensor_id=sensor_id)
+    click.echo(f'{total} mesures agrégées')
+
+
+@capteurs_cli.command('exporter')
+@click.option('--format', 'format_', default='csv', show_default=True,
+              type=click.Choice(['csv', 'ndjson', 'parquet', 'arrow']), help="Format d'export")
+@click.option('--sortie', default='-', show_default=True, help='Fichier de sortie (- : sortie standard)')
+@click.option('--gzip', 'compress', is_flag=True, help='Compresser en gzip')
+@click.option('--sensor-id', default=None, help='Limiter à un capteur')
+@click.option('--sensor-type', default=None, help='Limiter à un type de capteur')
+@click.option('--exploitation', 'exploitation_id', type=int, default=None, help='Limiter à une exploitation')
+@click.option('--parcelle', 'parcelle_id', type=int, default=None, help='Limiter à une parcelle')
+@click.option('--debut', type=click.DateTime(), default=None, help='Début de la période (inclus)')
+@click.option('--fin', type=click.DateTime(), default=None, help='Fin de la période (incluse)')
+def exporter_capteurs(format_, sortie, compress, sensor_id, sensor_type, exploitation_id, parcelle_id, debut, fin):
+    """Exporte les mesures de capteurs en flux (CSV, NDJSON, Parquet ou Arrow)"""
+    from services.sensor_export_service import export_sensor_data
+
+    try:
+        with click.open_file(sortie, 'wb') as fichier:
+            stats = export_sensor_data(
+                fichier, format_, compress, sensor_id=sensor_id, sensor_type=sensor_type,
+                exploitation_id=exploitation_id, parcelle_id=parcelle_id, start=debut, end=fin,
+            )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if sortie != '-':
+        click.echo(f"{stats['octets']} octets écrits dans {sortie}")
+
+
+@meteo_cli.command('prefetch')
+@click.option('--workers', default=4, show_default=True, help='Appels HTTP simultanés')
+@click.option('--rpm', default=50.0, show_default=True, help='Appels maximum par minute (0 = illimité)')
+@click.option('--lang', default='fr', show_default=True, help='Langue des descriptions')
+def prefetch_meteo(workers, rpm, lang):
+    """Précharge la météo de toutes les exploitations géolocalisées"""
+    from services.meteo_prefetch_service import prefetch_weather
+
+    stats = prefetch_weather(lang=lang, max_workers=workers, requests_per_minute=rpm or None)
+    click.echo(
+        f"{stats['exploitations']} exploitations, {stats['cellules']} cellules, "
+        f"{stats['appels']} appels, {stats['enregistres']} enregistrés en {stats['duree']}s"
+    )
+    for erreur in stats['erreurs']:
+        click.echo(f"Erreur {erreur['type']} {erreur['cellule']}: {erreur['erreur']}", err=True)
+
+
+@recommandations_cli.command('generer')
+@click.option('--region', 'regions', type=int, multiple=True,
+              help='Région à traiter (répétable ; par défaut tout le pays)')
+@click.option('--processus', default=4, show_default=True, help='Processus d\'évaluation (1 = sans pool)')
+@click.option('--taille-tache', default=2000, show_default=True, help='Exploitations par tâche')
+def generer_recommandations(regions, processus, taille_tache):
+    """Génère les recommandations de toutes les exploitations (sans doublons)"""
+    from services.recommandation_batch_service import generate_all_recommandations
+
+    stats = generate_all_recommandations(
+        region_ids=regions or None, processus=processus, taille_tache=taille_tache
+    )
+    click.echo(
+        f"{stats['exploitations']} exploitations ({stats['regions']} régions), "
+        f"{stats['recommandations']} recommandations : {stats['creees']} créées, "
+        f"{stats['mises_a_jour']} mises à jour, {stats['inchangees']} inchangées, "
+        f"{stats['echecs']} en échec en {stats['duree']}s ({stats['debit']} exploitations/s)"
+    )
+
+
+@statistiques_cli.command('recalculer')
+def recalculer_statistiques():
+    """Recalcule la table des statistiques agrégées depuis les données"""
+    from database import db
+    from services.statistique_service import rebuild_statistiques
+
+    lignes = rebuild_statistiques()
+    db.session.commit()
+    click.echo(f'{lignes} lignes de statistiques recalculées')
+
+
+@base_cli.command('index')
+def creer_index():
+    """Crée les index déclarés par les modèles qui manquent dans la base"""
+    from database import ensure_indexes
+
+    crees = ensure_indexes()
+    for nom in crees:
+        click.echo(f'Index {nom} créé')
+    click.echo(f'{len(crees)} index créés')
+
+
+def register_commands(app):
+    """Enregistre les groupes de commandes CLI sur l'application"""
+    app.cli.add_command(capteurs_cli)
+    app.cli.add_command(meteo_cli)
+    app.cli.add_command(recommandations_cli)
+    app.cli.add_command(statistiques_cli)
+    app.cli.add_command(base_cli)
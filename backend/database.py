@@ -8,9 +8,17 @@ db = SQLAlchemy()
 def init_db():
     """Initialise la base de données et crée toutes les tables"""
     # Importer tous les modèles pour qu'ils soient enregistrés
-    from models import User, Role, Exploitation, Parcelle, AnalyseSol, DonneeClimatique, Intrant, Recommandation, HistoriqueAction, Recolte
+    from models import User, Role, Exploitation, Parcelle, AnalyseSol, DonneeClimatique, Intrant, Recommandation, HistoriqueAction, Recolte, StatistiqueAgregee, VersionCache
+    from services.statistique_service import rebuild_statistiques
     db.create_all()
     
+    # Index ajoutés aux modèles après la création des tables d'une base existante
+    ensure_indexes()
+    
+    # Construire les statistiques agrégées d'une base existante (maintenues ensuite à chaque écriture)
+    if not StatistiqueAgregee.query.first() and Exploitation.query.first():
+        rebuild_statistiques()
+    
     # Créer les rôles de base s'ils n'existent pas
     roles_data = [
         {'nom': 'Agriculteur', 'description': 'Producteur agricole'},
@@ -24,6 +32,33 @@ def init_db():
             role = Role(nom=role_data['nom'], description=role_data['description'])
             db.session.add(role)
     
+    # Ligne de version partagée du cache de la hiérarchie géographique
+    if not db.session.get(VersionCache, 'hierarchie'):
+        db.session.add(VersionCache(nom='hierarchie', version=0))
+    
     db.session.commit()
     print("Base de données initialisée avec succès")
 
+def ensure_indexes():
+    """
+    Crée les index déclarés par les modèles (__table_args__) qui manquent dans
+    la base : create_all() ne crée que les tables absentes, pas les index
+    ajoutés ensuite à une table existante
+
+    Returns:
+        Noms des index créés
+    """
+    from sqlalchemy import inspect
+    
+    inspecteur = inspect(db.engine)
+    tables = set(inspecteur.get_table_names())
+    crees = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existants = {index['name'] for index in inspecteur.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            if index.name not in existants:
+                index.create(db.engine)
+                crees.append(index.name)
+    return crees
@@ -10,6 +10,8 @@ from models.recommandation import Recommandation
 from models.historique_action import HistoriqueAction
 from models.recolte import Recolte
 from models.region import Region, Prefecture, Commune
+from models.statistique import StatistiqueAgregee
+from models.version_cache import VersionCache
 
 __all__ = [
     'User', 'Role',
@@ -20,6 +22,8 @@ __all__ = [
     'Recommandation',
     'HistoriqueAction',
     'Recolte',
-    'Region', 'Prefecture', 'Commune'
+    'Region', 'Prefecture', 'Commune',
+    'StatistiqueAgregee',
+    'VersionCache'
 ]
 
@@ -8,6 +8,11 @@ import json
 class AnalyseSol(db.Model):
     """Analyse de sol d'une parcelle"""
     __tablename__ = 'analyses_sols'
+    __table_args__ = (
+        db.Index('ix_analyses_sols_exploitation_date', 'exploitation_id', 'date_prelevement'),
+        db.Index('ix_analyses_sols_parcelle', 'parcelle_id'),
+        db.Index('ix_analyses_sols_date', 'date_prelevement'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     date_prelevement = db.Column(db.Date, nullable=False)
@@ -7,6 +7,9 @@ from datetime import datetime
 class DonneeClimatique(db.Model):
     """Données climatiques pour une exploitation"""
     __tablename__ = 'donnees_climatiques'
+    __table_args__ = (
+        db.Index('ix_donnees_climatiques_exploitation_date', 'exploitation_id', 'date_debut'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     date_debut = db.Column(db.Date, nullable=False)
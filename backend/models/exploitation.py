@@ -7,6 +7,12 @@ from datetime import datetime
 class Exploitation(db.Model):
     """Exploitation agricole"""
     __tablename__ = 'exploitations'
+    __table_args__ = (
+        db.Index('ix_exploitations_proprietaire', 'proprietaire_id'),
+        db.Index('ix_exploitations_region', 'region_id'),
+        db.Index('ix_exploitations_prefecture', 'prefecture_id'),
+        db.Index('ix_exploitations_commune', 'commune_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     nom = db.Column(db.String(200), nullable=False)
@@ -30,7 +36,10 @@ class Exploitation(db.Model):
     analyses_sols = db.relationship('AnalyseSol', backref='exploitation', lazy=True)
     intrants = db.relationship('Intrant', backref='exploitation', lazy=True)
     
-    def to_dict(self):
+    def to_dict(self, compteurs=None):
+        # compteurs : {objet: nombres déjà calculés} (voir utils/serialization.py), évite de charger les collections
+        compteurs = compteurs or {}
+        parcelles_count = compteurs.get(self, {}).get('parcelles_count')
         return {
             'id': self.id,
             'nom': self.nom,
@@ -42,21 +51,24 @@ class Exploitation(db.Model):
             'type_culture_principal': self.type_culture_principal,
             'historique_cultural': self.historique_cultural,
             'proprietaire_id': self.proprietaire_id,
-            'proprietaire': self.proprietaire.to_dict() if self.proprietaire else None,
+            'proprietaire': self.proprietaire.to_dict(**compteurs.get(self.proprietaire, {})) if self.proprietaire else None,
             'region_id': self.region_id,
-            'region': self.region.to_dict() if self.region else None,
+            'region': self.region.to_dict(**compteurs.get(self.region, {})) if self.region else None,
             'prefecture_id': self.prefecture_id,
-            'prefecture': self.prefecture.to_dict() if self.prefecture else None,
+            'prefecture': self.prefecture.to_dict(**compteurs.get(self.prefecture, {})) if self.prefecture else None,
             'commune_id': self.commune_id,
-            'commune': self.commune.to_dict() if self.commune else None,
+            'commune': self.commune.to_dict(**compteurs.get(self.commune, {})) if self.commune else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'parcelles_count': len(self.parcelles) if self.parcelles else 0
+            'parcelles_count': parcelles_count if parcelles_count is not None else (len(self.parcelles) if self.parcelles else 0)
         }
 
 class Parcelle(db.Model):
     """Parcelle d'une exploitation"""
     __tablename__ = 'parcelles'
+    __table_args__ = (
+        db.Index('ix_parcelles_exploitation', 'exploitation_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     nom = db.Column(db.String(200), nullable=False)
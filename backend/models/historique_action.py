@@ -7,6 +7,9 @@ from datetime import datetime
 class HistoriqueAction(db.Model):
     """Journalisation des actions utilisateur"""
     __tablename__ = 'historiques_actions'
+    __table_args__ = (
+        db.Index('ix_historiques_actions_user_date', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     action = db.Column(db.String(100), nullable=False)  # create, update, delete, view
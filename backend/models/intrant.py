@@ -7,6 +7,10 @@ from datetime import datetime
 class Intrant(db.Model):
     """Intrant agricole utilisé"""
     __tablename__ = 'intrants'
+    __table_args__ = (
+        db.Index('ix_intrants_exploitation_date', 'exploitation_id', 'date_application'),
+        db.Index('ix_intrants_parcelle', 'parcelle_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     type_intrant = db.Column(db.String(100), nullable=False)  # Engrais, Pesticide, Semence, etc.
@@ -0,0 +1,78 @@
+"""
+Modèles pour les données météo stockées localement
+"""
+from database import db
+from datetime import datetime
+import json
+
+class MeteoSnapshot(db.Model):
+    """Dernière réponse OpenWeather connue pour une cellule de grille (préchargement)"""
+    __tablename__ = 'meteo_snapshots'
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'grid_lat', 'grid_lon', 'lang', name='uq_meteo_snapshots_cell'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # current, forecast
+    grid_lat = db.Column(db.Float, nullable=False)  # Centre de la cellule de grille
+    grid_lon = db.Column(db.Float, nullable=False)
+    lang = db.Column(db.String(5), nullable=False, default='fr')
+    payload = db.Column(db.Text, nullable=False)  # Réponse formatée (JSON)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'grid_lat': self.grid_lat,
+            'grid_lon': self.grid_lon,
+            'lang': self.lang,
+            'payload': json.loads(self.payload) if self.payload else None,
+            'fetched_at': self.fetched_at.isoformat() if self.fetched_at else None
+        }
+
+class ReleveMeteo(db.Model):
+    """Relevé météo normalisé (observation ou prévision) par cellule de grille et horodatage"""
+    __tablename__ = 'releves_meteo'
+    __table_args__ = (
+        db.UniqueConstraint('grid_lat', 'grid_lon', 'source', 'date', name='uq_releves_meteo_cell_date'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    grid_lat = db.Column(db.Float, nullable=False)  # Centre de la cellule de grille
+    grid_lon = db.Column(db.Float, nullable=False)
+    source = db.Column(db.String(20), nullable=False)  # observation, prevision
+    date = db.Column(db.DateTime, nullable=False)  # Heure observée ou prévue
+    temperature = db.Column(db.Float)  # °C
+    temperature_min = db.Column(db.Float)
+    temperature_max = db.Column(db.Float)
+    humidite = db.Column(db.Float)  # %
+    pression = db.Column(db.Float)  # hPa
+    vitesse_vent = db.Column(db.Float)  # m/s
+    direction_vent = db.Column(db.Float)  # degrés
+    pluviometrie = db.Column(db.Float)  # mm
+    nuages = db.Column(db.Float)  # %
+    description = db.Column(db.String(200))
+    icon = db.Column(db.String(20))
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'grid_lat': self.grid_lat,
+            'grid_lon': self.grid_lon,
+            'source': self.source,
+            'date': self.date.isoformat() if self.date else None,
+            'temperature': self.temperature,
+            'temperature_min': self.temperature_min,
+            'temperature_max': self.temperature_max,
+            'humidite': self.humidite,
+            'pression': self.pression,
+            'vitesse_vent': self.vitesse_vent,
+            'direction_vent': self.direction_vent,
+            'pluviometrie': self.pluviometrie,
+            'nuages': self.nuages,
+            'description': self.description,
+            'icon': self.icon,
+            'fetched_at': self.fetched_at.isoformat() if self.fetched_at else None
+        }
@@ -7,6 +7,12 @@ from datetime import datetime
 class Recolte(db.Model):
     """Récolte agricole"""
     __tablename__ = 'recoltes'
+    __table_args__ = (
+        db.Index('ix_recoltes_exploitation_culture_periode', 'exploitation_id', 'type_culture', 'annee', 'mois'),
+        db.Index('ix_recoltes_culture_periode', 'type_culture', 'annee', 'mois'),
+        db.Index('ix_recoltes_periode', 'annee', 'mois'),
+        db.Index('ix_recoltes_parcelle', 'parcelle_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     exploitation_id = db.Column(db.Integer, db.ForeignKey('exploitations.id'), nullable=False)
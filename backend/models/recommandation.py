@@ -7,6 +7,10 @@ from datetime import datetime
 class Recommandation(db.Model):
     """Recommandation basée sur les données saisies"""
     __tablename__ = 'recommandations'
+    __table_args__ = (
+        db.Index('ix_recommandations_exploitation', 'exploitation_id'),
+        db.Index('ix_recommandations_parcelle', 'parcelle_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     type_recommandation = db.Column(db.String(100), nullable=False)  # Fertilisation, Irrigation, Traitement, etc.
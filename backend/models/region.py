@@ -23,7 +23,8 @@ class Region(db.Model):
     prefectures = db.relationship('Prefecture', backref='region', lazy=True, cascade='all, delete-orphan')
     exploitations = db.relationship('Exploitation', backref='region', lazy=True)
     
-    def to_dict(self):
+    def to_dict(self, prefectures_count=None, exploitations_count=None):
+        # Nombres déjà calculés (voir utils/serialization.py) : évitent de charger les collections
         return {
             'id': self.id,
             'nom': self.nom,
@@ -33,8 +34,8 @@ class Region(db.Model):
             'latitude': self.latitude,
             'longitude': self.longitude,
             'description': self.description,
-            'prefectures_count': len(self.prefectures) if self.prefectures else 0,
-            'exploitations_count': len(self.exploitations) if self.exploitations else 0,
+            'prefectures_count': prefectures_count if prefectures_count is not None else (len(self.prefectures) if self.prefectures else 0),
+            'exploitations_count': exploitations_count if exploitations_count is not None else (len(self.exploitations) if self.exploitations else 0),
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
@@ -42,6 +43,9 @@ class Region(db.Model):
 class Prefecture(db.Model):
     """Préfecture (sous-division de région)"""
     __tablename__ = 'prefectures'
+    __table_args__ = (
+        db.Index('ix_prefectures_region', 'region_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     nom = db.Column(db.String(100), nullable=False)
@@ -59,7 +63,8 @@ class Prefecture(db.Model):
     communes = db.relationship('Commune', backref='prefecture', lazy=True, cascade='all, delete-orphan')
     exploitations = db.relationship('Exploitation', backref='prefecture', lazy=True)
     
-    def to_dict(self):
+    def to_dict(self, communes_count=None, exploitations_count=None):
+        # Nombres déjà calculés (voir utils/serialization.py) : évitent de charger les collections
         return {
             'id': self.id,
             'nom': self.nom,
@@ -71,8 +76,8 @@ class Prefecture(db.Model):
             'latitude': self.latitude,
             'longitude': self.longitude,
             'description': self.description,
-            'communes_count': len(self.communes) if self.communes else 0,
-            'exploitations_count': len(self.exploitations) if self.exploitations else 0,
+            'communes_count': communes_count if communes_count is not None else (len(self.communes) if self.communes else 0),
+            'exploitations_count': exploitations_count if exploitations_count is not None else (len(self.exploitations) if self.exploitations else 0),
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
@@ -80,6 +85,9 @@ class Prefecture(db.Model):
 class Commune(db.Model):
     """Commune (sous-division de préfecture)"""
     __tablename__ = 'communes'
+    __table_args__ = (
+        db.Index('ix_communes_prefecture', 'prefecture_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     nom = db.Column(db.String(100), nullable=False)
@@ -95,7 +103,8 @@ class Commune(db.Model):
     # Relations
     exploitations = db.relationship('Exploitation', backref='commune', lazy=True)
     
-    def to_dict(self):
+    def to_dict(self, exploitations_count=None):
+        # Nombre déjà calculé (voir utils/serialization.py) : évite de charger la collection
         return {
             'id': self.id,
             'nom': self.nom,
@@ -108,7 +117,7 @@ class Commune(db.Model):
             'latitude': self.latitude,
             'longitude': self.longitude,
             'description': self.description,
-            'exploitations_count': len(self.exploitations) if self.exploitations else 0,
+            'exploitations_count': exploitations_count if exploitations_count is not None else (len(self.exploitations) if self.exploitations else 0),
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
@@ -8,6 +8,10 @@ import json
 class Sensor(db.Model):
     """Capteur IoT pour l'agriculture"""
     __tablename__ = 'sensors'
+    __table_args__ = (
+        db.Index('ix_sensors_exploitation', 'exploitation_id'),
+        db.Index('ix_sensors_parcelle', 'parcelle_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     sensor_id = db.Column(db.String(100), unique=True, nullable=False)  # ID unique du capteur
@@ -45,6 +49,10 @@ class Sensor(db.Model):
 class SensorData(db.Model):
     """Données brutes des capteurs"""
     __tablename__ = 'sensor_data'
+    __table_args__ = (
+        db.Index('ix_sensor_data_sensor_timestamp', 'sensor_id', 'timestamp'),
+        db.Index('ix_sensor_data_exploitation_timestamp', 'exploitation_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     sensor_id = db.Column(db.String(100), db.ForeignKey('sensors.sensor_id'), nullable=False)
@@ -86,3 +94,42 @@ class SensorData(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+
+class SensorRollup(db.Model):
+    """Agrégats des mesures de capteurs par intervalle de temps (1m, 1h, 1d)"""
+    __tablename__ = 'sensor_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('sensor_id', 'resolution', 'bucket_start', name='uq_sensor_rollups_bucket'),
+        db.Index('ix_sensor_rollups_exploitation', 'exploitation_id', 'resolution', 'bucket_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sensor_id = db.Column(db.String(100), db.ForeignKey('sensors.sensor_id'), nullable=False)
+    sensor_type = db.Column(db.String(50), nullable=False)
+    resolution = db.Column(db.String(5), nullable=False)  # 1m, 1h, 1d
+    bucket_start = db.Column(db.DateTime, nullable=False)  # Début de l'intervalle
+    parcelle_id = db.Column(db.Integer, db.ForeignKey('parcelles.id'))
+    exploitation_id = db.Column(db.Integer, db.ForeignKey('exploitations.id'))
+    count = db.Column(db.Integer, nullable=False, default=0)
+    sum_value = db.Column(db.Float, nullable=False, default=0)
+    min_value = db.Column(db.Float)
+    max_value = db.Column(db.Float)
+    last_value = db.Column(db.Float)
+    last_timestamp = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'sensor_id': self.sensor_id,
+            'sensor_type': self.sensor_type,
+            'resolution': self.resolution,
+            'bucket_start': self.bucket_start.isoformat() if self.bucket_start else None,
+            'parcelle_id': self.parcelle_id,
+            'exploitation_id': self.exploitation_id,
+            'count': self.count,
+            'min': self.min_value,
+            'max': self.max_value,
+            'avg': self.sum_value / self.count if self.count else None,
+            'last': self.last_value,
+            'last_timestamp': self.last_timestamp.isoformat() if self.last_timestamp else None
+        }
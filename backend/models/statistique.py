@@ -0,0 +1,45 @@
+"""
+Modèle pour les statistiques agrégées (tableaux de bord)
+"""
+from database import db
+from datetime import datetime
+
+class StatistiqueAgregee(db.Model):
+    """
+    Compteurs agrégés par (région, préfecture, commune, culture principale)
+    Maintenus incrémentalement (voir services/statistique_service.py) ;
+    0 et '' désignent une référence géographique ou une culture non renseignée.
+    """
+    __tablename__ = 'statistiques_agregees'
+    __table_args__ = (
+        db.UniqueConstraint('region_id', 'prefecture_id', 'commune_id', 'culture', name='uq_statistiques_agregees_cle'),
+        db.Index('ix_statistiques_agregees_prefecture', 'prefecture_id'),
+        db.Index('ix_statistiques_agregees_commune', 'commune_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    region_id = db.Column(db.Integer, nullable=False, default=0)
+    prefecture_id = db.Column(db.Integer, nullable=False, default=0)
+    commune_id = db.Column(db.Integer, nullable=False, default=0)
+    culture = db.Column(db.String(100), nullable=False, default='')
+    nombre_exploitations = db.Column(db.Integer, nullable=False, default=0)
+    superficie_totale = db.Column(db.Float, nullable=False, default=0)  # en hectares
+    nombre_analyses = db.Column(db.Integer, nullable=False, default=0)
+    nombre_intrants = db.Column(db.Integer, nullable=False, default=0)
+    nombre_recoltes = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'region_id': self.region_id or None,
+            'prefecture_id': self.prefecture_id or None,
+            'commune_id': self.commune_id or None,
+            'culture': self.culture or None,
+            'nombre_exploitations': self.nombre_exploitations,
+            'superficie_totale': self.superficie_totale,
+            'nombre_analyses': self.nombre_analyses,
+            'nombre_intrants': self.nombre_intrants,
+            'nombre_recoltes': self.nombre_recoltes,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
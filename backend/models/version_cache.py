@@ -0,0 +1,16 @@
+"""
+Modèle pour les numéros de version des caches en mémoire
+"""
+from database import db
+
+
+class VersionCache(db.Model):
+    """
+    Numéro de version partagé d'un cache en mémoire (ex: 'hierarchie')
+    Incrémenté dans la transaction qui modifie les données du cache : chaque
+    processus compare sa copie à cette ligne, quel que soit le processus qui a écrit.
+    """
+    __tablename__ = 'versions_cache'
+
+    nom = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
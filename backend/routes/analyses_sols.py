@@ -10,7 +10,8 @@ from models.exploitation import Exploitation
 from models.sensor import SensorData
 from utils.historique import log_action
 from utils.validators import validate_analyse_sol_data
-from routes.utils import get_pagination_params, paginate_query
+from routes.utils import get_pagination_params, get_cursor_params, paginate_query, paginate_keyset
+from routes.imports import import_response
 import json
 
 analyses_sols_bp = Blueprint('analyses_sols', __name__)
@@ -18,11 +19,15 @@ analyses_sols_bp = Blueprint('analyses_sols', __name__)
 @analyses_sols_bp.route('', methods=['GET'])
 @jwt_required()
 def get_analyses():
-    """Liste toutes les analyses de sol avec pagination"""
+    """
+    Liste toutes les analyses de sol avec pagination
+    Avec ?cursor= (vide pour la première page), pagination par curseur sur (date_prelevement, id)
+    """
     try:
         exploitation_id = request.args.get('exploitation_id', type=int)
         parcelle_id = request.args.get('parcelle_id', type=int)
         page, per_page = get_pagination_params()
+        cursor, total = get_cursor_params()
         
         query = AnalyseSol.query
         
@@ -31,11 +36,20 @@ def get_analyses():
         if parcelle_id:
             query = query.filter_by(parcelle_id=parcelle_id)
         
+        if cursor is not None:
+            result = paginate_keyset(
+                query, [(AnalyseSol.date_prelevement, True), (AnalyseSol.id, True)],
+                cursor, per_page, total=total
+            )
+            return jsonify(result), 200
+        
         # Tri par date de prélèvement décroissante
         query = query.order_by(AnalyseSol.date_prelevement.desc())
         
         result = paginate_query(query, page, per_page)
         return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -130,6 +144,29 @@ def create_analyse():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@analyses_sols_bp.route('/import', methods=['POST'])
+@jwt_required()
+def import_analyses():
+    """
+    Importer des analyses de sol depuis un fichier CSV, NDJSON ou JSON
+    
+    Corps : fichier envoyé tel quel (Content-Type text/csv, application/x-ndjson
+    ou application/json {"analyses_sols": [...]}) ou champ `fichier` multipart.
+    Lignes validées comme pour la création unitaire, insérées par lots
+    (?taille_lot=, 1000 par défaut) avec une entrée d'historique par lot.
+    L'importateur est enregistré comme technicien de chaque analyse.
+    ?dry_run=1 pour une simulation. Retourne un résumé avec les erreurs par ligne.
+    """
+    try:
+        return import_response('analyses_sols', get_jwt_identity())
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @analyses_sols_bp.route('/<int:analyse_id>', methods=['GET'])
 @jwt_required()
 def get_analyse(analyse_id):
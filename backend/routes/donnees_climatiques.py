@@ -8,13 +8,19 @@ from database import db
 from models.donnee_climatique import DonneeClimatique
 from models.exploitation import Exploitation
 from utils.historique import log_action
+from utils.validators import validate_donnee_climatique_data
+from routes.utils import list_response
+from routes.imports import import_response
 
 donnees_climatiques_bp = Blueprint('donnees_climatiques', __name__)
 
 @donnees_climatiques_bp.route('', methods=['GET'])
 @jwt_required()
 def get_donnees_climatiques():
-    """Liste toutes les données climatiques"""
+    """
+    Liste toutes les données climatiques
+    Paginée avec ?page=/?per_page=, sinon envoyée en flux (tableau JSON ou ?format=ndjson)
+    """
     try:
         exploitation_id = request.args.get('exploitation_id')
         
@@ -22,8 +28,9 @@ def get_donnees_climatiques():
         if exploitation_id:
             query = query.filter_by(exploitation_id=exploitation_id)
         
-        donnees = query.all()
-        return jsonify([d.to_dict() for d in donnees]), 200
+        return list_response(query.order_by(DonneeClimatique.id)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -35,16 +42,23 @@ def create_donnee_climatique():
         user_id = get_jwt_identity()
         data = request.get_json()
         
-        if not data.get('date_debut') or not data.get('date_fin') or not data.get('exploitation_id'):
-            return jsonify({'error': 'date_debut, date_fin et exploitation_id sont requis'}), 400
+        # Validation (mêmes règles que l'import)
+        errors = validate_donnee_climatique_data(data)
+        if errors:
+            return jsonify({'errors': errors}), 400
         
         # Vérifier que l'exploitation existe
         exploitation = Exploitation.query.get(data['exploitation_id'])
         if not exploitation:
             return jsonify({'error': 'Exploitation non trouvée'}), 404
         
-        date_debut = datetime.strptime(data['date_debut'], '%Y-%m-%d').date()
-        date_fin = datetime.strptime(data['date_fin'], '%Y-%m-%d').date()
+        try:
+            date_debut = datetime.strptime(data['date_debut'], '%Y-%m-%d').date()
+            date_fin = datetime.strptime(data['date_fin'], '%Y-%m-%d').date()
+        except (ValueError, TypeError):
+            return jsonify({'errors': ['Les dates doivent être au format AAAA-MM-JJ']}), 400
+        if date_fin < date_debut:
+            return jsonify({'errors': ['date_fin doit être postérieure à date_debut']}), 400
         
         donnee = DonneeClimatique(
             date_debut=date_debut,
@@ -70,6 +84,28 @@ def create_donnee_climatique():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@donnees_climatiques_bp.route('/import', methods=['POST'])
+@jwt_required()
+def import_donnees_climatiques():
+    """
+    Importer des données climatiques depuis un fichier CSV, NDJSON ou JSON
+    
+    Corps : fichier envoyé tel quel (Content-Type text/csv, application/x-ndjson
+    ou application/json {"donnees_climatiques": [...]}) ou champ `fichier` multipart.
+    Lignes validées comme pour la création unitaire, insérées par lots
+    (?taille_lot=, 1000 par défaut) avec une entrée d'historique par lot.
+    ?dry_run=1 pour une simulation. Retourne un résumé avec les erreurs par ligne.
+    """
+    try:
+        return import_response('donnees_climatiques', get_jwt_identity())
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @donnees_climatiques_bp.route('/<int:donnee_id>', methods=['GET'])
 @jwt_required()
 def get_donnee_climatique(donnee_id):
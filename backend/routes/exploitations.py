@@ -8,27 +8,32 @@ from models.exploitation import Exploitation
 from utils.historique import log_action
 from utils.validators import validate_exploitation_data
 from routes.utils import get_pagination_params, paginate_query
+from utils.serialization import exploitation_load_options, exploitation_serializer, get_serialization_profile
 
 exploitations_bp = Blueprint('exploitations', __name__)
 
 @exploitations_bp.route('', methods=['GET'])
 @jwt_required()
 def get_exploitations():
-    """Liste toutes les exploitations avec pagination"""
+    """Liste toutes les exploitations avec pagination (?fields=summary|full)"""
     try:
         user_id = get_jwt_identity()
         page, per_page = get_pagination_params()
+        profil = get_serialization_profile()
         
         # Filtrer par propriétaire ou toutes si admin
-        query = Exploitation.query.filter_by(proprietaire_id=user_id)
+        query = Exploitation.query.filter_by(proprietaire_id=user_id)\
+            .options(*exploitation_load_options(profil))
         
         # Recherche par nom si fournie
         search = request.args.get('search')
         if search:
             query = query.filter(Exploitation.nom.ilike(f'%{search}%'))
         
-        result = paginate_query(query, page, per_page)
+        result = paginate_query(query, page, per_page, serializer=exploitation_serializer(profil))
         return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
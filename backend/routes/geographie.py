@@ -1,12 +1,16 @@
 """
 Routes pour la gestion de la structure géographique hiérarchique
 """
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.orm import joinedload
 from database import db
 from models.region import Region, Prefecture, Commune
 from models.exploitation import Exploitation
 from utils.historique import log_action
+from services.geographie_service import get_hierarchie
+from routes.utils import list_response
+from utils.serialization import serialize_geographie
 
 geographie_bp = Blueprint('geographie', __name__)
 
@@ -15,10 +19,14 @@ geographie_bp = Blueprint('geographie', __name__)
 @geographie_bp.route('/regions', methods=['GET'])
 @jwt_required()
 def get_regions():
-    """Liste toutes les régions"""
+    """
+    Liste toutes les régions
+    Paginée avec ?page=/?per_page=, sinon envoyée en flux (tableau JSON ou ?format=ndjson)
+    """
     try:
-        regions = Region.query.all()
-        return jsonify([r.to_dict() for r in regions]), 200
+        return list_response(Region.query.order_by(Region.id), serialize_geographie), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -30,7 +38,7 @@ def get_region(region_id):
         region = Region.query.get(region_id)
         if not region:
             return jsonify({'error': 'Région non trouvée'}), 404
-        return jsonify(region.to_dict()), 200
+        return jsonify(serialize_geographie([region])[0]), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -70,16 +78,20 @@ def create_region():
 @geographie_bp.route('/prefectures', methods=['GET'])
 @jwt_required()
 def get_prefectures():
-    """Liste toutes les préfectures, optionnellement filtrées par région"""
+    """
+    Liste toutes les préfectures, optionnellement filtrées par région
+    Paginée avec ?page=/?per_page=, sinon envoyée en flux (tableau JSON ou ?format=ndjson)
+    """
     try:
         region_id = request.args.get('region_id', type=int)
+        query = Prefecture.query.options(joinedload(Prefecture.region))
         
         if region_id:
-            prefectures = Prefecture.query.filter_by(region_id=region_id).all()
-        else:
-            prefectures = Prefecture.query.all()
+            query = query.filter_by(region_id=region_id)
         
-        return jsonify([p.to_dict() for p in prefectures]), 200
+        return list_response(query.order_by(Prefecture.id), serialize_geographie), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -91,7 +103,7 @@ def get_prefecture(prefecture_id):
         prefecture = Prefecture.query.get(prefecture_id)
         if not prefecture:
             return jsonify({'error': 'Préfecture non trouvée'}), 404
-        return jsonify(prefecture.to_dict()), 200
+        return jsonify(serialize_geographie([prefecture])[0]), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -132,12 +144,15 @@ def create_prefecture():
 @geographie_bp.route('/communes', methods=['GET'])
 @jwt_required()
 def get_communes():
-    """Liste toutes les communes, optionnellement filtrées par préfecture ou région"""
+    """
+    Liste toutes les communes, optionnellement filtrées par préfecture ou région
+    Paginée avec ?page=/?per_page=, sinon envoyée en flux (tableau JSON ou ?format=ndjson)
+    """
     try:
         prefecture_id = request.args.get('prefecture_id', type=int)
         region_id = request.args.get('region_id', type=int)
         
-        query = Commune.query
+        query = Commune.query.options(joinedload(Commune.prefecture).joinedload(Prefecture.region))
         
         if prefecture_id:
             query = query.filter_by(prefecture_id=prefecture_id)
@@ -145,8 +160,9 @@ def get_communes():
             # Filtrer par région via la préfecture
             query = query.join(Prefecture).filter(Prefecture.region_id == region_id)
         
-        communes = query.all()
-        return jsonify([c.to_dict() for c in communes]), 200
+        return list_response(query.order_by(Commune.id), serialize_geographie), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -158,7 +174,7 @@ def get_commune(commune_id):
         commune = Commune.query.get(commune_id)
         if not commune:
             return jsonify({'error': 'Commune non trouvée'}), 404
-        return jsonify(commune.to_dict()), 200
+        return jsonify(serialize_geographie([commune])[0]), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -198,25 +214,21 @@ def create_commune():
 @geographie_bp.route('/hierarchie', methods=['GET'])
 @jwt_required()
 def get_hierarchie_complete():
-    """Récupère la hiérarchie complète (régions avec préfectures et communes)"""
+    """
+    Récupère la hiérarchie complète (régions avec préfectures et communes)
+
+    Servie depuis le cache en mémoire avec un ETag fort : un client qui envoie
+    If-None-Match avec l'ETag reçu précédemment obtient 304 sans corps tant que
+    la géographie n'a pas changé.
+    """
     try:
-        regions = Region.query.all()
-        result = []
-        
-        for region in regions:
-            region_dict = region.to_dict()
-            prefectures_list = []
-            
-            for prefecture in region.prefectures:
-                prefecture_dict = prefecture.to_dict()
-                communes_list = [c.to_dict() for c in prefecture.communes]
-                prefecture_dict['communes'] = communes_list
-                prefectures_list.append(prefecture_dict)
-            
-            region_dict['prefectures'] = prefectures_list
-            result.append(region_dict)
-        
-        return jsonify(result), 200
+        corps, etag, version = get_hierarchie()
+        response = current_app.response_class(corps, status=200, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['X-Hierarchie-Version'] = str(version)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
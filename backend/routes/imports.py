@@ -0,0 +1,48 @@
+"""
+Réponse commune des routes d'import en masse
+"""
+from flask import jsonify, request
+from database import db
+from services.import_service import (
+    TAILLE_LOT_IMPORT, bulk_import, detect_import_format, get_import_spec, iter_import_records
+)
+
+
+def import_response(type_import, user_id):
+    """
+    Réponse d'un import en masse (voir services.import_service.bulk_import)
+
+    Corps : fichier envoyé tel quel (Content-Type text/csv, application/x-ndjson
+    ou application/json {"<type_import>": [...]}) ou champ `fichier` multipart.
+    ?taille_lot= (1000 par défaut) et ?dry_run=1 pour une simulation sans
+    enregistrement. Le commit est fait ici, sauf en simulation.
+
+    Raises:
+        ValueError: format, taille de lot ou contenu invalide
+    """
+    spec = get_import_spec(type_import)
+    taille_lot = request.args.get('taille_lot', TAILLE_LOT_IMPORT, type=int)
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'oui')
+
+    fichier = request.files.get('fichier') or request.files.get('file')
+    if fichier:
+        format_ = detect_import_format(fichier.mimetype, fichier.filename)
+        flux = fichier.stream
+    else:
+        format_ = detect_import_format(request.mimetype)
+        flux = request.stream
+
+    resume = bulk_import(
+        type_import, iter_import_records(flux, format_, cle_json=type_import), user_id,
+        taille_lot=taille_lot, dry_run=dry_run, details={'format': format_},
+    )
+    if not resume['lignes']:
+        db.session.rollback()
+        return jsonify({'error': f"Aucun enregistrement fourni ({spec['libelle']})"}), 400
+    db.session.commit()
+
+    if dry_run:
+        message = f"Simulation : {resume['importees']} {spec['libelle']} seraient importé(e)s"
+    else:
+        message = f"{resume['importees']} {spec['libelle']} importé(e)s avec succès"
+    return jsonify({'message': message, **resume}), 200 if dry_run else 201
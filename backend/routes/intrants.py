@@ -9,13 +9,18 @@ from models.intrant import Intrant
 from models.exploitation import Exploitation
 from utils.historique import log_action
 from utils.validators import validate_intrant_data
+from routes.utils import list_response
+from routes.imports import import_response
 
 intrants_bp = Blueprint('intrants', __name__)
 
 @intrants_bp.route('', methods=['GET'])
 @jwt_required()
 def get_intrants():
-    """Liste tous les intrants"""
+    """
+    Liste tous les intrants
+    Paginée avec ?page=/?per_page=, sinon envoyée en flux (tableau JSON ou ?format=ndjson)
+    """
     try:
         exploitation_id = request.args.get('exploitation_id')
         parcelle_id = request.args.get('parcelle_id')
@@ -27,8 +32,9 @@ def get_intrants():
         if parcelle_id:
             query = query.filter_by(parcelle_id=parcelle_id)
         
-        intrants = query.all()
-        return jsonify([i.to_dict() for i in intrants]), 200
+        return list_response(query.order_by(Intrant.id)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -77,6 +83,28 @@ def create_intrant():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@intrants_bp.route('/import', methods=['POST'])
+@jwt_required()
+def import_intrants():
+    """
+    Importer des intrants depuis un fichier CSV, NDJSON ou JSON
+    
+    Corps : fichier envoyé tel quel (Content-Type text/csv, application/x-ndjson
+    ou application/json {"intrants": [...]}) ou champ `fichier` multipart.
+    Lignes validées comme pour la création unitaire, insérées par lots
+    (?taille_lot=, 1000 par défaut) avec une entrée d'historique par lot.
+    ?dry_run=1 pour une simulation. Retourne un résumé avec les erreurs par ligne.
+    """
+    try:
+        return import_response('intrants', get_jwt_identity())
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @intrants_bp.route('/<int:intrant_id>', methods=['GET'])
 @jwt_required()
 def get_intrant(intrant_id):
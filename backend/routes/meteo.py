@@ -1,14 +1,27 @@
 """
 Routes pour la gestion de la météo et conseils d'irrigation
 """
-from flask import Blueprint, request, jsonify
+import json
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from services.irrigation_service import generate_conseils_irrigation
-from services.meteo_service import get_current_weather, get_weather_forecast, get_weather_by_city
+from services.irrigation_service import generate_conseils_irrigation, generate_conseils_irrigation_batch
+from services.meteo_service import (
+    get_current_weather, get_weather_forecast, get_weather_by_city, get_current_and_forecast, get_cache_stats,
+    grid_cell, iter_weather_by_cell
+)
+from services.meteo_store_service import SOURCE_OBSERVATION, SOURCE_PREVISION, rainfall_since, weather_history
 from models.exploitation import Exploitation
+from models.user import User
+from routes.utils import get_pagination_params, paginate_query
 
 meteo_bp = Blueprint('meteo', __name__)
 
+# Rôles autorisés à consulter les exploitations dont ils ne sont pas propriétaires
+ROLES_ENCADREMENT = ('Agent', 'Technicien')
+# Nombre maximal d'exploitations par requête groupée
+BATCH_MAX_EXPLOITATIONS = 5000
+
 @meteo_bp.route('/test/ville', methods=['GET'])
 def test_meteo_ville():
     """
@@ -85,6 +98,105 @@ def test_meteo_previsions():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@meteo_bp.route('/conseils-irrigation/batch', methods=['POST'])
+@jwt_required()
+def get_conseils_irrigation_batch():
+    """
+    Génère les conseils d'irrigation de plusieurs exploitations en une requête
+    Body: {"exploitation_ids": [...]} ou {"region_id"|"prefecture_id"|"commune_id": X}
+
+    Les exploitations d'une même cellule de grille partagent un seul appel météo ;
+    les cellules sont récupérées en parallèle. La réponse est un flux NDJSON :
+    une ligne par exploitation dès que sa météo est disponible, puis une ligne
+    de synthèse. Les agents et techniciens peuvent cibler toutes les
+    exploitations, les autres utilisateurs uniquement les leurs.
+    """
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json() or {}
+        
+        query = Exploitation.query
+        if data.get('exploitation_ids'):
+            query = query.filter(Exploitation.id.in_(data['exploitation_ids']))
+        elif data.get('commune_id'):
+            query = query.filter_by(commune_id=data['commune_id'])
+        elif data.get('prefecture_id'):
+            query = query.filter_by(prefecture_id=data['prefecture_id'])
+        elif data.get('region_id'):
+            query = query.filter_by(region_id=data['region_id'])
+        else:
+            return jsonify({'error': 'exploitation_ids, region_id, prefecture_id ou commune_id requis'}), 400
+        
+        user = User.query.get(user_id)
+        if not user or not user.role or user.role.nom not in ROLES_ENCADREMENT:
+            query = query.filter_by(proprietaire_id=user_id)
+        
+        exploitations = query.with_entities(
+            Exploitation.id, Exploitation.latitude, Exploitation.longitude, Exploitation.type_culture_principal
+        ).order_by(Exploitation.id).limit(BATCH_MAX_EXPLOITATIONS + 1).all()
+        
+        if not exploitations:
+            return jsonify({'error': 'Aucune exploitation trouvée'}), 404
+        if len(exploitations) > BATCH_MAX_EXPLOITATIONS:
+            return jsonify({'error': f'Maximum {BATCH_MAX_EXPLOITATIONS} exploitations par requête'}), 400
+        
+        # Regrouper les exploitations par cellule de grille
+        cellules = {}
+        sans_coordonnees = []
+        for exploitation in exploitations:
+            if not exploitation.latitude or not exploitation.longitude:
+                sans_coordonnees.append(exploitation.id)
+                continue
+            cellules.setdefault(grid_cell(exploitation.latitude, exploitation.longitude), []).append(exploitation)
+        
+        def generate():
+            erreurs = 0
+            for exploitation_id in sans_coordonnees:
+                erreurs += 1
+                yield json.dumps({
+                    'exploitation_id': exploitation_id,
+                    'error': 'Coordonnées GPS non définies pour cette exploitation'
+                }) + '\n'
+            
+            depuis = datetime.utcnow() - timedelta(hours=24)
+            for cell, meteo_cellule, previsions_cellule, erreur in iter_weather_by_cell(cellules):
+                membres = cellules[cell]
+                if erreur:
+                    for exploitation in membres:
+                        erreurs += 1
+                        yield json.dumps({'exploitation_id': exploitation.id, 'error': erreur}) + '\n'
+                    continue
+                
+                # Même météo pour toutes les exploitations de la cellule : calcul groupé
+                derniere_pluviometrie = rainfall_since(cell, depuis)
+                conseils_cellule = generate_conseils_irrigation_batch(
+                    [meteo_cellule] * len(membres),
+                    [previsions_cellule] * len(membres),
+                    [derniere_pluviometrie] * len(membres),
+                    [e.type_culture_principal for e in membres],
+                )
+                for exploitation, conseils in zip(membres, conseils_cellule):
+                    position = {'latitude': exploitation.latitude, 'longitude': exploitation.longitude}
+                    yield json.dumps({
+                        'exploitation_id': exploitation.id,
+                        'conseils': conseils,
+                        'meteo_actuelle': {**meteo_cellule, **position},
+                        'previsions': [{**p, **position} for p in previsions_cellule[:5]]
+                    }) + '\n'
+            
+            yield json.dumps({
+                'termine': True,
+                'exploitations': len(exploitations),
+                'cellules': len(cellules),
+                'erreurs': erreurs
+            }) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson'), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @meteo_bp.route('/conseils-irrigation/<int:exploitation_id>', methods=['POST', 'GET'])
 @jwt_required()
 def get_conseils_irrigation(exploitation_id):
@@ -109,9 +221,12 @@ def get_conseils_irrigation(exploitation_id):
         
         # Si GET, récupérer automatiquement depuis OpenWeather
         if request.method == 'GET':
-            meteo_actuelle = get_current_weather(exploitation.latitude, exploitation.longitude)
-            previsions = get_weather_forecast(exploitation.latitude, exploitation.longitude)
-            derniere_pluviometrie = None  # Peut être récupéré depuis la base de données si nécessaire
+            meteo_actuelle, previsions = get_current_and_forecast(exploitation.latitude, exploitation.longitude)
+            # Pluie observée sur les dernières 24h d'après le stockage local
+            derniere_pluviometrie = rainfall_since(
+                grid_cell(exploitation.latitude, exploitation.longitude),
+                datetime.utcnow() - timedelta(hours=24)
+            )
         else:
             # Si POST, utiliser les données fournies
             data = request.get_json() or {}
@@ -121,8 +236,10 @@ def get_conseils_irrigation(exploitation_id):
             
             # Si aucune donnée n'est fournie, récupérer depuis OpenWeather
             if not meteo_actuelle:
-                meteo_actuelle = get_current_weather(exploitation.latitude, exploitation.longitude)
-                previsions = get_weather_forecast(exploitation.latitude, exploitation.longitude) if not previsions else previsions
+                if previsions:
+                    meteo_actuelle = get_current_weather(exploitation.latitude, exploitation.longitude)
+                else:
+                    meteo_actuelle, previsions = get_current_and_forecast(exploitation.latitude, exploitation.longitude)
         
         if not meteo_actuelle:
             return jsonify({'error': 'Impossible de récupérer les données météo'}), 500
@@ -281,9 +398,8 @@ def get_meteo_complete(exploitation_id):
         if not exploitation.latitude or not exploitation.longitude:
             return jsonify({'error': 'Coordonnées GPS non définies pour cette exploitation'}), 400
         
-        # Récupérer météo actuelle et prévisions
-        meteo_actuelle = get_current_weather(exploitation.latitude, exploitation.longitude)
-        previsions = get_weather_forecast(exploitation.latitude, exploitation.longitude)
+        # Récupérer météo actuelle et prévisions (en parallèle)
+        meteo_actuelle, previsions = get_current_and_forecast(exploitation.latitude, exploitation.longitude)
         
         return jsonify({
             'meteo_actuelle': meteo_actuelle,
@@ -297,5 +413,65 @@ def get_meteo_complete(exploitation_id):
         return jsonify({'error': str(e)}), 500
 
 
+@meteo_bp.route('/historique', methods=['GET'])
+@jwt_required()
+def get_historique_meteo():
+    """
+    Historique des relevés météo enregistrés localement (observations et prévisions)
+    Query params: latitude, longitude OU exploitation_id ; start_date, end_date, source
+    """
+    try:
+        user_id = get_jwt_identity()
+        latitude = request.args.get('latitude', type=float)
+        longitude = request.args.get('longitude', type=float)
+        exploitation_id = request.args.get('exploitation_id', type=int)
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        source = request.args.get('source')
+        page, per_page = get_pagination_params()
+        
+        if exploitation_id:
+            exploitation = Exploitation.query.get(exploitation_id)
+            if not exploitation:
+                return jsonify({'error': 'Exploitation non trouvée'}), 404
+            
+            if exploitation.proprietaire_id != user_id:
+                return jsonify({'error': 'Non autorisé'}), 403
+            
+            if not exploitation.latitude or not exploitation.longitude:
+                return jsonify({'error': 'Coordonnées GPS non définies pour cette exploitation'}), 400
+            
+            latitude = exploitation.latitude
+            longitude = exploitation.longitude
+        
+        if latitude is None or longitude is None:
+            return jsonify({'error': 'Coordonnées GPS requises (latitude, longitude) ou exploitation_id'}), 400
+        
+        if source and source not in (SOURCE_OBSERVATION, SOURCE_PREVISION):
+            return jsonify({'error': f'source doit être {SOURCE_OBSERVATION} ou {SOURCE_PREVISION}'}), 400
+        
+        query = weather_history(
+            grid_cell(latitude, longitude),
+            start=datetime.fromisoformat(start_date) if start_date else None,
+            end=datetime.fromisoformat(end_date) if end_date else None,
+            source=source
+        )
+        
+        return jsonify(paginate_query(query, page, per_page)), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 
+@meteo_bp.route('/cache/stats', methods=['GET'])
+@jwt_required()
+def get_meteo_cache_stats():
+    """
+    Statistiques du cache des appels OpenWeather (hits, misses, évictions)
+    """
+    try:
+        return jsonify(get_cache_stats()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -8,7 +8,11 @@ from database import db
 from models.recolte import Recolte
 from models.exploitation import Exploitation
 from utils.historique import log_action
-from routes.utils import get_pagination_params, paginate_query
+from utils.validators import validate_recolte_data
+from routes.utils import get_pagination_params, get_cursor_params, paginate_query, paginate_keyset
+from routes.imports import import_response
+from services.recolte_service import STATISTIQUES_VIDES, harvest_statistics, parse_group_by
+from services.prevision_service import forecast_series, list_series, validate_modele
 import json
 
 recoltes_bp = Blueprint('recoltes', __name__)
@@ -16,7 +20,10 @@ recoltes_bp = Blueprint('recoltes', __name__)
 @recoltes_bp.route('', methods=['GET'])
 @jwt_required()
 def get_recoltes():
-    """Liste toutes les récoltes avec filtres"""
+    """
+    Liste toutes les récoltes avec filtres
+    Avec ?cursor= (vide pour la première page), pagination par curseur sur (annee, mois, id)
+    """
     try:
         exploitation_id = request.args.get('exploitation_id', type=int)
         parcelle_id = request.args.get('parcelle_id', type=int)
@@ -24,6 +31,7 @@ def get_recoltes():
         annee = request.args.get('annee', type=int)
         mois = request.args.get('mois', type=int)
         page, per_page = get_pagination_params()
+        cursor, total = get_cursor_params()
         
         query = Recolte.query
         
@@ -38,11 +46,20 @@ def get_recoltes():
         if mois:
             query = query.filter_by(mois=mois)
         
+        if cursor is not None:
+            result = paginate_keyset(
+                query, [(Recolte.annee, True), (Recolte.mois, True), (Recolte.id, True)],
+                cursor, per_page, total=total
+            )
+            return jsonify(result), 200
+        
         query = query.order_by(Recolte.annee.desc(), Recolte.mois.desc())
         
         result = paginate_query(query, page, per_page)
         return jsonify(result), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -54,10 +71,10 @@ def create_recolte():
         user_id = get_jwt_identity()
         data = request.get_json()
         
-        # Validation
-        if not data.get('exploitation_id') or not data.get('type_culture') or \
-           not data.get('mois') or not data.get('annee') or not data.get('quantite_recoltee'):
-            return jsonify({'error': 'Données incomplètes'}), 400
+        # Validation (mêmes règles que l'import)
+        errors = validate_recolte_data(data)
+        if errors:
+            return jsonify({'errors': errors}), 400
         
         # Vérifier que l'exploitation existe
         exploitation = Exploitation.query.get(data['exploitation_id'])
@@ -103,64 +120,21 @@ def create_recolte():
 @recoltes_bp.route('/import', methods=['POST'])
 @jwt_required()
 def import_recoltes():
-    """Importer des récoltes depuis un fichier CSV/JSON"""
+    """
+    Importer des récoltes depuis un fichier CSV, NDJSON ou JSON
+    
+    Corps : fichier envoyé tel quel (Content-Type text/csv, application/x-ndjson
+    ou application/json {"recoltes": [...]}) ou champ `fichier` multipart.
+    CSV et NDJSON sont lus en flux et insérés par lots (?taille_lot=, 1000 par défaut),
+    avec une entrée d'historique par lot ; ?dry_run=1 pour une simulation.
+    Retourne un résumé avec les erreurs par ligne, sans la liste des récoltes créées.
+    """
     try:
-        user_id = get_jwt_identity()
-        data = request.get_json()
-        
-        if not data.get('recoltes') or not isinstance(data['recoltes'], list):
-            return jsonify({'error': 'Format invalide. Attendu: {"recoltes": [...]}'}), 400
-        
-        recoltes_importees = []
-        erreurs = []
-        
-        for idx, rec_data in enumerate(data['recoltes']):
-            try:
-                # Validation des données minimales
-                if not rec_data.get('exploitation_id') or not rec_data.get('type_culture') or \
-                   not rec_data.get('mois') or not rec_data.get('annee') or not rec_data.get('quantite_recoltee'):
-                    erreurs.append(f'Ligne {idx + 1}: Données incomplètes')
-                    continue
-                
-                # Calculer le rendement si possible
-                rendement = None
-                if rec_data.get('superficie_recoltee') and rec_data['superficie_recoltee'] > 0:
-                    rendement = rec_data['quantite_recoltee'] / rec_data['superficie_recoltee']
-                
-                recolte = Recolte(
-                    exploitation_id=rec_data['exploitation_id'],
-                    parcelle_id=rec_data.get('parcelle_id'),
-                    type_culture=rec_data['type_culture'],
-                    mois=rec_data['mois'],
-                    annee=rec_data['annee'],
-                    quantite_recoltee=rec_data['quantite_recoltee'],
-                    unite_mesure=rec_data.get('unite_mesure', 'kg'),
-                    superficie_recoltee=rec_data.get('superficie_recoltee'),
-                    rendement=rendement or rec_data.get('rendement'),
-                    prix_vente=rec_data.get('prix_vente'),
-                    cout_production=rec_data.get('cout_production'),
-                    qualite=rec_data.get('qualite'),
-                    conditions_climatiques=rec_data.get('conditions_climatiques'),
-                    observations=rec_data.get('observations'),
-                )
-                
-                db.session.add(recolte)
-                recoltes_importees.append(recolte)
-                
-            except Exception as e:
-                erreurs.append(f'Ligne {idx + 1}: {str(e)}')
-        
-        db.session.commit()
-        
-        log_action(user_id, 'import', 'recolte', None, {'nombre': len(recoltes_importees)})
-        
-        return jsonify({
-            'message': f'{len(recoltes_importees)} récoltes importées avec succès',
-            'importees': len(recoltes_importees),
-            'erreurs': erreurs,
-            'recoltes': [r.to_dict() for r in recoltes_importees]
-        }), 201
+        return import_response('recoltes', get_jwt_identity())
         
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -168,67 +142,49 @@ def import_recoltes():
 @recoltes_bp.route('/statistics', methods=['GET'])
 @jwt_required()
 def get_statistics():
-    """Récupérer les statistiques des récoltes"""
+    """
+    Récupérer les statistiques des récoltes (calculées en SQL)
+    
+    Filtres : exploitation_id, type_culture, annee, mois, region_id.
+    Avec ?group_by=culture,annee,mois,region (un ou plusieurs), retourne aussi
+    le tableau des statistiques par groupe.
+    """
     try:
-        exploitation_id = request.args.get('exploitation_id', type=int)
-        type_culture = request.args.get('type_culture')
-        annee = request.args.get('annee', type=int)
-        
-        query = Recolte.query
-        
-        if exploitation_id:
-            query = query.filter_by(exploitation_id=exploitation_id)
-        if type_culture:
-            query = query.filter_by(type_culture=type_culture)
-        if annee:
-            query = query.filter_by(annee=annee)
+        filtres = {
+            'exploitation_id': request.args.get('exploitation_id', type=int),
+            'type_culture': request.args.get('type_culture'),
+            'annee': request.args.get('annee', type=int),
+            'mois': request.args.get('mois', type=int),
+            'region_id': request.args.get('region_id', type=int),
+        }
+        group_by = parse_group_by(request.args.get('group_by'))
         
-        recoltes = query.all()
-        
-        if not recoltes:
-            return jsonify({
-                'min': 0,
-                'max': 0,
-                'moyenne': 0,
-                'mediane': 0,
-                'ecart_type': 0,
-                'nombre': 0
-            }), 200
-        
-        quantites = [r.quantite_recoltee for r in recoltes]
-        quantites.sort()
-        
-        min_val = min(quantites)
-        max_val = max(quantites)
-        moyenne = sum(quantites) / len(quantites)
-        
-        # Médiane
-        n = len(quantites)
-        if n % 2 == 0:
-            mediane = (quantites[n//2 - 1] + quantites[n//2]) / 2
-        else:
-            mediane = quantites[n//2]
+        lignes = harvest_statistics(**filtres)
+        resultat = lignes[0] if lignes else dict(STATISTIQUES_VIDES)
         
-        # Écart-type
-        variance = sum((x - moyenne) ** 2 for x in quantites) / len(quantites)
-        ecart_type = variance ** 0.5
+        if group_by:
+            resultat = {
+                **resultat,
+                'group_by': group_by,
+                'groupes': harvest_statistics(group_by, **filtres)
+            }
         
-        return jsonify({
-            'min': min_val,
-            'max': max_val,
-            'moyenne': moyenne,
-            'mediane': mediane,
-            'ecart_type': ecart_type,
-            'nombre': len(recoltes)
-        }), 200
+        return jsonify(resultat), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @recoltes_bp.route('/prevision', methods=['GET'])
 @jwt_required()
 def get_prevision():
-    """Calculer la prévision pour la prochaine récolte"""
+    """
+    Calculer la prévision pour la prochaine récolte d'une série (exploitation × culture)
+    
+    ?modele=auto|lissage|saisonnier|regression (auto par défaut : le premier
+    modèle disponible parmi régression, saisonnier et lissage)
+    """
     try:
         exploitation_id = request.args.get('exploitation_id', type=int)
         type_culture = request.args.get('type_culture')
@@ -236,61 +192,42 @@ def get_prevision():
         if not exploitation_id or not type_culture:
             return jsonify({'error': 'exploitation_id et type_culture requis'}), 400
         
-        # Récupérer les récoltes historiques
-        recoltes = Recolte.query.filter_by(
-            exploitation_id=exploitation_id,
-            type_culture=type_culture
-        ).order_by(Recolte.annee.desc(), Recolte.mois.desc()).limit(12).all()
-        
-        if len(recoltes) < 3:
-            return jsonify({
-                'quantite_prevue': 0,
-                'probabilite_bonne': 50,
-                'probabilite_mauvaise': 50,
-                'prediction': 'moyenne',
-                'raison': 'Données insuffisantes pour une prévision fiable'
-            }), 200
-        
-        quantites = [r.quantite_recoltee for r in recoltes]
-        moyenne = sum(quantites) / len(quantites)
-        tendance = (quantites[0] - quantites[-1]) / len(quantites) if len(quantites) > 1 else 0
-        
-        # Prévision basée sur la moyenne et la tendance
-        quantite_prevue = moyenne + (tendance * 1.2)  # Ajustement avec facteur
-        
-        # Calculer les probabilités
-        ecart_type = (sum((x - moyenne) ** 2 for x in quantites) / len(quantites)) ** 0.5
-        
-        # Si la prévision est supérieure à la moyenne + écart-type, bonne récolte probable
-        if quantite_prevue > moyenne + ecart_type:
-            probabilite_bonne = 70
-            probabilite_mauvaise = 30
-            prediction = 'bonne'
-        elif quantite_prevue < moyenne - ecart_type:
-            probabilite_bonne = 30
-            probabilite_mauvaise = 70
-            prediction = 'mauvaise'
+        prevision = forecast_series([(exploitation_id, type_culture)], request.args.get('modele'))[0]
+        return jsonify(prevision), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@recoltes_bp.route('/prevision/batch', methods=['POST'])
+@jwt_required()
+def get_previsions_batch():
+    """
+    Prévisions de toutes les séries d'une région ou d'une liste d'exploitations
+    
+    Body: {"region_id": X} ou {"exploitation_ids": [...]}, avec optionnellement
+    "type_culture" et "modele". Toutes les séries sont ajustées en une passe.
+    """
+    try:
+        data = request.get_json() or {}
+        modele = validate_modele(data.get('modele'))
+        
+        if data.get('region_id'):
+            cles = list_series(region_id=data['region_id'], type_culture=data.get('type_culture'))
+        elif data.get('exploitation_ids'):
+            cles = list_series(exploitation_ids=data['exploitation_ids'], type_culture=data.get('type_culture'))
         else:
-            probabilite_bonne = 50
-            probabilite_mauvaise = 50
-            prediction = 'moyenne'
-        
-        facteurs = {
-            'moyenne_historique': moyenne,
-            'tendance': tendance,
-            'ecart_type': ecart_type,
-            'nombre_recoltes_analysees': len(recoltes)
-        }
+            return jsonify({'error': 'region_id ou exploitation_ids requis'}), 400
         
+        previsions = forecast_series(cles, modele)
         return jsonify({
-            'quantite_prevue': round(quantite_prevue, 2),
-            'probabilite_bonne': round(probabilite_bonne, 1),
-            'probabilite_mauvaise': round(probabilite_mauvaise, 1),
-            'prediction': prediction,
-            'raison': f'Basé sur {len(recoltes)} récoltes historiques',
-            'facteurs': facteurs
+            'previsions': previsions,
+            'nombre': len(previsions)
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
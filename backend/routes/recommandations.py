@@ -6,16 +6,19 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from database import db
 from models.recommandation import Recommandation
 from models.exploitation import Exploitation
-from services.recommandation_service import generate_recommandations
+from services.recommandation_service import generate_recommandations, save_recommandations
 from utils.historique import log_action
-import json
+from routes.utils import list_response
 
 recommandations_bp = Blueprint('recommandations', __name__)
 
 @recommandations_bp.route('', methods=['GET'])
 @jwt_required()
 def get_recommandations():
-    """Liste toutes les recommandations"""
+    """
+    Liste toutes les recommandations
+    Paginée avec ?page=/?per_page=, sinon envoyée en flux (tableau JSON ou ?format=ndjson)
+    """
     try:
         exploitation_id = request.args.get('exploitation_id')
         parcelle_id = request.args.get('parcelle_id')
@@ -27,8 +30,9 @@ def get_recommandations():
         if parcelle_id:
             query = query.filter_by(parcelle_id=parcelle_id)
         
-        recommandations = query.all()
-        return jsonify([r.to_dict() for r in recommandations]), 200
+        return list_response(query.order_by(Recommandation.id)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -47,24 +51,17 @@ def generate_recommandations_for_exploitation(exploitation_id):
         # Générer les recommandations basées sur les données réelles
         recommandations = generate_recommandations(exploitation_id)
         
-        # Sauvegarder les recommandations
-        created_recommendations = []
-        for rec_data in recommandations:
-            recommandation = Recommandation(
-                type_recommandation=rec_data['type_recommandation'],
-                titre=rec_data['titre'],
-                description=rec_data['description'],
-                parametres_utilises=json.dumps(rec_data.get('parametres_utilises', {})),
-                priorite=rec_data.get('priorite', 'moyenne'),
-                exploitation_id=exploitation_id,
-                parcelle_id=rec_data.get('parcelle_id')
-            )
-            db.session.add(recommandation)
-            created_recommendations.append(recommandation)
-        
+        # Sauvegarder les recommandations (mise à jour des recommandations déjà générées)
+        enregistrement = save_recommandations({exploitation_id: recommandations})
         db.session.commit()
-        
-        log_action(user_id, 'generate', 'recommandation', exploitation_id, {'count': len(recommandations)})
+        created_recommendations = Recommandation.query.filter(Recommandation.id.in_(enregistrement['ids']))\
+            .order_by(Recommandation.id).all()
+        
+        log_action(user_id, 'generate', 'recommandation', exploitation_id, {
+            'count': len(recommandations),
+            'creees': enregistrement['creees'],
+            'mises_a_jour': enregistrement['mises_a_jour']
+        })
         
         return jsonify({
             'message': f'{len(recommandations)} recommandations générées',
@@ -1,24 +1,59 @@
 """
 Routes pour la gestion des capteurs IoT
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
 from database import db
-from models.sensor import Sensor, SensorData
+from models.sensor import Sensor, SensorData, SensorRollup
 from models.exploitation import Exploitation
 from utils.historique import log_action
-from routes.utils import get_pagination_params, paginate_query
+from routes.utils import (
+    get_pagination_params, get_cursor_params, decode_cursor, paginate_query, paginate_select,
+    paginate_keyset, list_response, CURSOR_NEXT,
+)
+from services.sensor_service import (
+    ROLLUP_RESOLUTIONS, ingest_sensor_readings, parse_ndjson, parse_sensor_timestamp, update_rollups
+)
+from services.sensor_storage_service import select_sensor_readings, sensor_row_to_dict
+from services.sensor_export_service import MIMETYPES, export_filename, iter_sensor_export
+from sqlalchemy import select
 import json
 
 sensors_bp = Blueprint('sensors', __name__)
 
+def _batch_response(lectures):
+    """Enregistre un lot de mesures et construit la réponse avec le statut de chaque mesure"""
+    if not lectures:
+        return jsonify({'error': 'Aucune mesure fournie'}), 400
+
+    result = ingest_sensor_readings(lectures)
+    status_code = 201 if result['acceptees'] else 400
+    return jsonify({
+        'message': f"{result['acceptees']} mesures enregistrées, {result['rejetees']} rejetées",
+        **result
+    }), status_code
+
 @sensors_bp.route('/data', methods=['POST'])
 def receive_sensor_data():
-    """Endpoint pour recevoir les données des capteurs (peut être public avec authentification par API key)"""
+    """
+    Endpoint pour recevoir les données des capteurs (peut être public avec authentification par API key)
+    Accepte une mesure unique, un tableau de mesures, {"readings": [...]} ou un corps NDJSON
+    (Content-Type: application/x-ndjson) pour l'envoi groupé depuis les passerelles
+    """
     try:
+        if request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+            return _batch_response(parse_ndjson(request.get_data(as_text=True)))
+
         data = request.get_json()
-        
+
+        if isinstance(data, list):
+            return _batch_response(data)
+        if isinstance(data, dict) and isinstance(data.get('readings'), list):
+            return _batch_response(data['readings'])
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Format invalide'}), 400
+
         # Validation des données minimales
         if not data.get('sensor_id') or not data.get('sensor_type') or data.get('value') is None:
             return jsonify({'error': 'sensor_id, sensor_type et value sont requis'}), 400
@@ -41,13 +76,21 @@ def receive_sensor_data():
             longitude=data.get('longitude'),
             parcelle_id=data.get('parcelle_id') or sensor.parcelle_id,
             exploitation_id=data.get('exploitation_id') or sensor.exploitation_id,
-            timestamp=datetime.fromisoformat(data['timestamp'].replace('Z', '+00:00')) if data.get('timestamp') else datetime.utcnow(),
+            timestamp=parse_sensor_timestamp(data.get('timestamp')),
             battery_level=data.get('battery_level'),
             signal_strength=data.get('signal_strength'),
             sensor_metadata=json.dumps(data.get('metadata', {})) if data.get('metadata') else None
         )
         
         db.session.add(sensor_data)
+        update_rollups([{
+            'sensor_id': sensor_data.sensor_id,
+            'sensor_type': sensor_data.sensor_type,
+            'value': sensor_data.value,
+            'timestamp': sensor_data.timestamp,
+            'parcelle_id': sensor_data.parcelle_id,
+            'exploitation_id': sensor_data.exploitation_id,
+        }])
         
         # Mettre à jour le capteur
         sensor.last_reading = datetime.utcnow()
@@ -68,7 +111,12 @@ def receive_sensor_data():
 @sensors_bp.route('/data', methods=['GET'])
 @jwt_required()
 def get_sensor_data():
-    """Récupérer les données des capteurs"""
+    """
+    Récupérer les données des capteurs
+    Avec resolution=1m|1h|1d, retourne les agrégats (min/max/avg/count/last) au lieu des mesures brutes
+    Avec ?cursor= (vide pour la première page), pagination par curseur sur (timestamp, id)
+    (ou (bucket_start, sensor_id) pour les agrégats) : coût constant quelle que soit la profondeur
+    """
     try:
         sensor_id = request.args.get('sensor_id')
         sensor_type = request.args.get('sensor_type')
@@ -76,35 +124,125 @@ def get_sensor_data():
         parcelle_id = request.args.get('parcelle_id', type=int)
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
+        resolution = request.args.get('resolution')
         page, per_page = get_pagination_params()
+        cursor, total = get_cursor_params()
+        
+        if resolution:
+            if resolution not in ROLLUP_RESOLUTIONS:
+                return jsonify({'error': f"resolution doit être l'une de: {', '.join(ROLLUP_RESOLUTIONS)}"}), 400
+            
+            query = SensorRollup.query.filter_by(resolution=resolution)
+            if sensor_id:
+                query = query.filter_by(sensor_id=sensor_id)
+            if sensor_type:
+                query = query.filter_by(sensor_type=sensor_type)
+            if exploitation_id:
+                query = query.filter_by(exploitation_id=exploitation_id)
+            if parcelle_id:
+                query = query.filter_by(parcelle_id=parcelle_id)
+            if start_date:
+                query = query.filter(SensorRollup.bucket_start >= datetime.fromisoformat(start_date))
+            if end_date:
+                query = query.filter(SensorRollup.bucket_start <= datetime.fromisoformat(end_date))
+            
+            if cursor is not None:
+                result = paginate_keyset(
+                    query, [(SensorRollup.bucket_start, True), (SensorRollup.sensor_id, False)],
+                    cursor, per_page, total=total
+                )
+                result['resolution'] = resolution
+                return jsonify(result), 200
+            
+            query = query.order_by(SensorRollup.bucket_start.desc(), SensorRollup.sensor_id)
+            
+            result = paginate_query(query, page, per_page)
+            result['resolution'] = resolution
+            return jsonify(result), 200
+        
+        start = datetime.fromisoformat(start_date) if start_date else None
+        end = datetime.fromisoformat(end_date) if end_date else None
+        if cursor:
+            # La position du curseur borne la plage : seules les partitions restantes sont lues
+            direction, position = decode_cursor(cursor)
+            # Même forme que les clés de tri de paginate_keyset (timestamp, id)
+            if len(position) != 2 or not isinstance(position[0], datetime):
+                raise ValueError('Curseur invalide')
+            if direction == CURSOR_NEXT:
+                end = min(end, position[0]) if end else position[0]
+            else:
+                start = max(start, position[0]) if start else position[0]
+        
+        # Lecture sur la table chaude et les seules partitions mensuelles concernées
+        readings = select_sensor_readings(
+            sensor_id=sensor_id,
+            sensor_type=sensor_type,
+            exploitation_id=exploitation_id,
+            parcelle_id=parcelle_id,
+            start=start,
+            end=end,
+        )
         
-        query = SensorData.query
+        if cursor is not None:
+            result = paginate_keyset(
+                select(readings), [(readings.c.timestamp, True), (readings.c.id, True)],
+                cursor, per_page, serializer=lambda rows: [sensor_row_to_dict(r) for r in rows], total=total
+            )
+            return jsonify(result), 200
         
-        if sensor_id:
-            query = query.filter_by(sensor_id=sensor_id)
-        if sensor_type:
-            query = query.filter_by(sensor_type=sensor_type)
-        if exploitation_id:
-            query = query.filter_by(exploitation_id=exploitation_id)
-        if parcelle_id:
-            query = query.filter_by(parcelle_id=parcelle_id)
-        if start_date:
-            query = query.filter(SensorData.timestamp >= datetime.fromisoformat(start_date))
-        if end_date:
-            query = query.filter(SensorData.timestamp <= datetime.fromisoformat(end_date))
+        query = select(readings).order_by(readings.c.timestamp.desc(), readings.c.id.desc())
         
-        query = query.order_by(SensorData.timestamp.desc())
-        
-        result = paginate_query(query, page, per_page)
+        result = paginate_select(query, page, per_page, sensor_row_to_dict)
         return jsonify(result), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@sensors_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_sensor_readings():
+    """
+    Export en flux des mesures de capteurs, lu sur un curseur serveur
+    format=csv|ndjson|parquet|arrow (parquet/arrow si pyarrow est installé), gzip=1 pour compresser
+    Filtres: sensor_id, sensor_type, exploitation_id, parcelle_id, start_date, end_date
+    """
+    try:
+        format_ = request.args.get('format', 'csv')
+        compress = request.args.get('gzip', '').lower() in ('1', 'true', 'oui')
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        
+        morceaux = iter_sensor_export(
+            format_,
+            compress,
+            sensor_id=request.args.get('sensor_id'),
+            sensor_type=request.args.get('sensor_type'),
+            exploitation_id=request.args.get('exploitation_id', type=int),
+            parcelle_id=request.args.get('parcelle_id', type=int),
+            start=datetime.fromisoformat(start_date) if start_date else None,
+            end=datetime.fromisoformat(end_date) if end_date else None,
+        )
+        response = Response(
+            stream_with_context(morceaux),
+            mimetype='application/gzip' if compress else MIMETYPES[format_],
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename={export_filename(format_, compress)}'
+        return response
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @sensors_bp.route('', methods=['GET'])
 @jwt_required()
 def get_sensors():
-    """Liste tous les capteurs"""
+    """
+    Liste tous les capteurs
+    Paginée avec ?page=/?per_page=, sinon envoyée en flux (tableau JSON ou ?format=ndjson)
+    """
     try:
         exploitation_id = request.args.get('exploitation_id', type=int)
         parcelle_id = request.args.get('parcelle_id', type=int)
@@ -122,9 +260,10 @@ def get_sensors():
         if is_active is not None:
             query = query.filter_by(is_active=is_active)
         
-        sensors = query.all()
-        return jsonify([sensor.to_dict() for sensor in sensors]), 200
+        return list_response(query.order_by(Sensor.id)), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
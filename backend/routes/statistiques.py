@@ -1,19 +1,25 @@
 """
 Routes pour les statistiques et tableaux de bord nationaux
+Les compteurs sont lus dans la table statistiques_agregees, maintenue à
+chaque écriture (voir services/statistique_service.py).
 """
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
-from database import db
-from models.exploitation import Exploitation
-from models.region import Region, Prefecture, Commune
-from models.analyse_sol import AnalyseSol
-from models.intrant import Intrant
-from models.recolte import Recolte
-from sqlalchemy import func, and_
-from datetime import datetime, timedelta
+from models.region import Region, Prefecture
+from services.statistique_service import (
+    SOURCE_AGREGATS, SOURCE_DIRECTE, aggregate_statistiques, evolution_cumulee, shift_date, truncate_date
+)
+from datetime import date, datetime
 
 statistiques_bp = Blueprint('statistiques', __name__)
 
+def _source_statistiques():
+    """Source des compteurs : table agrégée (défaut) ou calcul direct (?source=direct)"""
+    source = request.args.get('source', SOURCE_AGREGATS)
+    if source not in (SOURCE_AGREGATS, SOURCE_DIRECTE):
+        raise ValueError(f"Paramètre source invalide (attendu: {SOURCE_AGREGATS} ou {SOURCE_DIRECTE})")
+    return source
+
 # ========== STATISTIQUES NATIONALES ==========
 
 @statistiques_bp.route('/nationales', methods=['GET'])
@@ -21,63 +27,43 @@ statistiques_bp = Blueprint('statistiques', __name__)
 def get_statistiques_nationales():
     """Statistiques agrégées au niveau national"""
     try:
-        # Nombre total d'exploitations
-        total_exploitations = Exploitation.query.count()
-        
-        # Superficie totale cultivée
-        superficie_totale = db.session.query(func.sum(Exploitation.superficie_totale)).scalar() or 0
+        source = _source_statistiques()
+        totaux = aggregate_statistiques(source=source)
         
         # Répartition par type de culture
-        cultures = db.session.query(
-            Exploitation.type_culture_principal,
-            func.count(Exploitation.id).label('count'),
-            func.sum(Exploitation.superficie_totale).label('superficie')
-        ).filter(Exploitation.type_culture_principal.isnot(None)).group_by(Exploitation.type_culture_principal).all()
-        
         repartition_cultures = [
             {
-                'culture': c[0],
-                'nombre_exploitations': c[1],
-                'superficie_totale': float(c[2]) if c[2] else 0
+                'culture': culture,
+                'nombre_exploitations': stats['nombre_exploitations'],
+                'superficie_totale': float(stats['superficie_totale'])
             }
-            for c in cultures
+            for culture, stats in sorted(aggregate_statistiques('culture', source=source).items())
+            if culture and stats['nombre_exploitations']
         ]
         
         # Répartition par région
-        regions_stats = db.session.query(
-            Region.nom,
-            func.count(Exploitation.id).label('count'),
-            func.sum(Exploitation.superficie_totale).label('superficie')
-        ).outerjoin(Exploitation, Region.id == Exploitation.region_id).group_by(Region.id, Region.nom).all()
-        
-        repartition_regions = [
-            {
-                'region': r[0],
-                'nombre_exploitations': r[1],
-                'superficie_totale': float(r[2]) if r[2] else 0
-            }
-            for r in regions_stats
-        ]
-        
-        # Nombre total d'analyses de sol
-        total_analyses = AnalyseSol.query.count()
-        
-        # Nombre total d'intrants
-        total_intrants = Intrant.query.count()
-        
-        # Nombre total de récoltes
-        total_recoltes = Recolte.query.count()
+        par_region = aggregate_statistiques('region_id', source=source)
+        repartition_regions = []
+        for region in Region.query.order_by(Region.id).all():
+            stats = par_region.get(region.id, {})
+            repartition_regions.append({
+                'region': region.nom,
+                'nombre_exploitations': stats.get('nombre_exploitations', 0),
+                'superficie_totale': float(stats.get('superficie_totale', 0))
+            })
         
         return jsonify({
-            'total_exploitations': total_exploitations,
-            'superficie_totale_cultivee': float(superficie_totale),
+            'total_exploitations': totaux['nombre_exploitations'],
+            'superficie_totale_cultivee': float(totaux['superficie_totale']),
             'repartition_par_culture': repartition_cultures,
             'repartition_par_region': repartition_regions,
-            'total_analyses_sol': total_analyses,
-            'total_intrants': total_intrants,
-            'total_recoltes': total_recoltes,
+            'total_analyses_sol': totaux['nombre_analyses'],
+            'total_intrants': totaux['nombre_intrants'],
+            'total_recoltes': totaux['nombre_recoltes'],
             'date_calcul': datetime.utcnow().isoformat()
         }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -88,55 +74,44 @@ def get_statistiques_nationales():
 def get_statistiques_regionales(region_id):
     """Statistiques pour une région spécifique"""
     try:
+        source = _source_statistiques()
         region = Region.query.get(region_id)
         if not region:
             return jsonify({'error': 'Région non trouvée'}), 404
         
-        # Exploitations de la région
-        exploitations = Exploitation.query.filter_by(region_id=region_id).all()
-        total_exploitations = len(exploitations)
-        superficie_totale = sum(e.superficie_totale for e in exploitations)
+        totaux = aggregate_statistiques(region_id=region_id, source=source)
         
         # Répartition par préfecture
+        prefectures = region.prefectures
+        par_prefecture = aggregate_statistiques('prefecture_id', prefecture_id=[p.id for p in prefectures], source=source)
         prefectures_stats = []
-        for prefecture in region.prefectures:
-            prefecture_exploitations = Exploitation.query.filter_by(prefecture_id=prefecture.id).all()
+        for prefecture in prefectures:
+            stats = par_prefecture.get(prefecture.id, {})
             prefectures_stats.append({
                 'prefecture_id': prefecture.id,
                 'prefecture_nom': prefecture.nom,
-                'nombre_exploitations': len(prefecture_exploitations),
-                'superficie_totale': sum(e.superficie_totale for e in prefecture_exploitations)
+                'nombre_exploitations': stats.get('nombre_exploitations', 0),
+                'superficie_totale': float(stats.get('superficie_totale', 0))
             })
         
         # Répartition par culture
-        cultures = {}
-        for exploitation in exploitations:
-            if exploitation.type_culture_principal:
-                if exploitation.type_culture_principal not in cultures:
-                    cultures[exploitation.type_culture_principal] = {
-                        'nombre': 0,
-                        'superficie': 0
-                    }
-                cultures[exploitation.type_culture_principal]['nombre'] += 1
-                cultures[exploitation.type_culture_principal]['superficie'] += exploitation.superficie_totale
-        
         repartition_cultures = [
-            {'culture': k, **v} for k, v in cultures.items()
+            {'culture': culture, 'nombre': stats['nombre_exploitations'], 'superficie': float(stats['superficie_totale'])}
+            for culture, stats in sorted(aggregate_statistiques('culture', region_id=region_id, source=source).items())
+            if culture and stats['nombre_exploitations']
         ]
         
-        # Analyses de sol dans la région
-        exploitation_ids = [e.id for e in exploitations]
-        total_analyses = AnalyseSol.query.filter(AnalyseSol.exploitation_id.in_(exploitation_ids)).count()
-        
         return jsonify({
-            'region': region.to_dict(),
-            'total_exploitations': total_exploitations,
-            'superficie_totale_cultivee': superficie_totale,
+            'region': region.to_dict(exploitations_count=totaux['nombre_exploitations']),
+            'total_exploitations': totaux['nombre_exploitations'],
+            'superficie_totale_cultivee': float(totaux['superficie_totale']),
             'repartition_par_prefecture': prefectures_stats,
             'repartition_par_culture': repartition_cultures,
-            'total_analyses_sol': total_analyses,
+            'total_analyses_sol': totaux['nombre_analyses'],
             'date_calcul': datetime.utcnow().isoformat()
         }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -147,32 +122,31 @@ def get_statistiques_regionales(region_id):
 def comparer_regions():
     """Compare les statistiques entre toutes les régions"""
     try:
-        regions = Region.query.all()
-        comparaison = []
+        source = _source_statistiques()
+        par_region = aggregate_statistiques('region_id', source=source)
         
-        for region in regions:
-            exploitations = Exploitation.query.filter_by(region_id=region.id).all()
-            superficie_totale = sum(e.superficie_totale for e in exploitations)
-            
-            # Moyenne de superficie par exploitation
-            superficie_moyenne = superficie_totale / len(exploitations) if exploitations else 0
-            
-            # Types de cultures les plus fréquents
-            cultures = {}
-            for e in exploitations:
-                if e.type_culture_principal:
-                    cultures[e.type_culture_principal] = cultures.get(e.type_culture_principal, 0) + 1
-            
-            culture_principale = max(cultures.items(), key=lambda x: x[1])[0] if cultures else None
+        # Types de cultures les plus fréquents par région
+        cultures = {}
+        for (region_id, culture), stats in aggregate_statistiques(('region_id', 'culture'), source=source).items():
+            nombre = stats['nombre_exploitations']
+            if culture and nombre and (region_id not in cultures or nombre > cultures[region_id][1]):
+                cultures[region_id] = (culture, nombre)
+        
+        comparaison = []
+        for region in Region.query.order_by(Region.id).all():
+            stats = par_region.get(region.id, {})
+            nombre_exploitations = stats.get('nombre_exploitations', 0)
+            superficie_totale = float(stats.get('superficie_totale', 0))
             
             comparaison.append({
                 'region_id': region.id,
                 'region_nom': region.nom,
                 'region_code': region.code,
-                'nombre_exploitations': len(exploitations),
+                'nombre_exploitations': nombre_exploitations,
                 'superficie_totale': superficie_totale,
-                'superficie_moyenne_par_exploitation': superficie_moyenne,
-                'culture_principale': culture_principale,
+                # Moyenne de superficie par exploitation
+                'superficie_moyenne_par_exploitation': superficie_totale / nombre_exploitations if nombre_exploitations else 0,
+                'culture_principale': cultures[region.id][0] if region.id in cultures else None,
                 'pourcentage_superficie_nationale': 0  # Sera calculé côté client
             })
         
@@ -187,6 +161,8 @@ def comparer_regions():
             'superficie_nationale_totale': superficie_nationale,
             'date_calcul': datetime.utcnow().isoformat()
         }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -197,31 +173,35 @@ def comparer_regions():
 def get_statistiques_prefecture(prefecture_id):
     """Statistiques pour une préfecture spécifique"""
     try:
+        source = _source_statistiques()
         prefecture = Prefecture.query.get(prefecture_id)
         if not prefecture:
             return jsonify({'error': 'Préfecture non trouvée'}), 404
         
-        exploitations = Exploitation.query.filter_by(prefecture_id=prefecture_id).all()
-        superficie_totale = sum(e.superficie_totale for e in exploitations)
+        totaux = aggregate_statistiques(prefecture_id=prefecture_id, source=source)
         
         # Répartition par commune
+        communes = prefecture.communes
+        par_commune = aggregate_statistiques('commune_id', commune_id=[c.id for c in communes], source=source)
         communes_stats = []
-        for commune in prefecture.communes:
-            commune_exploitations = Exploitation.query.filter_by(commune_id=commune.id).all()
+        for commune in communes:
+            stats = par_commune.get(commune.id, {})
             communes_stats.append({
                 'commune_id': commune.id,
                 'commune_nom': commune.nom,
-                'nombre_exploitations': len(commune_exploitations),
-                'superficie_totale': sum(e.superficie_totale for e in commune_exploitations)
+                'nombre_exploitations': stats.get('nombre_exploitations', 0),
+                'superficie_totale': float(stats.get('superficie_totale', 0))
             })
         
         return jsonify({
-            'prefecture': prefecture.to_dict(),
-            'total_exploitations': len(exploitations),
-            'superficie_totale_cultivee': superficie_totale,
+            'prefecture': prefecture.to_dict(exploitations_count=totaux['nombre_exploitations']),
+            'total_exploitations': totaux['nombre_exploitations'],
+            'superficie_totale_cultivee': float(totaux['superficie_totale']),
             'repartition_par_commune': communes_stats,
             'date_calcul': datetime.utcnow().isoformat()
         }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -230,44 +210,44 @@ def get_statistiques_prefecture(prefecture_id):
 @statistiques_bp.route('/evolution', methods=['GET'])
 @jwt_required()
 def get_evolution_temporelle():
-    """Évolution des statistiques dans le temps"""
+    """
+    Évolution des statistiques dans le temps
+    Paramètres: entite (exploitations, analyses, intrants, recoltes, mesures),
+    granularite (jour, semaine, mois, annee), debut et fin (AAAA-MM-JJ), region_id.
+    L'ancien paramètre periode (annee, mois, semaine) reste accepté.
+    """
     try:
         # Paramètres de période
         periode = request.args.get('periode', 'annee')  # annee, mois, semaine
+        granularite = request.args.get('granularite') or (periode if periode in ('annee', 'mois') else 'semaine')
+        entite = request.args.get('entite', 'exploitations')
         region_id = request.args.get('region_id', type=int)
         
-        # Calculer la période
-        if periode == 'annee':
-            # 5 dernières années
-            dates = [datetime.now() - timedelta(days=365*i) for i in range(5, 0, -1)]
-        elif periode == 'mois':
-            # 12 derniers mois
-            dates = [datetime.now() - timedelta(days=30*i) for i in range(12, 0, -1)]
+        fin = request.args.get('fin')
+        fin = date.fromisoformat(fin) if fin else datetime.now().date()
+        debut = request.args.get('debut')
+        if debut:
+            debut = date.fromisoformat(debut)
         else:
-            # 4 dernières semaines
-            dates = [datetime.now() - timedelta(weeks=i) for i in range(4, 0, -1)]
+            # Par défaut : 5 années, 12 mois, 4 semaines ou 30 jours jusqu'à la date de fin
+            points = {'annee': 5, 'mois': 12, 'semaine': 4, 'jour': 30}.get(granularite, 12)
+            debut = shift_date(truncate_date(fin, granularite), granularite, 1 - points)
         
-        evolution = []
-        query = Exploitation.query
-        
-        if region_id:
-            query = query.filter_by(region_id=region_id)
-        
-        for date in dates:
-            exploitations_avant = query.filter(Exploitation.created_at <= date).count()
-            evolution.append({
-                'date': date.isoformat(),
-                'nombre_exploitations': exploitations_avant
-            })
+        evolution = evolution_cumulee(entite, granularite, debut, fin, region_id=region_id)
+        if entite == 'exploitations':
+            for point in evolution:
+                point['nombre_exploitations'] = point['cumul']
         
         return jsonify({
             'periode': periode,
+            'granularite': granularite,
+            'entite': entite,
+            'debut': debut.isoformat(),
+            'fin': fin.isoformat(),
             'evolution': evolution,
             'region_id': region_id
         }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-
-
-
-
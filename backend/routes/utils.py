@@ -1,7 +1,23 @@
 """
 Utilitaires pour les routes API
 """
-from flask import request
+import base64
+import json
+from datetime import date, datetime
+from itertools import islice
+
+from flask import Response, current_app, jsonify, request, stream_with_context
+from sqlalchemy import and_, func, or_, select, text, tuple_
+from sqlalchemy.sql import Select
+from database import db
+
+CURSOR_NEXT = 'next'
+CURSOR_PREV = 'prev'
+TOTAL_MODES = ('none', 'exact', 'estimate')
+FORMAT_JSON = 'json'
+FORMAT_NDJSON = 'ndjson'
+LIST_FORMATS = (FORMAT_JSON, FORMAT_NDJSON)
+STREAM_BATCH_SIZE = 500
 
 def get_pagination_params():
     """Récupère les paramètres de pagination depuis la requête"""
@@ -16,8 +32,12 @@ def get_pagination_params():
     
     return page, per_page
 
-def paginate_query(query, page, per_page):
-    """Pagine une requête SQLAlchemy"""
+def paginate_query(query, page, per_page, serializer=None):
+    """
+    Pagine une requête SQLAlchemy
+    `serializer` reçoit la liste des objets de la page et retourne leurs dictionnaires
+    (par défaut to_dict() de chaque objet), voir utils/serialization.py
+    """
     pagination = query.paginate(
         page=page,
         per_page=per_page,
@@ -25,7 +45,7 @@ def paginate_query(query, page, per_page):
     )
     
     return {
-        'items': [item.to_dict() for item in pagination.items],
+        'items': serializer(pagination.items) if serializer else [item.to_dict() for item in pagination.items],
         'total': pagination.total,
         'page': page,
         'per_page': per_page,
@@ -34,6 +54,237 @@ def paginate_query(query, page, per_page):
         'has_prev': pagination.has_prev,
     }
 
+def paginate_select(stmt, page, per_page, serializer):
+    """
+    Pagine une requête SQLAlchemy Core (SELECT / sous-requête)
+    Retourne le même format que paginate_query, chaque ligne étant sérialisée par `serializer`
+    """
+    total = db.session.execute(
+        select(func.count()).select_from(stmt.order_by(None).subquery())
+    ).scalar() or 0
+    rows = db.session.execute(stmt.limit(per_page).offset((page - 1) * per_page)).all()
+    pages = (total + per_page - 1) // per_page if total else 0
+    
+    return {
+        'items': [serializer(row) for row in rows],
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': pages,
+        'has_next': page < pages,
+        'has_prev': page > 1,
+    }
+
+def get_cursor_params():
+    """
+    Paramètres de pagination par curseur (keyset)
+
+    Le mode curseur est actif dès que ?cursor= est présent (vide pour la première page).
+    ?total=none|exact|estimate choisit le calcul du total (aucun par défaut).
+
+    Returns:
+        Tuple (curseur ou None si mode page, mode de total)
+    """
+    cursor = request.args.get('cursor')
+    total = request.args.get('total', 'none')
+    if total not in TOTAL_MODES:
+        raise ValueError(f"Paramètre total invalide (attendu: {', '.join(TOTAL_MODES)})")
+    return cursor, total
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        raise ValueError('Curseur invalide')
+    return value
+
+def encode_cursor(direction, values):
+    """Curseur opaque (base64 URL) pour une direction et les valeurs des colonnes de tri"""
+    payload = json.dumps([direction, [_encode_value(v) for v in values]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Décode un curseur produit par encode_cursor
+
+    Returns:
+        Tuple (direction, liste des valeurs), ou (CURSOR_NEXT, None) pour un curseur vide
+    Raises:
+        ValueError: curseur illisible
+    """
+    if not cursor:
+        return CURSOR_NEXT, None
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (ValueError, TypeError) as e:
+        raise ValueError('Curseur invalide') from e
+    if direction not in (CURSOR_NEXT, CURSOR_PREV) or not isinstance(values, list):
+        raise ValueError('Curseur invalide')
+    return direction, [_decode_value(v) for v in values]
+
+def _keyset_condition(columns, values, after):
+    """
+    Condition « strictement après » (ou avant) la position `values` dans l'ordre `columns`
+    Comparaison de tuples quand toutes les colonnes ont le même sens (plage d'index),
+    sinon développement (a > x) OR (a = x AND b > y) ...
+    """
+    descendings = {desc for _, desc in columns}
+    if len(descendings) == 1:
+        key = tuple_(*[column for column, _ in columns])
+        bound = tuple_(*values)
+        return key < bound if descendings.pop() == after else key > bound
+
+    conditions = []
+    for i, (column, desc) in enumerate(columns):
+        greater = desc != after
+        comparison = column > values[i] if greater else column < values[i]
+        conditions.append(and_(*[c == v for (c, _), v in zip(columns[:i], values[:i])], comparison))
+    return or_(*conditions)
+
+def _estimate_total(stmt):
+    """Estimation du nombre de lignes par le planificateur (PostgreSQL), sinon comptage exact"""
+    if db.engine.dialect.name == 'postgresql':
+        compiled = stmt.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+        plan = db.session.execute(text(f'EXPLAIN (FORMAT JSON) {compiled}')).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    return db.session.execute(select(func.count()).select_from(stmt.order_by(None).subquery())).scalar() or 0
+
+def paginate_keyset(query, columns, cursor, per_page, serializer=None, total='none'):
+    """
+    Pagine une requête par curseur (keyset) : WHERE (colonnes de tri) < position, LIMIT n+1
+
+    Le coût d'une page ne dépend pas de sa profondeur (pas d'OFFSET ni de COUNT(*)).
+
+    Args:
+        query: Query ORM ou SELECT Core (filtres déjà appliqués, l'ordre est remplacé)
+        columns: Liste de (colonne, décroissant) formant une clé unique, ex.
+            [(SensorData.timestamp, True), (SensorData.id, True)] ; colonnes non nulles
+        cursor: Curseur reçu (None ou '' pour la première page)
+        per_page: Taille de page
+        serializer: Reçoit la liste des éléments (objets ou lignes) de la page
+            (par défaut to_dict() de chaque élément)
+        total: 'none' (pas de total), 'exact' (COUNT) ou 'estimate'
+
+    Returns:
+        Dictionnaire {items, per_page, next_cursor, prev_cursor, has_next, has_prev, total}
+    """
+    direction, values = decode_cursor(cursor)
+    if values is not None and len(values) != len(columns):
+        raise ValueError('Curseur invalide')
+    forward = direction == CURSOR_NEXT
+
+    base = query
+    if values is not None:
+        query = query.filter(_keyset_condition(columns, values, after=forward))
+    ordering = [
+        column.desc() if desc == forward else column.asc()
+        for column, desc in columns
+    ]
+    query = query.order_by(None).order_by(*ordering).limit(per_page + 1)
+
+    is_core = isinstance(query, Select)
+    rows = db.session.execute(query).all() if is_core else query.all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    def position(item):
+        return [getattr(item, column.key) for column, _ in columns]
+
+    has_next = has_more if forward else True
+    has_prev = values is not None if forward else has_more
+    result = {
+        'items': serializer(rows) if serializer else [item.to_dict() for item in rows],
+        'per_page': per_page,
+        'next_cursor': encode_cursor(CURSOR_NEXT, position(rows[-1])) if rows and has_next else None,
+        'prev_cursor': encode_cursor(CURSOR_PREV, position(rows[0])) if rows and has_prev else None,
+        'has_next': has_next and bool(rows),
+        'has_prev': has_prev and bool(rows),
+        'total': None,
+    }
+    if total != 'none':
+        stmt = base if is_core else base.statement
+        if total == 'exact':
+            result['total'] = db.session.execute(
+                select(func.count()).select_from(stmt.order_by(None).subquery())
+            ).scalar() or 0
+        else:
+            result['total'] = _estimate_total(stmt)
+    return result
+
+def get_list_format():
+    """
+    Format de flux demandé par ?format=json|ndjson (ou Accept: application/x-ndjson)
+    """
+    format_ = request.args.get('format')
+    if format_ is None:
+        accept = request.accept_mimetypes
+        ndjson = max(accept['application/x-ndjson'], accept['application/ndjson'])
+        format_ = FORMAT_NDJSON if ndjson and ndjson > accept['application/json'] else FORMAT_JSON
+    if format_ not in LIST_FORMATS:
+        raise ValueError(f"Paramètre format invalide (attendu: {', '.join(LIST_FORMATS)})")
+    return format_
+
+def stream_query(query, serializer=None, format_=FORMAT_JSON, batch_size=STREAM_BATCH_SIZE):
+    """
+    Réponse en flux d'une requête ORM, lue par lots sur un curseur serveur (yield_per)
+
+    La mémoire utilisée ne dépend que de la taille des lots : chaque lot est
+    sérialisé puis envoyé avant la lecture du suivant.
+
+    Args:
+        query: Query ORM (filtres et tri déjà appliqués)
+        serializer: Reçoit la liste des objets d'un lot et retourne leurs dictionnaires
+            (par défaut to_dict() de chaque objet)
+        format_: 'json' (tableau JSON envoyé par morceaux) ou 'ndjson' (un objet par ligne)
+        batch_size: Nombre d'objets lus et sérialisés à la fois
+    """
+    def generate():
+        dumps = current_app.json.dumps
+        rows = iter(query.yield_per(batch_size))
+        premier = True
+        if format_ == FORMAT_JSON:
+            yield '['
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            items = serializer(batch) if serializer else [item.to_dict() for item in batch]
+            if format_ == FORMAT_NDJSON:
+                yield ''.join(dumps(item) + '\n' for item in items)
+            else:
+                morceau = ','.join(dumps(item) for item in items)
+                yield morceau if premier else ',' + morceau
+            premier = False
+        if format_ == FORMAT_JSON:
+            yield ']'
 
+    mimetype = 'application/x-ndjson' if format_ == FORMAT_NDJSON else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
 
+def list_response(query, serializer=None):
+    """
+    Réponse d'une liste : paginée si ?page= ou ?per_page= est fourni (format de
+    paginate_query), sinon toute la liste en flux (tableau JSON par défaut, comme
+    avant, ou NDJSON avec ?format=ndjson)
 
+    Raises:
+        ValueError: format inconnu
+    """
+    if 'page' in request.args or 'per_page' in request.args:
+        page, per_page = get_pagination_params()
+        return jsonify(paginate_query(query, page, per_page, serializer))
+    return stream_query(query, serializer, get_list_format())
@@ -0,0 +1,123 @@
+"""
+Service de cache de la hiérarchie géographique (régions > préfectures > communes)
+
+L'arbre complet est sérialisé une fois puis servi depuis la mémoire du
+processus, avec un ETag fort calculé sur son contenu : deux processus qui
+servent le même arbre renvoient le même ETag, et les clients peuvent faire
+des GET conditionnels (If-None-Match -> 304).
+
+La copie en mémoire est validée à chaque requête contre un numéro de version
+stocké en base (ligne 'hierarchie' de versions_cache, une lecture par clé
+primaire) : ce numéro est incrémenté dans la transaction de toute écriture qui
+crée, modifie ou supprime une région, une préfecture ou une commune, ou qui
+change le rattachement géographique d'une exploitation (les compteurs
+exploitations_count font partie de l'arbre). Une écriture validée par
+n'importe quel processus rend donc l'arbre obsolète dans tous les autres.
+Les écritures en masse qui contournent l'ORM doivent appeler
+invalidate_hierarchie() dans leur transaction.
+"""
+import hashlib
+import threading
+from typing import Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import event, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from database import db
+from models.exploitation import Exploitation
+from models.region import Region, Prefecture, Commune
+from models.version_cache import VersionCache
+from utils.serialization import serialize_hierarchie
+
+ATTRIBUTS_GEOGRAPHIQUES = ('region_id', 'prefecture_id', 'commune_id', 'region', 'prefecture', 'commune')
+NOM_VERSION = 'hierarchie'
+
+_lock = threading.Lock()
+_cache = {'entree': None}  # entree : (version, corps JSON, etag)
+
+
+def hierarchie_version() -> int:
+    """Numéro de version courant de la hiérarchie, lu en base"""
+    version = db.session.execute(
+        select(VersionCache.version).where(VersionCache.nom == NOM_VERSION)
+    ).scalar()
+    return version or 0
+
+
+def _incrementer_version(connexion) -> None:
+    """Incrémente la version dans la transaction de la connexion (crée la ligne au besoin)"""
+    resultat = connexion.execute(
+        update(VersionCache).where(VersionCache.nom == NOM_VERSION).values(version=VersionCache.version + 1)
+    )
+    if not resultat.rowcount:
+        connexion.execute(insert(VersionCache).values(nom=NOM_VERSION, version=1))
+
+
+def clear_hierarchie_cache() -> None:
+    """Vide la copie en mémoire de ce processus (base recréée, tests)"""
+    with _lock:
+        _cache['entree'] = None
+
+
+def invalidate_hierarchie(session: Optional[Session] = None) -> None:
+    """
+    Invalide l'arbre dans tous les processus : incrémente la version dans la
+    transaction de la session (db.session par défaut), effective à son commit
+    """
+    session = session or db.session
+    _incrementer_version(session.connection())
+
+
+def get_hierarchie() -> Tuple[bytes, str, int]:
+    """
+    Hiérarchie complète sérialisée, depuis le cache si elle est à jour
+
+    Returns:
+        Tuple (corps JSON, ETag sans guillemets, version)
+    """
+    # Version lue avant l'arbre : une écriture validée entre les deux donne un
+    # arbre plus récent que sa version, reconstruit à la requête suivante
+    version = hierarchie_version()
+    with _lock:
+        entree = _cache['entree']
+    if entree is not None and entree[0] == version:
+        return entree[1], entree[2], version
+
+    corps = current_app.json.dumps(serialize_hierarchie()).encode('utf-8')
+    etag = hashlib.sha256(corps).hexdigest()[:32]
+    with _lock:
+        _cache['entree'] = (version, corps, etag)
+    return corps, etag, version
+
+
+def _modifie_hierarchie(session: Session) -> bool:
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, (Region, Prefecture, Commune, Exploitation)):
+            return True
+    for obj in session.dirty:
+        if isinstance(obj, (Region, Prefecture, Commune)) and session.is_modified(obj):
+            return True
+        if isinstance(obj, Exploitation):
+            etat = inspect(obj)
+            if any(etat.attrs[a].history.has_changes() for a in ATTRIBUTS_GEOGRAPHIQUES):
+                return True
+    return False
+
+
+@event.listens_for(Session, 'before_flush')
+def _avant_flush(session, flush_context, instances):
+    if _modifie_hierarchie(session):
+        session.info['hierarchie_modifiee'] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _apres_flush(session, flush_context):
+    # Incrément à chaque flush concerné : survit au rollback d'un savepoint antérieur
+    if session.info.pop('hierarchie_modifiee', False):
+        _incrementer_version(session.connection())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _apres_rollback(session):
+    session.info.pop('hierarchie_modifiee', None)
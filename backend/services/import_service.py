@@ -0,0 +1,486 @@
+"""
+Service d'import en masse (récoltes, analyses de sol, intrants, données climatiques)
+
+Le fichier (CSV, NDJSON ou JSON) est lu ligne à ligne et traité par lots :
+- chaque ligne est validée avec le validateur de utils/validators.py utilisé
+  par la création unitaire, puis convertie (types, dates, longueurs) ;
+- les références (exploitation, parcelle) sont vérifiées contre les
+  identifiants existants, chargés en une requête par lot ;
+- les lignes valides d'un lot sont insérées par un INSERT groupé dans un
+  SAVEPOINT ; si le lot échoue, il est rejoué ligne à ligne pour isoler
+  les lignes fautives sans perdre les autres ;
+- chaque lot inséré donne une seule entrée d'historique (action 'import').
+
+En simulation (dry_run), tout l'import est exécuté dans un SAVEPOINT annulé
+à la fin : le résumé est celui d'un import réel, sans rien enregistrer.
+
+Le résultat est un résumé (lignes lues, importées, rejetées, erreurs par
+ligne) et non la liste des enregistrements créés.
+"""
+import csv
+import io
+import json
+import time
+from datetime import date, datetime
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import db
+from models.analyse_sol import AnalyseSol
+from models.donnee_climatique import DonneeClimatique
+from models.exploitation import Exploitation, Parcelle
+from models.historique_action import HistoriqueAction
+from models.intrant import Intrant
+from models.recolte import Recolte
+from services.prevision_service import mark_previsions_invalides
+from services.statistique_service import COMPTEURS_ENFANTS, apply_statistiques_deltas, child_deltas
+from utils.historique import action_values
+from utils.validators import (
+    validate_analyse_sol_data, validate_donnee_climatique_data, validate_intrant_data, validate_recolte_data
+)
+
+FORMAT_CSV = 'csv'
+FORMAT_NDJSON = 'ndjson'
+FORMAT_JSON = 'json'
+IMPORT_FORMATS = (FORMAT_CSV, FORMAT_NDJSON, FORMAT_JSON)
+TAILLE_LOT_IMPORT = 1000
+TAILLE_LOT_MAX = 10000
+MAX_ERREURS_DETAILLEES = 1000
+
+
+def detect_import_format(mimetype: Optional[str], filename: Optional[str] = None) -> str:
+    """
+    Format d'un envoi d'après son type MIME ou l'extension du fichier
+
+    Raises:
+        ValueError: format non reconnu
+    """
+    extension = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else None
+    if mimetype in ('text/csv', 'application/csv') or extension == 'csv':
+        return FORMAT_CSV
+    if mimetype in ('application/x-ndjson', 'application/ndjson') or extension in ('ndjson', 'jsonl'):
+        return FORMAT_NDJSON
+    if mimetype == 'application/json' or extension == 'json':
+        return FORMAT_JSON
+    raise ValueError(f"Format d'import non reconnu (attendu: {', '.join(IMPORT_FORMATS)})")
+
+
+def iter_import_records(flux, format_: str, cle_json: str = 'recoltes') -> Iterator[Tuple[int, object]]:
+    """
+    Enregistrements d'un fichier d'import, avec leur numéro de ligne
+
+    CSV et NDJSON sont lus en flux ; JSON (tableau, ou objet {cle_json: [...]})
+    est chargé en entier. Une ligne illisible est rendue comme une exception
+    pour être comptée en erreur sans interrompre l'import.
+
+    Args:
+        flux: Flux binaire ou texte du fichier
+        format_: csv, ndjson ou json
+
+    Returns:
+        Itérateur de (numéro de ligne, dictionnaire ou exception)
+    """
+    texte = io.TextIOWrapper(flux, encoding='utf-8-sig', newline='') if not isinstance(flux, io.TextIOBase) else flux
+
+    if format_ == FORMAT_CSV:
+        lecteur = csv.DictReader(texte)
+        for numero, ligne in enumerate(lecteur, start=2):  # ligne 1 : en-têtes
+            yield numero, {k.strip(): v for k, v in ligne.items() if k is not None}
+    elif format_ == FORMAT_NDJSON:
+        for numero, ligne in enumerate(texte, start=1):
+            if not ligne.strip():
+                continue
+            try:
+                yield numero, json.loads(ligne)
+            except ValueError as e:
+                yield numero, ValueError(f'JSON invalide ({e.msg})')
+    elif format_ == FORMAT_JSON:
+        try:
+            donnees = json.load(texte)
+        except ValueError as e:
+            raise ValueError(f'JSON invalide ({e})') from e
+        if isinstance(donnees, dict):
+            donnees = donnees.get(cle_json)
+        if not isinstance(donnees, list):
+            raise ValueError(f'Format invalide. Attendu: {{"{cle_json}": [...]}} ou un tableau')
+        for numero, enregistrement in enumerate(donnees, start=1):
+            yield numero, enregistrement
+    else:
+        raise ValueError(f"Format d'import non reconnu (attendu: {', '.join(IMPORT_FORMATS)})")
+
+
+def _vide(valeur) -> bool:
+    return valeur is None or (isinstance(valeur, str) and not valeur.strip())
+
+
+def _entier(donnees: Dict, champ: str, erreurs: List[str], requis=False, minimum=None, maximum=None):
+    valeur = donnees.get(champ)
+    if _vide(valeur):
+        if requis:
+            erreurs.append(f'{champ} est requis')
+        return None
+    try:
+        if isinstance(valeur, bool):
+            raise ValueError
+        nombre = float(valeur)
+        if not nombre.is_integer():
+            raise ValueError
+        nombre = int(nombre)
+    except (ValueError, TypeError):
+        erreurs.append(f'{champ} doit être un entier')
+        return None
+    if (minimum is not None and nombre < minimum) or (maximum is not None and nombre > maximum):
+        erreurs.append(f'{champ} doit être entre {minimum} et {maximum}')
+        return None
+    return nombre
+
+
+def _reel(donnees: Dict, champ: str, erreurs: List[str], requis=False, positif=False):
+    valeur = donnees.get(champ)
+    if _vide(valeur):
+        if requis:
+            erreurs.append(f'{champ} est requis')
+        return None
+    try:
+        if isinstance(valeur, bool):
+            raise ValueError
+        nombre = float(valeur)
+    except (ValueError, TypeError):
+        erreurs.append(f'{champ} doit être un nombre')
+        return None
+    if positif and nombre <= 0:
+        erreurs.append(f'{champ} doit être supérieur à 0')
+        return None
+    return nombre
+
+
+def _texte(donnees: Dict, champ: str, erreurs: List[str], requis=False, longueur=None):
+    valeur = donnees.get(champ)
+    if _vide(valeur):
+        if requis:
+            erreurs.append(f'{champ} est requis')
+        return None
+    valeur = str(valeur).strip()
+    if longueur and len(valeur) > longueur:
+        erreurs.append(f'{champ} dépasse {longueur} caractères')
+        return None
+    return valeur
+
+
+def _date(donnees: Dict, champ: str, erreurs: List[str], requis=False):
+    valeur = donnees.get(champ)
+    if _vide(valeur):
+        if requis:
+            erreurs.append(f'{champ} est requis')
+        return None
+    if isinstance(valeur, date):
+        return valeur.date() if isinstance(valeur, datetime) else valeur
+    try:
+        return datetime.strptime(str(valeur).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        erreurs.append(f'{champ} doit être une date au format AAAA-MM-JJ')
+        return None
+
+
+def parse_recolte(donnees: Dict, user_id=None) -> Tuple[Dict, List[str]]:
+    """
+    Convertit une ligne d'import de récolte
+
+    Returns:
+        Tuple (valeurs des colonnes de Recolte, liste des erreurs)
+    """
+    erreurs = []
+    ligne = {
+        'exploitation_id': _entier(donnees, 'exploitation_id', erreurs, requis=True),
+        'parcelle_id': _entier(donnees, 'parcelle_id', erreurs),
+        'type_culture': _texte(donnees, 'type_culture', erreurs, requis=True, longueur=100),
+        'mois': _entier(donnees, 'mois', erreurs, requis=True, minimum=1, maximum=12),
+        'annee': _entier(donnees, 'annee', erreurs, requis=True, minimum=1900, maximum=2100),
+        'quantite_recoltee': _reel(donnees, 'quantite_recoltee', erreurs, requis=True, positif=True),
+        'unite_mesure': _texte(donnees, 'unite_mesure', erreurs, longueur=20) or 'kg',
+        'superficie_recoltee': _reel(donnees, 'superficie_recoltee', erreurs),
+        'rendement': _reel(donnees, 'rendement', erreurs),
+        'prix_vente': _reel(donnees, 'prix_vente', erreurs),
+        'cout_production': _reel(donnees, 'cout_production', erreurs),
+        'qualite': _texte(donnees, 'qualite', erreurs, longueur=50),
+        'conditions_climatiques': _texte(donnees, 'conditions_climatiques', erreurs),
+        'observations': _texte(donnees, 'observations', erreurs),
+    }
+    if erreurs:
+        return ligne, erreurs
+
+    # Calculer le rendement si possible
+    if ligne['superficie_recoltee'] and ligne['superficie_recoltee'] > 0:
+        ligne['rendement'] = ligne['quantite_recoltee'] / ligne['superficie_recoltee']
+    return ligne, []
+
+
+def parse_analyse_sol(donnees: Dict, user_id=None) -> Tuple[Dict, List[str]]:
+    """
+    Convertit une ligne d'import d'analyse de sol (résultats de laboratoire)
+
+    L'utilisateur qui importe est enregistré comme technicien.
+    """
+    erreurs = []
+    ligne = {
+        'date_prelevement': _date(donnees, 'date_prelevement', erreurs, requis=True),
+        'ph': _reel(donnees, 'ph', erreurs),
+        'humidite': _reel(donnees, 'humidite', erreurs),
+        'texture': _texte(donnees, 'texture', erreurs, longueur=100),
+        'azote_n': _reel(donnees, 'azote_n', erreurs),
+        'phosphore_p': _reel(donnees, 'phosphore_p', erreurs),
+        'potassium_k': _reel(donnees, 'potassium_k', erreurs),
+        'observations': _texte(donnees, 'observations', erreurs),
+        'exploitation_id': _entier(donnees, 'exploitation_id', erreurs, requis=True),
+        'parcelle_id': _entier(donnees, 'parcelle_id', erreurs),
+        'technicien_id': int(user_id) if user_id is not None else None,
+        'data_source': 'manual',
+    }
+    if ligne['technicien_id'] is None:
+        erreurs.append('technicien_id est requis')
+    return ligne, erreurs
+
+
+def parse_intrant(donnees: Dict, user_id=None) -> Tuple[Dict, List[str]]:
+    """Convertit une ligne d'import d'intrant"""
+    erreurs = []
+    ligne = {
+        'type_intrant': _texte(donnees, 'type_intrant', erreurs, requis=True, longueur=100),
+        'nom_commercial': _texte(donnees, 'nom_commercial', erreurs, longueur=200),
+        'quantite': _reel(donnees, 'quantite', erreurs, requis=True, positif=True),
+        'unite': _texte(donnees, 'unite', erreurs, longueur=20) or 'kg',
+        'date_application': _date(donnees, 'date_application', erreurs, requis=True),
+        'culture_concernée': _texte(donnees, 'culture_concernée', erreurs, longueur=100),
+        'exploitation_id': _entier(donnees, 'exploitation_id', erreurs, requis=True),
+        'parcelle_id': _entier(donnees, 'parcelle_id', erreurs),
+    }
+    return ligne, erreurs
+
+
+def parse_donnee_climatique(donnees: Dict, user_id=None) -> Tuple[Dict, List[str]]:
+    """Convertit une ligne d'import de donnée climatique"""
+    erreurs = []
+    ligne = {
+        'date_debut': _date(donnees, 'date_debut', erreurs, requis=True),
+        'date_fin': _date(donnees, 'date_fin', erreurs, requis=True),
+        'temperature_min': _reel(donnees, 'temperature_min', erreurs),
+        'temperature_max': _reel(donnees, 'temperature_max', erreurs),
+        'pluviometrie': _reel(donnees, 'pluviometrie', erreurs),
+        'periode_observée': _texte(donnees, 'periode_observée', erreurs, longueur=100),
+        'exploitation_id': _entier(donnees, 'exploitation_id', erreurs, requis=True),
+    }
+    if ligne['date_debut'] and ligne['date_fin'] and ligne['date_fin'] < ligne['date_debut']:
+        erreurs.append('date_fin doit être postérieure à date_debut')
+    return ligne, erreurs
+
+
+# Types d'import : modèle, validateur partagé avec la création unitaire, conversion
+IMPORTS = {
+    'recoltes': {
+        'model': Recolte, 'entite': 'recolte', 'libelle': 'récoltes',
+        'validateur': validate_recolte_data, 'conversion': parse_recolte,
+    },
+    'analyses_sols': {
+        'model': AnalyseSol, 'entite': 'analyse_sol', 'libelle': 'analyses de sol',
+        'validateur': validate_analyse_sol_data, 'conversion': parse_analyse_sol,
+    },
+    'intrants': {
+        'model': Intrant, 'entite': 'intrant', 'libelle': 'intrants',
+        'validateur': validate_intrant_data, 'conversion': parse_intrant,
+    },
+    'donnees_climatiques': {
+        'model': DonneeClimatique, 'entite': 'donnee_climatique', 'libelle': 'données climatiques',
+        'validateur': validate_donnee_climatique_data, 'conversion': parse_donnee_climatique,
+    },
+}
+
+
+def get_import_spec(type_import: str) -> Dict:
+    """
+    Description d'un type d'import (clé de IMPORTS)
+
+    Raises:
+        ValueError: type d'import inconnu
+    """
+    if type_import not in IMPORTS:
+        raise ValueError(f"Type d'import invalide (attendu: {', '.join(IMPORTS)})")
+    return IMPORTS[type_import]
+
+
+def prepare_record(type_import: str, donnees, user_id=None) -> Tuple[Optional[Dict], List[str]]:
+    """
+    Valide puis convertit un enregistrement d'import
+
+    Les cellules vides (CSV) sont traitées comme des champs absents avant le
+    passage du validateur.
+
+    Returns:
+        Tuple (valeurs des colonnes ou None, liste des erreurs)
+    """
+    if not isinstance(donnees, dict):
+        return None, ['Enregistrement invalide (objet attendu)']
+    spec = get_import_spec(type_import)
+    donnees = {k: v for k, v in donnees.items() if not _vide(v)}
+    erreurs = spec['validateur'](donnees)
+    if erreurs:
+        return None, erreurs
+    ligne, erreurs = spec['conversion'](donnees, user_id)
+    return (None, erreurs) if erreurs else (ligne, [])
+
+
+def _references(lignes: List[Dict]) -> Tuple[set, Dict[int, int]]:
+    """Exploitations et parcelles (avec leur exploitation) existantes parmi celles d'un lot"""
+    exploitation_ids = {l['exploitation_id'] for l in lignes}
+    parcelle_ids = {l['parcelle_id'] for l in lignes if l.get('parcelle_id') is not None}
+    exploitations = set(db.session.scalars(
+        select(Exploitation.id).where(Exploitation.id.in_(exploitation_ids))
+    ))
+    parcelles = dict(db.session.execute(
+        select(Parcelle.id, Parcelle.exploitation_id).where(Parcelle.id.in_(parcelle_ids))
+    ).all()) if parcelle_ids else {}
+    return exploitations, parcelles
+
+
+def _verifier_references(lignes: List[Tuple[int, Dict]]) -> Tuple[List[Tuple[int, Dict]], List[Tuple[int, List[str]]]]:
+    exploitations, parcelles = _references([l for _, l in lignes])
+    valides, erreurs = [], []
+    for numero, ligne in lignes:
+        parcelle_id = ligne.get('parcelle_id')
+        if ligne['exploitation_id'] not in exploitations:
+            erreurs.append((numero, [f"Exploitation {ligne['exploitation_id']} introuvable"]))
+        elif parcelle_id is not None and parcelle_id not in parcelles:
+            erreurs.append((numero, [f"Parcelle {parcelle_id} introuvable"]))
+        elif parcelle_id is not None and parcelles[parcelle_id] != ligne['exploitation_id']:
+            erreurs.append((numero, [f"La parcelle {parcelle_id} n'appartient pas à l'exploitation {ligne['exploitation_id']}"]))
+        else:
+            valides.append((numero, ligne))
+    return valides, erreurs
+
+
+def _inserer(model, lignes: List[Dict]):
+    """INSERT groupé et mise à jour des statistiques agrégées (dans la transaction courante)"""
+    db.session.execute(insert(model), lignes)
+    if model in COMPTEURS_ENFANTS:
+        comptes = {}
+        for ligne in lignes:
+            comptes[ligne['exploitation_id']] = comptes.get(ligne['exploitation_id'], 0) + 1
+        apply_statistiques_deltas(child_deltas(model, comptes))
+    if model in (AnalyseSol, DonneeClimatique):
+        # Variables des prévisions de récoltes (les nouvelles récoltes sont repérées par identifiant)
+        mark_previsions_invalides(db.session, {l['exploitation_id'] for l in lignes})
+
+
+def _inserer_lot(model, lignes: List[Tuple[int, Dict]]) -> Tuple[int, List[Tuple[int, List[str]]]]:
+    """
+    Insère un lot dans un SAVEPOINT ; en cas d'échec, rejoue ligne à ligne
+
+    Returns:
+        Tuple (nombre de lignes insérées, erreurs par ligne)
+    """
+    try:
+        with db.session.begin_nested():
+            _inserer(model, [l for _, l in lignes])
+        return len(lignes), []
+    except SQLAlchemyError:
+        pass
+
+    inserees, erreurs = 0, []
+    for numero, ligne in lignes:
+        try:
+            with db.session.begin_nested():
+                _inserer(model, [ligne])
+            inserees += 1
+        except SQLAlchemyError as e:
+            erreurs.append((numero, [f'Insertion refusée ({e.__class__.__name__})']))
+    return inserees, erreurs
+
+
+def bulk_import(type_import: str, enregistrements: Iterable[Tuple[int, object]], user_id=None,
+                taille_lot: int = TAILLE_LOT_IMPORT, dry_run: bool = False,
+                max_erreurs: int = MAX_ERREURS_DETAILLEES, details: Optional[Dict] = None) -> Dict:
+    """
+    Importe des enregistrements par lots (sans commit : à la charge de l'appelant)
+
+    Args:
+        type_import: Clé de IMPORTS (recoltes, analyses_sols, intrants, donnees_climatiques)
+        enregistrements: Itérateur de (numéro de ligne, dictionnaire), voir iter_import_records
+        user_id: Utilisateur qui importe (historique ; technicien des analyses de sol)
+        taille_lot: Nombre de lignes validées et insérées à la fois
+        dry_run: Simulation : tout est exécuté puis annulé
+        max_erreurs: Nombre maximal d'erreurs détaillées dans le résumé
+        details: Détails ajoutés à chaque entrée d'historique (ex. format du fichier)
+
+    Returns:
+        Résumé {lignes, importees, rejetees, lots, erreurs, erreurs_tronquees, simulation, duree}
+    """
+    spec = get_import_spec(type_import)
+    if taille_lot < 1 or taille_lot > TAILLE_LOT_MAX:
+        raise ValueError(f'taille_lot doit être entre 1 et {TAILLE_LOT_MAX}')
+
+    debut = time.perf_counter()
+    resume = {'lignes': 0, 'importees': 0, 'rejetees': 0, 'lots': 0, 'erreurs': [],
+              'erreurs_tronquees': False, 'simulation': dry_run}
+
+    def rejeter(numero, messages):
+        resume['rejetees'] += 1
+        if len(resume['erreurs']) < max_erreurs:
+            resume['erreurs'].append({'ligne': numero, 'erreurs': messages})
+        else:
+            resume['erreurs_tronquees'] = True
+
+    simulation = db.session.begin_nested() if dry_run else None
+    try:
+        enregistrements = iter(enregistrements)
+        while True:
+            lot = list(islice(enregistrements, taille_lot))
+            if not lot:
+                break
+            resume['lignes'] += len(lot)
+            resume['lots'] += 1
+
+            lignes = []
+            for numero, donnees in lot:
+                if isinstance(donnees, Exception):
+                    rejeter(numero, [str(donnees)])
+                    continue
+                ligne, erreurs = prepare_record(type_import, donnees, user_id)
+                if erreurs:
+                    rejeter(numero, erreurs)
+                else:
+                    lignes.append((numero, ligne))
+            if not lignes:
+                continue
+
+            lignes, erreurs = _verifier_references(lignes)
+            for numero, messages in erreurs:
+                rejeter(numero, messages)
+            if not lignes:
+                continue
+
+            inserees, erreurs = _inserer_lot(spec['model'], lignes)
+            resume['importees'] += inserees
+            for numero, messages in erreurs:
+                rejeter(numero, messages)
+            if inserees and user_id is not None:
+                # Une seule entrée d'historique par lot
+                db.session.execute(insert(HistoriqueAction), [action_values(
+                    user_id, 'import', spec['entite'], None,
+                    {**(details or {}), 'lot': resume['lots'], 'nombre': inserees,
+                     'rejetees': len(lot) - inserees},
+                )])
+    finally:
+        if simulation is not None:
+            simulation.rollback()
+
+    resume['erreurs'].sort(key=lambda e: e['ligne'])
+    resume['duree'] = round(time.perf_counter() - debut, 3)
+    return resume
+
+
+def bulk_import_recoltes(enregistrements: Iterable[Tuple[int, object]], taille_lot: int = TAILLE_LOT_IMPORT,
+                         max_erreurs: int = MAX_ERREURS_DETAILLEES, **options) -> Dict:
+    """Importe des récoltes par lots (voir bulk_import)"""
+    return bulk_import('recoltes', enregistrements, taille_lot=taille_lot, max_erreurs=max_erreurs, **options)
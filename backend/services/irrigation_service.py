@@ -3,7 +3,25 @@ Service de génération de conseils d'irrigation basés sur la météo
 ⚠️ Basé uniquement sur les données météo réelles fournies
 """
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Besoins en eau selon la culture (valeurs indicatives basées sur données utilisateur)
+BESOINS_EAU_JOURNALIERS = {
+    'maïs': 5.0,  # mm/jour
+    'riz': 8.0,
+    'coton': 6.0,
+    'manioc': 3.0,
+    'igname': 4.0,
+    'tomate': 4.5,
+    'haricot': 3.5,
+}
+BESOIN_EAU_DEFAUT = 4.0
+
+# Nombre de pas de prévision (3h) pour 24h et 48h
+PAS_24H = 8
+PAS_48H = 16
 
 def generate_conseils_irrigation(
     meteo_actuelle: Dict,
@@ -22,119 +40,265 @@ def generate_conseils_irrigation(
     
     Returns:
         Liste de conseils d'irrigation avec paramètres utilisés
+
+    Les règles ne sont écrites qu'une fois, dans generate_conseils_irrigation_batch
+    (appelée ici pour une seule exploitation).
+    """
+    return generate_conseils_irrigation_batch(
+        [meteo_actuelle], [previsions], [derniere_pluviometrie], [type_culture]
+    )[0]
+
+
+# --- Variante vectorisée (NumPy) pour le calcul sur de nombreuses exploitations ---
+
+def _valeur(value) -> float:
+    """None -> NaN pour la construction des tableaux"""
+    return np.nan if value is None else float(value)
+
+
+def forecast_arrays(previsions_par_exploitation: Sequence[List[Dict]]):
+    """
+    Convertit des listes de prévisions (pas de 3h) en tableaux alignés
+
+    Args:
+        previsions_par_exploitation: Une liste de prévisions par exploitation
+
+    Returns:
+        Tuple (pluie, nb_previsions) : pluie de forme (exploitations, pas) complétée
+        par des zéros, et nombre de prévisions disponibles par exploitation
+    """
+    nb_previsions = np.array([len(p) for p in previsions_par_exploitation], dtype=np.int64)
+    pas = max(int(nb_previsions.max()) if len(nb_previsions) else 0, 1)
+    pluie = np.zeros((len(previsions_par_exploitation), pas))
+    for i, previsions in enumerate(previsions_par_exploitation):
+        pluie[i, :len(previsions)] = [p.get('pluviometrie', 0) or 0 for p in previsions]
+    return pluie, nb_previsions
+
+
+def besoins_eau(types_culture: Sequence[Optional[str]]) -> np.ndarray:
+    """Besoin en eau journalier (mm) de chaque exploitation selon sa culture"""
+    return np.array([
+        BESOINS_EAU_JOURNALIERS.get(t.lower() if t else '', BESOIN_EAU_DEFAUT) for t in types_culture
+    ])
+
+
+def rolling_rain(pluie: np.ndarray, pas: int) -> np.ndarray:
+    """
+    Cumul de pluie sur une fenêtre glissante de `pas` prévisions
+
+    Args:
+        pluie: Tableau (exploitations, pas de temps)
+        pas: Taille de la fenêtre (8 = 24h, 16 = 48h)
+
+    Returns:
+        Tableau (exploitations, horizons) : cumul pour chaque heure de départ
+    """
+    cumul = np.cumsum(pluie, axis=1)
+    cumul = np.concatenate([np.zeros((pluie.shape[0], 1)), cumul], axis=1)
+    return cumul[:, pas:] - cumul[:, :-pas]
+
+
+def rolling_deficits(pluie: np.ndarray, besoin_eau: np.ndarray, jours: int = 1) -> np.ndarray:
+    """
+    Déficit hydrique (besoin - pluie prévue) sur des fenêtres glissantes de 24h × jours,
+    pour chaque exploitation et chaque heure de départ
+
+    Args:
+        pluie: Tableau (exploitations, pas de temps de 3h)
+        besoin_eau: Besoin journalier par exploitation (mm)
+        jours: Longueur de la fenêtre en jours
+
+    Returns:
+        Tableau (exploitations, horizons)
+    """
+    return (besoin_eau * jours)[:, None] - rolling_rain(pluie, PAS_24H * jours)
+
+
+def compute_irrigation_batch(
+    pluie_actuelle: np.ndarray,
+    temperature_max: np.ndarray,
+    humidite: np.ndarray,
+    pluie_previsions: np.ndarray,
+    nb_previsions: np.ndarray,
+    besoin_eau: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    Évalue les règles d'irrigation de N exploitations en une passe
+
+    Les cumuls 24h/48h sont lus dans un cumul unique. Les valeurs manquantes
+    sont des NaN (pluie manquante = 0).
+
+    Args:
+        pluie_actuelle: Pluie actuelle (N,)
+        temperature_max: Température maximale (N,)
+        humidite: Humidité relative (N,)
+        pluie_previsions: Pluie prévue par pas de 3h (N, T), complétée par des zéros
+        nb_previsions: Nombre de prévisions disponibles (N,)
+        besoin_eau: Besoin journalier (N,)
+
+    Returns:
+        Dictionnaire de tableaux (N,) : cumuls, déficits et masques de chaque conseil
     """
-    conseils = []
-    parametres_utilises = {
-        'temperature_actuelle': meteo_actuelle.get('temperature'),
-        'humidite_actuelle': meteo_actuelle.get('humidite'),
-        'pluviometrie_actuelle': meteo_actuelle.get('pluviometrie', 0),
-        'date_analyse': datetime.now().isoformat(),
+    pluie_actuelle = np.nan_to_num(pluie_actuelle, nan=0.0)
+    cumul = np.cumsum(pluie_previsions, axis=1)
+    cumul = np.concatenate([np.zeros((cumul.shape[0], 1)), cumul], axis=1)
+    pas = cumul.shape[1] - 1
+
+    pluie_24h = cumul[:, min(PAS_24H, pas)]
+    pluie_48h = cumul[:, min(PAS_48H, pas)]
+    pluie_totale = pluie_actuelle + pluie_24h
+    besoin_24h = besoin_eau * 1
+    deficit = besoin_24h - pluie_totale
+    besoin_48h = besoin_eau * 2
+    deficit_48h = besoin_48h - pluie_48h
+
+    urgente = deficit > 5
+    recommandee = ~urgente & (deficit > 2)
+    non_necessaire = ~urgente & ~recommandee & (pluie_totale >= besoin_24h)
+    with np.errstate(invalid='ignore'):
+        chaleur = temperature_max > 35
+        air_sec = (humidite != 0) & (humidite < 40)
+    planification = (nb_previsions >= PAS_48H) & (deficit_48h > 10)
+
+    return {
+        'pluie_actuelle': pluie_actuelle,
+        'pluie_24h': pluie_24h,
+        'pluie_totale': pluie_totale,
+        'besoin_eau': besoin_eau,
+        'besoin_24h': besoin_24h,
+        'deficit': deficit,
+        'pluie_48h': pluie_48h,
+        'deficit_48h': deficit_48h,
+        'urgente': urgente,
+        'recommandee': recommandee,
+        'non_necessaire': non_necessaire,
+        'chaleur': chaleur,
+        'air_sec': air_sec,
+        'planification': planification,
     }
 
-    # 1. Analyse de la pluviométrie actuelle et prévue
-    pluviometrie_actuelle = meteo_actuelle.get('pluviometrie', 0) or 0
-    pluviometrie_prevue_24h = sum(
-        p.get('pluviometrie', 0) or 0 for p in previsions[:8]  # 8 * 3h = 24h
+
+def generate_conseils_irrigation_batch(
+    meteos_actuelles: Sequence[Dict],
+    previsions_par_exploitation: Sequence[List[Dict]],
+    dernieres_pluviometries: Optional[Sequence[Optional[float]]] = None,
+    types_culture: Optional[Sequence[Optional[str]]] = None,
+) -> List[List[Dict]]:
+    """
+    Génère les conseils d'irrigation de nombreuses exploitations
+
+    Seule implémentation des règles de conseil (generate_conseils_irrigation
+    l'appelle pour une exploitation) ; les calculs sont faits par
+    compute_irrigation_batch (seuils de déficit, chaleur, air sec, 48h), la
+    rédaction des conseils ci-dessous.
+
+    Args:
+        meteos_actuelles: Météo actuelle de chaque exploitation
+        previsions_par_exploitation: Prévisions de chaque exploitation
+        dernieres_pluviometries: Dernière pluviométrie enregistrée (mm) par exploitation
+        types_culture: Type de culture par exploitation
+
+    Returns:
+        Liste (par exploitation) de listes de conseils
+    """
+    n = len(meteos_actuelles)
+    dernieres_pluviometries = dernieres_pluviometries or [None] * n
+    types_culture = types_culture or [None] * n
+
+    pluie, nb_previsions = forecast_arrays(previsions_par_exploitation)
+    r = compute_irrigation_batch(
+        pluie_actuelle=np.array([_valeur(m.get('pluviometrie', 0) or 0) for m in meteos_actuelles]),
+        temperature_max=np.array([_valeur(m.get('temperature_max', m.get('temperature'))) for m in meteos_actuelles]),
+        humidite=np.array([_valeur(m.get('humidite')) for m in meteos_actuelles]),
+        pluie_previsions=pluie,
+        nb_previsions=nb_previsions,
+        besoin_eau=besoins_eau(types_culture),
     )
-    pluviometrie_totale = pluviometrie_actuelle + pluviometrie_prevue_24h
-
-    parametres_utilises['pluviometrie_prevue_24h'] = pluviometrie_prevue_24h
-    parametres_utilises['pluviometrie_totale'] = pluviometrie_totale
-
-    # 2. Analyse de la température
-    temperature = meteo_actuelle.get('temperature')
-    temperature_max = meteo_actuelle.get('temperature_max', temperature)
-    humidite = meteo_actuelle.get('humidite')
-
-    # 3. Besoins en eau selon la culture (valeurs indicatives basées sur données utilisateur)
-    besoins_eau_journaliers = {
-        'maïs': 5.0,  # mm/jour
-        'riz': 8.0,
-        'coton': 6.0,
-        'manioc': 3.0,
-        'igname': 4.0,
-        'tomate': 4.5,
-        'haricot': 3.5,
-    }
-    
-    besoin_eau = besoins_eau_journaliers.get(type_culture.lower() if type_culture else '', 4.0)
-    parametres_utilises['besoin_eau_culture'] = besoin_eau
-    parametres_utilises['type_culture'] = type_culture
-
-    # 4. Calcul du déficit hydrique
-    besoin_eau_24h = besoin_eau * 1  # Besoin pour 24h
-    deficit_hydrique = besoin_eau_24h - pluviometrie_totale
-
-    parametres_utilises['besoin_eau_24h'] = besoin_eau_24h
-    parametres_utilises['deficit_hydrique'] = deficit_hydrique
-
-    # 5. Conseils basés sur le déficit hydrique
-    if deficit_hydrique > 5:
-        conseils.append({
-            'type': 'irrigation_urgente',
-            'titre': 'Irrigation urgente recommandée',
-            'description': f'Le déficit hydrique est de {deficit_hydrique:.1f} mm. '
-                          f'La pluviométrie prévue ({pluviometrie_prevue_24h:.1f} mm) est insuffisante '
-                          f'pour couvrir les besoins de la culture ({besoin_eau_24h:.1f} mm/jour). '
-                          f'Irrigation immédiate recommandée.',
-            'quantite_recommandee': f'{deficit_hydrique:.1f} mm',
-            'priorite': 'élevée',
-            'parametres_utilises': parametres_utilises.copy(),
-        })
-    elif deficit_hydrique > 2:
-        conseils.append({
-            'type': 'irrigation_recommandee',
-            'titre': 'Irrigation recommandée',
-            'description': f'Déficit hydrique modéré de {deficit_hydrique:.1f} mm. '
-                          f'Irrigation complémentaire recommandée pour optimiser la croissance.',
-            'quantite_recommandee': f'{deficit_hydrique:.1f} mm',
-            'priorite': 'moyenne',
-            'parametres_utilises': parametres_utilises.copy(),
-        })
-    elif pluviometrie_totale >= besoin_eau_24h:
-        conseils.append({
-            'type': 'irrigation_non_necessaire',
-            'titre': 'Irrigation non nécessaire',
-            'description': f'La pluviométrie prévue ({pluviometrie_prevue_24h:.1f} mm) '
-                          f'couvre les besoins de la culture. Aucune irrigation supplémentaire nécessaire pour le moment.',
-            'quantite_recommandee': '0 mm',
-            'priorite': 'faible',
-            'parametres_utilises': parametres_utilises.copy(),
-        })
+    # Conversion unique en types Python (sérialisables en JSON)
+    r = {cle: valeurs.tolist() for cle, valeurs in r.items()}
+    date_analyse = datetime.now().isoformat()
 
-    # 6. Conseils basés sur la température élevée
-    if temperature_max and temperature_max > 35:
-        conseils.append({
-            'type': 'irrigation_rafraichissement',
-            'titre': 'Température élevée - Irrigation de rafraîchissement',
-            'description': f'Température maximale élevée ({temperature_max:.1f}°C). '
-                          f'Irrigation légère recommandée pour rafraîchir les cultures et réduire le stress thermique.',
-            'quantite_recommandee': '2-3 mm',
-            'priorite': 'moyenne',
-            'parametres_utilises': parametres_utilises.copy(),
+    resultats = []
+    for i, meteo_actuelle in enumerate(meteos_actuelles):
+        parametres_utilises = {
+            'temperature_actuelle': meteo_actuelle.get('temperature'),
+            'humidite_actuelle': meteo_actuelle.get('humidite'),
+            'pluviometrie_actuelle': meteo_actuelle.get('pluviometrie', 0),
+            'date_analyse': date_analyse,
+            'pluviometrie_prevue_24h': r['pluie_24h'][i],
+            'pluviometrie_totale': r['pluie_totale'][i],
+        }
+        if dernieres_pluviometries[i] is not None:
+            parametres_utilises['derniere_pluviometrie'] = dernieres_pluviometries[i]
+        parametres_utilises.update({
+            'besoin_eau_culture': r['besoin_eau'][i],
+            'type_culture': types_culture[i],
+            'besoin_eau_24h': r['besoin_24h'][i],
+            'deficit_hydrique': r['deficit'][i],
         })
 
-    # 7. Conseils basés sur l'humidité de l'air
-    if humidite and humidite < 40:
-        conseils.append({
-            'type': 'irrigation_humidite',
-            'titre': 'Air sec - Irrigation recommandée',
-            'description': f'Humidité relative faible ({humidite:.0f}%). '
-                          f'L\'évapotranspiration est élevée. Irrigation recommandée pour compenser les pertes d\'eau.',
-            'quantite_recommandee': '3-5 mm',
-            'priorite': 'moyenne',
-            'parametres_utilises': parametres_utilises.copy(),
-        })
+        deficit = r['deficit'][i]
+        pluie_24h = r['pluie_24h'][i]
+        besoin_24h = r['besoin_24h'][i]
+        conseils = []
+        if r['urgente'][i]:
+            conseils.append({
+                'type': 'irrigation_urgente',
+                'titre': 'Irrigation urgente recommandée',
+                'description': f'Le déficit hydrique est de {deficit:.1f} mm. '
+                              f'La pluviométrie prévue ({pluie_24h:.1f} mm) est insuffisante '
+                              f'pour couvrir les besoins de la culture ({besoin_24h:.1f} mm/jour). '
+                              f'Irrigation immédiate recommandée.',
+                'quantite_recommandee': f'{deficit:.1f} mm',
+                'priorite': 'élevée',
+                'parametres_utilises': parametres_utilises.copy(),
+            })
+        elif r['recommandee'][i]:
+            conseils.append({
+                'type': 'irrigation_recommandee',
+                'titre': 'Irrigation recommandée',
+                'description': f'Déficit hydrique modéré de {deficit:.1f} mm. '
+                              f'Irrigation complémentaire recommandée pour optimiser la croissance.',
+                'quantite_recommandee': f'{deficit:.1f} mm',
+                'priorite': 'moyenne',
+                'parametres_utilises': parametres_utilises.copy(),
+            })
+        elif r['non_necessaire'][i]:
+            conseils.append({
+                'type': 'irrigation_non_necessaire',
+                'titre': 'Irrigation non nécessaire',
+                'description': f'La pluviométrie prévue ({pluie_24h:.1f} mm) '
+                              f'couvre les besoins de la culture. Aucune irrigation supplémentaire nécessaire pour le moment.',
+                'quantite_recommandee': '0 mm',
+                'priorite': 'faible',
+                'parametres_utilises': parametres_utilises.copy(),
+            })
+
+        if r['chaleur'][i]:
+            temperature_max = meteo_actuelle.get('temperature_max', meteo_actuelle.get('temperature'))
+            conseils.append({
+                'type': 'irrigation_rafraichissement',
+                'titre': 'Température élevée - Irrigation de rafraîchissement',
+                'description': f'Température maximale élevée ({temperature_max:.1f}°C). '
+                              f'Irrigation légère recommandée pour rafraîchir les cultures et réduire le stress thermique.',
+                'quantite_recommandee': '2-3 mm',
+                'priorite': 'moyenne',
+                'parametres_utilises': parametres_utilises.copy(),
+            })
 
-    # 8. Analyse des prévisions à 48h
-    if len(previsions) >= 16:  # 16 * 3h = 48h
-        pluviometrie_48h = sum(
-            p.get('pluviometrie', 0) or 0 for p in previsions[:16]
-        )
-        besoin_eau_48h = besoin_eau * 2
-        deficit_48h = besoin_eau_48h - pluviometrie_48h
+        if r['air_sec'][i]:
+            conseils.append({
+                'type': 'irrigation_humidite',
+                'titre': 'Air sec - Irrigation recommandée',
+                'description': f'Humidité relative faible ({meteo_actuelle.get("humidite"):.0f}%). '
+                              f'L\'évapotranspiration est élevée. Irrigation recommandée pour compenser les pertes d\'eau.',
+                'quantite_recommandee': '3-5 mm',
+                'priorite': 'moyenne',
+                'parametres_utilises': parametres_utilises.copy(),
+            })
 
-        if deficit_48h > 10:
+        if r['planification'][i]:
+            deficit_48h = r['deficit_48h'][i]
             conseils.append({
                 'type': 'planification_irrigation',
                 'titre': 'Planification irrigation sur 48h',
@@ -144,25 +308,22 @@ def generate_conseils_irrigation(
                 'priorite': 'moyenne',
                 'parametres_utilises': {
                     **parametres_utilises,
-                    'pluviometrie_prevue_48h': pluviometrie_48h,
+                    'pluviometrie_prevue_48h': r['pluie_48h'][i],
                     'deficit_hydrique_48h': deficit_48h,
                 },
             })
 
-    # Si aucun conseil généré, ajouter un message informatif
-    if not conseils:
-        conseils.append({
-            'type': 'information',
-            'titre': 'Données météo insuffisantes',
-            'description': 'Les données météo disponibles ne permettent pas de générer des conseils d\'irrigation précis. '
-                          'Veuillez vérifier que les coordonnées GPS de l\'exploitation sont correctes.',
-            'quantite_recommandee': 'N/A',
-            'priorite': 'faible',
-            'parametres_utilises': parametres_utilises,
-        })
-
-    return conseils
-
-
+        if not conseils:
+            conseils.append({
+                'type': 'information',
+                'titre': 'Données météo insuffisantes',
+                'description': 'Les données météo disponibles ne permettent pas de générer des conseils d\'irrigation précis. '
+                              'Veuillez vérifier que les coordonnées GPS de l\'exploitation sont correctes.',
+                'quantite_recommandee': 'N/A',
+                'priorite': 'faible',
+                'parametres_utilises': parametres_utilises,
+            })
 
+        resultats.append(conseils)
 
+    return resultats
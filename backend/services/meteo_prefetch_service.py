@@ -0,0 +1,203 @@
+"""
+Service de préchargement de la météo pour toutes les exploitations géolocalisées
+Les exploitations sont regroupées par cellule de grille : une seule paire
+d'appels (actuelle + prévisions) est faite par cellule, avec une concurrence
+bornée et un débit limité pour respecter le quota OpenWeather.
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import db
+from models.exploitation import Exploitation
+from models.meteo import MeteoSnapshot
+from services.meteo_service import (
+    fetch_current_weather, fetch_weather_forecast, get_cache, get_cache_ttl, grid_cell
+)
+from services.meteo_store_service import store_weather
+
+FETCHERS = {
+    'current': fetch_current_weather,
+    'forecast': fetch_weather_forecast,
+}
+
+
+class RateLimiter:
+    """Limiteur de débit partagé entre threads (appels espacés régulièrement)"""
+
+    def __init__(self, requests_per_minute: Optional[float]):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloque jusqu'à ce qu'un nouvel appel soit autorisé"""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def exploitation_grid_cells() -> Dict[Tuple[float, float], int]:
+    """
+    Regroupe les exploitations géolocalisées par cellule de grille
+
+    Returns:
+        Dictionnaire {cellule (lat, lon): nombre d'exploitations}
+    """
+    cells = {}
+    coordonnees = db.session.query(Exploitation.latitude, Exploitation.longitude).filter(
+        Exploitation.latitude.isnot(None),
+        Exploitation.longitude.isnot(None)
+    )
+    for latitude, longitude in coordonnees:
+        cell = grid_cell(latitude, longitude)
+        cells[cell] = cells.get(cell, 0) + 1
+    return cells
+
+
+def iter_weather_for_cells(
+    cells: Iterable[Tuple[float, float]],
+    kinds: Iterable[str] = ('current', 'forecast'),
+    lang: str = 'fr',
+    max_workers: int = 4,
+    requests_per_minute: Optional[float] = 50
+) -> Iterator[Tuple[Tuple[float, float], str, Optional[object], Optional[str]]]:
+    """
+    Récupère la météo de plusieurs cellules en parallèle
+
+    Les threads ne font que les appels HTTP (aucun accès à la base) ;
+    les résultats sont produits au fil de l'eau dans le thread appelant.
+
+    Yields:
+        Tuples (cellule, type, données ou None, erreur ou None)
+    """
+    limiter = RateLimiter(requests_per_minute)
+
+    def fetch(cell, kind):
+        limiter.acquire()
+        return FETCHERS[kind](cell[0], cell[1], lang)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='meteo-prefetch') as executor:
+        futures = {
+            executor.submit(fetch, cell, kind): (cell, kind)
+            for cell in cells
+            for kind in kinds
+        }
+        for future in as_completed(futures):
+            cell, kind = futures[future]
+            try:
+                yield cell, kind, future.result(), None
+            except Exception as e:
+                yield cell, kind, None, str(e)
+
+
+def _snapshot_insert(dialect_name):
+    """Construction INSERT ... ON CONFLICT adaptée au dialecte de la base"""
+    if dialect_name == 'postgresql':
+        return postgresql.insert(MeteoSnapshot.__table__)
+    return sqlite.insert(MeteoSnapshot.__table__)
+
+
+def save_snapshots(rows: Iterable[Dict]) -> int:
+    """
+    Enregistre (ou remplace) les données préchargées de plusieurs cellules
+
+    Args:
+        rows: Dictionnaires avec kind, grid_lat, grid_lon, lang, payload, fetched_at
+
+    Returns:
+        Nombre de lignes écrites
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+
+    stmt = _snapshot_insert(db.session.get_bind().dialect.name)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['kind', 'grid_lat', 'grid_lon', 'lang'],
+        set_={'payload': stmt.excluded.payload, 'fetched_at': stmt.excluded.fetched_at}
+    )
+    db.session.execute(stmt, rows)
+    return len(rows)
+
+
+def prefetch_weather(
+    lang: str = 'fr',
+    max_workers: int = 4,
+    requests_per_minute: Optional[float] = 50,
+    batch_size: int = 100
+) -> Dict:
+    """
+    Précharge la météo actuelle et les prévisions de toutes les cellules
+    contenant au moins une exploitation géolocalisée
+
+    Les résultats sont écrits dans meteo_snapshots et dans le stockage
+    normalisé releves_meteo (par lots), et placés dans le cache mémoire
+    du processus. Une erreur sur une cellule n'interrompt pas le job.
+
+    Args:
+        lang: Langue des descriptions
+        max_workers: Nombre d'appels HTTP simultanés
+        requests_per_minute: Débit maximal d'appels (None = illimité)
+        batch_size: Nombre de lignes par commit
+
+    Returns:
+        Statistiques du préchargement
+    """
+    debut = time.perf_counter()
+    cells = exploitation_grid_cells()
+    stats = {
+        'exploitations': sum(cells.values()),
+        'cellules': len(cells),
+        'appels': 0,
+        'enregistres': 0,
+        'releves': 0,
+        'erreurs': [],
+    }
+
+    pending = []
+    try:
+        for cell, kind, data, erreur in iter_weather_for_cells(
+            cells, lang=lang, max_workers=max_workers, requests_per_minute=requests_per_minute
+        ):
+            stats['appels'] += 1
+            if erreur:
+                stats['erreurs'].append({'cellule': list(cell), 'type': kind, 'erreur': erreur})
+                continue
+
+            get_cache().set((kind, cell, lang), data, get_cache_ttl(kind))
+            if kind == 'current':
+                stats['releves'] += store_weather(cell, meteo_actuelle=data)
+            else:
+                stats['releves'] += store_weather(cell, previsions=data)
+            pending.append({
+                'kind': kind,
+                'grid_lat': cell[0],
+                'grid_lon': cell[1],
+                'lang': lang,
+                'payload': json.dumps(data),
+                'fetched_at': datetime.utcnow(),
+            })
+            if len(pending) >= batch_size:
+                stats['enregistres'] += save_snapshots(pending)
+                db.session.commit()
+                pending = []
+
+        stats['enregistres'] += save_snapshots(pending)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    stats['duree'] = round(time.perf_counter() - debut, 3)
+    return stats
@@ -1,11 +1,50 @@
 """
 Service pour récupérer les données météo depuis OpenWeatherMap API
+Les réponses sont mises en cache par cellule de grille (coordonnées arrondies)
+afin que les exploitations voisines partagent un même appel à l'API.
+En cas d'absence en mémoire, les données préchargées (table meteo_snapshots)
+sont utilisées avant d'interroger OpenWeather. Les réponses obtenues sont
+conservées dans le stockage local (releves_meteo), qui sert de secours
+lorsque l'API est injoignable.
 """
 import os
+import json
+import threading
 import requests
-from typing import Dict, List, Optional
-from datetime import datetime, date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from datetime import datetime, date, timedelta
 from collections import defaultdict
+from flask import current_app, has_app_context
+
+from database import db
+from models.meteo import MeteoSnapshot
+from services.meteo_store_service import latest_observation, store_weather, stored_forecasts
+from utils.cache import TTLCache
+
+# Durées de vie par défaut du cache (secondes), surchargeables par variables d'environnement
+DEFAULT_CACHE_TTL = {
+    'current': 600,     # METEO_CACHE_TTL_CURRENT
+    'forecast': 3600,   # METEO_CACHE_TTL_FORECAST
+    'city': 600,        # METEO_CACHE_TTL_CITY
+}
+DEFAULT_CACHE_GRID = 0.05  # METEO_CACHE_GRID (degrés, ~5 km)
+DEFAULT_CACHE_MAXSIZE = 1024  # METEO_CACHE_MAXSIZE
+
+# Âge maximal (secondes) d'une donnée préchargée pour être servie sans appel à l'API
+DEFAULT_SNAPSHOT_MAX_AGE = {
+    'current': 3600,    # METEO_SNAPSHOT_MAX_AGE_CURRENT
+    'forecast': 21600,  # METEO_SNAPSHOT_MAX_AGE_FORECAST
+}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+_client = None
+_executor = None
+_client_lock = threading.Lock()
 
 
 def get_api_key() -> str:
@@ -16,9 +55,129 @@ def get_api_key() -> str:
     return api_key
 
 
+def get_cache() -> TTLCache:
+    """Cache météo partagé par le processus (créé au premier appel)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TTLCache(maxsize=int(os.getenv('METEO_CACHE_MAXSIZE', DEFAULT_CACHE_MAXSIZE)))
+    return _cache
+
+
+def get_cache_ttl(kind: str) -> float:
+    """Durée de vie en cache d'un type de réponse ('current', 'forecast', 'city')"""
+    return float(os.getenv(f'METEO_CACHE_TTL_{kind.upper()}', DEFAULT_CACHE_TTL[kind]))
+
+
+def grid_cell(latitude: float, longitude: float) -> Tuple[float, float]:
+    """
+    Arrondit des coordonnées au centre de leur cellule de grille
+
+    La taille de cellule (en degrés) est définie par METEO_CACHE_GRID.
+    """
+    grid = float(os.getenv('METEO_CACHE_GRID', DEFAULT_CACHE_GRID))
+    return (
+        round(round(latitude / grid) * grid, 4),
+        round(round(longitude / grid) * grid, 4),
+    )
+
+
+def get_cache_stats() -> Dict:
+    """Statistiques du cache météo (hits, misses, évictions) et configuration"""
+    return {
+        **get_cache().stats(),
+        'grid': float(os.getenv('METEO_CACHE_GRID', DEFAULT_CACHE_GRID)),
+        'ttl': {kind: get_cache_ttl(kind) for kind in DEFAULT_CACHE_TTL},
+    }
+
+
+def load_snapshot(kind: str, cell: Tuple[float, float], lang: str = 'fr'):
+    """
+    Retourne la donnée préchargée d'une cellule si elle est assez récente
+
+    Hors contexte d'application (threads du pool HTTP), retourne toujours None.
+    """
+    if not has_app_context():
+        return None
+
+    max_age = float(os.getenv(f'METEO_SNAPSHOT_MAX_AGE_{kind.upper()}', DEFAULT_SNAPSHOT_MAX_AGE[kind]))
+    snapshot = MeteoSnapshot.query.filter(
+        MeteoSnapshot.kind == kind,
+        MeteoSnapshot.grid_lat == cell[0],
+        MeteoSnapshot.grid_lon == cell[1],
+        MeteoSnapshot.lang == lang,
+        MeteoSnapshot.fetched_at >= datetime.utcnow() - timedelta(seconds=max_age)
+    ).first()
+    return json.loads(snapshot.payload) if snapshot else None
+
+
+def _remember(kind: str, cell: Tuple[float, float], lang: str, value) -> None:
+    """
+    Met en cache une réponse fraîche d'OpenWeather et l'enregistre dans le
+    stockage local (dans sa propre transaction, sans toucher à la session
+    de la requête en cours)
+    """
+    get_cache().set((kind, cell, lang), value, get_cache_ttl(kind))
+    if not has_app_context():
+        return
+    try:
+        with db.engine.begin() as connection:
+            if kind == 'current':
+                store_weather(cell, meteo_actuelle=value, connection=connection)
+            else:
+                store_weather(cell, previsions=value, connection=connection)
+    except Exception as e:
+        # Le stockage local ne doit jamais faire échouer la requête
+        current_app.logger.warning(f'Stockage des relevés météo impossible: {str(e)}')
+
+
+def _offline(kind: str, cell: Tuple[float, float], erreur: Exception):
+    """
+    Données de secours du stockage local lorsque OpenWeather est injoignable
+
+    Relance l'erreur d'origine si aucun relevé n'est disponible.
+    """
+    if not has_app_context():
+        raise erreur
+    value = latest_observation(cell) if kind == 'current' else stored_forecasts(cell)
+    if not value:
+        raise erreur
+    return value
+
+
+def _cached_weather(kind: str, latitude: float, longitude: float, lang: str, fetch: bool = True):
+    """
+    Recherche une donnée météo en mémoire, puis dans les données préchargées,
+    puis (si fetch) auprès d'OpenWeather pour le centre de la cellule, et en
+    dernier recours dans le stockage local
+    """
+    cell = grid_cell(latitude, longitude)
+    key = (kind, cell, lang)
+    value = get_cache().get(key)
+    if value is not None:
+        return value
+
+    value = load_snapshot(kind, cell, lang)
+    if value is not None:
+        get_cache().set(key, value, get_cache_ttl(kind))
+        return value
+
+    if not fetch:
+        return None
+
+    fetcher = fetch_current_weather if kind == 'current' else fetch_weather_forecast
+    try:
+        value = fetcher(cell[0], cell[1], lang)
+    except Exception as e:
+        return _offline(kind, cell, e)
+    _remember(kind, cell, lang, value)
+    return value
+
+
 def get_current_weather(latitude: float, longitude: float, lang: str = 'fr') -> Dict:
     """
-    Récupère les conditions météo actuelles pour des coordonnées données
+    Récupère les conditions météo actuelles (avec cache par cellule de grille)
     
     Args:
         latitude: Latitude en degrés décimaux
@@ -28,74 +187,269 @@ def get_current_weather(latitude: float, longitude: float, lang: str = 'fr') ->
     Returns:
         Dictionnaire avec les données météo formatées
     """
-    api_key = get_api_key()
-    base_url = 'https://api.openweathermap.org/data/2.5/weather'
+    meteo = _cached_weather('current', latitude, longitude, lang)
+    return {**meteo, 'latitude': latitude, 'longitude': longitude}
+
+
+def get_weather_forecast(latitude: float, longitude: float, lang: str = 'fr') -> List[Dict]:
+    """
+    Récupère les prévisions météo sur 5 jours (avec cache par cellule de grille)
     
-    params = {
-        'lat': latitude,
-        'lon': longitude,
-        'appid': api_key,
-        'units': 'metric',  # Température en Celsius
-        'lang': lang
-    }
+    Args:
+        latitude: Latitude en degrés décimaux
+        longitude: Longitude en degrés décimaux
+        lang: Langue pour la description (fr, en, etc.)
     
+    Returns:
+        Liste de dictionnaires avec les prévisions formatées
+    """
+    previsions = _cached_weather('forecast', latitude, longitude, lang)
+    return [{**p, 'latitude': latitude, 'longitude': longitude} for p in previsions]
+
+
+def get_weather_by_city(city_name: str, country_code: Optional[str] = None, lang: str = 'fr') -> Dict:
+    """
+    Récupère les conditions météo actuelles par nom de ville (avec cache)
+    
+    Args:
+        city_name: Nom de la ville
+        country_code: Code pays (optionnel, ex: 'FR', 'US')
+        lang: Langue pour la description
+    
+    Returns:
+        Dictionnaire avec les données météo formatées
+    """
+    key = ('city', city_name.strip().lower(), (country_code or '').upper(), lang)
+    meteo = get_cache().get(key)
+    if meteo is None:
+        meteo = fetch_weather_by_city(city_name, country_code, lang)
+        get_cache().set(key, meteo, get_cache_ttl('city'))
+    return dict(meteo)
+
+
+class OpenWeatherClient:
+    """
+    Client HTTP OpenWeatherMap à session persistante
+
+    Les connexions TCP/TLS sont réutilisées (keep-alive) via un pool de taille
+    configurable, et les erreurs transitoires (429, 5xx) sont relancées avec
+    un délai exponentiel. Le client est partagé entre threads.
+    """
+
+    BASE_URL = 'https://api.openweathermap.org/data/2.5'
+
+    def __init__(self, pool_size: int = 10, retries: int = 2, backoff_factor: float = 0.5, timeout: float = 10):
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, endpoint: str, params: Dict, not_found_message: str, label: str = 'de la météo') -> Dict:
+        """
+        Exécute une requête GET sur l'API et traduit les erreurs
+
+        Args:
+            endpoint: Chemin de l'API ('weather', 'forecast')
+            params: Paramètres de la requête (sans appid/units)
+            not_found_message: Message d'erreur en cas de 404
+            label: Complément du message pour les erreurs réseau génériques
+
+        Returns:
+            Réponse JSON décodée
+        """
+        params = {**params, 'appid': get_api_key(), 'units': 'metric'}  # Température en Celsius
+
+        try:
+            response = self.session.get(f'{self.BASE_URL}/{endpoint}', params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.Timeout:
+            raise Exception('Timeout lors de la connexion à l\'API OpenWeather. Veuillez réessayer.')
+        except requests.exceptions.ConnectionError:
+            raise Exception('Erreur de connexion à l\'API OpenWeather. Vérifiez votre connexion internet.')
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == 401:
+                raise ValueError('Clé API OpenWeather invalide. Vérifiez votre clé API.')
+            elif e.response.status_code == 404:
+                raise ValueError(not_found_message)
+            else:
+                error_data = e.response.json() if e.response.text else {}
+                error_msg = error_data.get('message', f'Erreur HTTP {e.response.status_code}')
+                raise Exception(f'Erreur API OpenWeather: {error_msg}')
+        except requests.exceptions.RequestException as e:
+            raise Exception(f'Erreur lors de la récupération {label}: {str(e)}')
+        except ValueError as e:
+            raise Exception(f'Format de réponse inattendu de l\'API: {str(e)}')
+
+
+def get_client() -> OpenWeatherClient:
+    """
+    Client OpenWeather partagé par le processus (créé au premier appel)
+
+    Configuration: METEO_HTTP_POOL_SIZE, METEO_HTTP_RETRIES, METEO_HTTP_TIMEOUT
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenWeatherClient(
+                    pool_size=int(os.getenv('METEO_HTTP_POOL_SIZE', 10)),
+                    retries=int(os.getenv('METEO_HTTP_RETRIES', 2)),
+                    timeout=float(os.getenv('METEO_HTTP_TIMEOUT', 10)),
+                )
+    return _client
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Pool de threads partagé pour les appels météo concurrents"""
+    global _executor
+    if _executor is None:
+        with _client_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv('METEO_HTTP_WORKERS', 8)),
+                    thread_name_prefix='meteo'
+                )
+    return _executor
+
+
+def get_current_and_forecast(latitude: float, longitude: float, lang: str = 'fr') -> Tuple[Dict, List[Dict]]:
+    """
+    Récupère en parallèle la météo actuelle et les prévisions d'une position
+
+    Les prévisions sont demandées dans un thread du pool pendant que la météo
+    actuelle est récupérée dans le thread appelant : le temps de réponse est
+    celui de l'appel le plus lent au lieu de la somme des deux.
+
+    Returns:
+        Tuple (météo actuelle, prévisions)
+    """
+    # Cache et données préchargées sont consultés dans le thread appelant
+    # (contexte d'application) ; seul l'appel HTTP part dans le pool
+    previsions = _cached_weather('forecast', latitude, longitude, lang, fetch=False)
+    if previsions is not None:
+        previsions = [{**p, 'latitude': latitude, 'longitude': longitude} for p in previsions]
+        return get_current_weather(latitude, longitude, lang), previsions
+
+    cell = grid_cell(latitude, longitude)
+    future = _get_executor().submit(fetch_weather_forecast, cell[0], cell[1], lang)
     try:
-        response = requests.get(base_url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Vérifier si l'API retourne une erreur
-        if response.status_code != 200:
-            error_msg = data.get('message', 'Erreur inconnue de l\'API OpenWeather')
-            raise Exception(f'Erreur API OpenWeather: {error_msg}')
-        
-        # Formater les données au format attendu par l'application
-        main = data.get('main', {})
-        weather = data.get('weather', [{}])[0]
-        wind = data.get('wind', {})
-        rain = data.get('rain', {})
-        clouds = data.get('clouds', {})
-        
-        return {
-            'temperature': main.get('temp'),
-            'temperature_min': main.get('temp_min'),
-            'temperature_max': main.get('temp_max'),
-            'humidite': main.get('humidity'),  # En %
-            'pression': main.get('pressure'),  # En hPa
-            'vitesse_vent': wind.get('speed'),  # En m/s
-            'direction_vent': wind.get('deg'),  # En degrés
-            'description': weather.get('description'),
-            'icon': weather.get('icon'),
-            'pluviometrie': rain.get('1h') or rain.get('3h') or 0,  # En mm
-            'nuages': clouds.get('all'),  # En %
-            'date': datetime.utcnow().isoformat(),
-            'latitude': latitude,
-            'longitude': longitude,
-            'ville': data.get('name'),
-            'pays': data.get('sys', {}).get('country')
+        meteo_actuelle = get_current_weather(latitude, longitude, lang)
+    finally:
+        # Toujours attendre le thread pour ne pas perdre son exception
+        erreur = future.exception()
+
+    if erreur:
+        previsions = _offline('forecast', cell, erreur)
+    else:
+        previsions = future.result()
+        _remember('forecast', cell, lang, previsions)
+    return meteo_actuelle, [{**p, 'latitude': latitude, 'longitude': longitude} for p in previsions]
+
+
+def _fetch_cell(cell: Tuple[float, float], kinds: Iterable[str], lang: str) -> Dict:
+    """Appels HTTP d'une cellule (exécuté dans un thread, sans accès à la base)"""
+    resultats = {}
+    for kind in kinds:
+        fetcher = fetch_current_weather if kind == 'current' else fetch_weather_forecast
+        try:
+            resultats[kind] = (fetcher(cell[0], cell[1], lang), None)
+        except Exception as e:
+            resultats[kind] = (None, e)
+    return resultats
+
+
+def iter_weather_by_cell(
+    cells: Iterable[Tuple[float, float]],
+    lang: str = 'fr',
+    max_workers: int = 8
+) -> Iterator[Tuple[Tuple[float, float], Optional[Dict], Optional[List[Dict]], Optional[str]]]:
+    """
+    Récupère la météo actuelle et les prévisions de plusieurs cellules de grille
+
+    Les cellules déjà en cache (mémoire ou données préchargées) sont produites
+    immédiatement ; les autres sont récupérées en parallèle et produites au fil
+    de leur arrivée. Les réponses sont mises en cache et stockées, et le
+    stockage local sert de secours en cas d'erreur.
+
+    Args:
+        cells: Centres de cellules (voir grid_cell)
+        lang: Langue des descriptions
+        max_workers: Nombre de cellules récupérées simultanément
+
+    Yields:
+        Tuples (cellule, météo actuelle, prévisions, erreur ou None)
+    """
+    a_recuperer = {}
+    for cell in cells:
+        valeurs = {
+            kind: _cached_weather(kind, cell[0], cell[1], lang, fetch=False)
+            for kind in ('current', 'forecast')
         }
-    except requests.exceptions.Timeout:
-        raise Exception('Timeout lors de la connexion à l\'API OpenWeather. Veuillez réessayer.')
-    except requests.exceptions.ConnectionError:
-        raise Exception('Erreur de connexion à l\'API OpenWeather. Vérifiez votre connexion internet.')
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 401:
-            raise ValueError('Clé API OpenWeather invalide. Vérifiez votre clé API.')
-        elif e.response.status_code == 404:
-            raise ValueError('Localisation non trouvée. Vérifiez les coordonnées.')
+        if all(v is not None for v in valeurs.values()):
+            yield cell, valeurs['current'], valeurs['forecast'], None
         else:
-            error_data = e.response.json() if e.response.text else {}
-            error_msg = error_data.get('message', f'Erreur HTTP {e.response.status_code}')
-            raise Exception(f'Erreur API OpenWeather: {error_msg}')
-    except requests.exceptions.RequestException as e:
-        raise Exception(f'Erreur lors de la récupération de la météo: {str(e)}')
-    except (KeyError, ValueError) as e:
-        raise Exception(f'Format de réponse inattendu de l\'API: {str(e)}')
+            a_recuperer[cell] = valeurs
 
+    if not a_recuperer:
+        return
 
-def get_weather_forecast(latitude: float, longitude: float, lang: str = 'fr') -> List[Dict]:
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='meteo-batch') as executor:
+        futures = {
+            executor.submit(_fetch_cell, cell, [k for k, v in valeurs.items() if v is None], lang): cell
+            for cell, valeurs in a_recuperer.items()
+        }
+        for future in as_completed(futures):
+            cell = futures[future]
+            valeurs = a_recuperer[cell]
+            try:
+                for kind, (value, erreur) in future.result().items():
+                    if erreur:
+                        value = _offline(kind, cell, erreur)
+                    else:
+                        _remember(kind, cell, lang, value)
+                    valeurs[kind] = value
+            except Exception as e:
+                yield cell, None, None, str(e)
+                continue
+            yield cell, valeurs['current'], valeurs['forecast'], None
+
+
+def _format_weather(data: Dict, rain: float, latitude: Optional[float], longitude: Optional[float]) -> Dict:
+    """Formate une observation OpenWeather au format attendu par l'application"""
+    main = data.get('main', {})
+    weather = data.get('weather', [{}])[0]
+    wind = data.get('wind', {})
+    clouds = data.get('clouds', {})
+
+    return {
+        'temperature': main.get('temp'),
+        'temperature_min': main.get('temp_min'),
+        'temperature_max': main.get('temp_max'),
+        'humidite': main.get('humidity'),  # En %
+        'pression': main.get('pressure'),  # En hPa
+        'vitesse_vent': wind.get('speed'),  # En m/s
+        'direction_vent': wind.get('deg'),  # En degrés
+        'description': weather.get('description'),
+        'icon': weather.get('icon'),
+        'pluviometrie': rain,  # En mm
+        'nuages': clouds.get('all'),  # En %
+        'latitude': latitude,
+        'longitude': longitude,
+    }
+
+
+def fetch_current_weather(latitude: float, longitude: float, lang: str = 'fr') -> Dict:
     """
-    Récupère les prévisions météo pour les 5 prochains jours (3h par 3h)
+    Récupère (sans cache) les conditions météo actuelles pour des coordonnées données
     
     Args:
         latitude: Latitude en degrés décimaux
@@ -103,76 +457,59 @@ def get_weather_forecast(latitude: float, longitude: float, lang: str = 'fr') ->
         lang: Langue pour la description (fr, en, etc.)
     
     Returns:
-        Liste de dictionnaires avec les prévisions formatées
+        Dictionnaire avec les données météo formatées
+    """
+    data = get_client().get(
+        'weather',
+        {'lat': latitude, 'lon': longitude, 'lang': lang},
+        'Localisation non trouvée. Vérifiez les coordonnées.'
+    )
+
+    rain = data.get('rain', {})
+    meteo = _format_weather(data, rain.get('1h') or rain.get('3h') or 0, latitude, longitude)
+    meteo.update({
+        'date': datetime.utcnow().isoformat(),
+        'ville': data.get('name'),
+        'pays': data.get('sys', {}).get('country')
+    })
+    return meteo
+
+
+def fetch_weather_forecast(latitude: float, longitude: float, lang: str = 'fr') -> List[Dict]:
     """
-    api_key = get_api_key()
-    base_url = 'https://api.openweathermap.org/data/2.5/forecast'
+    Récupère (sans cache) les prévisions météo pour les 5 prochains jours (3h par 3h)
     
-    params = {
-        'lat': latitude,
-        'lon': longitude,
-        'appid': api_key,
-        'units': 'metric',  # Température en Celsius
-        'lang': lang
-    }
+    Args:
+        latitude: Latitude en degrés décimaux
+        longitude: Longitude en degrés décimaux
+        lang: Langue pour la description (fr, en, etc.)
     
-    try:
-        response = requests.get(base_url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        previsions = []
-        for item in data.get('list', []):
-            main = item.get('main', {})
-            weather = item.get('weather', [{}])[0]
-            wind = item.get('wind', {})
-            rain = item.get('rain', {})
-            clouds = item.get('clouds', {})
-            
-            # Convertir le timestamp en datetime
-            dt_timestamp = item.get('dt')
-            date = datetime.fromtimestamp(dt_timestamp) if dt_timestamp else None
-            
-            previsions.append({
-                'temperature': main.get('temp'),
-                'temperature_min': main.get('temp_min'),
-                'temperature_max': main.get('temp_max'),
-                'humidite': main.get('humidity'),
-                'pression': main.get('pressure'),
-                'vitesse_vent': wind.get('speed'),
-                'direction_vent': wind.get('deg'),
-                'description': weather.get('description'),
-                'icon': weather.get('icon'),
-                'pluviometrie': rain.get('3h') or 0,  # Prévisions en 3h
-                'nuages': clouds.get('all'),
-                'date': date.isoformat() if date else None,
-                'latitude': latitude,
-                'longitude': longitude
-            })
-        
-        return previsions
-    except requests.exceptions.Timeout:
-        raise Exception('Timeout lors de la connexion à l\'API OpenWeather. Veuillez réessayer.')
-    except requests.exceptions.ConnectionError:
-        raise Exception('Erreur de connexion à l\'API OpenWeather. Vérifiez votre connexion internet.')
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 401:
-            raise ValueError('Clé API OpenWeather invalide. Vérifiez votre clé API.')
-        elif e.response.status_code == 404:
-            raise ValueError('Localisation non trouvée. Vérifiez les coordonnées.')
-        else:
-            error_data = e.response.json() if e.response.text else {}
-            error_msg = error_data.get('message', f'Erreur HTTP {e.response.status_code}')
-            raise Exception(f'Erreur API OpenWeather: {error_msg}')
-    except requests.exceptions.RequestException as e:
-        raise Exception(f'Erreur lors de la récupération des prévisions: {str(e)}')
-    except (KeyError, ValueError) as e:
-        raise Exception(f'Format de réponse inattendu de l\'API: {str(e)}')
+    Returns:
+        Liste de dictionnaires avec les prévisions formatées
+    """
+    data = get_client().get(
+        'forecast',
+        {'lat': latitude, 'lon': longitude, 'lang': lang},
+        'Localisation non trouvée. Vérifiez les coordonnées.',
+        label='des prévisions'
+    )
 
+    previsions = []
+    for item in data.get('list', []):
+        # Convertir le timestamp en datetime
+        dt_timestamp = item.get('dt')
+        date = datetime.fromtimestamp(dt_timestamp) if dt_timestamp else None
 
-def get_weather_by_city(city_name: str, country_code: Optional[str] = None, lang: str = 'fr') -> Dict:
+        prevision = _format_weather(item, item.get('rain', {}).get('3h') or 0, latitude, longitude)  # Prévisions en 3h
+        prevision['date'] = date.isoformat() if date else None
+        previsions.append(prevision)
+
+    return previsions
+
+
+def fetch_weather_by_city(city_name: str, country_code: Optional[str] = None, lang: str = 'fr') -> Dict:
     """
-    Récupère les conditions météo actuelles par nom de ville
+    Récupère (sans cache) les conditions météo actuelles par nom de ville
     
     Args:
         city_name: Nom de la ville
@@ -182,68 +519,26 @@ def get_weather_by_city(city_name: str, country_code: Optional[str] = None, lang
     Returns:
         Dictionnaire avec les données météo formatées
     """
-    api_key = get_api_key()
-    base_url = 'https://api.openweathermap.org/data/2.5/weather'
-    
     # Construire le paramètre q (query)
     query = city_name
     if country_code:
         query = f'{city_name},{country_code}'
-    
-    params = {
-        'q': query,
-        'appid': api_key,
-        'units': 'metric',
-        'lang': lang
-    }
-    
-    try:
-        response = requests.get(base_url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        main = data.get('main', {})
-        weather = data.get('weather', [{}])[0]
-        wind = data.get('wind', {})
-        rain = data.get('rain', {})
-        clouds = data.get('clouds', {})
-        coord = data.get('coord', {})
-        
-        return {
-            'temperature': main.get('temp'),
-            'temperature_min': main.get('temp_min'),
-            'temperature_max': main.get('temp_max'),
-            'humidite': main.get('humidity'),
-            'pression': main.get('pressure'),
-            'vitesse_vent': wind.get('speed'),
-            'direction_vent': wind.get('deg'),
-            'description': weather.get('description'),
-            'icon': weather.get('icon'),
-            'pluviometrie': rain.get('1h') or rain.get('3h') or 0,
-            'nuages': clouds.get('all'),
-            'date': datetime.utcnow().isoformat(),
-            'latitude': coord.get('lat'),
-            'longitude': coord.get('lon'),
-            'ville': data.get('name'),
-            'pays': data.get('sys', {}).get('country')
-        }
-    except requests.exceptions.Timeout:
-        raise Exception('Timeout lors de la connexion à l\'API OpenWeather. Veuillez réessayer.')
-    except requests.exceptions.ConnectionError:
-        raise Exception('Erreur de connexion à l\'API OpenWeather. Vérifiez votre connexion internet.')
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 401:
-            raise ValueError('Clé API OpenWeather invalide. Vérifiez votre clé API.')
-        elif e.response.status_code == 404:
-            raise ValueError(f'Ville "{city_name}" non trouvée. Vérifiez le nom de la ville.')
-        else:
-            error_data = e.response.json() if e.response.text else {}
-            error_msg = error_data.get('message', f'Erreur HTTP {e.response.status_code}')
-            raise Exception(f'Erreur API OpenWeather: {error_msg}')
-    except requests.exceptions.RequestException as e:
-        raise Exception(f'Erreur lors de la récupération de la météo: {str(e)}')
-    except (KeyError, ValueError) as e:
-        raise Exception(f'Format de réponse inattendu de l\'API: {str(e)}')
+
+    data = get_client().get(
+        'weather',
+        {'q': query, 'lang': lang},
+        f'Ville "{city_name}" non trouvée. Vérifiez le nom de la ville.'
+    )
+
+    rain = data.get('rain', {})
+    coord = data.get('coord', {})
+    meteo = _format_weather(data, rain.get('1h') or rain.get('3h') or 0, coord.get('lat'), coord.get('lon'))
+    meteo.update({
+        'date': datetime.utcnow().isoformat(),
+        'ville': data.get('name'),
+        'pays': data.get('sys', {}).get('country')
+    })
+    return meteo
 
 
 def group_forecasts_by_day(previsions: List[Dict]) -> List[Dict]:
@@ -0,0 +1,205 @@
+"""
+Stockage local normalisé des relevés météo (observations et prévisions)
+Chaque réponse OpenWeather est décomposée en lignes par cellule de grille et
+horodatage ; une nouvelle récupération met à jour la ligne existante au lieu
+d'en créer une autre. Ces relevés servent d'historique, de secours hors ligne
+et de source pour les conseils d'irrigation et les recommandations.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import db
+from models.meteo import ReleveMeteo
+
+SOURCE_OBSERVATION = 'observation'
+SOURCE_PREVISION = 'prevision'
+
+MESURES = (
+    'temperature', 'temperature_min', 'temperature_max', 'humidite', 'pression',
+    'vitesse_vent', 'direction_vent', 'pluviometrie', 'nuages', 'description', 'icon',
+)
+
+
+def _parse_date(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+
+def _row(cell: Tuple[float, float], source: str, date: datetime, meteo: Dict, fetched_at: datetime) -> Dict:
+    row = {
+        'grid_lat': cell[0],
+        'grid_lon': cell[1],
+        'source': source,
+        'date': date,
+        'fetched_at': fetched_at,
+    }
+    for mesure in MESURES:
+        row[mesure] = meteo.get(mesure)
+    return row
+
+
+def store_weather(
+    cell: Tuple[float, float],
+    meteo_actuelle: Optional[Dict] = None,
+    previsions: Optional[List[Dict]] = None,
+    connection=None
+) -> int:
+    """
+    Enregistre une observation et/ou des prévisions pour une cellule
+
+    Les observations sont ramenées à l'heure (une par cellule et par heure,
+    la plus récente l'emporte) ; les prévisions sont indexées par leur heure
+    prévue et remplacées à chaque nouvelle récupération. Ne fait pas de commit.
+
+    Args:
+        cell: Centre de la cellule de grille (lat, lon)
+        meteo_actuelle: Météo actuelle formatée par meteo_service
+        previsions: Prévisions formatées par meteo_service
+        connection: Connexion à utiliser (par défaut la session courante)
+
+    Returns:
+        Nombre de relevés écrits
+    """
+    maintenant = datetime.utcnow()
+    rows = {}
+    if meteo_actuelle:
+        date = (_parse_date(meteo_actuelle.get('date')) or maintenant).replace(minute=0, second=0, microsecond=0)
+        rows[(SOURCE_OBSERVATION, date)] = _row(cell, SOURCE_OBSERVATION, date, meteo_actuelle, maintenant)
+    for prevision in previsions or []:
+        date = _parse_date(prevision.get('date'))
+        if date:
+            rows[(SOURCE_PREVISION, date)] = _row(cell, SOURCE_PREVISION, date, prevision, maintenant)
+
+    if not rows:
+        return 0
+
+    executor = connection if connection is not None else db.session
+    dialect = connection.dialect if connection is not None else db.session.get_bind().dialect
+    stmt = (postgresql if dialect.name == 'postgresql' else sqlite).insert(ReleveMeteo.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['grid_lat', 'grid_lon', 'source', 'date'],
+        set_={colonne: stmt.excluded[colonne] for colonne in MESURES + ('fetched_at',)}
+    )
+    executor.execute(stmt, list(rows.values()))
+    return len(rows)
+
+
+def _releve_to_meteo(releve: ReleveMeteo) -> Dict:
+    """Convertit un relevé au format retourné par meteo_service"""
+    meteo = {mesure: getattr(releve, mesure) for mesure in MESURES}
+    meteo.update({
+        'date': releve.date.isoformat(),
+        'latitude': releve.grid_lat,
+        'longitude': releve.grid_lon,
+    })
+    return meteo
+
+
+def _cell_query(cell: Tuple[float, float], source: str):
+    return ReleveMeteo.query.filter(
+        ReleveMeteo.grid_lat == cell[0],
+        ReleveMeteo.grid_lon == cell[1],
+        ReleveMeteo.source == source
+    )
+
+
+def latest_observation(cell: Tuple[float, float]) -> Optional[Dict]:
+    """Dernière observation enregistrée pour une cellule (ou None)"""
+    releve = _cell_query(cell, SOURCE_OBSERVATION).order_by(ReleveMeteo.date.desc()).first()
+    return _releve_to_meteo(releve) if releve else None
+
+
+def stored_forecasts(cell: Tuple[float, float], start: Optional[datetime] = None) -> List[Dict]:
+    """
+    Prévisions enregistrées pour une cellule à partir d'une date
+    (par défaut les 3 dernières heures, pour inclure le créneau en cours)
+    """
+    start = start or datetime.utcnow() - timedelta(hours=3)
+    releves = _cell_query(cell, SOURCE_PREVISION).filter(ReleveMeteo.date >= start)\
+        .order_by(ReleveMeteo.date).all()
+    return [_releve_to_meteo(r) for r in releves]
+
+
+def weather_history(
+    cell: Tuple[float, float],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    source: Optional[str] = None
+):
+    """Requête des relevés d'une cellule, triés par date, filtrés par période et source"""
+    query = ReleveMeteo.query.filter(ReleveMeteo.grid_lat == cell[0], ReleveMeteo.grid_lon == cell[1])
+    if source:
+        query = query.filter(ReleveMeteo.source == source)
+    if start:
+        query = query.filter(ReleveMeteo.date >= start)
+    if end:
+        query = query.filter(ReleveMeteo.date <= end)
+    return query.order_by(ReleveMeteo.date, ReleveMeteo.source)
+
+
+def rainfall_since(cell: Tuple[float, float], since: datetime) -> Optional[float]:
+    """Cumul de pluie observée depuis une date (None si aucune observation)"""
+    count, total = db.session.query(func.count(ReleveMeteo.id), func.sum(ReleveMeteo.pluviometrie)).filter(
+        ReleveMeteo.grid_lat == cell[0],
+        ReleveMeteo.grid_lon == cell[1],
+        ReleveMeteo.source == SOURCE_OBSERVATION,
+        ReleveMeteo.date >= since
+    ).one()
+    return (total or 0.0) if count else None
+
+
+def climate_summaries(cells, start: datetime, end: datetime) -> Dict[Tuple[float, float], Dict]:
+    """
+    Résumés climatiques d'une période pour plusieurs cellules, en une requête groupée
+
+    Returns:
+        Dictionnaire {cellule: résumé} (voir climate_summary) ; les cellules
+        sans observation sont absentes
+    """
+    cells = list(set(cells))
+    if not cells:
+        return {}
+
+    rows = db.session.query(
+        ReleveMeteo.grid_lat,
+        ReleveMeteo.grid_lon,
+        func.count(ReleveMeteo.id),
+        func.min(func.coalesce(ReleveMeteo.temperature_min, ReleveMeteo.temperature)),
+        func.max(func.coalesce(ReleveMeteo.temperature_max, ReleveMeteo.temperature)),
+        func.sum(ReleveMeteo.pluviometrie)
+    ).filter(
+        tuple_(ReleveMeteo.grid_lat, ReleveMeteo.grid_lon).in_(cells),
+        ReleveMeteo.source == SOURCE_OBSERVATION,
+        ReleveMeteo.date >= start,
+        ReleveMeteo.date <= end
+    ).group_by(ReleveMeteo.grid_lat, ReleveMeteo.grid_lon).all()
+
+    heures = max((end - start).total_seconds() / 3600, 1)
+    return {
+        (grid_lat, grid_lon): {
+            'date_debut': start.date(),
+            'date_fin': end.date(),
+            'temperature_min': temp_min,
+            'temperature_max': temp_max,
+            'pluviometrie': pluie or 0.0,
+            'couverture': min(count / heures, 1.0),
+        }
+        for grid_lat, grid_lon, count, temp_min, temp_max, pluie in rows
+    }
+
+
+def climate_summary(cell: Tuple[float, float], start: datetime, end: datetime) -> Optional[Dict]:
+    """
+    Résumé climatique d'une période à partir des observations horaires
+
+    Returns:
+        Dictionnaire avec temperature_min, temperature_max, pluviometrie et couverture
+        (part des heures de la période effectivement observées), ou None
+    """
+    return climate_summaries([cell], start, end).get(tuple(cell))
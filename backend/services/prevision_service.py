@@ -0,0 +1,643 @@
+"""
+Service de prévision des récoltes par série (exploitation × culture)
+
+Chaque série est la suite des quantités récoltées par période (année, mois),
+les récoltes d'une même période étant additionnées. Trois modèles sont
+ajustés sur chaque série :
+- lissage : lissage exponentiel double (Holt, niveau + tendance) ;
+- saisonnier : décomposition multiplicative par mois de récolte (indice =
+  moyenne du mois / moyenne de la série), puis Holt sur la série désaisonnalisée ;
+- regression : moindres carrés (ridge) sur la pluie et la température des
+  données climatiques des FENETRE_CLIMAT_MOIS mois précédant la récolte, et
+  sur le pH et l'azote de la dernière analyse de sol.
+
+Les modèles ne gardent que des statistiques cumulables (niveau, tendance,
+sommes par mois, X'X et X'y) : l'état d'une série est mis en cache et mis à
+jour avec les seules récoltes arrivées depuis. Le cache est propre à chaque
+processus ; il est revalidé contre la base à chaque prévision :
+- chaque état garde l'empreinte des récoltes intégrées (nombre, plus grand
+  identifiant, somme des quantités, des périodes et des quantités pondérées
+  par la période), comparée à celle de la base en une requête groupée ;
+- chaque état garde l'empreinte des données climatiques et des analyses de
+  sol utilisées (relues à chaque prévision pour les variables de la période
+  prévue), comparée sans requête supplémentaire.
+Si l'écart s'explique par des récoltes d'identifiant supérieur au dernier
+intégré, dans des périodes postérieures, elles sont ajoutées à l'état ; tout
+autre écart (modification, suppression, récolte validée après une autre
+d'identifiant supérieur, période déjà intégrée) provoque le recalcul complet
+de la série. Les écritures validées par un autre processus sont donc vues
+à la prévision suivante.
+
+Limite : une modification qui laisse l'empreinte inchangée (par exemple deux
+quantités échangées entre récoltes de même période) n'est pas détectée par
+les autres processus. Le processus qui valide l'écriture invalide en plus
+les séries concernées au commit (écouteurs de session) ; les écritures en
+masse qui contournent l'ORM peuvent appeler mark_previsions_invalides()
+(ou invalidate_previsions() hors transaction) pour le processus courant.
+
+Toutes les séries d'un lot (par exemple d'une région) sont ajustées ensemble
+sur des tableaux numpy (séries × périodes), avec un nombre constant de
+requêtes quel que soit le nombre de séries.
+"""
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import event, func, inspect, select, tuple_
+from sqlalchemy.orm import Session
+
+from database import db
+from models.analyse_sol import AnalyseSol
+from models.donnee_climatique import DonneeClimatique
+from models.exploitation import Exploitation
+from models.recolte import Recolte
+
+ALPHA = 0.5  # Lissage du niveau
+BETA = 0.3  # Lissage de la tendance
+FENETRE_CLIMAT_MOIS = 6  # Mois de données climatiques avant la récolte
+RIDGE = 1e-3  # Régularisation relative de la régression
+NOMBRE_MIN_RECOLTES = 3
+MAX_EXPLOITATIONS_CACHE = 20000
+
+# Variables explicatives de la régression (la constante en premier)
+VARIABLES = ('constante', 'pluviometrie', 'temperature', 'ph', 'azote_n')
+NB_VARIABLES = len(VARIABLES)
+
+MODELE_AUTO = 'auto'
+# Ordre de préférence du mode auto : le premier modèle disponible pour la série est retenu
+ORDRE_AUTO = ('regression', 'saisonnier', 'lissage')
+
+# Empreinte des récoltes d'une série : nombre, plus grand id, sommes des quantités,
+# des périodes et des quantités × périodes
+TAILLE_EMPREINTE = 5
+
+# Champs de l'état d'une série et leur forme (hors dimension des séries)
+CHAMPS_ETAT = {
+    'dernier_id': (),
+    'dernier_t': (),
+    'n': (),
+    'somme': (),
+    'somme_carres': (),
+    'niveau': (),
+    'tendance': (),
+    'niveau_saison': (),
+    'tendance_saison': (),
+    'somme_mois': (12,),
+    'nb_mois': (12,),
+    'xtx': (NB_VARIABLES, NB_VARIABLES),
+    'xty': (NB_VARIABLES,),
+    'n_regression': (),
+    # Empreintes des données intégrées : voir _empreinte_lignes et _empreinte_contexte
+    'empreinte': (TAILLE_EMPREINTE,),
+    'empreinte_contexte': (),
+}
+
+Cle = Tuple[int, str]
+
+_lock = threading.Lock()
+_cache = {'version': 0, 'exploitations': OrderedDict()}  # exploitation_id -> {culture: état}
+
+
+def invalidate_previsions(exploitation_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Invalide les séries en cache (toutes, ou celles des exploitations données)
+
+    Returns:
+        Nouvelle version du cache
+    """
+    with _lock:
+        _cache['version'] += 1
+        if exploitation_ids is None:
+            _cache['exploitations'].clear()
+        else:
+            for exploitation_id in exploitation_ids:
+                _cache['exploitations'].pop(exploitation_id, None)
+        return _cache['version']
+
+
+def get_prevision_cache_stats() -> Dict:
+    """Nombre d'exploitations et de séries en cache"""
+    with _lock:
+        return {
+            'version': _cache['version'],
+            'exploitations': len(_cache['exploitations']),
+            'series': sum(len(s) for s in _cache['exploitations'].values()),
+        }
+
+
+def _lire_cache(cles: Sequence[Cle]) -> Tuple[int, Dict[Cle, Dict]]:
+    with _lock:
+        etats = {}
+        for exploitation_id, culture in cles:
+            series = _cache['exploitations'].get(exploitation_id)
+            if series is not None and culture in series:
+                _cache['exploitations'].move_to_end(exploitation_id)
+                etats[(exploitation_id, culture)] = series[culture]
+        return _cache['version'], etats
+
+
+def _ecrire_cache(version: int, etats: Dict[Cle, Dict]):
+    with _lock:
+        # Une invalidation pendant le calcul rend ces états douteux : ne pas les garder
+        if _cache['version'] != version:
+            return
+        for (exploitation_id, culture), etat in etats.items():
+            _cache['exploitations'].setdefault(exploitation_id, {})[culture] = etat
+            _cache['exploitations'].move_to_end(exploitation_id)
+        while len(_cache['exploitations']) > MAX_EXPLOITATIONS_CACHE:
+            _cache['exploitations'].popitem(last=False)
+
+
+# --- Calcul vectorisé -------------------------------------------------------
+
+def etat_vide(nombre: int) -> Dict[str, np.ndarray]:
+    """État initial (aucune récolte intégrée) de `nombre` séries"""
+    return {champ: np.zeros((nombre,) + forme) for champ, forme in CHAMPS_ETAT.items()}
+
+
+def _empiler(etats: Sequence[Optional[Dict]]) -> Dict[str, np.ndarray]:
+    lot = etat_vide(len(etats))
+    for i, etat in enumerate(etats):
+        if etat is not None:
+            for champ in CHAMPS_ETAT:
+                lot[champ][i] = etat[champ]
+    return lot
+
+
+def _extraire(lot: Dict[str, np.ndarray], i: int) -> Dict:
+    return {champ: lot[champ][i].copy() for champ in CHAMPS_ETAT}
+
+
+def _holt(niveau, tendance, n, y, masque, alpha, beta):
+    """Un pas de lissage de Holt pour les séries du masque (tableaux modifiés en place)"""
+    premier = masque & (n == 0)
+    second = masque & (n == 1)
+    suite = masque & (n >= 2)
+
+    prevu = niveau + tendance
+    nouveau_niveau = alpha * y + (1 - alpha) * prevu
+    nouvelle_tendance = beta * (nouveau_niveau - niveau) + (1 - beta) * tendance
+
+    tendance[second] = (y - niveau)[second]
+    niveau[second] = y[second]
+    niveau[premier] = y[premier]
+    tendance[premier] = 0
+    niveau[suite] = nouveau_niveau[suite]
+    tendance[suite] = nouvelle_tendance[suite]
+
+
+def update_series(lot: Dict[str, np.ndarray], valeurs: np.ndarray, periodes: np.ndarray,
+                  variables: np.ndarray, ids: np.ndarray, alpha: float = ALPHA, beta: float = BETA):
+    """
+    Intègre de nouvelles périodes dans les états de S séries, en une passe par colonne
+
+    Args:
+        lot: États empilés (voir etat_vide), modifiés en place
+        valeurs: Quantités (S, T), NaN après la fin de chaque série
+        periodes: Périodes annee * 12 + mois - 1 (S, T), croissantes sur chaque ligne
+        variables: Variables explicatives (S, T, NB_VARIABLES), NaN si inconnues
+        ids: Plus grand identifiant de récolte de chaque période (S, T)
+    """
+    lignes = np.arange(valeurs.shape[0])
+    for j in range(valeurs.shape[1]):
+        y = valeurs[:, j]
+        masque = ~np.isnan(y)
+        if not masque.any():
+            break
+        y = np.where(masque, y, 0.0)
+        mois = np.where(masque, periodes[:, j] % 12, 0).astype(np.int64)
+
+        # Statistiques de la série et indices saisonniers (après ajout de la valeur)
+        lot['somme'] += y
+        lot['somme_carres'] += y * y
+        lot['somme_mois'][lignes, mois] += y
+        lot['nb_mois'][lignes, mois] += masque
+        n_apres = lot['n'] + masque
+        with np.errstate(invalid='ignore', divide='ignore'):
+            moyenne = lot['somme'] / n_apres
+            indice = (lot['somme_mois'][lignes, mois] / lot['nb_mois'][lignes, mois]) / moyenne
+        indice = np.where(masque & (indice > 0), indice, 1.0)
+
+        _holt(lot['niveau'], lot['tendance'], lot['n'], y, masque, alpha, beta)
+        _holt(lot['niveau_saison'], lot['tendance_saison'], lot['n'], y / indice, masque, alpha, beta)
+
+        # Régression : seules les périodes dont toutes les variables sont connues
+        x = variables[:, j, :]
+        complet = masque & ~np.isnan(x).any(axis=1)
+        x = np.where(complet[:, None], x, 0.0)
+        lot['xtx'] += x[:, :, None] * x[:, None, :]
+        lot['xty'] += x * np.where(complet, y, 0.0)[:, None]
+        lot['n_regression'] += complet
+
+        lot['n'] = n_apres
+        lot['dernier_t'] = np.where(masque, periodes[:, j], lot['dernier_t'])
+        lot['dernier_id'] = np.where(masque, np.maximum(lot['dernier_id'], ids[:, j]), lot['dernier_id'])
+
+
+def next_periods(lot: Dict[str, np.ndarray]) -> np.ndarray:
+    """Prochaine période de récolte : mois observé suivant le dernier, l'année suivante sinon"""
+    observes = lot['nb_mois'] > 0
+    dernier_mois = (lot['dernier_t'] % 12).astype(np.int64)
+    apres = observes & (np.arange(12)[None, :] > dernier_mois[:, None])
+    decalage = np.where(apres.any(axis=1), np.argmax(apres, axis=1), np.argmax(observes, axis=1) + 12)
+    return lot['dernier_t'] - dernier_mois + decalage
+
+
+def _prevision_lissage(lot, periodes, variables):
+    prevision = lot['niveau'] + lot['tendance']
+    return np.where(lot['n'] >= NOMBRE_MIN_RECOLTES, prevision, np.nan)
+
+
+def _prevision_saisonniere(lot, periodes, variables):
+    mois = (periodes % 12).astype(np.int64)
+    lignes = np.arange(len(mois))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        moyenne = lot['somme'] / lot['n']
+        indice = (lot['somme_mois'][lignes, mois] / lot['nb_mois'][lignes, mois]) / moyenne
+    prevision = (lot['niveau_saison'] + lot['tendance_saison']) * indice
+    # Une saisonnalité suppose au moins deux mois de récolte distincts
+    disponible = (lot['n'] >= NOMBRE_MIN_RECOLTES + 1) & ((lot['nb_mois'] > 0).sum(axis=1) >= 2)
+    return np.where(disponible, prevision, np.nan)
+
+
+def _prevision_regression(lot, periodes, variables):
+    # Pénalité proportionnelle à la dispersion (somme des carrés centrée) de chaque variable, donc
+    # indépendante des unités ; constante non pénalisée. Une variable constante (colinéaire à la
+    # constante) est fortement pénalisée, une variable jamais observée garde une pénalité de 1.
+    diagonale = np.einsum('sii->si', lot['xtx'])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dispersion = diagonale - lot['xtx'][:, 0, :] ** 2 / lot['n_regression'][:, None]
+    constante = ~(dispersion > 1e-9 * diagonale)
+    penalite = np.where(constante, diagonale, RIDGE * dispersion)
+    penalite[:, 0] = 0.0
+    penalite = np.where(diagonale > 0, penalite, 1.0)
+    systeme = lot['xtx'] + penalite[:, :, None] * np.eye(NB_VARIABLES)[None, :, :]
+    coefficients = np.linalg.solve(systeme, lot['xty'][:, :, None])[:, :, 0]
+    prevision = np.einsum('sv,sv->s', np.nan_to_num(variables), coefficients)
+    disponible = (lot['n_regression'] >= NB_VARIABLES + 2) & ~np.isnan(variables).any(axis=1)
+    return np.where(disponible, prevision, np.nan)
+
+
+# Modèles disponibles : nom -> fonction (états, périodes prévues, variables prévues) -> prévisions (NaN si indisponible)
+MODELES = {
+    'lissage': _prevision_lissage,
+    'saisonnier': _prevision_saisonniere,
+    'regression': _prevision_regression,
+}
+
+
+def validate_modele(modele: Optional[str]) -> str:
+    """
+    Vérifie un nom de modèle (auto par défaut)
+
+    Raises:
+        ValueError: modèle inconnu
+    """
+    modele = modele or MODELE_AUTO
+    if modele != MODELE_AUTO and modele not in MODELES:
+        raise ValueError(f"Modèle invalide (attendu: {', '.join((MODELE_AUTO,) + tuple(MODELES))})")
+    return modele
+
+
+# --- Données ------------------------------------------------------------------
+
+def _periode(annee: int, mois: int) -> int:
+    return annee * 12 + mois - 1
+
+
+def _fenetre(periode: int) -> Tuple[date, date]:
+    """Dates de début et de fin de la fenêtre climatique d'une période de récolte"""
+    debut = periode - FENETRE_CLIMAT_MOIS + 1
+    fin = periode + 1
+    return date(debut // 12, debut % 12 + 1, 1), date(fin // 12, fin % 12 + 1, 1)
+
+
+def _contexte(exploitation_ids: Sequence[int]) -> Tuple[Dict, Dict]:
+    """Données climatiques et analyses de sol des exploitations (une requête chacune)"""
+    climat, sols = {}, {}
+    if not exploitation_ids:
+        return climat, sols
+    for e, debut, fin, tmin, tmax, pluie in db.session.execute(
+        select(DonneeClimatique.exploitation_id, DonneeClimatique.date_debut, DonneeClimatique.date_fin,
+               DonneeClimatique.temperature_min, DonneeClimatique.temperature_max, DonneeClimatique.pluviometrie)
+        .where(DonneeClimatique.exploitation_id.in_(exploitation_ids))
+        .order_by(DonneeClimatique.exploitation_id, DonneeClimatique.id)
+    ):
+        climat.setdefault(e, []).append((debut, fin, tmin, tmax, pluie))
+    for e, prelevement, ph, azote in db.session.execute(
+        select(AnalyseSol.exploitation_id, AnalyseSol.date_prelevement, AnalyseSol.ph, AnalyseSol.azote_n)
+        .where(AnalyseSol.exploitation_id.in_(exploitation_ids))
+        .order_by(AnalyseSol.exploitation_id, AnalyseSol.date_prelevement, AnalyseSol.id)
+    ):
+        analyses = sols.setdefault(e, ([], []))
+        analyses[0].append(prelevement)
+        analyses[1].append((ph, azote))
+    return climat, sols
+
+
+def _variables(exploitation_id: int, periode: int, climat: Dict, sols: Dict) -> List[float]:
+    """Variables explicatives d'une période de récolte (NaN si inconnues)"""
+    debut, fin = _fenetre(periode)
+    pluies, temperatures = [], []
+    for date_debut, date_fin, tmin, tmax, pluie in climat.get(exploitation_id, ()):
+        if date_fin >= debut and date_debut < fin:
+            if pluie is not None:
+                pluies.append(pluie)
+            bornes = [t for t in (tmin, tmax) if t is not None]
+            if bornes:
+                temperatures.append(sum(bornes) / len(bornes))
+    ph = azote = None
+    if exploitation_id in sols:
+        dates, valeurs = sols[exploitation_id]
+        position = bisect_right(dates, fin) - 1
+        while position >= 0 and dates[position] >= fin:
+            position -= 1
+        if position >= 0:
+            ph, azote = valeurs[position]
+    return [
+        1.0,
+        sum(pluies) if pluies else np.nan,
+        sum(temperatures) / len(temperatures) if temperatures else np.nan,
+        np.nan if ph is None else ph,
+        np.nan if azote is None else azote,
+    ]
+
+
+def _points(lignes: Iterable) -> Dict[Cle, List[Tuple[int, float, int]]]:
+    """Récoltes (exploitation_id, type_culture, annee, mois, quantite, id) -> périodes triées par série"""
+    series = {}
+    for e, culture, annee, mois, quantite, recolte_id in lignes:
+        periodes = series.setdefault((e, culture), {})
+        periode = _periode(annee, mois)
+        somme, dernier_id = periodes.get(periode, (0.0, 0))
+        periodes[periode] = (somme + quantite, max(dernier_id, recolte_id))
+    return {
+        cle: [(periode, somme, recolte_id) for periode, (somme, recolte_id) in sorted(periodes.items())]
+        for cle, periodes in series.items()
+    }
+
+
+def _requete_recoltes():
+    return select(Recolte.exploitation_id, Recolte.type_culture, Recolte.annee, Recolte.mois,
+                  Recolte.quantite_recoltee, Recolte.id)
+
+
+def list_series(region_id: Optional[int] = None, exploitation_ids: Optional[Sequence[int]] = None,
+                type_culture: Optional[str] = None) -> List[Cle]:
+    """Séries (exploitation_id, type_culture) ayant au moins une récolte"""
+    stmt = select(Recolte.exploitation_id, Recolte.type_culture).distinct()
+    if region_id is not None:
+        stmt = stmt.join(Exploitation, Exploitation.id == Recolte.exploitation_id) \
+            .where(Exploitation.region_id == region_id)
+    if exploitation_ids is not None:
+        stmt = stmt.where(Recolte.exploitation_id.in_(exploitation_ids))
+    if type_culture:
+        stmt = stmt.where(Recolte.type_culture == type_culture)
+    return [tuple(cle) for cle in db.session.execute(stmt.order_by(Recolte.exploitation_id, Recolte.type_culture))]
+
+
+def _empreintes(cles: Sequence[Cle]) -> Dict[Cle, np.ndarray]:
+    """Empreinte des récoltes de chaque série en base, en une requête groupée"""
+    periode = Recolte.annee * 12 + Recolte.mois - 1
+    quantite = Recolte.quantite_recoltee
+    stmt = (
+        select(Recolte.exploitation_id, Recolte.type_culture, func.count(), func.max(Recolte.id),
+               func.sum(quantite), func.sum(periode), func.sum(quantite * periode))
+        .where(tuple_(Recolte.exploitation_id, Recolte.type_culture).in_(cles))
+        .group_by(Recolte.exploitation_id, Recolte.type_culture)
+    )
+    return {(e, culture): np.array(valeurs, dtype=float) for e, culture, *valeurs in db.session.execute(stmt)}
+
+
+def _empreinte_lignes(lignes: Iterable, depart: Optional[np.ndarray] = None) -> np.ndarray:
+    """Empreinte (même forme que _empreintes) de récoltes lues, ajoutée à une empreinte de départ"""
+    empreinte = np.zeros(TAILLE_EMPREINTE) if depart is None else depart.copy()
+    for _, _, annee, mois, quantite, recolte_id in lignes:
+        periode = _periode(annee, mois)
+        empreinte += (1, 0, quantite, periode, quantite * periode)
+        empreinte[1] = max(empreinte[1], recolte_id)
+    return empreinte
+
+
+def _meme_empreinte(etat: np.ndarray, base: Optional[np.ndarray]) -> bool:
+    # Nombre et identifiant exacts ; sommes à l'arrondi près (ordre d'addition différent en SQL)
+    return base is not None and etat[0] == base[0] and etat[1] == base[1] \
+        and np.allclose(etat[2:], base[2:], rtol=1e-9, atol=1e-6)
+
+
+def _empreinte_contexte(exploitation_id: int, climat: Dict, sols: Dict) -> float:
+    """Empreinte des données climatiques et analyses de sol lues pour une exploitation"""
+    dates, valeurs = sols.get(exploitation_id, ((), ()))
+    empreinte = hash((tuple(climat.get(exploitation_id, ())), tuple(dates), tuple(valeurs)))
+    # Entier exactement représentable dans l'état (float64)
+    return float(empreinte % (1 << 52))
+
+
+def _series_a_jour(cles: Sequence[Cle]) -> Tuple[Dict[str, np.ndarray], Dict, Dict]:
+    """
+    États à jour des séries : depuis le cache si leurs empreintes sont celles
+    de la base, complétés par les récoltes arrivées depuis, ou recalculés entièrement
+    """
+    version, en_cache = _lire_cache(cles)
+    exploitation_ids = sorted({e for e, _ in cles})
+    empreintes = _empreintes(cles)
+    climat, sols = _contexte(exploitation_ids)
+    contextes = {e: _empreinte_contexte(e, climat, sols) for e in exploitation_ids}
+
+    # États calculés avec les mêmes données climatiques et de sol ; parmi eux, ceux
+    # dont les récoltes ont changé sont complétés (ou recalculés) ci-dessous
+    valides = {cle: etat for cle, etat in en_cache.items() if etat['empreinte_contexte'] == contextes[cle[0]]}
+    a_lire = [cle for cle in cles if cle not in valides or not _meme_empreinte(valides[cle]['empreinte'],
+                                                                              empreintes.get(cle))]
+    seuil = min((int(valides[cle]['dernier_id']) if cle in valides else 0) for cle in a_lire) if a_lire else 0
+    lues = {}
+    if a_lire:
+        for ligne in db.session.execute(
+            _requete_recoltes()
+            .where(tuple_(Recolte.exploitation_id, Recolte.type_culture).in_(a_lire), Recolte.id > seuil)
+        ):
+            lues.setdefault((ligne[0], ligne[1]), []).append(ligne)
+
+    a_lire = set(a_lire)
+    a_recalculer, departs, integrees = [], [], []
+    for cle in cles:
+        etat = valides.get(cle)
+        lignes = []
+        if cle in a_lire:
+            if etat is not None:
+                lignes = [ligne for ligne in lues.get(cle, ()) if ligne[5] > etat['dernier_id']]
+                premiere = min((_periode(ligne[2], ligne[3]) for ligne in lignes), default=None)
+                # Seul un ajout de récoltes dans des périodes nouvelles s'intègre à l'état
+                if premiere is None or premiere <= etat['dernier_t'] or not _meme_empreinte(
+                        _empreinte_lignes(lignes, etat['empreinte']), empreintes.get(cle)):
+                    etat = None
+            if etat is None:
+                lignes = lues.get(cle, [])
+                if seuil > 0:
+                    a_recalculer.append(cle)
+        departs.append(etat)
+        integrees.append(lignes)
+
+    if a_recalculer:
+        completes = {}
+        for ligne in db.session.execute(
+            _requete_recoltes().where(tuple_(Recolte.exploitation_id, Recolte.type_culture).in_(a_recalculer))
+        ):
+            completes.setdefault((ligne[0], ligne[1]), []).append(ligne)
+        for i, cle in enumerate(cles):
+            if departs[i] is None:
+                integrees[i] = completes.get(cle, [])
+
+    ajouts = [_points(lignes).get(cle, []) for cle, lignes in zip(cles, integrees)]
+    longueur = max([len(p) for p in ajouts] + [0])
+    valeurs = np.full((len(cles), longueur), np.nan)
+    periodes = np.zeros((len(cles), longueur), dtype=np.int64)
+    ids = np.zeros((len(cles), longueur))
+    variables = np.full((len(cles), longueur, NB_VARIABLES), np.nan)
+    for i, ((exploitation_id, _), points) in enumerate(zip(cles, ajouts)):
+        for j, (periode, quantite, recolte_id) in enumerate(points):
+            valeurs[i, j] = quantite
+            periodes[i, j] = periode
+            ids[i, j] = recolte_id
+            variables[i, j] = _variables(exploitation_id, periode, climat, sols)
+
+    lot = _empiler(departs)
+    update_series(lot, valeurs, periodes, variables, ids)
+    for i, ((exploitation_id, _), etat, lignes) in enumerate(zip(cles, departs, integrees)):
+        lot['empreinte'][i] = _empreinte_lignes(lignes, None if etat is None else etat['empreinte'])
+        lot['empreinte_contexte'][i] = contextes[exploitation_id]
+    _ecrire_cache(version, {cle: _extraire(lot, i) for i, cle in enumerate(cles) if lot['n'][i] > 0})
+    return lot, climat, sols
+
+
+def _classer(prevue: float, moyenne: float, ecart_type: float) -> Tuple[str, int, int]:
+    """Prédiction et probabilités (bonne, mauvaise) comme la prévision historique"""
+    if prevue > moyenne + ecart_type:
+        return 'bonne', 70, 30
+    if prevue < moyenne - ecart_type:
+        return 'mauvaise', 30, 70
+    return 'moyenne', 50, 50
+
+
+def forecast_series(cles: Sequence[Cle], modele: str = MODELE_AUTO) -> List[Dict]:
+    """
+    Prévision de la prochaine récolte de plusieurs séries, en une passe vectorisée
+
+    Args:
+        cles: Séries (exploitation_id, type_culture)
+        modele: auto (premier disponible dans ORDRE_AUTO) ou clé de MODELES
+
+    Returns:
+        Une prévision par série, dans l'ordre des clés
+    """
+    modele = validate_modele(modele)
+    cles = list(cles)
+    if not cles:
+        return []
+    lot, climat, sols = _series_a_jour(cles)
+
+    periodes = next_periods(lot)
+    variables = np.array([
+        _variables(exploitation_id, int(periode), climat, sols)
+        for (exploitation_id, _), periode in zip(cles, periodes)
+    ]).reshape(len(cles), NB_VARIABLES)
+    previsions = {nom: fonction(lot, periodes, variables) for nom, fonction in MODELES.items()}
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        moyennes = lot['somme'] / lot['n']
+        ecarts_types = np.sqrt(np.maximum(lot['somme_carres'] / lot['n'] - moyennes ** 2, 0))
+
+    resultats = []
+    for i, (exploitation_id, culture) in enumerate(cles):
+        resultat = {'exploitation_id': exploitation_id, 'type_culture': culture}
+        n = int(lot['n'][i])
+        disponibles = {nom: float(valeurs[i]) for nom, valeurs in previsions.items() if not np.isnan(valeurs[i])}
+        choisi = next((nom for nom in ORDRE_AUTO if nom in disponibles), None) if modele == MODELE_AUTO else modele
+
+        if n < NOMBRE_MIN_RECOLTES or choisi not in disponibles:
+            resultat.update({
+                'quantite_prevue': 0,
+                'probabilite_bonne': 50,
+                'probabilite_mauvaise': 50,
+                'prediction': 'moyenne',
+                'raison': 'Données insuffisantes pour une prévision fiable' if n < NOMBRE_MIN_RECOLTES
+                          else f'Données insuffisantes pour le modèle {choisi}',
+            })
+            resultats.append(resultat)
+            continue
+
+        prevue = max(disponibles[choisi], 0.0)
+        moyenne, ecart_type = float(moyennes[i]), float(ecarts_types[i])
+        prediction, probabilite_bonne, probabilite_mauvaise = _classer(prevue, moyenne, ecart_type)
+        periode = int(periodes[i])
+        resultat.update({
+            'quantite_prevue': round(prevue, 2),
+            'probabilite_bonne': round(probabilite_bonne, 1),
+            'probabilite_mauvaise': round(probabilite_mauvaise, 1),
+            'prediction': prediction,
+            'raison': f'Modèle {choisi} basé sur {n} périodes de récolte',
+            'modele': choisi,
+            'periode': {'annee': periode // 12, 'mois': periode % 12 + 1},
+            'previsions': {nom: round(max(valeur, 0.0), 2) for nom, valeur in disponibles.items()},
+            'facteurs': {
+                'moyenne_historique': moyenne,
+                'tendance': float(lot['tendance'][i]),
+                'ecart_type': ecart_type,
+                'nombre_recoltes_analysees': n,
+            },
+        })
+        resultats.append(resultat)
+    return resultats
+
+
+# --- Invalidation -------------------------------------------------------------
+
+def mark_previsions_invalides(session: Session, exploitation_ids: Iterable[int]):
+    """
+    Fait invalider les séries des exploitations au prochain commit de la session
+    (écritures en masse de données climatiques ou d'analyses hors ORM)
+    """
+    session.info.setdefault('previsions_invalides', set()).update(exploitation_ids)
+
+
+def _exploitations_modifiees(session: Session) -> set:
+    """Exploitations dont les séries doivent être recalculées après ce flush"""
+    ids = set()
+    for obj in session.dirty:
+        if isinstance(obj, (Recolte, DonneeClimatique, AnalyseSol)) and session.is_modified(obj):
+            historique = inspect(obj).attrs.exploitation_id.history
+            ids.update(v for v in (historique.deleted or ()) if v is not None)
+            ids.add(obj.exploitation_id)
+    for obj in session.deleted:
+        if isinstance(obj, (Recolte, DonneeClimatique, AnalyseSol)):
+            ids.add(obj.exploitation_id)
+        elif isinstance(obj, Exploitation):
+            ids.add(obj.id)
+    # Nouvelles récoltes : intégrées à la demande ; nouvelles variables : séries à recalculer
+    for obj in session.new:
+        if isinstance(obj, (DonneeClimatique, AnalyseSol)):
+            ids.add(obj.exploitation_id)
+    ids.discard(None)
+    return ids
+
+
+@event.listens_for(Session, 'before_flush')
+def _avant_flush(session, flush_context, instances):
+    ids = _exploitations_modifiees(session)
+    if ids:
+        mark_previsions_invalides(session, ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apres_commit(session):
+    ids = session.info.pop('previsions_invalides', None)
+    if ids:
+        invalidate_previsions(ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _apres_rollback(session):
+    session.info.pop('previsions_invalides', None)
@@ -0,0 +1,123 @@
+"""
+Service de statistiques des récoltes, calculées en SQL
+
+Nombre, minimum, maximum, moyenne, écart-type et médiane des quantités
+récoltées sont calculés par la base en une requête, éventuellement par
+groupe (culture, année, mois, région) : aucune récolte n'est chargée en
+mémoire, quel que soit le nombre de lignes concernées.
+
+La médiane utilise des fonctions de fenêtre (rang de chaque quantité dans
+son groupe) et la variance est calculée en deux passes (écart à la moyenne
+du groupe, elle aussi obtenue par fenêtre), ce qui évite la perte de
+précision de la formule E[x²] - E[x]². Les deux fonctionnent sous SQLite
+(3.25+) comme sous PostgreSQL.
+"""
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import case, func, select
+
+from database import db
+from models.exploitation import Exploitation
+from models.recolte import Recolte
+
+# Regroupements disponibles : nom du paramètre -> (clé de la réponse, colonne)
+GROUPES_STATISTIQUES = {
+    'culture': ('type_culture', Recolte.type_culture),
+    'annee': ('annee', Recolte.annee),
+    'mois': ('mois', Recolte.mois),
+    'region': ('region_id', Exploitation.region_id),
+}
+
+STATISTIQUES_VIDES = {'min': 0, 'max': 0, 'moyenne': 0, 'mediane': 0, 'ecart_type': 0, 'nombre': 0}
+
+
+def parse_group_by(valeur: Optional[str]) -> List[str]:
+    """
+    Regroupements demandés (?group_by=culture,annee)
+
+    Raises:
+        ValueError: regroupement inconnu
+    """
+    groupes = []
+    for nom in (valeur or '').split(','):
+        nom = nom.strip()
+        if not nom:
+            continue
+        if nom not in GROUPES_STATISTIQUES:
+            raise ValueError(f"group_by invalide (attendu: {', '.join(GROUPES_STATISTIQUES)})")
+        if nom not in groupes:
+            groupes.append(nom)
+    return groupes
+
+
+def harvest_statistics(group_by: Sequence[str] = (), exploitation_id=None, type_culture=None,
+                       annee=None, mois=None, region_id=None) -> List[Dict]:
+    """
+    Statistiques des quantités récoltées, globales ou par groupe
+
+    Args:
+        group_by: Regroupements (clés de GROUPES_STATISTIQUES), dans l'ordre voulu
+        exploitation_id, type_culture, annee, mois, region_id: Filtres optionnels
+
+    Returns:
+        Une ligne par groupe {clés du groupe..., min, max, moyenne, mediane,
+        ecart_type, nombre}, triées par groupe ; sans regroupement, une seule
+        ligne (aucune si aucune récolte ne correspond)
+    """
+    groupes = [GROUPES_STATISTIQUES[nom] for nom in group_by]
+    colonnes = [colonne.label(cle) for cle, colonne in groupes]
+    partition = [colonne for _, colonne in groupes]
+    quantite = Recolte.quantite_recoltee
+
+    mesures = select(
+        *colonnes,
+        quantite.label('quantite'),
+        func.avg(quantite).over(partition_by=partition).label('moyenne_groupe'),
+        func.row_number().over(partition_by=partition, order_by=quantite).label('rang'),
+        func.count().over(partition_by=partition).label('effectif'),
+    )
+    if 'region' in group_by or region_id:
+        mesures = mesures.join(Exploitation, Exploitation.id == Recolte.exploitation_id)
+    if exploitation_id:
+        mesures = mesures.where(Recolte.exploitation_id == exploitation_id)
+    if type_culture:
+        mesures = mesures.where(Recolte.type_culture == type_culture)
+    if annee:
+        mesures = mesures.where(Recolte.annee == annee)
+    if mois:
+        mesures = mesures.where(Recolte.mois == mois)
+    if region_id:
+        mesures = mesures.where(Exploitation.region_id == region_id)
+    mesures = mesures.subquery()
+
+    cles = [mesures.c[cle] for cle, _ in groupes]
+    ecart = mesures.c.quantite - mesures.c.moyenne_groupe
+    # Rangs du milieu : (n + 1) / 2 et (n + 2) / 2 en division entière (un seul si n est impair)
+    milieu = mesures.c.rang.in_([(mesures.c.effectif + 1) // 2, (mesures.c.effectif + 2) // 2])
+    stmt = select(
+        *cles,
+        func.min(mesures.c.quantite).label('min'),
+        func.max(mesures.c.quantite).label('max'),
+        func.avg(mesures.c.quantite).label('moyenne'),
+        func.avg(case((milieu, mesures.c.quantite))).label('mediane'),
+        func.avg(ecart * ecart).label('variance'),
+        func.count().label('nombre'),
+    )
+    if cles:
+        stmt = stmt.group_by(*cles).order_by(*cles)
+
+    lignes = []
+    for row in db.session.execute(stmt).mappings():
+        if not row['nombre']:
+            continue
+        ligne = {cle: row[cle] for cle, _ in groupes}
+        ligne.update({
+            'min': row['min'],
+            'max': row['max'],
+            'moyenne': row['moyenne'],
+            'mediane': row['mediane'],
+            'ecart_type': max(row['variance'], 0) ** 0.5,
+            'nombre': row['nombre'],
+        })
+        lignes.append(ligne)
+    return lignes
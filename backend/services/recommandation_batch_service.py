@@ -0,0 +1,160 @@
+"""
+Service de génération des recommandations par lot (job nocturne)
+Les exploitations sont réparties par région en tâches évaluées dans un pool
+de processus ; chaque processus charge et évalue ses exploitations, le
+processus principal enregistre les résultats sans doublons (voir
+save_recommandations) et committe tâche par tâche.
+
+Une exploitation dont l'évaluation échoue, ou une tâche qui échoue
+entièrement (chargement, enregistrement), est comptée dans les échecs du
+job et journalisée ; les autres tâches continuent d'être enregistrées.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from flask import current_app
+
+from database import db
+from models.exploitation import Exploitation
+from services.recommandation_service import generate_recommandations_batch, save_recommandations
+
+# Nombre maximal d'exploitations par tâche envoyée à un processus
+TAILLE_TACHE = 2000
+
+
+def region_partitions(region_ids: Optional[Iterable[int]] = None) -> Dict[Optional[int], List[int]]:
+    """
+    Regroupe les identifiants d'exploitations par région
+
+    Args:
+        region_ids: Régions à traiter (None = tout le pays, y compris les
+            exploitations sans région)
+
+    Returns:
+        Dictionnaire {region_id: identifiants d'exploitations}
+    """
+    query = db.session.query(Exploitation.region_id, Exploitation.id)
+    if region_ids is not None:
+        query = query.filter(Exploitation.region_id.in_(list(region_ids)))
+
+    partitions = {}
+    for region_id, exploitation_id in query.order_by(Exploitation.region_id, Exploitation.id):
+        partitions.setdefault(region_id, []).append(exploitation_id)
+    return partitions
+
+
+def _taches(partitions: Dict[Optional[int], List[int]], taille: int) -> Iterator[Tuple[Optional[int], List[int]]]:
+    """Découpe chaque région en tâches d'au plus `taille` exploitations"""
+    for region_id, ids in partitions.items():
+        for debut in range(0, len(ids), taille):
+            yield region_id, ids[debut:debut + taille]
+
+
+def _init_worker():
+    """Prépare un processus du pool : contexte applicatif et connexions propres"""
+    from app import app
+
+    contexte = app.app_context()
+    contexte.push()
+    # Les connexions héritées du processus parent ne doivent pas être réutilisées
+    db.engine.dispose(close=False)
+
+
+def _evaluer_tache(region_id: Optional[int], exploitation_ids: List[int]):
+    """
+    Évalue les règles pour une tâche (exécuté dans un processus du pool)
+
+    Returns:
+        Tuple (region_id, résultats, échecs {exploitation_id: message})
+    """
+    echecs = {}
+    try:
+        return region_id, generate_recommandations_batch(exploitation_ids, echecs), echecs
+    finally:
+        db.session.remove()
+
+
+def _iter_resultats(taches, processus: int):
+    """
+    Produit les résultats des tâches au fil de l'eau (dans le processus courant si
+    processus <= 1) ; une tâche en échec donne un échec pour chacune de ses exploitations
+    """
+    if processus <= 1:
+        for region_id, ids in taches:
+            echecs = {}
+            try:
+                resultats = generate_recommandations_batch(ids, echecs)
+            except Exception as e:
+                db.session.rollback()
+                resultats, echecs = {}, dict.fromkeys(ids, f'{type(e).__name__}: {e}')
+            yield region_id, resultats, echecs
+        return
+
+    with ProcessPoolExecutor(max_workers=processus, initializer=_init_worker) as executor:
+        futures = {executor.submit(_evaluer_tache, region_id, ids): (region_id, ids) for region_id, ids in taches}
+        for future in as_completed(futures):
+            try:
+                resultat = future.result()
+            except Exception as e:
+                region_id, ids = futures[future]
+                resultat = region_id, {}, dict.fromkeys(ids, f'{type(e).__name__}: {e}')
+            yield resultat
+
+
+def generate_all_recommandations(
+    region_ids: Optional[Iterable[int]] = None,
+    processus: int = 4,
+    taille_tache: int = TAILLE_TACHE
+) -> Dict:
+    """
+    Génère et enregistre les recommandations de toutes les exploitations
+    d'une ou plusieurs régions (ou du pays entier)
+
+    Les recommandations déjà présentes sont mises à jour au lieu d'être
+    dupliquées ; relancer le job sur des données inchangées n'écrit rien.
+    Les échecs (par exploitation) sont comptés sans interrompre le job.
+
+    Args:
+        region_ids: Régions à traiter (None = tout le pays)
+        processus: Nombre de processus d'évaluation (1 = dans le processus courant)
+        taille_tache: Nombre maximal d'exploitations par tâche
+
+    Returns:
+        Statistiques du job (compteurs dont echecs, durée et débit en exploitations/s)
+    """
+    debut = time.perf_counter()
+    partitions = region_partitions(region_ids)
+    # Libérer les connexions avant de créer les processus du pool
+    db.session.remove()
+
+    stats = {
+        'regions': len(partitions),
+        'exploitations': 0,
+        'recommandations': 0,
+        'creees': 0,
+        'mises_a_jour': 0,
+        'inchangees': 0,
+        'echecs': 0,
+    }
+    for region_id, resultats, echecs in _iter_resultats(_taches(partitions, taille_tache), processus):
+        try:
+            enregistrement = save_recommandations(resultats)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            echecs.update(dict.fromkeys(resultats, f'{type(e).__name__}: {e}'))
+        else:
+            stats['exploitations'] += len(resultats)
+            stats['recommandations'] += sum(len(recs) for recs in resultats.values())
+            for compteur in ('creees', 'mises_a_jour', 'inchangees'):
+                stats[compteur] += enregistrement[compteur]
+        for exploitation_id, message in echecs.items():
+            current_app.logger.warning(
+                f'Recommandations non générées pour l\'exploitation {exploitation_id} (région {region_id}): {message}'
+            )
+        stats['echecs'] += len(echecs)
+
+    stats['duree'] = round(time.perf_counter() - debut, 3)
+    stats['debit'] = round(stats['exploitations'] / stats['duree'], 1) if stats['duree'] else None
+    return stats
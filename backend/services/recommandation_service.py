@@ -1,37 +1,184 @@
 """
 Service de génération de recommandations basées sur les données réelles
 ⚠️ Aucune donnée par défaut - toutes les recommandations sont basées sur les données saisies
+
+Les données utilisées par les règles (3 dernières analyses, dernière donnée
+climatique, dernier intrant) sont chargées en une seule requête pour un lot
+d'exploitations, puis évaluées sans accès à la base.
 """
+import json
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Date, Float, Integer, String, cast, func, insert, literal, null, select, union_all, update
+
 from database import db
 from models.analyse_sol import AnalyseSol
 from models.donnee_climatique import DonneeClimatique
 from models.intrant import Intrant
 from models.exploitation import Exploitation, Parcelle
+from models.recommandation import Recommandation
+from services.meteo_service import grid_cell
+from services.meteo_store_service import climate_summaries
 from datetime import datetime, timedelta
 
-def generate_recommandations(exploitation_id):
+# Période et couverture minimale des relevés météo locaux utilisés
+# lorsqu'aucune donnée climatique n'a été saisie
+PERIODE_RELEVES_JOURS = 30
+COUVERTURE_RELEVES_MIN = 0.8
+
+# Nombre d'analyses de sol utilisées par les règles (moyennes sur les 3 dernières)
+NB_ANALYSES = 3
+# Taille des lots d'identifiants par requête de chargement
+TAILLE_LOT_CHARGEMENT = 500
+
+
+def _colonnes(source, exploitation_id, rang, date_1=None, date_2=None, valeurs=(), parcelle_id=None, libelle=None):
+    """Colonnes communes aux branches de la requête UNION ALL de chargement"""
+    valeurs = list(valeurs) + [None] * (4 - len(valeurs))
+    return [
+        literal(source, String).label('source'),
+        exploitation_id.label('exploitation_id'),
+        rang.label('rang'),
+        (date_1 if date_1 is not None else cast(null(), Date)).label('date_1'),
+        (date_2 if date_2 is not None else cast(null(), Date)).label('date_2'),
+    ] + [
+        (v if v is not None else cast(null(), Float)).label(f'valeur_{i}') for i, v in enumerate(valeurs, 1)
+    ] + [
+        (parcelle_id if parcelle_id is not None else cast(null(), Integer)).label('parcelle_id'),
+        (libelle if libelle is not None else cast(null(), String)).label('libelle'),
+    ]
+
+
+def _derniers(model, source, ids, limite, ordre, **colonnes):
+    """Branche retournant les `limite` lignes les plus récentes de chaque exploitation"""
+    rang = func.row_number().over(partition_by=model.exploitation_id, order_by=ordre)
+    classement = select(*_colonnes(source, model.exploitation_id, rang, **colonnes))\
+        .where(model.exploitation_id.in_(ids)).subquery()
+    return select(classement).where(classement.c.rang <= limite)
+
+
+def load_recommandation_inputs(exploitation_ids: Iterable[int]) -> Dict[int, Dict]:
     """
-    Génère des recommandations basées uniquement sur les données réelles saisies
-    Retourne une liste de recommandations avec leurs paramètres utilisés
+    Charge les données utilisées par les règles de recommandation
+
+    Une seule requête (UNION ALL avec ROW_NUMBER par exploitation) par lot de
+    TAILLE_LOT_CHARGEMENT exploitations ; une requête groupée supplémentaire
+    résume les relevés météo locaux des exploitations sans donnée climatique.
+
+    Args:
+        exploitation_ids: Identifiants des exploitations
+
+    Returns:
+        Dictionnaire {exploitation_id: données}, sans les exploitations inexistantes
+    """
+    ids = list(dict.fromkeys(exploitation_ids))
+    donnees = {}
+
+    for debut in range(0, len(ids), TAILLE_LOT_CHARGEMENT):
+        lot = ids[debut:debut + TAILLE_LOT_CHARGEMENT]
+        requete = union_all(
+            select(*_colonnes(
+                'exploitation', Exploitation.id, literal(1, Integer),
+                valeurs=(Exploitation.latitude, Exploitation.longitude)
+            )).where(Exploitation.id.in_(lot)),
+            _derniers(
+                AnalyseSol, 'analyse', lot, NB_ANALYSES,
+                [AnalyseSol.date_prelevement.desc(), AnalyseSol.id.desc()],
+                date_1=AnalyseSol.date_prelevement,
+                valeurs=(AnalyseSol.ph, AnalyseSol.azote_n, AnalyseSol.phosphore_p, AnalyseSol.potassium_k),
+                parcelle_id=AnalyseSol.parcelle_id
+            ),
+            _derniers(
+                DonneeClimatique, 'climat', lot, 1,
+                [DonneeClimatique.date_debut.desc(), DonneeClimatique.id.desc()],
+                date_1=DonneeClimatique.date_debut, date_2=DonneeClimatique.date_fin,
+                valeurs=(DonneeClimatique.temperature_min, DonneeClimatique.temperature_max,
+                         DonneeClimatique.pluviometrie)
+            ),
+            _derniers(
+                Intrant, 'intrant', lot, 1,
+                [Intrant.date_application.desc(), Intrant.id.desc()],
+                date_1=Intrant.date_application,
+                parcelle_id=Intrant.parcelle_id,
+                libelle=Intrant.type_intrant
+            ),
+        )
+
+        lignes = db.session.execute(select(requete.subquery()).order_by('exploitation_id', 'source', 'rang'))
+        # La ligne 'exploitation' garantit l'existence ; les autres peuvent précéder dans le tri
+        autres = []
+        for ligne in lignes:
+            if ligne.source == 'exploitation':
+                donnees[ligne.exploitation_id] = {
+                    'exploitation_id': ligne.exploitation_id,
+                    'latitude': ligne.valeur_1,
+                    'longitude': ligne.valeur_2,
+                    'analyses_sols': [],
+                    'resume_climatique': None,
+                    'dernier_intrant': None,
+                }
+            else:
+                autres.append(ligne)
+
+        for ligne in autres:
+            cible = donnees.get(ligne.exploitation_id)
+            if cible is None:
+                continue
+            if ligne.source == 'analyse':
+                cible['analyses_sols'].append(SimpleNamespace(
+                    date_prelevement=ligne.date_1, ph=ligne.valeur_1, azote_n=ligne.valeur_2,
+                    phosphore_p=ligne.valeur_3, potassium_k=ligne.valeur_4, parcelle_id=ligne.parcelle_id
+                ))
+            elif ligne.source == 'climat':
+                cible['resume_climatique'] = {
+                    'date_debut': ligne.date_1,
+                    'date_fin': ligne.date_2,
+                    'temperature_min': ligne.valeur_1,
+                    'temperature_max': ligne.valeur_2,
+                    'pluviometrie': ligne.valeur_3,
+                }
+            else:
+                cible['dernier_intrant'] = SimpleNamespace(
+                    type_intrant=ligne.libelle, date_application=ligne.date_1, parcelle_id=ligne.parcelle_id
+                )
+
+    # À défaut de saisie, résumer les relevés météo locaux s'ils sont assez complets
+    sans_climat = {
+        exploitation_id: grid_cell(d['latitude'], d['longitude'])
+        for exploitation_id, d in donnees.items()
+        if d['resume_climatique'] is None and d['latitude'] is not None and d['longitude'] is not None
+    }
+    if sans_climat:
+        fin = datetime.utcnow()
+        resumes = climate_summaries(sans_climat.values(), fin - timedelta(days=PERIODE_RELEVES_JOURS), fin)
+        for exploitation_id, cell in sans_climat.items():
+            resume = resumes.get(cell)
+            if resume and resume['couverture'] >= COUVERTURE_RELEVES_MIN:
+                donnees[exploitation_id]['resume_climatique'] = resume
+
+    return donnees
+
+
+def _moyenne(valeurs: Iterable) -> Optional[float]:
+    """Moyenne des valeurs renseignées (0 compris), None si aucune"""
+    valeurs = [v for v in valeurs if v is not None]
+    return sum(valeurs) / len(valeurs) if valeurs else None
+
+
+def evaluate_recommandations(donnees: Dict, aujourd_hui=None) -> List[Dict]:
+    """
+    Applique les règles de recommandation aux données chargées d'une exploitation
+    (voir load_recommandation_inputs), sans accès à la base
+
+    Returns:
+        Liste de recommandations avec leurs paramètres utilisés
     """
     recommandations = []
-    
-    # Récupérer toutes les données de l'exploitation
-    exploitation = Exploitation.query.get(exploitation_id)
-    if not exploitation:
-        return recommandations
-    
-    # Récupérer les analyses de sol les plus récentes
-    analyses_sols = AnalyseSol.query.filter_by(exploitation_id=exploitation_id)\
-        .order_by(AnalyseSol.date_prelevement.desc()).all()
-    
-    # Récupérer les données climatiques récentes
-    donnees_climatiques = DonneeClimatique.query.filter_by(exploitation_id=exploitation_id)\
-        .order_by(DonneeClimatique.date_debut.desc()).limit(5).all()
-    
-    # Récupérer les intrants récents
-    intrants = Intrant.query.filter_by(exploitation_id=exploitation_id)\
-        .order_by(Intrant.date_application.desc()).limit(10).all()
+    aujourd_hui = aujourd_hui or datetime.now().date()
+    analyses_sols = donnees['analyses_sols']
+    resume_climatique = donnees['resume_climatique']
+    dernier_intrant = donnees['dernier_intrant']
     
     # 1. Recommandations basées sur l'analyse de sol
     if analyses_sols:
@@ -69,16 +216,16 @@ def generate_recommandations(exploitation_id):
         if derniere_analyse.azote_n is not None and derniere_analyse.phosphore_p is not None and derniere_analyse.potassium_k is not None:
             # Calculer les moyennes si plusieurs analyses existent
             if len(analyses_sols) > 1:
-                moy_n = sum(a.azote_n for a in analyses_sols[:3] if a.azote_n) / len([a for a in analyses_sols[:3] if a.azote_n])
-                moy_p = sum(a.phosphore_p for a in analyses_sols[:3] if a.phosphore_p) / len([a for a in analyses_sols[:3] if a.phosphore_p])
-                moy_k = sum(a.potassium_k for a in analyses_sols[:3] if a.potassium_k) / len([a for a in analyses_sols[:3] if a.potassium_k])
+                moy_n = _moyenne(a.azote_n for a in analyses_sols[:3])
+                moy_p = _moyenne(a.phosphore_p for a in analyses_sols[:3])
+                moy_k = _moyenne(a.potassium_k for a in analyses_sols[:3])
                 
                 parametres_utilises['moyenne_azote'] = moy_n
                 parametres_utilises['moyenne_phosphore'] = moy_p
                 parametres_utilises['moyenne_potassium'] = moy_k
                 
                 # Recommandation basée sur les moyennes
-                if moy_n < 20:
+                if moy_n is not None and moy_n < 20:
                     recommandations.append({
                         'type_recommandation': 'Fertilisation',
                         'titre': 'Carence en azote',
@@ -88,7 +235,7 @@ def generate_recommandations(exploitation_id):
                         'parcelle_id': derniere_analyse.parcelle_id
                     })
                 
-                if moy_p < 15:
+                if moy_p is not None and moy_p < 15:
                     recommandations.append({
                         'type_recommandation': 'Fertilisation',
                         'titre': 'Carence en phosphore',
@@ -98,7 +245,7 @@ def generate_recommandations(exploitation_id):
                         'parcelle_id': derniere_analyse.parcelle_id
                     })
                 
-                if moy_k < 150:
+                if moy_k is not None and moy_k < 150:
                     recommandations.append({
                         'type_recommandation': 'Fertilisation',
                         'titre': 'Carence en potassium',
@@ -120,64 +267,57 @@ def generate_recommandations(exploitation_id):
                     })
     
     # 2. Recommandations basées sur les données climatiques
-    if donnees_climatiques:
-        derniere_donnee = donnees_climatiques[0]
+    if resume_climatique:
+        pluviometrie = resume_climatique['pluviometrie']
         parametres_climatiques = {
-            'temperature_min': derniere_donnee.temperature_min,
-            'temperature_max': derniere_donnee.temperature_max,
-            'pluviometrie': derniere_donnee.pluviometrie,
-            'periode': f"{derniere_donnee.date_debut} à {derniere_donnee.date_fin}"
+            'temperature_min': resume_climatique['temperature_min'],
+            'temperature_max': resume_climatique['temperature_max'],
+            'pluviometrie': pluviometrie,
+            'periode': f"{resume_climatique['date_debut']} à {resume_climatique['date_fin']}"
         }
+        if 'couverture' in resume_climatique:
+            parametres_climatiques['source'] = 'releves_meteo'
+            parametres_climatiques['couverture'] = round(resume_climatique['couverture'], 2)
         
-        if derniere_donnee.pluviometrie is not None:
-            if derniere_donnee.pluviometrie < 50:
+        if pluviometrie is not None:
+            if pluviometrie < 50:
                 recommandations.append({
                     'type_recommandation': 'Irrigation',
                     'titre': 'Pluviométrie insuffisante',
-                    'description': f'La pluviométrie observée ({derniere_donnee.pluviometrie:.1f} mm) est faible. Irrigation complémentaire recommandée.',
+                    'description': f'La pluviométrie observée ({pluviometrie:.1f} mm) est faible. Irrigation complémentaire recommandée.',
                     'parametres_utilises': parametres_climatiques,
                     'priorite': 'élevée'
                 })
-            elif derniere_donnee.pluviometrie > 300:
+            elif pluviometrie > 300:
                 recommandations.append({
                     'type_recommandation': 'Gestion de l\'eau',
                     'titre': 'Pluviométrie excessive',
-                    'description': f'La pluviométrie observée ({derniere_donnee.pluviometrie:.1f} mm) est élevée. Vérifier le drainage et éviter l\'engorgement.',
+                    'description': f'La pluviométrie observée ({pluviometrie:.1f} mm) est élevée. Vérifier le drainage et éviter l\'engorgement.',
                     'parametres_utilises': parametres_climatiques,
                     'priorite': 'moyenne'
                 })
     
     # 3. Recommandations basées sur l'historique des intrants
-    if intrants:
-        # Analyser les types d'intrants utilisés
-        types_intrants = {}
-        for intrant in intrants:
-            if intrant.type_intrant not in types_intrants:
-                types_intrants[intrant.type_intrant] = []
-            types_intrants[intrant.type_intrant].append(intrant)
-        
+    if dernier_intrant:
         # Recommandation si pas d'intrants récents
-        derniers_intrants = sorted(intrants, key=lambda x: x.date_application, reverse=True)
-        if derniers_intrants:
-            dernier_intrant = derniers_intrants[0]
-            jours_ecoules = (datetime.now().date() - dernier_intrant.date_application).days
-            
-            if jours_ecoules > 90:
-                recommandations.append({
-                    'type_recommandation': 'Planification',
-                    'titre': 'Révision des intrants nécessaire',
-                    'description': f'Aucun intrant appliqué depuis {jours_ecoules} jours. Révision du plan de fertilisation recommandée.',
-                    'parametres_utilises': {
-                        'dernier_intrant': dernier_intrant.type_intrant,
-                        'date_application': dernier_intrant.date_application.isoformat(),
-                        'jours_ecoules': jours_ecoules
-                    },
-                    'priorite': 'moyenne',
-                    'parcelle_id': dernier_intrant.parcelle_id
-                })
+        jours_ecoules = (aujourd_hui - dernier_intrant.date_application).days
+        
+        if jours_ecoules > 90:
+            recommandations.append({
+                'type_recommandation': 'Planification',
+                'titre': 'Révision des intrants nécessaire',
+                'description': f'Aucun intrant appliqué depuis {jours_ecoules} jours. Révision du plan de fertilisation recommandée.',
+                'parametres_utilises': {
+                    'dernier_intrant': dernier_intrant.type_intrant,
+                    'date_application': dernier_intrant.date_application.isoformat(),
+                    'jours_ecoules': jours_ecoules
+                },
+                'priorite': 'moyenne',
+                'parcelle_id': dernier_intrant.parcelle_id
+            })
     
     # Si aucune donnée suffisante, retourner une recommandation informative
-    if not recommandations and not analyses_sols and not donnees_climatiques:
+    if not recommandations and not analyses_sols and not resume_climatique:
         recommandations.append({
             'type_recommandation': 'Information',
             'titre': 'Données insuffisantes',
@@ -189,5 +329,116 @@ def generate_recommandations(exploitation_id):
     return recommandations
 
 
+def generate_recommandations(exploitation_id):
+    """
+    Génère des recommandations basées uniquement sur les données réelles saisies
+    Retourne une liste de recommandations avec leurs paramètres utilisés
+    """
+    donnees = load_recommandation_inputs([exploitation_id]).get(exploitation_id)
+    if not donnees:
+        return []
+    return evaluate_recommandations(donnees)
+
+
+def generate_recommandations_batch(exploitation_ids: Iterable[int],
+                                   echecs: Optional[Dict[int, str]] = None) -> Dict[int, List[Dict]]:
+    """
+    Génère les recommandations de plusieurs exploitations
+    (une requête de chargement par lot au lieu de 4 par exploitation)
+
+    Args:
+        exploitation_ids: Exploitations à évaluer
+        echecs: Si fourni, une exploitation dont l'évaluation échoue y est
+            enregistrée ({exploitation_id: message}) et ignorée au lieu
+            d'interrompre le lot
+
+    Returns:
+        Dictionnaire {exploitation_id: recommandations}
+    """
+    aujourd_hui = datetime.now().date()
+    resultats = {}
+    for exploitation_id, donnees in load_recommandation_inputs(exploitation_ids).items():
+        try:
+            resultats[exploitation_id] = evaluate_recommandations(donnees, aujourd_hui)
+        except Exception as e:
+            if echecs is None:
+                raise
+            echecs[exploitation_id] = f'{type(e).__name__}: {e}'
+    return resultats
 
 
+def _cle_recommandation(exploitation_id, type_recommandation, parcelle_id, titre):
+    """Clé d'unicité d'une recommandation générée (une seule ligne par règle déclenchée)"""
+    return (exploitation_id, type_recommandation, parcelle_id, titre)
+
+
+def save_recommandations(resultats: Dict[int, List[Dict]]) -> Dict:
+    """
+    Enregistre des recommandations générées sans créer de doublons
+
+    Une recommandation existante de même exploitation, type, parcelle et titre
+    est mise à jour (description, paramètres, priorité) en conservant son
+    statut ; les autres sont insérées. Ne fait pas de commit.
+
+    Args:
+        resultats: Dictionnaire {exploitation_id: recommandations générées}
+
+    Returns:
+        Compteurs creees, mises_a_jour, inchangees et identifiants des lignes (ids)
+    """
+    stats = {'creees': 0, 'mises_a_jour': 0, 'inchangees': 0, 'ids': []}
+    if not resultats:
+        return stats
+
+    # Ligne la plus récente par clé (d'éventuels doublons anciens sont laissés tels quels)
+    existantes = {}
+    for ligne in db.session.query(
+        Recommandation.id, Recommandation.exploitation_id, Recommandation.type_recommandation,
+        Recommandation.parcelle_id, Recommandation.titre, Recommandation.description,
+        Recommandation.parametres_utilises, Recommandation.priorite
+    ).filter(Recommandation.exploitation_id.in_(list(resultats))).order_by(Recommandation.id):
+        existantes[_cle_recommandation(
+            ligne.exploitation_id, ligne.type_recommandation, ligne.parcelle_id, ligne.titre
+        )] = ligne
+
+    maintenant = datetime.utcnow()
+    a_inserer, a_mettre_a_jour, cles_inserees = [], [], set()
+    for exploitation_id, recommandations in resultats.items():
+        for rec_data in recommandations:
+            cle = _cle_recommandation(
+                exploitation_id, rec_data['type_recommandation'], rec_data.get('parcelle_id'), rec_data['titre']
+            )
+            valeurs = {
+                'description': rec_data['description'],
+                'parametres_utilises': json.dumps(rec_data.get('parametres_utilises', {})),
+                'priorite': rec_data.get('priorite', 'moyenne'),
+            }
+            existante = existantes.get(cle)
+            if existante is not None:
+                stats['ids'].append(existante.id)
+                if all(getattr(existante, champ) == valeur for champ, valeur in valeurs.items()):
+                    stats['inchangees'] += 1
+                else:
+                    a_mettre_a_jour.append(dict(valeurs, id=existante.id, updated_at=maintenant))
+            elif cle not in cles_inserees:
+                # Une même règle n'est insérée qu'une fois par lot
+                cles_inserees.add(cle)
+                valeurs.update({
+                    'type_recommandation': rec_data['type_recommandation'],
+                    'titre': rec_data['titre'],
+                    'exploitation_id': exploitation_id,
+                    'parcelle_id': rec_data.get('parcelle_id'),
+                    'statut': 'non_appliquée',
+                    'created_at': maintenant,
+                    'updated_at': maintenant,
+                })
+                a_inserer.append(valeurs)
+
+    if a_mettre_a_jour:
+        db.session.execute(update(Recommandation), a_mettre_a_jour)
+        stats['mises_a_jour'] = len(a_mettre_a_jour)
+    if a_inserer:
+        ids = db.session.scalars(insert(Recommandation).returning(Recommandation.id), a_inserer).all()
+        stats['ids'].extend(ids)
+        stats['creees'] = len(a_inserer)
+    return stats
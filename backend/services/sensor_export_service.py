@@ -0,0 +1,239 @@
+"""
+Export en masse des mesures de capteurs (CSV, NDJSON, Parquet, Arrow)
+
+Les mesures sont lues sur un curseur serveur (table chaude et seules
+partitions mensuelles concernées), par lots, et chaque lot est encodé puis
+rendu avant la lecture du suivant : la mémoire utilisée ne dépend que de la
+taille des lots, quel que soit le nombre de lignes exportées.
+
+Les formats colonnes (parquet, arrow) nécessitent pyarrow, dépendance
+optionnelle. La compression gzip s'applique à tous les formats.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import DateTime, Float, Integer, select
+
+from database import db
+from models.sensor import SensorData
+from services.sensor_storage_service import select_sensor_readings
+
+FORMAT_CSV = 'csv'
+FORMAT_NDJSON = 'ndjson'
+FORMAT_PARQUET = 'parquet'
+FORMAT_ARROW = 'arrow'
+EXPORT_FORMATS = (FORMAT_CSV, FORMAT_NDJSON, FORMAT_PARQUET, FORMAT_ARROW)
+TAILLE_LOT_EXPORT = 10000
+
+EXPORT_COLUMNS = [c.name for c in SensorData.__table__.columns]
+COLONNES_DATES = [
+    i for i, c in enumerate(SensorData.__table__.columns) if isinstance(c.type, DateTime)
+]
+
+MIMETYPES = {
+    FORMAT_CSV: 'text/csv',
+    FORMAT_NDJSON: 'application/x-ndjson',
+    FORMAT_PARQUET: 'application/vnd.apache.parquet',
+    FORMAT_ARROW: 'application/vnd.apache.arrow.stream',
+}
+EXTENSIONS = {FORMAT_CSV: 'csv', FORMAT_NDJSON: 'ndjson', FORMAT_PARQUET: 'parquet', FORMAT_ARROW: 'arrow'}
+
+
+def _pyarrow():
+    """Importe pyarrow (dépendance optionnelle des formats colonnes)"""
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401  (charge le sous-module)
+    except ImportError as e:
+        raise ValueError('Les formats parquet et arrow nécessitent pyarrow (pip install pyarrow)') from e
+    return pyarrow
+
+
+def columnar_available() -> bool:
+    """Indique si les formats parquet/arrow sont disponibles"""
+    try:
+        _pyarrow()
+    except ValueError:
+        return False
+    return True
+
+
+def validate_export_format(format_: str) -> str:
+    """
+    Vérifie un format d'export
+
+    Raises:
+        ValueError: format inconnu, ou format colonnes sans pyarrow
+    """
+    if format_ not in EXPORT_FORMATS:
+        raise ValueError(f"Format d'export invalide (attendu: {', '.join(EXPORT_FORMATS)})")
+    if format_ in (FORMAT_PARQUET, FORMAT_ARROW):
+        _pyarrow()
+    return format_
+
+
+def export_filename(format_: str, compress: bool = False) -> str:
+    """Nom de fichier proposé pour un export"""
+    return f"sensor_data.{EXTENSIONS[format_]}{'.gz' if compress else ''}"
+
+
+def iter_sensor_batches(sensor_id=None, sensor_type=None, exploitation_id=None, parcelle_id=None,
+                        start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        batch_size: int = TAILLE_LOT_EXPORT) -> Iterator[List]:
+    """
+    Lots de mesures (lignes Core) triées par (timestamp, id), lus sur un curseur serveur
+    """
+    readings = select_sensor_readings(
+        sensor_id=sensor_id, sensor_type=sensor_type, exploitation_id=exploitation_id,
+        parcelle_id=parcelle_id, start=start, end=end,
+    )
+    stmt = (
+        select(*[readings.c[c] for c in EXPORT_COLUMNS])
+        .order_by(readings.c.timestamp, readings.c.id)
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    for batch in db.session.execute(stmt).partitions(batch_size):
+        yield batch
+
+
+def _lignes_texte(batch: List) -> List[List]:
+    """Lignes d'un lot avec les dates au format ISO (seules les colonnes DateTime sont converties)"""
+    lignes = []
+    for row in batch:
+        ligne = list(row)
+        for i in COLONNES_DATES:
+            if ligne[i] is not None:
+                ligne[i] = ligne[i].isoformat()
+        lignes.append(ligne)
+    return lignes
+
+
+def _encoder_csv(batches: Iterator[List]) -> Iterator[bytes]:
+    tampon = io.StringIO()
+    writer = csv.writer(tampon, lineterminator='\n')
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows(_lignes_texte(batch))
+        yield tampon.getvalue().encode('utf-8')
+        tampon.seek(0)
+        tampon.truncate()
+    if tampon.tell():
+        yield tampon.getvalue().encode('utf-8')
+
+
+def _encoder_ndjson(batches: Iterator[List]) -> Iterator[bytes]:
+    for batch in batches:
+        yield ''.join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, ligne))) + '\n' for ligne in _lignes_texte(batch)
+        ).encode('utf-8')
+
+
+class _Sortie(io.RawIOBase):
+    """Flux d'écriture dont le contenu est vidé à chaque lot (puits des writers pyarrow)"""
+
+    def __init__(self):
+        super().__init__()
+        self._morceaux = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, donnees):
+        self._morceaux.append(bytes(donnees))
+        self._position += len(donnees)
+        return len(donnees)
+
+    def tell(self):
+        return self._position
+
+    def vider(self) -> bytes:
+        donnees = b''.join(self._morceaux)
+        self._morceaux = []
+        return donnees
+
+
+def _schema_arrow(pa):
+    types = {}
+    for colonne in SensorData.__table__.columns:
+        if isinstance(colonne.type, DateTime):
+            types[colonne.name] = pa.timestamp('us')
+        elif isinstance(colonne.type, Integer):
+            types[colonne.name] = pa.int64()
+        elif isinstance(colonne.type, Float):
+            types[colonne.name] = pa.float64()
+        else:
+            types[colonne.name] = pa.string()
+    return pa.schema([(nom, types[nom]) for nom in EXPORT_COLUMNS])
+
+
+def _encoder_colonnes(batches: Iterator[List], format_: str) -> Iterator[bytes]:
+    pa = _pyarrow()
+    schema = _schema_arrow(pa)
+    sortie = _Sortie()
+    if format_ == FORMAT_PARQUET:
+        writer = pa.parquet.ParquetWriter(sortie, schema, compression='snappy')
+    else:
+        writer = pa.ipc.new_stream(sortie, schema)
+    for batch in batches:
+        colonnes = list(zip(*batch))
+        writer.write_batch(pa.record_batch(
+            [pa.array(valeurs, type=schema.field(i).type) for i, valeurs in enumerate(colonnes)],
+            schema=schema,
+        ))
+        yield sortie.vider()
+    writer.close()
+    yield sortie.vider()
+
+
+def _gzip(morceaux: Iterator[bytes]) -> Iterator[bytes]:
+    compresseur = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 : en-tête et fin gzip
+    for morceau in morceaux:
+        compresse = compresseur.compress(morceau)
+        if compresse:
+            yield compresse
+    yield compresseur.flush()
+
+
+def iter_sensor_export(format_: str = FORMAT_CSV, compress: bool = False,
+                       batch_size: int = TAILLE_LOT_EXPORT, **filtres) -> Iterator[bytes]:
+    """
+    Export des mesures de capteurs, morceau par morceau
+
+    Args:
+        format_: csv, ndjson, parquet ou arrow (flux IPC)
+        compress: Compresser le flux en gzip
+        batch_size: Nombre de lignes lues et encodées à la fois
+        **filtres: sensor_id, sensor_type, exploitation_id, parcelle_id, start, end
+
+    Returns:
+        Itérateur d'octets à écrire tels quels (fichier ou réponse HTTP)
+    """
+    validate_export_format(format_)
+    batches = iter_sensor_batches(batch_size=batch_size, **filtres)
+    if format_ == FORMAT_CSV:
+        morceaux = _encoder_csv(batches)
+    elif format_ == FORMAT_NDJSON:
+        morceaux = _encoder_ndjson(batches)
+    else:
+        morceaux = _encoder_colonnes(batches, format_)
+    morceaux = (m for m in morceaux if m)
+    return _gzip(morceaux) if compress else morceaux
+
+
+def export_sensor_data(fichier, format_: str = FORMAT_CSV, compress: bool = False, **filtres) -> Dict:
+    """
+    Écrit un export dans un fichier binaire ouvert
+
+    Returns:
+        Dictionnaire {octets, format, compresse}
+    """
+    octets = 0
+    for morceau in iter_sensor_export(format_, compress, **filtres):
+        fichier.write(morceau)
+        octets += len(morceau)
+    return {'octets': octets, 'format': format_, 'compresse': compress}
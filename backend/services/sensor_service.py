@@ -0,0 +1,277 @@
+"""
+Service d'ingestion des données de capteurs IoT
+Permet d'enregistrer un lot de mesures avec une seule requête de validation,
+une insertion groupée et un seul commit. Les agrégats (1m, 1h, 1d) sont
+maintenus dans la même transaction.
+"""
+import json
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import db
+from models.sensor import Sensor, SensorData, SensorRollup
+from services.sensor_storage_service import select_sensor_readings
+
+# Résolutions des agrégats et troncature correspondante de l'horodatage
+ROLLUP_RESOLUTIONS = {
+    '1m': lambda ts: ts.replace(second=0, microsecond=0),
+    '1h': lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    '1d': lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+
+def parse_sensor_timestamp(value: Optional[str]) -> datetime:
+    """Convertit un horodatage ISO 8601 (avec 'Z' éventuel) en datetime"""
+    if not value:
+        return datetime.utcnow()
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def parse_ndjson(body: str) -> List[Dict]:
+    """
+    Découpe un corps NDJSON (un objet JSON par ligne) en liste de mesures
+
+    Les lignes vides sont ignorées. Une ligne invalide est conservée sous forme
+    d'entrée None afin d'être rejetée avec son index d'origine.
+    """
+    lectures = []
+    for ligne in body.splitlines():
+        ligne = ligne.strip()
+        if not ligne:
+            continue
+        try:
+            lectures.append(json.loads(ligne))
+        except ValueError:
+            lectures.append(None)
+    return lectures
+
+
+def _build_row(data, sensor: Optional[Sensor]) -> Tuple[Optional[Dict], Optional[str]]:
+    """Valide une mesure et construit la ligne à insérer (ou retourne l'erreur)"""
+    if not isinstance(data, dict):
+        return None, 'Format de mesure invalide'
+
+    if not data.get('sensor_id') or not data.get('sensor_type') or data.get('value') is None:
+        return None, 'sensor_id, sensor_type et value sont requis'
+
+    if not sensor:
+        return None, 'Capteur non enregistré'
+
+    if not sensor.is_active:
+        return None, 'Capteur désactivé'
+
+    try:
+        value = float(data['value'])
+        timestamp = parse_sensor_timestamp(data.get('timestamp'))
+    except (ValueError, TypeError, AttributeError) as e:
+        return None, f'Valeur invalide: {str(e)}'
+
+    return {
+        'sensor_id': data['sensor_id'],
+        'sensor_type': data['sensor_type'],
+        'value': value,
+        'unit': data.get('unit', ''),
+        'latitude': data.get('latitude'),
+        'longitude': data.get('longitude'),
+        'parcelle_id': data.get('parcelle_id') or sensor.parcelle_id,
+        'exploitation_id': data.get('exploitation_id') or sensor.exploitation_id,
+        'timestamp': timestamp,
+        'battery_level': data.get('battery_level'),
+        'signal_strength': data.get('signal_strength'),
+        'sensor_metadata': json.dumps(data.get('metadata', {})) if data.get('metadata') else None,
+        'created_at': datetime.utcnow(),
+    }, None
+
+
+def ingest_sensor_readings(lectures: List[Dict]) -> Dict:
+    """
+    Enregistre un lot de mesures de capteurs
+
+    Les capteurs référencés sont chargés en une seule requête, les mesures
+    valides sont insérées en un seul INSERT groupé et le tout est validé
+    par un unique commit.
+
+    Args:
+        lectures: Liste de mesures au format accepté par POST /api/sensors/data
+
+    Returns:
+        Dictionnaire avec le nombre de mesures acceptées/rejetées et le statut
+        de chaque mesure (dans l'ordre de la requête)
+    """
+    sensor_ids = {
+        l['sensor_id'] for l in lectures
+        if isinstance(l, dict) and l.get('sensor_id')
+    }
+    sensors = {}
+    if sensor_ids:
+        sensors = {
+            s.sensor_id: s
+            for s in Sensor.query.filter(Sensor.sensor_id.in_(sensor_ids)).all()
+        }
+
+    rows = []
+    resultats = []
+    # Dernier niveau de batterie connu par capteur (la dernière mesure du lot l'emporte)
+    batteries = {}
+
+    for index, data in enumerate(lectures):
+        sensor = sensors.get(data.get('sensor_id')) if isinstance(data, dict) else None
+        row, erreur = _build_row(data, sensor)
+        if erreur:
+            resultats.append({'index': index, 'statut': 'rejetee', 'erreur': erreur})
+            continue
+
+        rows.append(row)
+        resultats.append({'index': index, 'statut': 'acceptee'})
+        if 'battery_level' in data:
+            batteries[row['sensor_id']] = data['battery_level']
+
+    if rows:
+        try:
+            db.session.execute(insert(SensorData), rows)
+            update_rollups(rows)
+
+            # Mettre à jour les capteurs concernés en un seul UPDATE groupé
+            maintenant = datetime.utcnow()
+            capteurs_lus = {row['sensor_id'] for row in rows}
+            db.session.execute(
+                update(Sensor.__table__)
+                .where(Sensor.__table__.c.sensor_id == bindparam('b_sensor_id'))
+                .values(last_reading=maintenant, updated_at=maintenant),
+                [{'b_sensor_id': sid} for sid in capteurs_lus]
+            )
+
+            if batteries:
+                db.session.execute(
+                    update(Sensor.__table__)
+                    .where(Sensor.__table__.c.sensor_id == bindparam('b_sensor_id'))
+                    .values(battery_level=bindparam('b_battery_level')),
+                    [{'b_sensor_id': sid, 'b_battery_level': level} for sid, level in batteries.items()]
+                )
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    return {
+        'acceptees': len(rows),
+        'rejetees': len(lectures) - len(rows),
+        'resultats': resultats,
+    }
+
+
+def _rollup_insert(dialect_name):
+    """Construction INSERT ... ON CONFLICT adaptée au dialecte de la base"""
+    if dialect_name == 'postgresql':
+        return postgresql.insert(SensorRollup.__table__), func.least, func.greatest
+    # SQLite : min()/max() à deux arguments sont des fonctions scalaires
+    return sqlite.insert(SensorRollup.__table__), func.min, func.max
+
+
+def update_rollups(rows: Iterable[Dict]) -> int:
+    """
+    Met à jour de façon incrémentale les agrégats des mesures fournies
+
+    Les mesures sont d'abord agrégées en mémoire par (capteur, résolution, intervalle),
+    puis fusionnées dans sensor_rollups par un upsert groupé. Ne fait pas de commit :
+    l'appelant valide l'insertion des mesures et des agrégats dans la même transaction.
+
+    Args:
+        rows: Mesures (dictionnaires avec sensor_id, sensor_type, value, timestamp,
+              parcelle_id, exploitation_id)
+
+    Returns:
+        Nombre d'intervalles mis à jour
+    """
+    buckets = {}
+    for row in rows:
+        timestamp = row['timestamp'].replace(tzinfo=None)
+        for resolution, truncate in ROLLUP_RESOLUTIONS.items():
+            key = (row['sensor_id'], resolution, truncate(timestamp))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = {
+                    'sensor_id': row['sensor_id'],
+                    'sensor_type': row['sensor_type'],
+                    'resolution': resolution,
+                    'bucket_start': key[2],
+                    'parcelle_id': row.get('parcelle_id'),
+                    'exploitation_id': row.get('exploitation_id'),
+                    'count': 1,
+                    'sum_value': row['value'],
+                    'min_value': row['value'],
+                    'max_value': row['value'],
+                    'last_value': row['value'],
+                    'last_timestamp': timestamp,
+                    'updated_at': datetime.utcnow(),
+                }
+                continue
+            bucket['count'] += 1
+            bucket['sum_value'] += row['value']
+            bucket['min_value'] = min(bucket['min_value'], row['value'])
+            bucket['max_value'] = max(bucket['max_value'], row['value'])
+            if timestamp >= bucket['last_timestamp']:
+                bucket['last_value'] = row['value']
+                bucket['last_timestamp'] = timestamp
+
+    if not buckets:
+        return 0
+
+    stmt, least, greatest = _rollup_insert(db.session.get_bind().dialect.name)
+    table = SensorRollup.__table__
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.sensor_id, table.c.resolution, table.c.bucket_start],
+        set_={
+            'count': table.c.count + excluded.count,
+            'sum_value': table.c.sum_value + excluded.sum_value,
+            'min_value': least(table.c.min_value, excluded.min_value),
+            'max_value': greatest(table.c.max_value, excluded.max_value),
+            'last_value': case(
+                (excluded.last_timestamp >= table.c.last_timestamp, excluded.last_value),
+                else_=table.c.last_value
+            ),
+            'last_timestamp': greatest(table.c.last_timestamp, excluded.last_timestamp),
+            'updated_at': excluded.updated_at,
+        }
+    )
+    db.session.execute(stmt, list(buckets.values()))
+    return len(buckets)
+
+
+def rebuild_rollups(sensor_id: Optional[str] = None, batch_size: int = 10000) -> int:
+    """
+    Recalcule entièrement les agrégats à partir des mesures brutes
+    (table chaude et partitions archivées), par exemple après un import historique
+
+    Returns:
+        Nombre de mesures relues
+    """
+    try:
+        purge = delete(SensorRollup)
+        if sensor_id:
+            purge = purge.where(SensorRollup.sensor_id == sensor_id)
+        db.session.execute(purge)
+
+        readings = select_sensor_readings(sensor_id=sensor_id)
+        result = db.session.execute(
+            select(readings.c.sensor_id, readings.c.sensor_type, readings.c.value, readings.c.timestamp,
+                   readings.c.parcelle_id, readings.c.exploitation_id)
+        )
+        total = 0
+        while True:
+            batch = [dict(row._mapping) for row in result.fetchmany(batch_size)]
+            if not batch:
+                break
+            update_rollups(batch)
+            total += len(batch)
+
+        db.session.commit()
+        return total
+    except Exception:
+        db.session.rollback()
+        raise
@@ -0,0 +1,187 @@
+"""
+Stockage partitionné par mois des données de capteurs
+
+Les nouvelles mesures sont écrites dans la table chaude `sensor_data`.
+Les mois révolus sont archivés dans des partitions en ajout seul
+(`sensor_data_AAAAMM`), indexées sur (sensor_id, timestamp).
+Les lectures par plage de dates n'interrogent que les partitions
+concernées et une partition peut être supprimée en un seul DROP TABLE.
+"""
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import Column, Index, MetaData, Table, and_, delete, func, inspect, insert, select, union_all
+
+from database import db
+from models.sensor import SensorData
+
+PARTITION_PREFIX = 'sensor_data_'
+PARTITION_PATTERN = re.compile(r'^sensor_data_(\d{6})$')
+
+# Métadonnées séparées : les partitions sont créées à la demande et ne font
+# pas partie du schéma géré par db.create_all()
+partitions_metadata = MetaData()
+
+
+def month_key(moment: datetime) -> str:
+    """Clé de partition (AAAAMM) d'une date"""
+    return f'{moment.year:04d}{moment.month:02d}'
+
+
+def month_bounds(key: str):
+    """Retourne le début (inclus) et la fin (exclue) du mois d'une clé AAAAMM"""
+    annee, mois = int(key[:4]), int(key[4:])
+    debut = datetime(annee, mois, 1)
+    fin = datetime(annee + 1, 1, 1) if mois == 12 else datetime(annee, mois + 1, 1)
+    return debut, fin
+
+
+def partition_name(key: str) -> str:
+    """Nom de la table de partition pour une clé AAAAMM"""
+    return f'{PARTITION_PREFIX}{key}'
+
+
+def get_partition_table(key: str) -> Table:
+    """Définition de la table de partition (mêmes colonnes que sensor_data, sans clés étrangères)"""
+    name = partition_name(key)
+    if name in partitions_metadata.tables:
+        return partitions_metadata.tables[name]
+
+    columns = [
+        Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable)
+        for c in SensorData.__table__.columns
+    ]
+    table = Table(name, partitions_metadata, *columns)
+    Index(f'ix_{name}_sensor_timestamp', table.c.sensor_id, table.c.timestamp)
+    Index(f'ix_{name}_exploitation_timestamp', table.c.exploitation_id, table.c.timestamp)
+    return table
+
+
+def list_partitions() -> List[str]:
+    """Liste triée des clés AAAAMM des partitions existantes"""
+    keys = []
+    for name in inspect(db.engine).get_table_names():
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            keys.append(match.group(1))
+    return sorted(keys)
+
+
+def _partitions_for_range(start: Optional[datetime], end: Optional[datetime]) -> List[str]:
+    """Partitions dont le mois recoupe la plage [start, end]"""
+    keys = list_partitions()
+    if start:
+        keys = [k for k in keys if k >= month_key(start)]
+    if end:
+        keys = [k for k in keys if k <= month_key(end)]
+    return keys
+
+
+def _filtered_select(table, sensor_id=None, sensor_type=None, exploitation_id=None,
+                     parcelle_id=None, start=None, end=None):
+    """SELECT filtré sur une table de mesures (table chaude ou partition)"""
+    conditions = []
+    if sensor_id:
+        conditions.append(table.c.sensor_id == sensor_id)
+    if sensor_type:
+        conditions.append(table.c.sensor_type == sensor_type)
+    if exploitation_id:
+        conditions.append(table.c.exploitation_id == exploitation_id)
+    if parcelle_id:
+        conditions.append(table.c.parcelle_id == parcelle_id)
+    if start:
+        conditions.append(table.c.timestamp >= start)
+    if end:
+        conditions.append(table.c.timestamp <= end)
+
+    columns = [table.c[c.name] for c in SensorData.__table__.columns]
+    stmt = select(*columns)
+    if conditions:
+        stmt = stmt.where(and_(*conditions))
+    return stmt
+
+
+def select_sensor_readings(sensor_id=None, sensor_type=None, exploitation_id=None,
+                           parcelle_id=None, start: Optional[datetime] = None,
+                           end: Optional[datetime] = None):
+    """
+    Construit la requête de lecture des mesures sur la table chaude et les
+    seules partitions qui recoupent la plage demandée
+
+    Returns:
+        Sous-requête (alias `readings`) exposant les colonnes de sensor_data
+    """
+    filtres = dict(sensor_id=sensor_id, sensor_type=sensor_type, exploitation_id=exploitation_id,
+                   parcelle_id=parcelle_id, start=start, end=end)
+
+    selects = [_filtered_select(SensorData.__table__, **filtres)]
+    for key in _partitions_for_range(start, end):
+        selects.append(_filtered_select(get_partition_table(key), **filtres))
+
+    if len(selects) == 1:
+        return selects[0].subquery('readings')
+    return union_all(*selects).subquery('readings')
+
+
+def sensor_row_to_dict(row) -> Dict:
+    """Sérialise une ligne de mesure comme SensorData.to_dict()"""
+    return SensorData(**dict(row._mapping)).to_dict()
+
+
+def archive_sensor_data(before: datetime) -> Dict[str, int]:
+    """
+    Déplace les mois révolus de la table chaude vers leurs partitions
+
+    Seuls les mois entièrement antérieurs au mois de `before` sont archivés.
+    Chaque mois est déplacé dans sa propre transaction (INSERT ... SELECT puis DELETE).
+
+    Returns:
+        Nombre de lignes archivées par clé AAAAMM
+    """
+    limite, _ = month_bounds(month_key(before))
+    hot = SensorData.__table__
+
+    premier = db.session.execute(
+        select(func.min(hot.c.timestamp)).where(hot.c.timestamp < limite)
+    ).scalar()
+    if premier is None:
+        return {}
+
+    archives = {}
+    key = month_key(premier)
+    while key < month_key(limite):
+        debut, fin = month_bounds(key)
+        periode = and_(hot.c.timestamp >= debut, hot.c.timestamp < fin)
+        try:
+            table = get_partition_table(key)
+            table.create(bind=db.session.connection(), checkfirst=True)
+            colonnes = [c.name for c in hot.columns]
+            result = db.session.execute(
+                insert(table).from_select(colonnes, select(*[hot.c[c] for c in colonnes]).where(periode))
+            )
+            db.session.execute(delete(hot).where(periode))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if result.rowcount:
+            archives[key] = result.rowcount
+        key = month_key(fin)
+
+    return archives
+
+
+def drop_partition(key: str) -> bool:
+    """Supprime une partition archivée (DROP TABLE). Retourne False si elle n'existe pas"""
+    if not re.fullmatch(r'\d{6}', key) or key not in list_partitions():
+        return False
+    table = get_partition_table(key)
+    try:
+        table.drop(bind=db.session.connection())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    partitions_metadata.remove(table)
+    return True
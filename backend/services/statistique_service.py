@@ -0,0 +1,542 @@
+"""
+Service de maintenance des statistiques agrégées (statistiques_agregees)
+
+Les compteurs par (région, préfecture, commune, culture principale) sont mis
+à jour incrémentalement à chaque flush de session qui crée, modifie ou
+supprime une exploitation, une analyse de sol, un intrant ou une récolte.
+Les écritures en masse qui contournent l'ORM (insert()/update() groupés,
+Query.delete()) doivent appliquer leurs écarts avec apply_statistiques_deltas,
+ou recalculer la table avec rebuild_statistiques.
+
+Fournit aussi l'évolution temporelle (comptes par intervalle et cumul).
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import Date, DateTime, case, event, func, inspect, null, select, tuple_, type_coerce
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from database import db
+from models.analyse_sol import AnalyseSol
+from models.exploitation import Exploitation
+from models.intrant import Intrant
+from models.recolte import Recolte
+from models.sensor import SensorRollup
+from models.statistique import StatistiqueAgregee
+
+# Compteur incrémenté par chaque type d'enregistrement rattaché à une exploitation
+COMPTEURS_ENFANTS = {
+    AnalyseSol: 'nombre_analyses',
+    Intrant: 'nombre_intrants',
+    Recolte: 'nombre_recoltes',
+}
+COMPTEURS = ('nombre_exploitations', 'superficie_totale') + tuple(COMPTEURS_ENFANTS.values())
+DIMENSIONS = ('region_id', 'prefecture_id', 'commune_id', 'type_culture_principal')
+
+Cle = Tuple[int, int, int, str]
+
+
+def statistique_key(region_id, prefecture_id, commune_id, culture) -> Cle:
+    """Clé d'agrégation (0 / '' pour une valeur non renseignée)"""
+    return (region_id or 0, prefecture_id or 0, commune_id or 0, culture or '')
+
+
+def _ajouter(deltas: Dict, cle: Cle, compteur: str, valeur):
+    if valeur:
+        ligne = deltas.setdefault(cle, {})
+        ligne[compteur] = ligne.get(compteur, 0) + valeur
+
+
+def _valeurs_exploitation(exploitation: Exploitation) -> Tuple[Cle, float]:
+    return (
+        statistique_key(exploitation.region_id, exploitation.prefecture_id,
+                        exploitation.commune_id, exploitation.type_culture_principal),
+        exploitation.superficie_totale or 0
+    )
+
+
+def _ajouter_exploitation(deltas: Dict, cle: Cle, superficie: float, signe: int):
+    _ajouter(deltas, cle, 'nombre_exploitations', signe)
+    _ajouter(deltas, cle, 'superficie_totale', signe * superficie)
+
+
+def _cles_exploitations(session: Session, exploitation_ids: Iterable[int]) -> Dict[int, Cle]:
+    """
+    Clés d'agrégation d'exploitations, avec les valeurs de la session si
+    l'exploitation y est chargée (les enregistrements rattachés suivent les
+    modifications de leur exploitation), sinon celles de la base
+    """
+    cles, manquantes = {}, set()
+    for exploitation_id in set(exploitation_ids):
+        if exploitation_id is None:
+            continue
+        exploitation = session.identity_map.get(inspect(Exploitation).identity_key_from_primary_key((exploitation_id,)))
+        if exploitation is not None:
+            cles[exploitation_id] = _valeurs_exploitation(exploitation)[0]
+        else:
+            manquantes.add(exploitation_id)
+    if manquantes:
+        for ligne in session.execute(
+            select(Exploitation.id, *[getattr(Exploitation, d) for d in DIMENSIONS])
+            .where(Exploitation.id.in_(manquantes))
+        ):
+            cles[ligne[0]] = statistique_key(*ligne[1:])
+    return cles
+
+
+def child_deltas(model, comptes: Dict[int, int]) -> Dict[Cle, Dict[str, float]]:
+    """
+    Écarts de compteurs pour des enregistrements rattachés (analyses, intrants,
+    récoltes) insérés en masse hors de l'ORM
+
+    Args:
+        model: Classe des enregistrements (clé de COMPTEURS_ENFANTS)
+        comptes: Dictionnaire {exploitation_id: nombre d'enregistrements (négatif si supprimés)}
+    """
+    compteur = COMPTEURS_ENFANTS[model]
+    cles = _cles_exploitations(db.session, comptes)
+    deltas = {}
+    for exploitation_id, nombre in comptes.items():
+        if exploitation_id in cles:
+            _ajouter(deltas, cles[exploitation_id], compteur, nombre)
+    return deltas
+
+
+def _ancienne_valeur(obj, attribut):
+    """Valeur d'un attribut avant modification (None si non chargée)"""
+    historique = inspect(obj).attrs[attribut].history
+    if historique.deleted:
+        return historique.deleted[0]
+    if historique.unchanged:
+        return historique.unchanged[0]
+    return None
+
+
+def _collecter_deltas(session: Session) -> Dict[Cle, Dict[str, float]]:
+    """Calcule les écarts de compteurs induits par les objets en attente de flush"""
+    deltas = {}
+    enfants_ajoutes, enfants_retires = [], []
+    exploitations_modifiees = []
+
+    for obj in session.new:
+        if isinstance(obj, Exploitation):
+            cle, superficie = _valeurs_exploitation(obj)
+            _ajouter_exploitation(deltas, cle, superficie, 1)
+        elif type(obj) in COMPTEURS_ENFANTS:
+            enfants_ajoutes.append((obj, obj.exploitation_id))
+
+    for obj in session.deleted:
+        if isinstance(obj, Exploitation):
+            # Valeurs en base : l'objet a pu être modifié avant sa suppression
+            exploitations_modifiees.append((obj, True))
+        elif type(obj) in COMPTEURS_ENFANTS:
+            enfants_retires.append((obj, _ancienne_valeur(obj, 'exploitation_id') or obj.exploitation_id))
+
+    for obj in session.dirty:
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        if isinstance(obj, Exploitation):
+            if any(inspect(obj).attrs[a].history.has_changes() for a in DIMENSIONS + ('superficie_totale',)):
+                exploitations_modifiees.append((obj, False))
+        elif type(obj) in COMPTEURS_ENFANTS and inspect(obj).attrs.exploitation_id.history.has_changes():
+            historique = inspect(obj).attrs.exploitation_id.history
+            ancien = historique.deleted[0] if historique.deleted else None
+            if ancien is not None:
+                enfants_retires.append((obj, ancien))
+            enfants_ajoutes.append((obj, obj.exploitation_id))
+
+    cles = _cles_exploitations(session, [e for _, e in enfants_ajoutes + enfants_retires])
+
+    if exploitations_modifiees:
+        ids = [obj.id for obj, _ in exploitations_modifiees]
+        anciennes = {
+            ligne.id: (statistique_key(*[getattr(ligne, d) for d in DIMENSIONS]), ligne.superficie_totale or 0)
+            for ligne in session.execute(
+                select(Exploitation.id, Exploitation.superficie_totale, *[getattr(Exploitation, d) for d in DIMENSIONS])
+                .where(Exploitation.id.in_(ids))
+            )
+        }
+        enfants = {}
+        for model, compteur in COMPTEURS_ENFANTS.items():
+            for exploitation_id, nombre in session.execute(
+                select(model.exploitation_id, func.count(model.id))
+                .where(model.exploitation_id.in_(ids)).group_by(model.exploitation_id)
+            ):
+                enfants.setdefault(exploitation_id, {})[compteur] = nombre
+
+        for obj, supprimee in exploitations_modifiees:
+            if obj.id not in anciennes:
+                continue
+            ancienne_cle, ancienne_superficie = anciennes[obj.id]
+            _ajouter_exploitation(deltas, ancienne_cle, ancienne_superficie, -1)
+            if supprimee:
+                nouvelle_cle = None
+            else:
+                nouvelle_cle, superficie = _valeurs_exploitation(obj)
+                _ajouter_exploitation(deltas, nouvelle_cle, superficie, 1)
+            # Les enregistrements rattachés suivent leur exploitation
+            for compteur, nombre in enfants.get(obj.id, {}).items():
+                if nouvelle_cle != ancienne_cle:
+                    _ajouter(deltas, ancienne_cle, compteur, -nombre)
+                    if nouvelle_cle is not None:
+                        _ajouter(deltas, nouvelle_cle, compteur, nombre)
+
+    # Les enregistrements d'une exploitation supprimée sont déjà retirés avec elle
+    supprimees = {obj.id for obj, supprimee in exploitations_modifiees if supprimee}
+    for signe, enfants_lies in ((1, enfants_ajoutes), (-1, enfants_retires)):
+        for obj, exploitation_id in enfants_lies:
+            if exploitation_id in supprimees:
+                continue
+            if exploitation_id is not None:
+                cle = cles.get(exploitation_id)
+            elif obj.exploitation is not None:
+                # Exploitation ajoutée dans le même flush (pas encore d'identifiant)
+                cle = _valeurs_exploitation(obj.exploitation)[0]
+            else:
+                cle = None
+            if cle is not None:
+                _ajouter(deltas, cle, COMPTEURS_ENFANTS[type(obj)], signe)
+
+    return deltas
+
+
+def _statistique_insert(dialect_name):
+    """Construction INSERT ... ON CONFLICT adaptée au dialecte de la base"""
+    if dialect_name == 'postgresql':
+        return postgresql.insert(StatistiqueAgregee.__table__)
+    return sqlite.insert(StatistiqueAgregee.__table__)
+
+
+def apply_statistiques_deltas(deltas: Dict[Cle, Dict[str, float]], connection=None) -> int:
+    """
+    Applique des écarts aux compteurs agrégés (upsert additif, sans commit)
+
+    Args:
+        deltas: Dictionnaire {clé (région, préfecture, commune, culture): {compteur: écart}}
+        connection: Connexion à utiliser (par défaut la session courante)
+
+    Returns:
+        Nombre de lignes agrégées touchées
+    """
+    rows = []
+    maintenant = datetime.utcnow()
+    for (region_id, prefecture_id, commune_id, culture), compteurs in deltas.items():
+        if not any(compteurs.values()):
+            continue
+        row = {compteur: compteurs.get(compteur, 0) for compteur in COMPTEURS}
+        row.update({
+            'region_id': region_id,
+            'prefecture_id': prefecture_id,
+            'commune_id': commune_id,
+            'culture': culture,
+            'updated_at': maintenant,
+        })
+        rows.append(row)
+    if not rows:
+        return 0
+
+    executor = connection if connection is not None else db.session
+    dialect = connection.dialect if connection is not None else db.session.get_bind().dialect
+    table = StatistiqueAgregee.__table__
+    stmt = _statistique_insert(dialect.name)
+    set_ = {compteur: table.c[compteur] + stmt.excluded[compteur] for compteur in COMPTEURS}
+    set_['updated_at'] = stmt.excluded.updated_at
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['region_id', 'prefecture_id', 'commune_id', 'culture'],
+        set_=set_
+    )
+    executor.execute(stmt, rows)
+    return len(rows)
+
+
+# Sources de lecture : table agrégée (par défaut) ou calcul direct sur les tables de base
+SOURCE_AGREGATS = 'agregats'
+SOURCE_DIRECTE = 'direct'
+DIMENSIONS_AGREGATS = ('region_id', 'prefecture_id', 'commune_id', 'culture')
+
+
+def _dimensions(group_by) -> Tuple[str, ...]:
+    if not group_by:
+        return ()
+    return (group_by,) if isinstance(group_by, str) else tuple(group_by)
+
+
+def _filtrer(query, colonne, filtres: Dict):
+    """Égalités sur les dimensions ; une liste filtre par IN"""
+    for champ, valeur in filtres.items():
+        if isinstance(valeur, (list, tuple, set)):
+            query = query.where(colonne(champ).in_(list(valeur)))
+        else:
+            query = query.where(colonne(champ) == valeur)
+    return query
+
+
+def _resultats(lignes, dimensions: Tuple[str, ...]):
+    """Regroupe les lignes (dimensions..., compteurs...) par clé normalisée (0 / '' pour non renseigné)"""
+    if not dimensions:
+        ligne = lignes.one()
+        return {compteur: valeur or 0 for compteur, valeur in zip(COMPTEURS, ligne)}
+
+    resultats = {}
+    for ligne in lignes:
+        valeurs = tuple(
+            valeur if valeur is not None else ('' if dimension == 'culture' else 0)
+            for dimension, valeur in zip(dimensions, ligne)
+        )
+        compteurs = resultats.setdefault(valeurs[0] if len(dimensions) == 1 else valeurs, dict.fromkeys(COMPTEURS, 0))
+        for compteur, valeur in zip(COMPTEURS, ligne[len(dimensions):]):
+            compteurs[compteur] += valeur or 0
+    return resultats
+
+
+def _colonne_agregat(dimension):
+    return getattr(StatistiqueAgregee, dimension)
+
+
+def _colonne_exploitation(dimension):
+    return getattr(Exploitation, 'type_culture_principal' if dimension == 'culture' else dimension)
+
+
+def _statistiques_agregats(dimensions, filtres):
+    colonnes = [_colonne_agregat(d) for d in dimensions]
+    query = select(*colonnes, *[func.sum(getattr(StatistiqueAgregee, c)) for c in COMPTEURS])
+    query = _filtrer(query, _colonne_agregat, filtres)
+    if colonnes:
+        query = query.group_by(*colonnes)
+    return _resultats(db.session.execute(query), dimensions)
+
+
+def _statistiques_directes(dimensions, filtres):
+    colonnes = [_colonne_exploitation(d) for d in dimensions]
+    # Un comptage groupé par exploitation pour chaque type d'enregistrement rattaché
+    enfants = [
+        select(model.exploitation_id, func.count(model.id).label('nombre'))
+        .group_by(model.exploitation_id).subquery()
+        for model in COMPTEURS_ENFANTS
+    ]
+    query = select(
+        *colonnes,
+        func.count(Exploitation.id),
+        func.sum(Exploitation.superficie_totale),
+        *[func.sum(enfant.c.nombre) for enfant in enfants]
+    ).select_from(Exploitation)
+    for enfant in enfants:
+        query = query.outerjoin(enfant, enfant.c.exploitation_id == Exploitation.id)
+    query = _filtrer(query, _colonne_exploitation, filtres)
+    if colonnes:
+        query = query.group_by(*colonnes)
+    return _resultats(db.session.execute(query), dimensions)
+
+
+def aggregate_statistiques(group_by=None, source: str = SOURCE_AGREGATS, **filtres):
+    """
+    Somme des compteurs, éventuellement groupée par une ou plusieurs dimensions
+    (une seule requête GROUP BY, quelle que soit la source)
+
+    Args:
+        group_by: Dimension (region_id, prefecture_id, commune_id, culture) ou tuple de dimensions
+        source: 'agregats' (table statistiques_agregees) ou 'direct' (calcul sur les
+            tables exploitations, analyses_sols, intrants et recoltes)
+        filtres: Égalités sur les dimensions (ex: region_id=3) ; une liste filtre par IN
+
+    Returns:
+        Dictionnaire {compteur: total}, ou {valeur (ou tuple de valeurs) des dimensions: {compteur: total}}
+    """
+    dimensions = _dimensions(group_by)
+    if source == SOURCE_DIRECTE:
+        return _statistiques_directes(dimensions, filtres)
+    if source != SOURCE_AGREGATS:
+        raise ValueError(f'Source de statistiques inconnue: {source}')
+    return _statistiques_agregats(dimensions, filtres)
+
+
+def rebuild_statistiques() -> int:
+    """
+    Recalcule entièrement la table des statistiques agrégées (sans commit)
+    À lancer après une écriture en masse hors ORM ou à la mise en service.
+
+    Returns:
+        Nombre de lignes agrégées
+    """
+    deltas = aggregate_statistiques(DIMENSIONS_AGREGATS, source=SOURCE_DIRECTE)
+    db.session.execute(StatistiqueAgregee.__table__.delete())
+    return apply_statistiques_deltas(deltas)
+
+
+GRANULARITES = ('jour', 'semaine', 'mois', 'annee')
+ENTITES_EVOLUTION = ('exploitations', 'analyses', 'intrants', 'recoltes', 'mesures')
+MAX_POINTS_EVOLUTION = 5000
+
+
+def truncate_date(valeur: date, granularite: str) -> date:
+    """Début de l'intervalle (jour, semaine du lundi, mois, année) contenant une date"""
+    if granularite == 'jour':
+        return valeur
+    if granularite == 'semaine':
+        return valeur - timedelta(days=valeur.weekday())
+    if granularite == 'mois':
+        return valeur.replace(day=1)
+    if granularite == 'annee':
+        return valeur.replace(month=1, day=1)
+    raise ValueError(f'Granularité inconnue: {granularite} (attendu: {", ".join(GRANULARITES)})')
+
+
+def shift_date(valeur: date, granularite: str, pas: int = 1) -> date:
+    """Début de l'intervalle situé `pas` intervalles après (ou avant) un début d'intervalle"""
+    if granularite == 'jour':
+        return valeur + timedelta(days=pas)
+    if granularite == 'semaine':
+        return valeur + timedelta(weeks=pas)
+    mois = valeur.year * 12 + valeur.month - 1 + (pas if granularite == 'mois' else 12 * pas)
+    return date(mois // 12, mois % 12 + 1, 1)
+
+
+def _tronquer_colonne(colonne, granularite: str, dialect_name: str):
+    """Expression SQL du début d'intervalle (mêmes bornes que truncate_date)"""
+    if dialect_name == 'postgresql':
+        unite = {'jour': 'day', 'semaine': 'week', 'mois': 'month', 'annee': 'year'}[granularite]
+        return func.date_trunc(unite, colonne)
+    if granularite == 'jour':
+        return func.date(colonne)
+    if granularite == 'semaine':
+        # SQLite : dimanche suivant (ou même jour) moins 6 jours = lundi de la semaine
+        return func.date(colonne, 'weekday 0', '-6 days')
+    if granularite == 'mois':
+        return func.strftime('%Y-%m-01', colonne)
+    return func.strftime('%Y-01-01', colonne)
+
+
+def _date_recolte(dialect_name: str):
+    """Premier jour de la période de récolte (annee, mois), en expression SQL de type Date"""
+    if dialect_name == 'postgresql':
+        return func.make_date(Recolte.annee, Recolte.mois, 1)
+    return type_coerce(func.printf('%04d-%02d-01', Recolte.annee, Recolte.mois), Date)
+
+
+def _avant_periode_recolte(borne: date):
+    """Récoltes dont la période commence avant une date (comparaison indexable sur annee, mois)"""
+    # Premier mois commençant à la borne ou après
+    mois = borne.year * 12 + borne.month - 1 + (borne.day > 1)
+    return tuple_(Recolte.annee, Recolte.mois) < (mois // 12, mois % 12 + 1)
+
+
+def _source_evolution(entite: str, dialect_name: str):
+    """
+    Colonne de date, condition « antérieure à une date », expression de comptage
+    et colonne exploitation_id d'une entité
+    """
+    if entite == 'recoltes':
+        # Période de récolte et non date de saisie (un import en masse saisit des campagnes passées)
+        return _date_recolte(dialect_name), _avant_periode_recolte, func.count(Recolte.id), Recolte.exploitation_id
+    if entite == 'exploitations':
+        colonne, comptage, exploitation_id = Exploitation.created_at, func.count(Exploitation.id), Exploitation.id
+    elif entite == 'analyses':
+        colonne, comptage, exploitation_id = (
+            AnalyseSol.date_prelevement, func.count(AnalyseSol.id), AnalyseSol.exploitation_id)
+    elif entite == 'intrants':
+        colonne, comptage, exploitation_id = Intrant.date_application, func.count(Intrant.id), Intrant.exploitation_id
+    elif entite == 'mesures':
+        # Agrégats journaliers : couvrent aussi les mesures archivées dans les partitions mensuelles
+        colonne, comptage, exploitation_id = (
+            SensorRollup.bucket_start, func.sum(SensorRollup.count), SensorRollup.exploitation_id)
+    else:
+        raise ValueError(f'Entité inconnue: {entite} (attendu: {", ".join(ENTITES_EVOLUTION)})')
+
+    def avant(borne: date):
+        if isinstance(colonne.type, DateTime):
+            borne = datetime.combine(borne, datetime.min.time())
+        return colonne < borne
+
+    return colonne, avant, comptage, exploitation_id
+
+
+def _as_date(valeur) -> date:
+    if isinstance(valeur, datetime):
+        return valeur.date()
+    if isinstance(valeur, date):
+        return valeur
+    return date.fromisoformat(str(valeur)[:10])
+
+
+def evolution_cumulee(
+    entite: str,
+    granularite: str,
+    debut: date,
+    fin: date,
+    region_id: int = None
+) -> List[Dict]:
+    """
+    Évolution d'une entité par intervalle de temps, avec cumul
+
+    Tous les points sont calculés par une seule requête groupée (les
+    enregistrements antérieurs à la période forment le cumul initial),
+    puis un cumul courant : le coût ne dépend pas du nombre de points.
+
+    Args:
+        entite: exploitations, analyses, intrants, recoltes (datées du premier
+            jour de leur période annee/mois) ou mesures (capteurs)
+        granularite: jour, semaine (commençant le lundi), mois ou annee
+        debut: Date incluse dans le premier intervalle
+        fin: Date incluse dans le dernier intervalle
+        region_id: Limiter aux exploitations d'une région
+
+    Returns:
+        Liste de points {date (début d'intervalle), nombre, cumul}, intervalles vides compris
+    """
+    dialect_name = db.session.get_bind().dialect.name
+    colonne, avant, comptage, exploitation_id = _source_evolution(entite, dialect_name)
+    premier = truncate_date(debut, granularite)
+    dernier = truncate_date(fin, granularite)
+    if dernier < premier:
+        raise ValueError('La date de fin doit être postérieure à la date de début')
+
+    periodes = [premier]
+    while periodes[-1] < dernier:
+        if len(periodes) >= MAX_POINTS_EVOLUTION:
+            raise ValueError(f'Période trop longue pour cette granularité (maximum {MAX_POINTS_EVOLUTION} points)')
+        periodes.append(shift_date(periodes[-1], granularite))
+
+    periode = case((avant(premier), null()), else_=_tronquer_colonne(colonne, granularite, dialect_name))
+    query = select(periode.label('periode'), comptage).where(avant(shift_date(dernier, granularite)))
+    if entite == 'mesures':
+        query = query.where(SensorRollup.resolution == '1d')
+    if region_id is not None and entite == 'exploitations':
+        query = query.where(Exploitation.region_id == region_id)
+    elif region_id is not None:
+        query = query.where(exploitation_id.in_(select(Exploitation.id).where(Exploitation.region_id == region_id)))
+
+    cumul, comptes = 0, {}
+    for valeur, nombre in db.session.execute(query.group_by(periode)):
+        if valeur is None:
+            cumul += nombre or 0
+        else:
+            cle = _as_date(valeur)
+            comptes[cle] = comptes.get(cle, 0) + (nombre or 0)
+
+    evolution = []
+    for debut_periode in periodes:
+        nombre = comptes.get(debut_periode, 0)
+        cumul += nombre
+        evolution.append({'date': debut_periode.isoformat(), 'nombre': nombre, 'cumul': cumul})
+    return evolution
+
+
+@event.listens_for(Session, 'before_flush')
+def _avant_flush(session, flush_context, instances):
+    with session.no_autoflush:
+        deltas = _collecter_deltas(session)
+    if deltas:
+        en_attente = session.info.setdefault('statistiques_deltas', [])
+        en_attente.append(deltas)
+
+
+@event.listens_for(Session, 'after_flush')
+def _apres_flush(session, flush_context):
+    for deltas in session.info.pop('statistiques_deltas', []):
+        apply_statistiques_deltas(deltas, session.connection())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _apres_rollback(session):
+    session.info.pop('statistiques_deltas', None)
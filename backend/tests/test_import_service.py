@@ -0,0 +1,298 @@
+"""
+Tests unitaires pour l'import en masse (récoltes, analyses de sol, intrants, données climatiques)
+"""
+import io
+import json
+import unittest
+from unittest.mock import patch
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from models.user import User, Role
+from models.exploitation import Exploitation, Parcelle
+from models.recolte import Recolte
+from models.analyse_sol import AnalyseSol
+from models.intrant import Intrant
+from models.donnee_climatique import DonneeClimatique
+from models.historique_action import HistoriqueAction
+from services import import_service
+from services.statistique_service import aggregate_statistiques
+
+
+class TestImportRecoltes(unittest.TestCase):
+    """Tests pour POST /api/recoltes/import (CSV, NDJSON, JSON)"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        with app.app_context():
+            db.create_all()
+            role = Role(nom='Agriculteur')
+            db.session.add(role)
+            db.session.commit()
+            user = User(username='importuser', email='import@example.com', role_id=role.id)
+            user.set_password('password123')
+            db.session.add(user)
+            db.session.commit()
+            exploitations = [Exploitation(nom=f'Ferme {i}', superficie_totale=10, proprietaire_id=user.id, region_id=1)
+                             for i in range(2)]
+            db.session.add_all(exploitations)
+            db.session.commit()
+            parcelle = Parcelle(nom='Parcelle A', superficie=2, exploitation_id=exploitations[0].id)
+            db.session.add(parcelle)
+            db.session.commit()
+            self.exploitation_ids = [e.id for e in exploitations]
+            self.parcelle_id = parcelle.id
+            self.token = create_access_token(identity=str(user.id))
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _post(self, data, content_type, query=''):
+        return self.app.post(f'/api/recoltes/import{query}', data=data, content_type=content_type,
+                             headers={'Authorization': f'Bearer {self.token}'})
+
+    def _csv(self, lignes):
+        entete = 'exploitation_id,parcelle_id,type_culture,mois,annee,quantite_recoltee,superficie_recoltee'
+        return '\n'.join([entete] + lignes).encode('utf-8')
+
+    def test_csv_import_with_line_errors(self):
+        """Test import CSV par lots : lignes valides importées, erreurs par ligne"""
+        e1, e2 = self.exploitation_ids
+        data = self._csv([
+            f'{e1},{self.parcelle_id},Maïs,6,2024,1200,2',   # ligne 2 : valide
+            f'{e2},,Sorgho,7,2024,800,',                     # ligne 3 : valide
+            f'999,,Maïs,6,2024,100,',                        # ligne 4 : exploitation inconnue
+            f'{e2},{self.parcelle_id},Maïs,6,2024,100,',     # ligne 5 : parcelle d'une autre exploitation
+            f'{e1},,Maïs,13,2024,100,',                      # ligne 6 : mois invalide
+            f'{e1},,,6,2024,abc,',                           # ligne 7 : culture manquante, quantité invalide
+            f'{e1},,Mil,8,2023,50,',                         # ligne 8 : valide
+        ])
+        response = self._post(data, 'text/csv', '?taille_lot=3')
+
+        self.assertEqual(response.status_code, 201)
+        resume = response.json
+        self.assertEqual((resume['lignes'], resume['importees'], resume['rejetees'], resume['lots']), (7, 3, 4, 3))
+        self.assertNotIn('recoltes', resume)
+        self.assertEqual([e['ligne'] for e in resume['erreurs']], [4, 5, 6, 7])
+        self.assertEqual(len(resume['erreurs'][3]['erreurs']), 2)
+
+        with app.app_context():
+            recoltes = Recolte.query.order_by(Recolte.id).all()
+            self.assertEqual([r.type_culture for r in recoltes], ['Maïs', 'Sorgho', 'Mil'])
+            self.assertEqual(recoltes[0].rendement, 600)
+            self.assertIsNotNone(recoltes[0].created_at)
+            # Statistiques agrégées à jour malgré l'INSERT groupé
+            self.assertEqual(aggregate_statistiques()['nombre_recoltes'], 3)
+            # Une entrée d'historique par lot inséré (le lot 2 est entièrement rejeté)
+            self.assertEqual(HistoriqueAction.query.filter_by(action='import', entite='recolte').count(), 2)
+
+    def test_ndjson_and_legacy_json(self):
+        """Test NDJSON (ligne illisible comptée en erreur) et corps JSON {"recoltes": [...]}"""
+        e1 = self.exploitation_ids[0]
+        ligne = {'exploitation_id': e1, 'type_culture': 'Riz', 'mois': 9, 'annee': 2024, 'quantite_recoltee': 40}
+        data = '\n'.join([json.dumps(ligne), '{pas du json', '', json.dumps(ligne)]).encode('utf-8')
+        response = self._post(data, 'application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json['importees'], response.json['rejetees']), (2, 1))
+        self.assertEqual(response.json['erreurs'][0]['ligne'], 2)
+
+        response = self._post(json.dumps({'recoltes': [ligne, {'type_culture': 'Riz'}]}), 'application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['importees'], 1)
+        self.assertIn('message', response.json)
+
+        response = self._post(json.dumps({'recoltes': []}), 'application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self._post(b'<xml/>', 'application/xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_multipart_upload(self):
+        """Test envoi du fichier CSV en multipart"""
+        data = self._csv([f'{self.exploitation_ids[1]},,Maïs,5,2024,10,'])
+        response = self.app.post('/api/recoltes/import', data={'fichier': (io.BytesIO(data), 'campagne.csv')},
+                                 content_type='multipart/form-data',
+                                 headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['importees'], 1)
+
+    def test_failed_batch_is_replayed_line_by_line(self):
+        """Test qu'un lot refusé par la base est rejoué ligne à ligne dans des savepoints"""
+        e1 = self.exploitation_ids[0]
+        inserer = import_service._inserer
+
+        def inserer_refusant(model, lignes):
+            if any(l['observations'] == 'refusee' for l in lignes):
+                raise IntegrityError('INSERT', {}, Exception('contrainte'))
+            inserer(model, lignes)
+
+        enregistrements = [
+            (i + 1, {'exploitation_id': e1, 'type_culture': 'Maïs', 'mois': 1, 'annee': 2024,
+                     'quantite_recoltee': 1, 'observations': 'refusee' if i == 1 else None})
+            for i in range(4)
+        ]
+        with app.app_context(), patch.object(import_service, '_inserer', side_effect=inserer_refusant):
+            resume = import_service.bulk_import_recoltes(enregistrements, taille_lot=4)
+            db.session.commit()
+            self.assertEqual((resume['importees'], resume['rejetees']), (3, 1))
+            self.assertEqual(resume['erreurs'][0]['ligne'], 2)
+            self.assertEqual(Recolte.query.count(), 3)
+            self.assertEqual(aggregate_statistiques()['nombre_recoltes'], 3)
+
+
+class TestImportGenerique(unittest.TestCase):
+    """Tests pour les imports d'analyses de sol, d'intrants et de données climatiques"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        with app.app_context():
+            db.create_all()
+            role = Role(nom='Technicien')
+            db.session.add(role)
+            db.session.commit()
+            user = User(username='labouser', email='labo@example.com', role_id=role.id)
+            user.set_password('password123')
+            db.session.add(user)
+            db.session.commit()
+            exploitation = Exploitation(nom='Ferme Labo', superficie_totale=10, proprietaire_id=user.id, region_id=1)
+            db.session.add(exploitation)
+            db.session.commit()
+            self.user_id = user.id
+            self.exploitation_id = exploitation.id
+            self.token = create_access_token(identity=str(user.id))
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _post(self, url, data, content_type):
+        return self.app.post(url, data=data, content_type=content_type,
+                             headers={'Authorization': f'Bearer {self.token}'})
+
+    def _analyses_csv(self, nombre):
+        lignes = ['date_prelevement,exploitation_id,ph,humidite,azote_n,texture']
+        lignes += [f'2024-03-{1 + i % 28:02d},{self.exploitation_id},{5 + i % 4},{20 + i % 10},{i},Argileux'
+                   for i in range(nombre)]
+        lignes += [
+            f'2024-03-01,{self.exploitation_id},15,,,',       # pH hors bornes (validateur)
+            f'01/03/2024,{self.exploitation_id},6,,,',        # date illisible (conversion)
+            f'2024-03-01,,6,,,Sableux',                       # exploitation manquante
+        ]
+        return '\n'.join(lignes).encode('utf-8')
+
+    def test_analyses_csv_batches_and_audit(self):
+        """Test import d'analyses de sol : validateur partagé, lots, une entrée d'historique par lot"""
+        response = self._post('/api/analyses-sols/import?taille_lot=100', self._analyses_csv(250), 'text/csv')
+
+        self.assertEqual(response.status_code, 201)
+        resume = response.json
+        self.assertEqual((resume['lignes'], resume['importees'], resume['rejetees'], resume['lots']), (253, 250, 3, 3))
+        self.assertFalse(resume['simulation'])
+        self.assertEqual([e['erreurs'] for e in resume['erreurs']], [
+            ['Le pH doit être entre 0 et 14'],
+            ['date_prelevement doit être une date au format AAAA-MM-JJ'],
+            ["L'exploitation est requise"],
+        ])
+
+        with app.app_context():
+            self.assertEqual(AnalyseSol.query.count(), 250)
+            analyse = AnalyseSol.query.order_by(AnalyseSol.id).first()
+            self.assertEqual((analyse.technicien_id, analyse.data_source, analyse.texture),
+                             (self.user_id, 'manual', 'Argileux'))
+            self.assertEqual(aggregate_statistiques()['nombre_analyses'], 250)
+            audits = HistoriqueAction.query.filter_by(action='import', entite='analyse_sol').all()
+            self.assertEqual(len(audits), 3)
+            self.assertEqual(sum(json.loads(a.details)['nombre'] for a in audits), 250)
+            self.assertEqual(json.loads(audits[0].details)['format'], 'csv')
+
+    def test_dry_run_writes_nothing(self):
+        """Test que la simulation rend le même résumé sans rien enregistrer"""
+        response = self._post('/api/analyses-sols/import?taille_lot=100&dry_run=1', self._analyses_csv(120), 'text/csv')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json['simulation'])
+        self.assertEqual((response.json['importees'], response.json['rejetees']), (120, 3))
+        with app.app_context():
+            self.assertEqual(AnalyseSol.query.count(), 0)
+            self.assertEqual(HistoriqueAction.query.count(), 0)
+            self.assertEqual(aggregate_statistiques()['nombre_analyses'], 0)
+
+    def test_intrants_and_climate_json(self):
+        """Test des imports d'intrants et de données climatiques (JSON et NDJSON)"""
+        intrants = [
+            {'type_intrant': 'Engrais', 'quantite': 50, 'date_application': '2024-05-02',
+             'exploitation_id': self.exploitation_id, 'culture_concernée': 'Maïs'},
+            {'type_intrant': 'Engrais', 'quantite': 0, 'date_application': '2024-05-02',
+             'exploitation_id': self.exploitation_id},
+        ]
+        response = self._post('/api/intrants/import', json.dumps({'intrants': intrants}), 'application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json['importees'], response.json['rejetees']), (1, 1))
+
+        donnees = [
+            {'date_debut': '2024-06-01', 'date_fin': '2024-06-30', 'pluviometrie': 120,
+             'exploitation_id': self.exploitation_id},
+            {'date_debut': '2024-06-30', 'date_fin': '2024-06-01', 'exploitation_id': self.exploitation_id},
+            {'date_debut': '2024-07-01', 'date_fin': '2024-07-31', 'exploitation_id': 999},
+        ]
+        data = '\n'.join(json.dumps(d) for d in donnees).encode('utf-8')
+        response = self._post('/api/donnees-climatiques/import', data, 'application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['importees'], 1)
+        self.assertEqual([e['ligne'] for e in response.json['erreurs']], [2, 3])
+
+        with app.app_context():
+            intrant = Intrant.query.one()
+            self.assertEqual((intrant.unite, intrant.culture_concernée), ('kg', 'Maïs'))
+            self.assertEqual(DonneeClimatique.query.one().pluviometrie, 120)
+            self.assertEqual(aggregate_statistiques()['nombre_intrants'], 1)
+
+    def test_unit_creation_uses_import_validators(self):
+        """Test que la création unitaire refuse les mêmes lignes que l'import"""
+        invalides = {
+            '/api/donnees-climatiques': [
+                {'date_debut': '2024-06-01', 'date_fin': '2024-06-30', 'temperature_max': 70,
+                 'exploitation_id': self.exploitation_id},
+                {'date_debut': '2024-06-01', 'date_fin': '2024-06-30', 'pluviometrie': -5,
+                 'exploitation_id': self.exploitation_id},
+                {'date_debut': '2024-06-30', 'date_fin': '2024-06-01', 'exploitation_id': self.exploitation_id},
+            ],
+            '/api/recoltes': [
+                {'exploitation_id': self.exploitation_id, 'type_culture': 'Maïs', 'annee': 2024, 'mois': 13,
+                 'quantite_recoltee': 100},
+                {'exploitation_id': self.exploitation_id, 'type_culture': 'Maïs', 'annee': 2024, 'mois': 8,
+                 'quantite_recoltee': -3},
+            ],
+        }
+        for url, lignes in invalides.items():
+            for ligne in lignes:
+                with self.subTest(url=url, ligne=ligne):
+                    response = self._post(url, json.dumps(ligne), 'application/json')
+                    self.assertEqual(response.status_code, 400)
+                    self.assertTrue(response.json['errors'])
+                    importe = self._post(f'{url}/import', json.dumps({url.split('/')[-1].replace('-', '_'): [ligne]}),
+                                         'application/json')
+                    self.assertEqual(importe.json['rejetees'], 1)
+
+        response = self._post('/api/donnees-climatiques', json.dumps({
+            'date_debut': '2024-06-01', 'date_fin': '2024-06-30', 'temperature_max': 35, 'pluviometrie': 12,
+            'exploitation_id': self.exploitation_id}), 'application/json')
+        self.assertEqual(response.status_code, 201)
+
+
+if __name__ == '__main__':
+    unittest.main()
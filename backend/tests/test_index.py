@@ -0,0 +1,210 @@
+"""
+Tests de non-régression des plans de requête : les listes et statistiques
+filtrées doivent utiliser un index (pas de parcours complet de table)
+"""
+import re
+import unittest
+from datetime import date, datetime, timedelta
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, inspect, text
+
+from app import app, db
+from database import ensure_indexes
+from models.user import User, Role
+from models.exploitation import Exploitation, Parcelle
+from models.region import Region, Prefecture, Commune
+from models.analyse_sol import AnalyseSol
+from models.intrant import Intrant
+from models.recolte import Recolte
+from models.donnee_climatique import DonneeClimatique
+from models.recommandation import Recommandation
+from models.historique_action import HistoriqueAction
+from models.sensor import Sensor
+from services.sensor_service import ingest_sensor_readings
+
+# Tables dont un parcours complet est une régression
+TABLES_INDEXEES = (
+    'exploitations', 'parcelles', 'analyses_sols', 'recoltes', 'intrants', 'donnees_climatiques',
+    'recommandations', 'historiques_actions', 'prefectures', 'communes', 'sensor_data',
+)
+PARCOURS_COMPLET = re.compile(r'\bSCAN (\w+)(?! USING)')
+
+
+class TestQueryPlans(unittest.TestCase):
+    """Tests EXPLAIN QUERY PLAN des routes de liste et de statistiques"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        with app.app_context():
+            db.create_all()
+            role = Role(nom='Agriculteur')
+            db.session.add(role)
+            db.session.commit()
+            users = [User(username=f'planuser{i}', email=f'plan{i}@example.com', role_id=role.id) for i in range(3)]
+            for user in users:
+                user.set_password('password123')
+            db.session.add_all(users)
+            db.session.commit()
+            region = Region(nom='Plateaux', code='PLA')
+            db.session.add(region)
+            db.session.flush()
+            prefecture = Prefecture(nom='Ogou', code='OGO', region_id=region.id)
+            db.session.add(prefecture)
+            db.session.flush()
+            commune = Commune(nom='Atakpamé', code='ATA', prefecture_id=prefecture.id)
+            db.session.add(commune)
+            db.session.flush()
+
+            exploitations = [
+                Exploitation(nom=f'Ferme {i}', superficie_totale=10, proprietaire_id=users[i % 3].id,
+                             region_id=region.id, prefecture_id=prefecture.id, commune_id=commune.id)
+                for i in range(30)
+            ]
+            db.session.add_all(exploitations)
+            db.session.flush()
+            parcelles = [Parcelle(nom=f'P{i}', superficie=1, exploitation_id=e.id) for i, e in enumerate(exploitations)]
+            db.session.add_all(parcelles)
+            db.session.flush()
+            debut = date(2023, 1, 1)
+            for i, e in enumerate(exploitations):
+                for k in range(10):
+                    db.session.add(Recolte(exploitation_id=e.id, parcelle_id=parcelles[i].id,
+                                           type_culture=('Maïs', 'Mil')[k % 2], annee=2020 + k % 5, mois=1 + k,
+                                           quantite_recoltee=k + 1))
+                    db.session.add(AnalyseSol(exploitation_id=e.id, parcelle_id=parcelles[i].id,
+                                              technicien_id=users[0].id, date_prelevement=debut + timedelta(days=k)))
+                    db.session.add(Intrant(exploitation_id=e.id, parcelle_id=parcelles[i].id, type_intrant='Engrais',
+                                           quantite=1, date_application=debut + timedelta(days=k)))
+                    db.session.add(DonneeClimatique(exploitation_id=e.id, date_debut=debut, date_fin=debut))
+                    db.session.add(Recommandation(exploitation_id=e.id, type_recommandation='fertilisation',
+                                                  titre=f'R{k}', description='-'))
+                    db.session.add(HistoriqueAction(action='create', entite='recolte', user_id=users[k % 3].id))
+            db.session.add(Sensor(sensor_id='SENSOR_PLAN', sensor_name='Humidité', sensor_type='soil_moisture',
+                                  exploitation_id=exploitations[0].id))
+            db.session.commit()
+            ingest_sensor_readings([
+                {'sensor_id': 'SENSOR_PLAN', 'sensor_type': 'soil_moisture', 'value': i,
+                 'timestamp': (datetime(2025, 1, 1) + timedelta(hours=i)).isoformat()}
+                for i in range(50)
+            ])
+            self.user_id = users[0].id
+            self.exploitation_id = exploitations[3].id
+            self.parcelle_id = parcelles[3].id
+            self.region_id, self.prefecture_id = region.id, prefecture.id
+            self.token = create_access_token(identity=str(users[0].id))
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _requetes(self, url):
+        """Requêtes SELECT exécutées par une route (réponse en flux comprise), avec leurs paramètres"""
+        requetes = []
+
+        def capturer(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+                requetes.append((statement, parameters))
+
+        with app.app_context():
+            moteur = db.engine
+        event.listen(moteur, 'before_cursor_execute', capturer)
+        try:
+            response = self.app.get(url, headers={'Authorization': f'Bearer {self.token}'})
+            response.get_data()
+        finally:
+            event.remove(moteur, 'before_cursor_execute', capturer)
+        self.assertEqual(response.status_code, 200, url)
+        return requetes
+
+    def _plan(self, statement, parameters):
+        with app.app_context():
+            with db.engine.connect() as connexion:
+                lignes = connexion.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+        return [ligne[-1] for ligne in lignes]
+
+    def _parcours_complets(self, requetes):
+        parcours = []
+        for statement, parameters in requetes:
+            plan = self._plan(statement, parameters)
+            for detail in plan:
+                match = PARCOURS_COMPLET.search(detail)
+                if match and match.group(1) in TABLES_INDEXEES:
+                    parcours.append((detail, statement, plan))
+        return parcours
+
+    def assertUsesIndexes(self, url):
+        requetes = self._requetes(url)
+        self.assertTrue(requetes, url)
+        parcours = self._parcours_complets(requetes)
+        self.assertFalse(parcours, f'{url} : parcours complet\n' + '\n'.join(
+            f'{detail}\n  {statement}\n  {plan}' for detail, statement, plan in parcours))
+
+    def test_filtered_lists_use_indexes(self):
+        """Test que chaque liste filtrée lit ses lignes par un index"""
+        e, p = self.exploitation_id, self.parcelle_id
+        for url in (
+            '/api/exploitations',
+            f'/api/parcelles?exploitation_id={e}',
+            f'/api/analyses-sols?exploitation_id={e}',
+            f'/api/analyses-sols?parcelle_id={p}',
+            '/api/analyses-sols?cursor=&per_page=5',
+            f'/api/recoltes?exploitation_id={e}&type_culture=Maïs',
+            '/api/recoltes?type_culture=Mil&annee=2021',
+            f'/api/recoltes?parcelle_id={p}',
+            '/api/recoltes?cursor=&per_page=5',
+            f'/api/intrants?exploitation_id={e}',
+            f'/api/intrants?parcelle_id={p}',
+            f'/api/donnees-climatiques?exploitation_id={e}',
+            f'/api/recommandations?exploitation_id={e}',
+            f'/api/sensors?exploitation_id={e}',
+            '/api/sensors/data?sensor_id=SENSOR_PLAN&per_page=10',
+            f'/api/geographie/prefectures?region_id={self.region_id}',
+            f'/api/geographie/communes?prefecture_id={self.prefecture_id}',
+        ):
+            with self.subTest(url=url):
+                self.assertUsesIndexes(url)
+
+    def test_statistics_use_indexes(self):
+        """Test que les statistiques filtrées lisent leurs lignes par un index"""
+        for url in (
+            f'/api/recoltes/statistics?exploitation_id={self.exploitation_id}',
+            '/api/recoltes/statistics?type_culture=Maïs&annee=2022&group_by=mois',
+            f'/api/recoltes/statistics?region_id={self.region_id}&group_by=culture',
+            f'/api/recoltes/prevision?exploitation_id={self.exploitation_id}&type_culture=Maïs',
+            f'/api/geographie/regions/{self.region_id}',
+        ):
+            with self.subTest(url=url):
+                self.assertUsesIndexes(url)
+
+    def test_historique_by_user(self):
+        """Test de l'historique d'un utilisateur par date (index user_id, created_at)"""
+        with app.app_context():
+            requete = HistoriqueAction.query.filter_by(user_id=self.user_id)\
+                .order_by(HistoriqueAction.created_at.desc()).limit(20)
+            compile_ = requete.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+        plan = self._plan(str(compile_), ())
+        self.assertTrue(any('ix_historiques_actions_user_date' in detail for detail in plan), plan)
+        self.assertFalse(any('TEMP B-TREE' in detail for detail in plan), plan)
+
+    def test_ensure_indexes_migrates_existing_tables(self):
+        """Test que la migration recrée les index manquants d'une base existante"""
+        with app.app_context():
+            db.session.execute(text('DROP INDEX ix_recoltes_exploitation_culture_periode'))
+            db.session.execute(text('DROP INDEX ix_exploitations_proprietaire'))
+            db.session.commit()
+
+            self.assertEqual(ensure_indexes(), ['ix_exploitations_proprietaire', 'ix_recoltes_exploitation_culture_periode'])
+            self.assertEqual(ensure_indexes(), [])
+            noms = {i['name'] for i in inspect(db.engine).get_indexes('recoltes')}
+            self.assertIn('ix_recoltes_exploitation_culture_periode', noms)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,159 @@
 """
 Tests unitaires pour le service d'irrigation
 """
+import random
 import unittest
-from services.irrigation_service import generate_conseils_irrigation
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from services.irrigation_service import (
+    BESOIN_EAU_DEFAUT, BESOINS_EAU_JOURNALIERS,
+    generate_conseils_irrigation, generate_conseils_irrigation_batch, rolling_deficits
+)
+
+
+# Copie de generate_conseils_irrigation avant sa réécriture sur la variante NumPy : ne pas modifier
+# sans changer délibérément les règles de conseil
+def conseils_reference(
+    meteo_actuelle: Dict,
+    previsions: List[Dict],
+    derniere_pluviometrie: Optional[float] = None,
+    type_culture: Optional[str] = None,
+) -> List[Dict]:
+    """Règles scalaires d'origine, figées comme référence de la variante vectorisée"""
+    conseils = []
+    parametres_utilises = {
+        'temperature_actuelle': meteo_actuelle.get('temperature'),
+        'humidite_actuelle': meteo_actuelle.get('humidite'),
+        'pluviometrie_actuelle': meteo_actuelle.get('pluviometrie', 0),
+        'date_analyse': datetime.now().isoformat(),
+    }
+
+    # 1. Analyse de la pluviométrie actuelle et prévue
+    pluviometrie_actuelle = meteo_actuelle.get('pluviometrie', 0) or 0
+    pluviometrie_prevue_24h = sum(
+        p.get('pluviometrie', 0) or 0 for p in previsions[:8]  # 8 * 3h = 24h
+    )
+    pluviometrie_totale = pluviometrie_actuelle + pluviometrie_prevue_24h
+
+    parametres_utilises['pluviometrie_prevue_24h'] = pluviometrie_prevue_24h
+    parametres_utilises['pluviometrie_totale'] = pluviometrie_totale
+    if derniere_pluviometrie is not None:
+        parametres_utilises['derniere_pluviometrie'] = derniere_pluviometrie
+
+    # 2. Analyse de la température
+    temperature = meteo_actuelle.get('temperature')
+    temperature_max = meteo_actuelle.get('temperature_max', temperature)
+    humidite = meteo_actuelle.get('humidite')
+
+    # 3. Besoins en eau selon la culture
+    besoin_eau = BESOINS_EAU_JOURNALIERS.get(type_culture.lower() if type_culture else '', BESOIN_EAU_DEFAUT)
+    parametres_utilises['besoin_eau_culture'] = besoin_eau
+    parametres_utilises['type_culture'] = type_culture
+
+    # 4. Calcul du déficit hydrique
+    besoin_eau_24h = besoin_eau * 1  # Besoin pour 24h
+    deficit_hydrique = besoin_eau_24h - pluviometrie_totale
+
+    parametres_utilises['besoin_eau_24h'] = besoin_eau_24h
+    parametres_utilises['deficit_hydrique'] = deficit_hydrique
+
+    # 5. Conseils basés sur le déficit hydrique
+    if deficit_hydrique > 5:
+        conseils.append({
+            'type': 'irrigation_urgente',
+            'titre': 'Irrigation urgente recommandée',
+            'description': f'Le déficit hydrique est de {deficit_hydrique:.1f} mm. '
+                          f'La pluviométrie prévue ({pluviometrie_prevue_24h:.1f} mm) est insuffisante '
+                          f'pour couvrir les besoins de la culture ({besoin_eau_24h:.1f} mm/jour). '
+                          f'Irrigation immédiate recommandée.',
+            'quantite_recommandee': f'{deficit_hydrique:.1f} mm',
+            'priorite': 'élevée',
+            'parametres_utilises': parametres_utilises.copy(),
+        })
+    elif deficit_hydrique > 2:
+        conseils.append({
+            'type': 'irrigation_recommandee',
+            'titre': 'Irrigation recommandée',
+            'description': f'Déficit hydrique modéré de {deficit_hydrique:.1f} mm. '
+                          f'Irrigation complémentaire recommandée pour optimiser la croissance.',
+            'quantite_recommandee': f'{deficit_hydrique:.1f} mm',
+            'priorite': 'moyenne',
+            'parametres_utilises': parametres_utilises.copy(),
+        })
+    elif pluviometrie_totale >= besoin_eau_24h:
+        conseils.append({
+            'type': 'irrigation_non_necessaire',
+            'titre': 'Irrigation non nécessaire',
+            'description': f'La pluviométrie prévue ({pluviometrie_prevue_24h:.1f} mm) '
+                          f'couvre les besoins de la culture. Aucune irrigation supplémentaire nécessaire pour le moment.',
+            'quantite_recommandee': '0 mm',
+            'priorite': 'faible',
+            'parametres_utilises': parametres_utilises.copy(),
+        })
+
+    # 6. Conseils basés sur la température élevée
+    if temperature_max and temperature_max > 35:
+        conseils.append({
+            'type': 'irrigation_rafraichissement',
+            'titre': 'Température élevée - Irrigation de rafraîchissement',
+            'description': f'Température maximale élevée ({temperature_max:.1f}°C). '
+                          f'Irrigation légère recommandée pour rafraîchir les cultures et réduire le stress thermique.',
+            'quantite_recommandee': '2-3 mm',
+            'priorite': 'moyenne',
+            'parametres_utilises': parametres_utilises.copy(),
+        })
+
+    # 7. Conseils basés sur l'humidité de l'air
+    if humidite and humidite < 40:
+        conseils.append({
+            'type': 'irrigation_humidite',
+            'titre': 'Air sec - Irrigation recommandée',
+            'description': f'Humidité relative faible ({humidite:.0f}%). '
+                          f'L\'évapotranspiration est élevée. Irrigation recommandée pour compenser les pertes d\'eau.',
+            'quantite_recommandee': '3-5 mm',
+            'priorite': 'moyenne',
+            'parametres_utilises': parametres_utilises.copy(),
+        })
+
+    # 8. Analyse des prévisions à 48h
+    if len(previsions) >= 16:  # 16 * 3h = 48h
+        pluviometrie_48h = sum(
+            p.get('pluviometrie', 0) or 0 for p in previsions[:16]
+        )
+        besoin_eau_48h = besoin_eau * 2
+        deficit_48h = besoin_eau_48h - pluviometrie_48h
+
+        if deficit_48h > 10:
+            conseils.append({
+                'type': 'planification_irrigation',
+                'titre': 'Planification irrigation sur 48h',
+                'description': f'Sur les 48 prochaines heures, le déficit hydrique prévu est de {deficit_48h:.1f} mm. '
+                              f'Planifier une irrigation de {deficit_48h:.1f} mm répartie sur 2 jours.',
+                'quantite_recommandee': f'{deficit_48h:.1f} mm',
+                'priorite': 'moyenne',
+                'parametres_utilises': {
+                    **parametres_utilises,
+                    'pluviometrie_prevue_48h': pluviometrie_48h,
+                    'deficit_hydrique_48h': deficit_48h,
+                },
+            })
+
+    # Si aucun conseil généré, ajouter un message informatif
+    if not conseils:
+        conseils.append({
+            'type': 'information',
+            'titre': 'Données météo insuffisantes',
+            'description': 'Les données météo disponibles ne permettent pas de générer des conseils d\'irrigation précis. '
+                          'Veuillez vérifier que les coordonnées GPS de l\'exploitation sont correctes.',
+            'quantite_recommandee': 'N/A',
+            'priorite': 'faible',
+            'parametres_utilises': parametres_utilises,
+        })
+
+    return conseils
+
 
 
 class TestIrrigationService(unittest.TestCase):
@@ -134,6 +285,72 @@ class TestIrrigationService(unittest.TestCase):
         self.assertGreater(len(conseils_mais), 0)
 
 
+
+class TestIrrigationBatch(unittest.TestCase):
+    """Tests pour la variante vectorisée des conseils d'irrigation"""
+
+    def _sans_date(self, conseils):
+        for conseil in conseils:
+            conseil['parametres_utilises'].pop('date_analyse')
+        return conseils
+
+    def test_batch_equivalent_to_reference(self):
+        """Test que la variante NumPy donne les mêmes conseils que les règles scalaires de référence"""
+        rng = random.Random(42)
+        cultures = ['maïs', 'Riz', 'coton', 'manioc', None, 'inconnue']
+
+        def valeur(bas, haut):
+            return rng.choice([None, round(rng.uniform(bas, haut), 1)])
+
+        meteos, previsions, pluies, types = [], [], [], []
+        for _ in range(500):
+            meteo = {'temperature': valeur(15, 42), 'humidite': rng.choice([0, valeur(10, 95)]),
+                     'pluviometrie': rng.choice([0, 0, valeur(0, 8)])}
+            if rng.random() < 0.5:
+                meteo['temperature_max'] = valeur(20, 45)
+            meteos.append(meteo)
+            previsions.append([
+                {'pluviometrie': rng.choice([0, 0, 0, None, round(rng.uniform(0, 4), 2)])}
+                for _ in range(rng.randint(0, 40))
+            ])
+            pluies.append(rng.choice([None, 3.5]))
+            types.append(rng.choice(cultures))
+
+        attendus = [
+            self._sans_date(conseils_reference(m, p, derniere_pluviometrie=d, type_culture=t))
+            for m, p, d, t in zip(meteos, previsions, pluies, types)
+        ]
+        obtenus = [
+            self._sans_date(c)
+            for c in generate_conseils_irrigation_batch(meteos, previsions, pluies, types)
+        ]
+
+        self.assertEqual(obtenus, attendus)
+        # La version unitaire (un appel du lot par exploitation) reste alignée sur la référence
+        self.assertEqual(
+            [self._sans_date(generate_conseils_irrigation(m, p, derniere_pluviometrie=d, type_culture=t))
+             for m, p, d, t in zip(meteos[:50], previsions[:50], pluies[:50], types[:50])],
+            attendus[:50],
+        )
+
+    def test_rolling_deficits(self):
+        """Test déficits sur fenêtres glissantes de 24h et 48h"""
+        pluie = np.array([
+            [1.0] * 20,
+            [0.0, 2.0] * 10,
+        ])
+        besoin = np.array([5.0, 4.0])
+
+        deficits_24h = rolling_deficits(pluie, besoin)
+        self.assertEqual(deficits_24h.shape, (2, 13))
+        self.assertTrue(np.allclose(deficits_24h[0], 5.0 - 8.0))
+        self.assertTrue(np.allclose(deficits_24h[1], 4.0 - 8.0))
+
+        deficits_48h = rolling_deficits(pluie, besoin, jours=2)
+        self.assertEqual(deficits_48h.shape, (2, 5))
+        self.assertAlmostEqual(deficits_48h[1, 0], 8.0 - sum(pluie[1, :16]))
+
+
 if __name__ == '__main__':
     unittest.main()
 
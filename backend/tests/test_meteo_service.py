@@ -0,0 +1,474 @@
+"""
+Tests unitaires pour le cache du service météo
+"""
+import os
+import json
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import requests
+from flask_jwt_extended import create_access_token
+
+from app import app, db
+from models.user import User, Role
+from models.exploitation import Exploitation
+from models.meteo import MeteoSnapshot, ReleveMeteo
+from services import meteo_service
+from services.meteo_prefetch_service import RateLimiter, prefetch_weather
+from services.meteo_store_service import rainfall_since, store_weather
+from services.recommandation_service import generate_recommandations
+from utils.cache import TTLCache
+
+
+def _fake_response(payload):
+    response = mock.Mock(status_code=200)
+    response.json.return_value = payload
+    return response
+
+
+CURRENT_PAYLOAD = {
+    'main': {'temp': 25.0, 'humidity': 60},
+    'weather': [{'description': 'ciel dégagé'}],
+    'name': 'Lomé',
+}
+
+
+class FakeClock:
+    """Horloge contrôlable pour tester l'expiration"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    """Tests pour le cache LRU avec TTL"""
+
+    def test_expiration(self):
+        """Test expiration d'une entrée après son TTL"""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, clock=clock)
+        cache.set('a', 1, ttl=10)
+
+        self.assertEqual(cache.get('a'), 1)
+        clock.now = 10
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_lru_eviction(self):
+        """Test éviction de l'entrée la moins récemment utilisée"""
+        cache = TTLCache(maxsize=2)
+        cache.set('a', 1, ttl=60)
+        cache.set('b', 2, ttl=60)
+        cache.get('a')
+        cache.set('c', 3, ttl=60)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['size'], 2)
+
+
+class TestMeteoCache(unittest.TestCase):
+    """Tests pour la mise en cache des appels OpenWeather"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.env = mock.patch.dict(os.environ, {'OPENWEATHER_API_KEY': 'test', 'METEO_CACHE_GRID': '0.05'})
+        self.env.start()
+        meteo_service.get_cache().clear()
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        meteo_service.get_cache().clear()
+        self.env.stop()
+
+    @mock.patch('services.meteo_service.requests.Session.get')
+    def test_neighbours_share_grid_cell(self, requests_get):
+        """Test que deux exploitations voisines partagent un seul appel API"""
+        requests_get.return_value = _fake_response(CURRENT_PAYLOAD)
+
+        premiere = meteo_service.get_current_weather(6.131, 1.222)
+        seconde = meteo_service.get_current_weather(6.139, 1.218)
+
+        self.assertEqual(requests_get.call_count, 1)
+        self.assertEqual(requests_get.call_args.kwargs['params']['lat'], 6.15)
+        self.assertEqual(premiere['temperature'], 25.0)
+        # Les coordonnées retournées restent celles de l'appelant
+        self.assertEqual((seconde['latitude'], seconde['longitude']), (6.139, 1.218))
+
+        stats = meteo_service.get_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    @mock.patch('services.meteo_service.requests.Session.get')
+    def test_distinct_cells_and_kinds(self, requests_get):
+        """Test que des cellules ou langues différentes ne partagent pas l'entrée"""
+        requests_get.return_value = _fake_response(CURRENT_PAYLOAD)
+
+        meteo_service.get_current_weather(6.13, 1.22)
+        meteo_service.get_current_weather(7.00, 1.22)
+        meteo_service.get_current_weather(6.13, 1.22, lang='en')
+
+        self.assertEqual(requests_get.call_count, 3)
+
+    @mock.patch('services.meteo_service.requests.Session.get')
+    def test_errors_are_not_cached(self, requests_get):
+        """Test qu'une erreur de l'API n'est pas mise en cache"""
+        requests_get.side_effect = requests.exceptions.Timeout()
+
+        with self.assertRaises(Exception):
+            meteo_service.get_current_weather(6.13, 1.22)
+
+        requests_get.side_effect = None
+        requests_get.return_value = _fake_response(CURRENT_PAYLOAD)
+        self.assertEqual(meteo_service.get_current_weather(6.13, 1.22)['ville'], 'Lomé')
+        self.assertEqual(requests_get.call_count, 2)
+
+
+
+class TestOpenWeatherClient(unittest.TestCase):
+    """Tests pour le client HTTP à session persistante"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.env = mock.patch.dict(os.environ, {'OPENWEATHER_API_KEY': 'test'})
+        self.env.start()
+        meteo_service.get_cache().clear()
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        meteo_service.get_cache().clear()
+        self.env.stop()
+
+    def test_session_pool_and_retry(self):
+        """Test configuration du pool de connexions et des relances"""
+        client = meteo_service.OpenWeatherClient(pool_size=4, retries=3)
+        adapter = client.session.get_adapter('https://api.openweathermap.org')
+
+        self.assertIs(meteo_service.get_client(), meteo_service.get_client())
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter.max_retries.total, 3)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+
+    @mock.patch('services.meteo_service.requests.Session.get')
+    def test_current_and_forecast_fetched_concurrently(self, session_get):
+        """Test récupération parallèle de la météo actuelle et des prévisions"""
+        def lent(url, params=None, timeout=None):
+            time.sleep(0.2)
+            if url.endswith('/forecast'):
+                return _fake_response({'list': [{'dt': 1750000000, 'main': {'temp': 22.0}, 'rain': {'3h': 1.5}}]})
+            return _fake_response(CURRENT_PAYLOAD)
+        session_get.side_effect = lent
+
+        debut = time.perf_counter()
+        meteo, previsions = meteo_service.get_current_and_forecast(6.13, 1.22)
+        duree = time.perf_counter() - debut
+
+        self.assertEqual(meteo['temperature'], 25.0)
+        self.assertEqual(previsions[0]['pluviometrie'], 1.5)
+        self.assertEqual(session_get.call_count, 2)
+        self.assertLess(duree, 0.35)
+
+
+
+def _fake_openweather(url, params=None, timeout=None):
+    if url.endswith('/forecast'):
+        return _fake_response({'list': [{'dt': 1750000000, 'main': {'temp': 22.0}}]})
+    return _fake_response(CURRENT_PAYLOAD)
+
+
+class TestMeteoPrefetch(unittest.TestCase):
+    """Tests pour le préchargement de la météo des exploitations"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.env = mock.patch.dict(os.environ, {'OPENWEATHER_API_KEY': 'test', 'METEO_CACHE_GRID': '0.05'})
+        self.env.start()
+        meteo_service.get_cache().clear()
+        with app.app_context():
+            db.create_all()
+            role = Role(nom='Agriculteur')
+            db.session.add(role)
+            db.session.commit()
+            user = User(username='testuser', email='test@example.com', role_id=role.id)
+            user.set_password('password123')
+            db.session.add(user)
+            db.session.commit()
+            coordonnees = [(6.131, 1.222), (6.139, 1.218), (6.135, 1.215), (9.55, 1.19), (None, None)]
+            db.session.add_all([
+                Exploitation(nom=f'Ferme {i}', superficie_totale=1.0, proprietaire_id=user.id,
+                             latitude=lat, longitude=lon)
+                for i, (lat, lon) in enumerate(coordonnees)
+            ])
+            db.session.commit()
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        meteo_service.get_cache().clear()
+        self.env.stop()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    @mock.patch('services.meteo_service.requests.Session.get')
+    def test_prefetch_deduplicates_on_grid(self, session_get):
+        """Test une paire d'appels par cellule et enregistrement des données"""
+        session_get.side_effect = _fake_openweather
+
+        with app.app_context():
+            stats = prefetch_weather(requests_per_minute=None)
+
+            self.assertEqual(stats['exploitations'], 4)
+            self.assertEqual(stats['cellules'], 2)
+            self.assertEqual(stats['appels'], 4)
+            self.assertEqual(stats['erreurs'], [])
+            self.assertEqual(session_get.call_count, 4)
+            self.assertEqual(MeteoSnapshot.query.count(), 4)
+
+            # Un second passage remplace les données sans doublon
+            prefetch_weather(requests_per_minute=None)
+            self.assertEqual(MeteoSnapshot.query.count(), 4)
+
+    @mock.patch('services.meteo_service.requests.Session.get')
+    def test_requests_served_from_snapshots(self, session_get):
+        """Test que les requêtes interactives n'appellent pas l'API après préchargement"""
+        session_get.side_effect = _fake_openweather
+
+        with app.app_context():
+            prefetch_weather(requests_per_minute=None)
+            meteo_service.get_cache().clear()
+            session_get.reset_mock()
+
+            meteo, previsions = meteo_service.get_current_and_forecast(6.135, 1.215)
+
+            session_get.assert_not_called()
+            self.assertEqual(meteo['ville'], 'Lomé')
+            self.assertEqual(meteo['latitude'], 6.135)
+            self.assertEqual(previsions[0]['temperature'], 22.0)
+
+    def test_rate_limiter(self):
+        """Test espacement des appels par le limiteur de débit"""
+        limiter = RateLimiter(requests_per_minute=600)
+        debut = time.perf_counter()
+        for _ in range(3):
+            limiter.acquire()
+        self.assertGreaterEqual(time.perf_counter() - debut, 0.19)
+
+
+
+class TestMeteoStore(unittest.TestCase):
+    """Tests pour le stockage local normalisé des relevés météo"""
+
+    CELL = (6.15, 1.2)
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        self.env = mock.patch.dict(os.environ, {'OPENWEATHER_API_KEY': 'test', 'METEO_CACHE_GRID': '0.05'})
+        self.env.start()
+        meteo_service.get_cache().clear()
+        with app.app_context():
+            db.create_all()
+            self.token = create_access_token(identity='1')
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        meteo_service.get_cache().clear()
+        self.env.stop()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _prevision(self, date, pluie):
+        return {'date': date.isoformat(), 'temperature': 24.0, 'pluviometrie': pluie}
+
+    def test_refetch_deduplicates(self):
+        """Test qu'une nouvelle récupération met à jour les relevés existants"""
+        heure = datetime(2025, 6, 1, 12)
+        with app.app_context():
+            store_weather(self.CELL, meteo_actuelle={'date': '2025-06-01T12:05:00', 'temperature': 25.0},
+                          previsions=[self._prevision(heure + timedelta(hours=3 * i), 0) for i in range(4)])
+            store_weather(self.CELL, meteo_actuelle={'date': '2025-06-01T12:45:00', 'temperature': 27.0},
+                          previsions=[self._prevision(heure + timedelta(hours=3 * i), 2.0) for i in range(2, 6)])
+            db.session.commit()
+
+            self.assertEqual(ReleveMeteo.query.filter_by(source='observation').count(), 1)
+            self.assertEqual(ReleveMeteo.query.filter_by(source='observation').first().temperature, 27.0)
+            self.assertEqual(ReleveMeteo.query.filter_by(source='prevision').count(), 6)
+            self.assertEqual(
+                ReleveMeteo.query.filter_by(source='prevision', date=heure + timedelta(hours=6)).first().pluviometrie,
+                2.0
+            )
+
+    @mock.patch('services.meteo_service.requests.Session.get')
+    def test_offline_fallback(self, session_get):
+        """Test que les relevés locaux sont servis quand l'API est injoignable"""
+        session_get.side_effect = _fake_openweather
+        with app.app_context():
+            meteo_service.get_current_and_forecast(6.131, 1.222)
+            self.assertEqual(ReleveMeteo.query.count(), 2)
+
+            meteo_service.get_cache().clear()
+            session_get.side_effect = requests.exceptions.ConnectionError()
+            meteo = meteo_service.get_current_weather(6.131, 1.222)
+            self.assertEqual(meteo['temperature'], 25.0)
+            self.assertEqual(meteo['latitude'], 6.131)
+
+            with self.assertRaises(Exception):
+                meteo_service.get_current_weather(9.55, 1.19)
+
+    def test_rainfall_and_history_route(self):
+        """Test cumul de pluie observée et GET /api/meteo/historique"""
+        maintenant = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        with app.app_context():
+            self.assertIsNone(rainfall_since(self.CELL, maintenant - timedelta(hours=24)))
+            for heures in (1, 2, 30):
+                store_weather(self.CELL, meteo_actuelle={
+                    'date': (maintenant - timedelta(hours=heures)).isoformat(), 'pluviometrie': 1.5
+                })
+            db.session.commit()
+            self.assertEqual(rainfall_since(self.CELL, maintenant - timedelta(hours=24)), 3.0)
+
+        response = self.app.get(
+            '/api/meteo/historique?latitude=6.14&longitude=1.21&source=observation',
+            headers={'Authorization': f'Bearer {self.token}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['items'][0]['pluviometrie'], 1.5)
+
+    def test_recommandations_use_local_summary(self):
+        """Test recommandations climatiques à partir des relevés locaux"""
+        with app.app_context():
+            role = Role(nom='Agriculteur')
+            db.session.add(role)
+            db.session.commit()
+            user = User(username='testuser', email='test@example.com', role_id=role.id)
+            user.set_password('password123')
+            db.session.add(user)
+            db.session.commit()
+            exploitation = Exploitation(nom='Ferme', superficie_totale=1.0, proprietaire_id=user.id,
+                                        latitude=6.131, longitude=1.222)
+            db.session.add(exploitation)
+            db.session.commit()
+
+            # Couverture insuffisante : pas de recommandation climatique
+            maintenant = datetime.utcnow()
+            store_weather(self.CELL, meteo_actuelle={'date': maintenant.isoformat(), 'pluviometrie': 0.1})
+            db.session.commit()
+            titres = [r['titre'] for r in generate_recommandations(exploitation.id)]
+            self.assertNotIn('Pluviométrie insuffisante', titres)
+
+            for heures in range(1, 30 * 24):
+                store_weather(self.CELL, meteo_actuelle={
+                    'date': (maintenant - timedelta(hours=heures)).isoformat(), 'pluviometrie': 0.01, 'temperature': 28.0
+                })
+            db.session.commit()
+            recommandations = generate_recommandations(exploitation.id)
+            climat = [r for r in recommandations if r['titre'] == 'Pluviométrie insuffisante']
+            self.assertEqual(len(climat), 1)
+            self.assertEqual(climat[0]['parametres_utilises']['source'], 'releves_meteo')
+
+
+
+class TestConseilsIrrigationBatch(unittest.TestCase):
+    """Tests pour les conseils d'irrigation groupés"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        self.env = mock.patch.dict(os.environ, {'OPENWEATHER_API_KEY': 'test', 'METEO_CACHE_GRID': '0.05'})
+        self.env.start()
+        meteo_service.get_cache().clear()
+        with app.app_context():
+            db.create_all()
+            agriculteur = Role(nom='Agriculteur')
+            agent = Role(nom='Agent')
+            db.session.add_all([agriculteur, agent])
+            db.session.commit()
+            proprietaire = User(username='fermier', email='fermier@example.com', role_id=agriculteur.id)
+            encadrant = User(username='agent', email='agent@example.com', role_id=agent.id)
+            for user in (proprietaire, encadrant):
+                user.set_password('password123')
+            db.session.add_all([proprietaire, encadrant])
+            db.session.commit()
+
+            coordonnees = [(6.131, 1.222), (6.139, 1.218), (9.55, 1.19), (None, None)]
+            db.session.add_all([
+                Exploitation(nom=f'Ferme {i}', superficie_totale=1.0, proprietaire_id=proprietaire.id,
+                             latitude=lat, longitude=lon, prefecture_id=1, type_culture_principal='maïs')
+                for i, (lat, lon) in enumerate(coordonnees)
+            ])
+            db.session.add(Exploitation(nom='Autre', superficie_totale=1.0, proprietaire_id=encadrant.id,
+                                        latitude=6.13, longitude=1.22, prefecture_id=2))
+            db.session.commit()
+            self.token_proprietaire = create_access_token(identity=str(proprietaire.id))
+            self.token_agent = create_access_token(identity=str(encadrant.id))
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        meteo_service.get_cache().clear()
+        self.env.stop()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _post(self, token, body):
+        response = self.app.post(
+            '/api/meteo/conseils-irrigation/batch',
+            data=json.dumps(body),
+            content_type='application/json',
+            headers={'Authorization': f'Bearer {token}'}
+        )
+        lignes = [json.loads(l) for l in response.data.decode().splitlines() if l]
+        return response, lignes
+
+    @mock.patch('services.meteo_service.requests.Session.get')
+    def test_batch_by_prefecture_groups_cells(self, session_get):
+        """Test une paire d'appels météo par cellule et une ligne par exploitation"""
+        session_get.side_effect = _fake_openweather
+
+        response, lignes = self._post(self.token_agent, {'prefecture_id': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(session_get.call_count, 4)  # 2 cellules x (actuelle + prévisions)
+        synthese = lignes[-1]
+        self.assertEqual((synthese['exploitations'], synthese['cellules'], synthese['erreurs']), (4, 2, 1))
+        resultats = [l for l in lignes[:-1] if 'conseils' in l]
+        self.assertEqual(len(resultats), 3)
+        self.assertEqual(resultats[0]['conseils'][0]['parametres_utilises']['type_culture'], 'maïs')
+
+    @mock.patch('services.meteo_service.requests.Session.get')
+    def test_batch_restricted_to_owner(self, session_get):
+        """Test qu'un agriculteur ne reçoit que ses propres exploitations"""
+        session_get.side_effect = _fake_openweather
+
+        response, lignes = self._post(self.token_proprietaire, {'exploitation_ids': [1, 2, 5]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(l['exploitation_id'] for l in lignes[:-1]), [1, 2])
+
+        response, _ = self._post(self.token_proprietaire, {'prefecture_id': 2})
+        self.assertEqual(response.status_code, 404)
+
+        response, _ = self._post(self.token_proprietaire, {})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,257 @@
+"""
+Tests unitaires pour la pagination par curseur (keyset) et les listes en flux
+"""
+import json
+import unittest
+from datetime import date, datetime, timedelta
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from app import app, db
+from models.user import User, Role
+from models.exploitation import Exploitation
+from models.recolte import Recolte
+from models.intrant import Intrant
+from models.region import Region, Prefecture, Commune
+from models.sensor import Sensor
+from services.sensor_service import ingest_sensor_readings
+from services.sensor_storage_service import archive_sensor_data, drop_partition, list_partitions
+from routes.utils import CURSOR_NEXT, STREAM_BATCH_SIZE, encode_cursor
+
+
+class TestKeysetPagination(unittest.TestCase):
+    """Tests pour ?cursor= sur les récoltes et les mesures de capteurs"""
+
+    NOMBRE_RECOLTES = 57
+    NOMBRE_MESURES = 90
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        with app.app_context():
+            db.create_all()
+            role = Role(nom='Agriculteur')
+            db.session.add(role)
+            db.session.commit()
+            user = User(username='cursoruser', email='cursor@example.com', role_id=role.id)
+            user.set_password('password123')
+            db.session.add(user)
+            db.session.commit()
+            exploitation = Exploitation(nom='Ma Ferme', superficie_totale=10, proprietaire_id=user.id)
+            db.session.add(exploitation)
+            db.session.commit()
+
+            # Beaucoup d'égalités sur (annee, mois) : l'id départage
+            db.session.add_all([
+                Recolte(exploitation_id=exploitation.id, type_culture='Maïs', annee=2020 + i % 4,
+                        mois=1 + i % 3, quantite_recoltee=i)
+                for i in range(self.NOMBRE_RECOLTES)
+            ])
+            db.session.add(Sensor(sensor_id='SENSOR_001', sensor_name='Humidité', sensor_type='soil_moisture'))
+            db.session.commit()
+
+            # Trois mois de mesures, dont deux archivés dans des partitions
+            debut = datetime(2025, 1, 1)
+            ingest_sensor_readings([
+                {'sensor_id': 'SENSOR_001', 'sensor_type': 'soil_moisture', 'value': i,
+                 'timestamp': (debut + timedelta(days=i)).isoformat()}
+                for i in range(self.NOMBRE_MESURES)
+            ])
+            archive_sensor_data(datetime(2025, 3, 10))
+            self.token = create_access_token(identity=str(user.id))
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            for key in list_partitions():
+                drop_partition(key)
+            db.session.remove()
+            db.drop_all()
+
+    def _get(self, url):
+        requetes = []
+
+        def compter(conn, cursor, statement, parameters, context, executemany):
+            requetes.append(statement)
+
+        with app.app_context():
+            moteur = db.engine
+        event.listen(moteur, 'before_cursor_execute', compter)
+        try:
+            response = self.app.get(url, headers={'Authorization': f'Bearer {self.token}'})
+        finally:
+            event.remove(moteur, 'before_cursor_execute', compter)
+        return response, requetes
+
+    def _parcourir(self, url):
+        """Parcourt toutes les pages vers l'avant puis vers l'arrière"""
+        pages = []
+        response, premieres = self._get(f'{url}&cursor=')
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json)
+            if not response.json['has_next']:
+                break
+            response, requetes = self._get(f"{url}&cursor={response.json['next_cursor']}")
+            # Même nombre de requêtes à chaque page, sans COUNT(*)
+            self.assertEqual(len(requetes), len(premieres))
+            self.assertFalse(any('COUNT(' in r.upper() for r in requetes))
+
+        arriere = [pages[-1]]
+        while arriere[-1]['has_prev']:
+            response, _ = self._get(f"{url}&cursor={arriere[-1]['prev_cursor']}")
+            self.assertEqual(response.status_code, 200)
+            arriere.append(response.json)
+        return pages, list(reversed(arriere))
+
+    def test_recoltes_cursor_matches_ordering(self):
+        """Test que les pages par curseur couvrent toutes les récoltes dans l'ordre (annee, mois, id)"""
+        pages, arriere = self._parcourir('/api/recoltes?per_page=10')
+
+        ids = [r['id'] for page in pages for r in page['items']]
+        with app.app_context():
+            attendus = [r.id for r in Recolte.query.order_by(
+                Recolte.annee.desc(), Recolte.mois.desc(), Recolte.id.desc()).all()]
+        self.assertEqual(ids, attendus)
+        self.assertEqual(len(pages), 6)
+        self.assertIsNone(pages[0]['prev_cursor'])
+        self.assertIsNone(pages[0]['total'])
+        # Le retour arrière redonne exactement les mêmes pages
+        self.assertEqual([p['items'] for p in arriere], [p['items'] for p in pages])
+
+    def test_sensor_data_cursor_across_partitions(self):
+        """Test du curseur sur les mesures réparties entre table chaude et partitions"""
+        pages, _ = self._parcourir('/api/sensors/data?sensor_id=SENSOR_001&per_page=25')
+
+        valeurs = [m['value'] for page in pages for m in page['items']]
+        self.assertEqual(valeurs, [float(v) for v in reversed(range(self.NOMBRE_MESURES))])
+
+    def test_total_modes(self):
+        """Test des modes de total (aucun, exact, estimé)"""
+        response, _ = self._get('/api/recoltes?per_page=10&cursor=&total=exact')
+        self.assertEqual(response.json['total'], self.NOMBRE_RECOLTES)
+        response, _ = self._get('/api/recoltes?per_page=10&cursor=&total=estimate&annee=2021')
+        self.assertEqual(response.json['total'], len([i for i in range(self.NOMBRE_RECOLTES) if i % 4 == 1]))
+        response, _ = self._get('/api/recoltes?cursor=&total=tout')
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_cursor(self):
+        """Test qu'un curseur illisible est refusé"""
+        for url in ('/api/recoltes?cursor=abc', '/api/sensors/data?cursor=abc', '/api/analyses-sols?cursor=%%%'):
+            response, _ = self._get(url)
+            self.assertEqual(response.status_code, 400)
+
+        # Curseur lisible mais sans valeurs (ou avec trop de valeurs)
+        for valeurs in ([], [datetime(2025, 1, 1), 1, 2]):
+            response, _ = self._get(f'/api/sensors/data?cursor={encode_cursor(CURSOR_NEXT, valeurs)}')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json['error'], 'Curseur invalide')
+
+    def test_page_mode_unchanged(self):
+        """Test que la pagination par page reste le comportement par défaut"""
+        response, _ = self._get('/api/recoltes?per_page=10&page=2')
+        self.assertEqual(response.json['total'], self.NOMBRE_RECOLTES)
+        self.assertEqual(response.json['page'], 2)
+
+
+class TestListStreaming(unittest.TestCase):
+    """Tests pour les listes paginées à la demande ou envoyées en flux"""
+
+    NOMBRE_INTRANTS = 2 * STREAM_BATCH_SIZE + 37
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        with app.app_context():
+            db.create_all()
+            role = Role(nom='Agriculteur')
+            db.session.add(role)
+            db.session.commit()
+            user = User(username='streamuser', email='stream@example.com', role_id=role.id)
+            user.set_password('password123')
+            db.session.add(user)
+            db.session.commit()
+            exploitation = Exploitation(nom='Grande Ferme', superficie_totale=500, proprietaire_id=user.id)
+            db.session.add(exploitation)
+            db.session.commit()
+            db.session.add_all([
+                Intrant(type_intrant='Engrais', quantite=i, date_application=date(2025, 1, 1) + timedelta(days=i % 300),
+                        exploitation_id=exploitation.id)
+                for i in range(self.NOMBRE_INTRANTS)
+            ])
+            region = Region(nom='Maritime', code='MAR')
+            db.session.add(region)
+            db.session.flush()
+            prefecture = Prefecture(nom='Golfe', code='GOL', region_id=region.id)
+            db.session.add(prefecture)
+            db.session.flush()
+            db.session.add_all([Commune(nom=f'Golfe {i}', code=f'G{i}', prefecture_id=prefecture.id) for i in range(7)])
+            db.session.commit()
+            self.token = create_access_token(identity=str(user.id))
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _get(self, url, headers=None):
+        return self.app.get(url, headers={'Authorization': f'Bearer {self.token}', **(headers or {})})
+
+    def test_default_is_streamed_json_array(self):
+        """Test que la liste complète reste un tableau JSON, envoyé par morceaux"""
+        response = self._get('/api/intrants')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        with app.app_context():
+            attendus = [i.to_dict() for i in Intrant.query.order_by(Intrant.id).all()]
+        self.assertEqual(response.json, attendus)
+
+    def test_ndjson_stream(self):
+        """Test du format NDJSON (paramètre ou en-tête Accept)"""
+        for url, headers in (('/api/intrants?format=ndjson', None),
+                             ('/api/intrants', {'Accept': 'application/x-ndjson'})):
+            response = self._get(url, headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'application/x-ndjson')
+            lignes = response.get_data(as_text=True).splitlines()
+            self.assertEqual(len(lignes), self.NOMBRE_INTRANTS)
+            self.assertEqual(json.loads(lignes[-1])['quantite'], self.NOMBRE_INTRANTS - 1)
+
+        response = self._get('/api/intrants?format=xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_pagination_on_request(self):
+        """Test que ?page= / ?per_page= renvoie le format paginé commun"""
+        response = self._get('/api/intrants?page=3&per_page=100')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['total'], self.NOMBRE_INTRANTS)
+        self.assertEqual(response.json['items'][0]['quantite'], 200)
+
+        for url in ('/api/recommandations', '/api/donnees-climatiques', '/api/sensors'):
+            response = self._get(f'{url}?per_page=10')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json['total'], 0)
+            self.assertEqual(self._get(url).json, [])
+
+    def test_geographie_stream_keeps_counts(self):
+        """Test que les listes géographiques en flux gardent les compteurs"""
+        response = self._get('/api/geographie/communes?region_id=1')
+        self.assertEqual(response.status_code, 200)
+        with app.app_context():
+            attendus = [c.to_dict() for c in Commune.query.order_by(Commune.id).all()]
+        self.assertEqual(response.json, attendus)
+
+        response = self._get('/api/geographie/prefectures?per_page=1')
+        self.assertEqual(response.json['items'][0]['communes_count'], 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,253 @@
+"""
+Tests unitaires pour le service de prévision des récoltes
+"""
+import unittest
+from datetime import date
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import delete, event, update
+
+from app import app, db
+from models.user import User, Role
+from models.exploitation import Exploitation
+from models.recolte import Recolte
+from models.analyse_sol import AnalyseSol
+from models.donnee_climatique import DonneeClimatique
+from services.prevision_service import forecast_series, get_prevision_cache_stats, invalidate_previsions, list_series
+
+
+class TestPrevisionRecoltes(unittest.TestCase):
+    """Tests pour GET /api/recoltes/prevision et POST /api/recoltes/prevision/batch"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        # Les identifiants repartent de 1 à chaque test : le cache ne doit rien garder
+        invalidate_previsions()
+        with app.app_context():
+            db.create_all()
+            role = Role(nom='Agriculteur')
+            db.session.add(role)
+            db.session.commit()
+            user = User(username='previsionuser', email='prevision@example.com', role_id=role.id)
+            user.set_password('password123')
+            db.session.add(user)
+            db.session.commit()
+            exploitations = [
+                Exploitation(nom=f'Ferme {i}', superficie_totale=10, proprietaire_id=user.id, region_id=1 + i % 2)
+                for i in range(4)
+            ]
+            db.session.add_all(exploitations)
+            db.session.commit()
+            self.exploitation_ids = [e.id for e in exploitations]
+            self.technicien_id = user.id
+            self.token = create_access_token(identity=str(user.id))
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+        invalidate_previsions()
+
+    def _recoltes(self, exploitation_id, culture, points):
+        with app.app_context():
+            db.session.add_all([
+                Recolte(exploitation_id=exploitation_id, type_culture=culture, annee=a, mois=m, quantite_recoltee=q)
+                for a, m, q in points
+            ])
+            db.session.commit()
+
+    def _get(self, url):
+        return self.app.get(url, headers={'Authorization': f'Bearer {self.token}'})
+
+    def test_trend_and_insufficient_data(self):
+        """Test du lissage sur une tendance linéaire et du cas sans historique suffisant"""
+        e1, e2 = self.exploitation_ids[:2]
+        self._recoltes(e1, 'Maïs', [(2019 + k, 8, 100 + 10 * k) for k in range(5)])
+        self._recoltes(e2, 'Maïs', [(2023, 8, 100), (2024, 8, 120)])
+
+        response = self._get(f'/api/recoltes/prevision?exploitation_id={e1}&type_culture=Maïs')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['modele'], 'lissage')
+        self.assertAlmostEqual(response.json['quantite_prevue'], 150)
+        self.assertEqual(response.json['periode'], {'annee': 2024, 'mois': 8})
+        self.assertEqual(response.json['prediction'], 'bonne')
+        self.assertEqual(response.json['facteurs']['nombre_recoltes_analysees'], 5)
+
+        response = self._get(f'/api/recoltes/prevision?exploitation_id={e2}&type_culture=Maïs')
+        self.assertEqual(response.json['quantite_prevue'], 0)
+        self.assertEqual(response.json['raison'], 'Données insuffisantes pour une prévision fiable')
+
+        response = self._get(f'/api/recoltes/prevision?exploitation_id={e1}&type_culture=Maïs&modele=arima')
+        self.assertEqual(response.status_code, 400)
+        response = self._get('/api/recoltes/prevision?type_culture=Maïs')
+        self.assertEqual(response.status_code, 400)
+
+    def test_seasonal_series(self):
+        """Test de la décomposition saisonnière (deux campagnes par an)"""
+        e1 = self.exploitation_ids[0]
+        points = []
+        for k in range(6):
+            points.append((2019 + k, 4, 200 * (1 + 0.02 * k)))   # grande saison
+            points.append((2019 + k, 10, 80 * (1 + 0.02 * k)))   # petite saison
+        self._recoltes(e1, 'Maïs', points)
+
+        with app.app_context():
+            prevision = forecast_series([(e1, 'Maïs')])[0]
+        self.assertEqual(prevision['modele'], 'saisonnier')
+        self.assertEqual(prevision['periode'], {'annee': 2025, 'mois': 4})
+        # La grande saison est prévue au niveau des grandes saisons, pas de la moyenne
+        self.assertGreater(prevision['quantite_prevue'], 180)
+        self.assertLess(prevision['previsions']['lissage'], 180)
+
+    def test_regression_on_climate_and_soil(self):
+        """Test de la régression sur pluie, température, pH et azote"""
+        e1 = self.exploitation_ids[0]
+
+        def rendement(pluie, temperature, ph, azote):
+            return 100 + 3 * pluie + 20 * temperature + 5 * ph + 0.5 * azote
+
+        with app.app_context():
+            for k in range(11):
+                annee = 2010 + k
+                pluie, temperature = 300 + (k * 37) % 90, 24 + (k * 5) % 7
+                ph, azote = 5 + (k * 3) % 4 * 0.5, 80 + (k * 11) % 40
+                db.session.add(DonneeClimatique(
+                    exploitation_id=e1, date_debut=date(annee, 5, 1), date_fin=date(annee, 5, 31),
+                    pluviometrie=pluie, temperature_min=temperature - 5, temperature_max=temperature + 5))
+                db.session.add(AnalyseSol(
+                    exploitation_id=e1, technicien_id=self.technicien_id, date_prelevement=date(annee, 3, 1),
+                    ph=ph, azote_n=azote))
+                if k < 10:
+                    db.session.add(Recolte(exploitation_id=e1, type_culture='Maïs', annee=annee, mois=9,
+                                           quantite_recoltee=rendement(pluie, temperature, ph, azote)))
+                else:
+                    attendu = rendement(pluie, temperature, ph, azote)
+            db.session.commit()
+            prevision = forecast_series([(e1, 'Maïs')])[0]
+        self.assertEqual(prevision['modele'], 'regression')
+        self.assertEqual(prevision['periode'], {'annee': 2020, 'mois': 9})
+        self.assertAlmostEqual(prevision['quantite_prevue'], attendu, delta=attendu * 0.01)
+
+    def test_incremental_refresh_matches_full_fit(self):
+        """Test que la mise à jour incrémentale du cache donne le même résultat qu'un recalcul"""
+        e1, e2 = self.exploitation_ids[:2]
+        self._recoltes(e1, 'Maïs', [(2018 + k, 4 + 6 * (k % 2), 100 + 7 * k) for k in range(6)])
+        self._recoltes(e2, 'Sorgho', [(2018 + k, 9, 50 + (k * 13) % 20) for k in range(6)])
+        cles = [(e1, 'Maïs'), (e2, 'Sorgho')]
+
+        def prevoir(recalcul=False):
+            if recalcul:
+                invalidate_previsions()
+            with app.app_context():
+                return forecast_series(cles, 'lissage')
+
+        prevoir()
+        self.assertEqual(get_prevision_cache_stats()['series'], 2)
+
+        # Nouvelle période : intégrée sans recalcul ; période déjà vue ou antérieure : recalcul
+        for points in ([(2024, 9, 75)], [(2020, 9, 40)], [(2023, 9, 5)]):
+            self._recoltes(e2, 'Sorgho', points)
+            self.assertEqual(prevoir(), prevoir(recalcul=True))
+
+        # Modification d'une récolte : séries de l'exploitation invalidées au commit
+        with app.app_context():
+            recolte = Recolte.query.filter_by(exploitation_id=e1).first()
+            recolte.quantite_recoltee = 1000
+            db.session.commit()
+        self.assertEqual(get_prevision_cache_stats()['series'], 1)
+        self.assertEqual(prevoir(), prevoir(recalcul=True))
+
+    def test_cache_detects_writes_from_other_processes(self):
+        """Test que les écritures non vues par ce processus (hors ORM) sont détectées par les empreintes"""
+        e1 = self.exploitation_ids[0]
+        self._recoltes(e1, 'Maïs', [(2016 + k, 9, 100 + 9 * k + (k * 7) % 5) for k in range(10)])
+        with app.app_context():
+            for k in range(12):
+                db.session.add(DonneeClimatique(
+                    exploitation_id=e1, date_debut=date(2016 + k, 5, 1), date_fin=date(2016 + k, 5, 31),
+                    pluviometrie=300 + (k * 37) % 90, temperature_min=20 + k % 3, temperature_max=30 + k % 4))
+                db.session.add(AnalyseSol(exploitation_id=e1, technicien_id=self.technicien_id,
+                                          date_prelevement=date(2016 + k, 3, 1), ph=5 + k % 3, azote_n=80 + k % 5))
+            db.session.commit()
+
+        def prevoir(recalcul=False):
+            if recalcul:
+                invalidate_previsions()
+            with app.app_context():
+                return forecast_series([(e1, 'Maïs')])
+
+        def ecrire(*instructions):
+            # Instructions SQL directes : aucun écouteur de session de ce processus ne les voit
+            with app.app_context():
+                for instruction in instructions:
+                    db.session.execute(instruction)
+                db.session.commit()
+            return prevoir()
+
+        prevoir()
+        with app.app_context():
+            ids = [r.id for r in Recolte.query.filter_by(exploitation_id=e1).order_by(Recolte.id)]
+
+        # Modification d'une quantité
+        obtenue = ecrire(update(Recolte).where(Recolte.id == ids[2]).values(quantite_recoltee=500))
+        self.assertEqual(obtenue, prevoir(recalcul=True))
+
+        # Récolte validée après une autre d'identifiant supérieur (identifiant libéré puis réutilisé)
+        ecrire(delete(Recolte).where(Recolte.id == ids[4]))
+        with app.app_context():
+            db.session.add(Recolte(id=ids[4], exploitation_id=e1, type_culture='Maïs', annee=2026, mois=9,
+                                   quantite_recoltee=400))
+            db.session.commit()
+        obtenue = prevoir()
+        self.assertEqual(obtenue[0]['periode'], {'annee': 2027, 'mois': 9})
+        self.assertEqual(obtenue, prevoir(recalcul=True))
+
+        # Données climatiques modifiées : la régression change
+        self.assertIn('regression', obtenue[0]['previsions'])
+        obtenue = ecrire(update(DonneeClimatique).where(DonneeClimatique.exploitation_id == e1,
+                                                        DonneeClimatique.date_debut < date(2020, 1, 1))
+                         .values(pluviometrie=DonneeClimatique.pluviometrie * 2))
+        self.assertEqual(obtenue, prevoir(recalcul=True))
+
+    def test_region_batch_in_constant_queries(self):
+        """Test des prévisions groupées d'une région, avec un nombre de requêtes constant"""
+        for i, exploitation_id in enumerate(self.exploitation_ids):
+            for culture in ('Maïs', 'Mil'):
+                self._recoltes(exploitation_id, culture, [(2018 + k, 8, 100 + i * 10 + k) for k in range(4)])
+
+        requetes = []
+
+        def compter(conn, cursor, statement, parameters, context, executemany):
+            requetes.append(statement)
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', compter)
+            try:
+                series = list_series(region_id=1)
+                previsions = forecast_series(series)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', compter)
+            unitaires = [forecast_series([cle])[0] for cle in series]
+
+        self.assertEqual(len(series), 4)
+        self.assertLessEqual(len(requetes), 5)
+        self.assertEqual(previsions, unitaires)
+
+        response = self.app.post('/api/recoltes/prevision/batch', json={'region_id': 2, 'type_culture': 'Mil'},
+                                 headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['nombre'], 2)
+        self.assertEqual({p['exploitation_id'] for p in response.json['previsions']}, set(self.exploitation_ids[1::2]))
+
+        response = self.app.post('/api/recoltes/prevision/batch', json={},
+                                 headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
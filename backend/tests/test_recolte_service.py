@@ -0,0 +1,132 @@
+"""
+Tests unitaires pour les statistiques des récoltes calculées en SQL
+"""
+import statistics
+import unittest
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from app import app, db
+from models.user import User, Role
+from models.exploitation import Exploitation
+from models.recolte import Recolte
+from services.recolte_service import harvest_statistics, parse_group_by
+
+
+class TestHarvestStatistics(unittest.TestCase):
+    """Tests pour GET /api/recoltes/statistics"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        with app.app_context():
+            db.create_all()
+            role = Role(nom='Agriculteur')
+            db.session.add(role)
+            db.session.commit()
+            user = User(username='statsuser', email='stats@example.com', role_id=role.id)
+            user.set_password('password123')
+            db.session.add(user)
+            db.session.commit()
+            exploitations = [
+                Exploitation(nom=f'Ferme {r}', superficie_totale=10, proprietaire_id=user.id, region_id=r)
+                for r in (1, 2)
+            ]
+            db.session.add_all(exploitations)
+            db.session.commit()
+            # Effectifs pairs et impairs selon les groupes, valeurs non triées
+            self.recoltes = [
+                (exploitations[i % 2].id, culture, 2022 + i % 3, 1 + i % 2, float((i * 37) % 101 + 1))
+                for i, culture in enumerate(['Maïs', 'Sorgho', 'Maïs', 'Mil', 'Maïs'] * 9)
+            ]
+            db.session.add_all([
+                Recolte(exploitation_id=e, type_culture=c, annee=a, mois=m, quantite_recoltee=q)
+                for e, c, a, m, q in self.recoltes
+            ])
+            db.session.commit()
+            self.regions = {e.id: e.region_id for e in exploitations}
+            self.token = create_access_token(identity=str(user.id))
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _get(self, url):
+        requetes = []
+
+        def compter(conn, cursor, statement, parameters, context, executemany):
+            requetes.append(statement)
+
+        with app.app_context():
+            moteur = db.engine
+        event.listen(moteur, 'before_cursor_execute', compter)
+        try:
+            response = self.app.get(url, headers={'Authorization': f'Bearer {self.token}'})
+        finally:
+            event.remove(moteur, 'before_cursor_execute', compter)
+        return response, requetes
+
+    def _attendu(self, quantites):
+        return {
+            'min': min(quantites), 'max': max(quantites), 'moyenne': statistics.fmean(quantites),
+            'mediane': statistics.median(quantites), 'ecart_type': statistics.pstdev(quantites),
+            'nombre': len(quantites),
+        }
+
+    def _comparer(self, obtenu, attendu):
+        for cle, valeur in attendu.items():
+            self.assertAlmostEqual(obtenu[cle], valeur, places=9, msg=cle)
+
+    def test_global_statistics_in_one_query(self):
+        """Test des statistiques globales et filtrées, sans charger les récoltes"""
+        response, requetes = self._get('/api/recoltes/statistics')
+        self.assertEqual(response.status_code, 200)
+        self._comparer(response.json, self._attendu([r[4] for r in self.recoltes]))
+        self.assertEqual(len([r for r in requetes if r.lstrip().upper().startswith('SELECT')]), 1)
+
+        response, _ = self._get('/api/recoltes/statistics?type_culture=Maïs&annee=2023')
+        self._comparer(response.json, self._attendu(
+            [r[4] for r in self.recoltes if r[1] == 'Maïs' and r[2] == 2023]))
+
+        response, _ = self._get('/api/recoltes/statistics?type_culture=Riz')
+        self.assertEqual(response.json, {'min': 0, 'max': 0, 'moyenne': 0, 'mediane': 0, 'ecart_type': 0, 'nombre': 0})
+
+    def test_group_by_breakdown(self):
+        """Test du tableau par culture et par région (médiane sur effectifs pairs et impairs)"""
+        response, _ = self._get('/api/recoltes/statistics?group_by=culture,region')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['group_by'], ['culture', 'region'])
+        self.assertEqual(response.json['nombre'], len(self.recoltes))
+
+        groupes = {}
+        for e, c, a, m, q in self.recoltes:
+            groupes.setdefault((c, self.regions[e]), []).append(q)
+        self.assertEqual([(g['type_culture'], g['region_id']) for g in response.json['groupes']], sorted(groupes))
+        self.assertEqual({len(q) % 2 for q in groupes.values()}, {0, 1})
+        for ligne in response.json['groupes']:
+            self._comparer(ligne, self._attendu(groupes[(ligne['type_culture'], ligne['region_id'])]))
+
+        response, _ = self._get('/api/recoltes/statistics?group_by=saison')
+        self.assertEqual(response.status_code, 400)
+
+    def test_service_group_by_annee_mois(self):
+        """Test du service avec regroupement par année et mois"""
+        with app.app_context():
+            lignes = harvest_statistics(parse_group_by('annee, mois,annee'), region_id=2)
+        groupes = {}
+        for e, c, a, m, q in self.recoltes:
+            if self.regions[e] == 2:
+                groupes.setdefault((a, m), []).append(q)
+        self.assertEqual([(l['annee'], l['mois']) for l in lignes], sorted(groupes))
+        for ligne in lignes:
+            self._comparer(ligne, self._attendu(groupes[(ligne['annee'], ligne['mois'])]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,13 +3,19 @@ Tests unitaires pour le service de recommandations
 """
 import unittest
 from datetime import datetime, timedelta
+from unittest.mock import patch
 from app import app, db
 from models.user import User, Role
 from models.exploitation import Exploitation
 from models.analyse_sol import AnalyseSol
 from models.donnee_climatique import DonneeClimatique
 from models.intrant import Intrant
-from services.recommandation_service import generate_recommandations
+from sqlalchemy import event
+from models.recommandation import Recommandation
+from models.region import Region
+from services import recommandation_service
+from services.recommandation_service import generate_recommandations, generate_recommandations_batch
+from services.recommandation_batch_service import generate_all_recommandations
 
 
 class TestRecommandationService(unittest.TestCase):
@@ -155,6 +161,223 @@ class TestRecommandationService(unittest.TestCase):
                 self.assertIn('parametres_utilises', rec)
                 self.assertIsNotNone(rec['parametres_utilises'])
 
+    def test_nutrient_averages_with_missing_values(self):
+        """Test des moyennes N/P/K quand une valeur est nulle (0) et une autre non renseignée"""
+        with app.app_context():
+            user = User.query.first()
+            exploitation_id = Exploitation.query.first().id
+            aujourd_hui = datetime.now().date()
+            db.session.add_all([
+                AnalyseSol(date_prelevement=aujourd_hui, ph=6.5, azote_n=0.0, phosphore_p=20.0,
+                           potassium_k=200.0, exploitation_id=exploitation_id, technicien_id=user.id),
+                AnalyseSol(date_prelevement=aujourd_hui - timedelta(days=60), ph=6.5, azote_n=None,
+                           phosphore_p=None, potassium_k=None, exploitation_id=exploitation_id,
+                           technicien_id=user.id),
+            ])
+            db.session.commit()
+
+            recommandations = generate_recommandations(exploitation_id)
+
+            azote = [r for r in recommandations if r['titre'] == 'Carence en azote']
+            self.assertEqual(len(azote), 1)
+            self.assertEqual(azote[0]['parametres_utilises']['moyenne_azote'], 0.0)
+
+
+class TestRecommandationBatch(unittest.TestCase):
+    """Tests pour le chargement groupé des données de recommandation"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _create_exploitations(self, nombre):
+        role = Role(nom='Agriculteur')
+        db.session.add(role)
+        db.session.commit()
+        user = User(username='batchuser', email='batch@example.com', role_id=role.id)
+        user.set_password('password123')
+        db.session.add(user)
+        db.session.commit()
+
+        aujourd_hui = datetime.now().date()
+        ids = []
+        for i in range(nombre):
+            exploitation = Exploitation(nom=f'Ferme {i}', superficie_totale=5, proprietaire_id=user.id)
+            db.session.add(exploitation)
+            db.session.flush()
+            ids.append(exploitation.id)
+            # 4 analyses : seules les 3 plus récentes entrent dans les moyennes
+            for j in range(4):
+                db.session.add(AnalyseSol(
+                    date_prelevement=aujourd_hui - timedelta(days=30 * j),
+                    ph=5.5 if i % 2 else 6.5,
+                    azote_n=10.0 if j < 3 else 100.0,
+                    phosphore_p=20.0,
+                    potassium_k=200.0,
+                    exploitation_id=exploitation.id,
+                    technicien_id=user.id
+                ))
+            db.session.add(DonneeClimatique(
+                date_debut=aujourd_hui - timedelta(days=30), date_fin=aujourd_hui,
+                pluviometrie=20.0, exploitation_id=exploitation.id
+            ))
+            db.session.add(Intrant(
+                type_intrant='Engrais', quantite=1,
+                date_application=aujourd_hui - timedelta(days=120), exploitation_id=exploitation.id
+            ))
+        db.session.commit()
+        return ids
+
+    def test_batch_matches_single(self):
+        """Test que le traitement par lot donne les mêmes recommandations qu'individuellement"""
+        with app.app_context():
+            ids = self._create_exploitations(6)
+
+            resultats = generate_recommandations_batch(ids + [999999])
+
+            self.assertEqual(sorted(resultats), ids)
+            for exploitation_id in ids:
+                self.assertEqual(resultats[exploitation_id], generate_recommandations(exploitation_id))
+            titres = [r['titre'] for r in resultats[ids[1]]]
+            self.assertIn('Sol trop acide', titres)
+            self.assertIn('Carence en azote', titres)
+            self.assertIn('Révision des intrants nécessaire', titres)
+
+    def test_batch_single_round_trip(self):
+        """Test que les données d'un lot sont chargées en une seule requête"""
+        with app.app_context():
+            ids = self._create_exploitations(20)
+            requetes = []
+
+            def compter(conn, cursor, statement, parameters, context, executemany):
+                requetes.append(statement)
+
+            event.listen(db.engine, 'before_cursor_execute', compter)
+            try:
+                resultats = generate_recommandations_batch(ids)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', compter)
+
+            self.assertEqual(len(resultats), 20)
+            self.assertEqual(len(requetes), 1)
+
+
+class TestRecommandationJob(unittest.TestCase):
+    """Tests pour la génération des recommandations par lot (job nocturne)"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        with app.app_context():
+            db.create_all()
+            role = Role(nom='Agriculteur')
+            db.session.add(role)
+            db.session.commit()
+            user = User(username='jobuser', email='job@example.com', role_id=role.id)
+            user.set_password('password123')
+            db.session.add(user)
+            self.regions = [Region(nom='Maritime', code='MAR'), Region(nom='Plateaux', code='PLA')]
+            db.session.add_all(self.regions)
+            db.session.commit()
+
+            for i in range(10):
+                exploitation = Exploitation(
+                    nom=f'Ferme {i}', superficie_totale=5, proprietaire_id=user.id,
+                    region_id=self.regions[i % 2].id
+                )
+                db.session.add(exploitation)
+                db.session.flush()
+                db.session.add(AnalyseSol(
+                    date_prelevement=datetime.now().date(), ph=5.5,
+                    exploitation_id=exploitation.id, technicien_id=user.id
+                ))
+            db.session.commit()
+            self.region_ids = [r.id for r in self.regions]
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_job_is_idempotent(self):
+        """Test qu'une deuxième exécution ne crée pas de doublons"""
+        with app.app_context():
+            premier = generate_all_recommandations(processus=1)
+            self.assertEqual(premier['regions'], 2)
+            self.assertEqual(premier['exploitations'], 10)
+            self.assertEqual(premier['creees'], 10)
+            self.assertIn('debit', premier)
+
+            second = generate_all_recommandations(processus=1)
+            self.assertEqual(second['creees'], 0)
+            self.assertEqual(second['inchangees'], 10)
+            self.assertEqual(Recommandation.query.count(), 10)
+
+    def test_job_updates_changed_recommandation(self):
+        """Test que la recommandation existante est mise à jour en conservant son statut"""
+        with app.app_context():
+            generate_all_recommandations(processus=1)
+            recommandation = Recommandation.query.first()
+            recommandation_id = recommandation.id
+            recommandation.statut = 'en_cours'
+            AnalyseSol.query.filter_by(exploitation_id=recommandation.exploitation_id).update({'ph': 5.0})
+            db.session.commit()
+
+            stats = generate_all_recommandations(processus=1)
+
+            self.assertEqual(stats['mises_a_jour'], 1)
+            recommandation = db.session.get(Recommandation, recommandation_id)
+            self.assertEqual(recommandation.statut, 'en_cours')
+            self.assertIn('5.0', recommandation.description)
+            self.assertEqual(Recommandation.query.count(), 10)
+
+    def test_job_continues_after_failure(self):
+        """Test qu'une exploitation en échec est comptée sans interrompre le job"""
+        evaluer = recommandation_service.evaluate_recommandations
+        appels = []
+
+        def evaluer_ou_echouer(donnees, aujourd_hui=None):
+            appels.append(donnees)
+            if len(appels) == 3:
+                raise ZeroDivisionError('division by zero')
+            return evaluer(donnees, aujourd_hui)
+
+        with app.app_context():
+            with patch.object(recommandation_service, 'evaluate_recommandations', evaluer_ou_echouer):
+                stats = generate_all_recommandations(processus=1, taille_tache=2)
+
+            self.assertEqual(stats['regions'], 2)
+            self.assertEqual(stats['echecs'], 1)
+            self.assertEqual(stats['exploitations'], 9)
+            self.assertEqual(Recommandation.query.count(), 9)
+
+            # Sans collecteur d'échecs, l'erreur remonte
+            with patch.object(recommandation_service, 'evaluate_recommandations', side_effect=ZeroDivisionError):
+                with self.assertRaises(ZeroDivisionError):
+                    generate_recommandations_batch([Exploitation.query.first().id])
+
+    def test_job_filters_region(self):
+        """Test que seules les exploitations des régions demandées sont traitées"""
+        with app.app_context():
+            stats = generate_all_recommandations(region_ids=[self.region_ids[0]], processus=1)
+
+            self.assertEqual(stats['regions'], 1)
+            self.assertEqual(stats['exploitations'], 5)
+            self.assertEqual(Recommandation.query.count(), 5)
+
 
 if __name__ == '__main__':
     unittest.main()
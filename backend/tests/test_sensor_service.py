@@ -0,0 +1,386 @@
+"""
+Tests unitaires pour l'ingestion des données de capteurs
+"""
+import unittest
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app import app, db
+from models.user import User, Role
+from models.exploitation import Exploitation
+from models.sensor import Sensor, SensorData, SensorRollup
+from services.sensor_service import ingest_sensor_readings, parse_ndjson, rebuild_rollups
+from flask_jwt_extended import create_access_token
+from services.sensor_storage_service import (
+    archive_sensor_data, drop_partition, list_partitions, select_sensor_readings
+)
+from services.sensor_export_service import EXPORT_COLUMNS, columnar_available
+
+
+class TestSensorService(unittest.TestCase):
+    """Tests pour l'ingestion groupée des mesures de capteurs"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        with app.app_context():
+            db.create_all()
+            self._create_test_data()
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _create_test_data(self):
+        """Créer des capteurs de test"""
+        role = Role(nom='Agriculteur')
+        db.session.add(role)
+        db.session.commit()
+
+        user = User(username='testuser', email='test@example.com', role_id=role.id)
+        user.set_password('password123')
+        db.session.add(user)
+        db.session.commit()
+
+        exploitation = Exploitation(nom='Ma Ferme', superficie_totale=10.5, proprietaire_id=user.id)
+        db.session.add(exploitation)
+        db.session.commit()
+        self.exploitation_id = exploitation.id
+
+        db.session.add_all([
+            Sensor(sensor_id='SENSOR_001', sensor_name='Humidité', sensor_type='soil_moisture',
+                   exploitation_id=exploitation.id),
+            Sensor(sensor_id='SENSOR_002', sensor_name='pH', sensor_type='ph', is_active=False),
+        ])
+        db.session.commit()
+
+    def test_ingest_mixed_batch(self):
+        """Test lot avec mesures valides et invalides"""
+        with app.app_context():
+            result = ingest_sensor_readings([
+                {'sensor_id': 'SENSOR_001', 'sensor_type': 'soil_moisture', 'value': 45.5,
+                 'timestamp': '2025-06-01T10:00:00Z', 'battery_level': 80},
+                {'sensor_id': 'SENSOR_002', 'sensor_type': 'ph', 'value': 6.5},
+                {'sensor_id': 'INCONNU', 'sensor_type': 'ph', 'value': 6.5},
+                {'sensor_id': 'SENSOR_001', 'sensor_type': 'soil_moisture'},
+                {'sensor_id': 'SENSOR_001', 'sensor_type': 'soil_moisture', 'value': 'abc'},
+                {'sensor_id': 'SENSOR_001', 'sensor_type': 'soil_moisture', 'value': 46.0, 'battery_level': 79},
+            ])
+
+            self.assertEqual(result['acceptees'], 2)
+            self.assertEqual(result['rejetees'], 4)
+            statuts = [r['statut'] for r in result['resultats']]
+            self.assertEqual(statuts, ['acceptee', 'rejetee', 'rejetee', 'rejetee', 'rejetee', 'acceptee'])
+            self.assertEqual(result['resultats'][1]['erreur'], 'Capteur désactivé')
+            self.assertEqual(result['resultats'][2]['erreur'], 'Capteur non enregistré')
+
+            self.assertEqual(SensorData.query.count(), 2)
+            donnee = SensorData.query.first()
+            self.assertEqual(donnee.exploitation_id, self.exploitation_id)
+
+            sensor = Sensor.query.filter_by(sensor_id='SENSOR_001').first()
+            self.assertIsNotNone(sensor.last_reading)
+            self.assertEqual(sensor.battery_level, 79)
+
+    def test_parse_ndjson(self):
+        """Test découpage d'un corps NDJSON"""
+        lectures = parse_ndjson('{"sensor_id": "A"}\n\n{invalide}\n{"sensor_id": "B"}\n')
+        self.assertEqual(len(lectures), 3)
+        self.assertEqual(lectures[0]['sensor_id'], 'A')
+        self.assertIsNone(lectures[1])
+
+    def test_post_batch_array(self):
+        """Test envoi d'un tableau de mesures sur POST /api/sensors/data"""
+        lectures = [
+            {'sensor_id': 'SENSOR_001', 'sensor_type': 'soil_moisture', 'value': 40 + i}
+            for i in range(50)
+        ]
+        response = self.app.post(
+            '/api/sensors/data',
+            data=json.dumps(lectures),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        data = json.loads(response.data)
+        self.assertEqual(data['acceptees'], 50)
+        self.assertEqual(len(data['resultats']), 50)
+
+    def test_post_batch_ndjson(self):
+        """Test envoi NDJSON sur POST /api/sensors/data"""
+        body = '\n'.join(json.dumps({'sensor_id': 'SENSOR_001', 'sensor_type': 'soil_moisture', 'value': v})
+                         for v in (10, 20, 30))
+        response = self.app.post(
+            '/api/sensors/data',
+            data=body,
+            content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(json.loads(response.data)['acceptees'], 3)
+
+    def test_post_single_reading(self):
+        """Test compatibilité avec l'envoi d'une mesure unique"""
+        response = self.app.post(
+            '/api/sensors/data',
+            data=json.dumps({'sensor_id': 'SENSOR_001', 'sensor_type': 'soil_moisture', 'value': 12.5}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('sensor_data', json.loads(response.data))
+
+
+class TestSensorStorage(unittest.TestCase):
+    """Tests pour le stockage partitionné par mois"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        with app.app_context():
+            db.create_all()
+            db.session.add(Sensor(sensor_id='SENSOR_001', sensor_name='Humidité', sensor_type='soil_moisture'))
+            db.session.commit()
+            ingest_sensor_readings([
+                {'sensor_id': 'SENSOR_001', 'sensor_type': 'soil_moisture', 'value': mois,
+                 'timestamp': f'2025-{mois:02d}-15T12:00:00'}
+                for mois in (1, 2, 3)
+            ])
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            for key in list_partitions():
+                drop_partition(key)
+            db.session.remove()
+            db.drop_all()
+
+    def _values(self, **filtres):
+        readings = select_sensor_readings(**filtres)
+        return sorted(r.value for r in db.session.execute(select(readings)).all())
+
+    def test_archive_moves_closed_months(self):
+        """Test archivage des mois révolus dans leurs partitions"""
+        with app.app_context():
+            archives = archive_sensor_data(datetime(2025, 3, 10))
+
+            self.assertEqual(archives, {'202501': 1, '202502': 1})
+            self.assertEqual(list_partitions(), ['202501', '202502'])
+            self.assertEqual(SensorData.query.count(), 1)
+            # Les lectures couvrent toujours la table chaude et les partitions
+            self.assertEqual(self._values(), [1.0, 2.0, 3.0])
+
+    def test_range_reads_only_relevant_partitions(self):
+        """Test que la plage de dates limite les partitions interrogées"""
+        with app.app_context():
+            archive_sensor_data(datetime(2025, 3, 10))
+
+            readings = select_sensor_readings(start=datetime(2025, 2, 1), end=datetime(2025, 2, 28))
+            sql = str(select(readings).compile(db.engine))
+            self.assertIn('sensor_data_202502', sql)
+            self.assertNotIn('sensor_data_202501', sql)
+            self.assertEqual(
+                self._values(start=datetime(2025, 2, 1), end=datetime(2025, 2, 28)), [2.0]
+            )
+
+    def test_drop_partition(self):
+        """Test suppression d'une partition"""
+        with app.app_context():
+            archive_sensor_data(datetime(2025, 3, 10))
+
+            self.assertTrue(drop_partition('202501'))
+            self.assertFalse(drop_partition('202501'))
+            self.assertEqual(self._values(), [2.0, 3.0])
+
+
+class TestSensorRollups(unittest.TestCase):
+    """Tests pour les agrégats 1m/1h/1d maintenus à l'ingestion"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        with app.app_context():
+            db.create_all()
+            db.session.add(Sensor(sensor_id='SENSOR_001', sensor_name='Humidité', sensor_type='soil_moisture'))
+            db.session.commit()
+            self.token = create_access_token(identity='1')
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _reading(self, value, timestamp):
+        return {'sensor_id': 'SENSOR_001', 'sensor_type': 'soil_moisture', 'value': value, 'timestamp': timestamp}
+
+    def _bucket(self, resolution, bucket_start):
+        return SensorRollup.query.filter_by(
+            sensor_id='SENSOR_001', resolution=resolution, bucket_start=bucket_start
+        ).first().to_dict()
+
+    def test_rollups_are_merged_incrementally(self):
+        """Test fusion des agrégats sur plusieurs lots"""
+        with app.app_context():
+            ingest_sensor_readings([
+                self._reading(30.0, '2025-06-01T10:05:00'),
+                self._reading(10.0, '2025-06-01T10:20:00'),
+            ])
+            ingest_sensor_readings([
+                self._reading(20.0, '2025-06-01T10:50:00'),
+                self._reading(99.0, '2025-06-01T10:01:00'),  # Mesure en retard
+                self._reading(5.0, '2025-06-01T11:00:00'),
+            ])
+
+            heure = self._bucket('1h', datetime(2025, 6, 1, 10))
+            self.assertEqual(heure['count'], 4)
+            self.assertEqual(heure['min'], 10.0)
+            self.assertEqual(heure['max'], 99.0)
+            self.assertAlmostEqual(heure['avg'], 39.75)
+            self.assertEqual(heure['last'], 20.0)
+
+            jour = self._bucket('1d', datetime(2025, 6, 1))
+            self.assertEqual(jour['count'], 5)
+            self.assertEqual(jour['last'], 5.0)
+            self.assertEqual(SensorRollup.query.filter_by(resolution='1m').count(), 5)
+
+    def test_rebuild_matches_incremental(self):
+        """Test que le recalcul complet redonne les mêmes agrégats"""
+        with app.app_context():
+            ingest_sensor_readings([self._reading(v, f'2025-06-01T10:{v:02d}:00') for v in range(0, 60, 7)])
+            avant = sorted((r.resolution, r.bucket_start, r.count, r.sum_value) for r in SensorRollup.query.all())
+
+            self.assertEqual(rebuild_rollups(), 9)
+            apres = sorted((r.resolution, r.bucket_start, r.count, r.sum_value) for r in SensorRollup.query.all())
+            self.assertEqual(avant, apres)
+
+    def test_get_data_with_resolution(self):
+        """Test GET /api/sensors/data?resolution=1d"""
+        with app.app_context():
+            ingest_sensor_readings([self._reading(10.0 * jour, f'2025-06-{jour:02d}T08:00:00') for jour in range(1, 6)])
+
+        response = self.app.get(
+            '/api/sensors/data?resolution=1d&sensor_id=SENSOR_001&start_date=2025-06-02',
+            headers={'Authorization': f'Bearer {self.token}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['total'], 4)
+        self.assertEqual(data['items'][0]['bucket_start'], '2025-06-05T00:00:00')
+
+        response = self.app.get(
+            '/api/sensors/data?resolution=1w',
+            headers={'Authorization': f'Bearer {self.token}'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class TestSensorExport(unittest.TestCase):
+    """Tests pour l'export en flux des mesures (CSV, NDJSON, Parquet, Arrow)"""
+
+    NOMBRE_MESURES = 120
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        with app.app_context():
+            db.create_all()
+            db.session.add_all([
+                Sensor(sensor_id='SENSOR_001', sensor_name='Humidité', sensor_type='soil_moisture'),
+                Sensor(sensor_id='SENSOR_002', sensor_name='pH', sensor_type='ph'),
+            ])
+            db.session.commit()
+            debut = datetime(2025, 1, 1)
+            ingest_sensor_readings([
+                {'sensor_id': f'SENSOR_00{1 + i % 2}', 'sensor_type': 'soil_moisture' if i % 2 == 0 else 'ph',
+                 'value': i, 'timestamp': (debut + timedelta(days=i)).isoformat(),
+                 'metadata': {'lot': i}}
+                for i in range(self.NOMBRE_MESURES)
+            ])
+            # Une partie des mesures dans les partitions mensuelles
+            archive_sensor_data(datetime(2025, 3, 10))
+            self.token = create_access_token(identity='1')
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            for key in list_partitions():
+                drop_partition(key)
+            db.session.remove()
+            db.drop_all()
+
+    def _export(self, query):
+        response = self.app.get(f'/api/sensors/export?{query}', headers={'Authorization': f'Bearer {self.token}'})
+        self.streamed = response.is_streamed
+        return response, response.get_data()
+
+    def test_csv_export_covers_partitions(self):
+        """Test export CSV filtré, trié par date, table chaude et partitions"""
+        response, data = self._export('sensor_id=SENSOR_001')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.streamed)
+        self.assertIn('sensor_data.csv', response.headers['Content-Disposition'])
+        lignes = list(csv.DictReader(io.StringIO(data.decode('utf-8'))))
+        self.assertEqual(list(lignes[0].keys()), EXPORT_COLUMNS)
+        self.assertEqual([float(l['value']) for l in lignes], [float(v) for v in range(0, self.NOMBRE_MESURES, 2)])
+        self.assertEqual(lignes[0]['timestamp'], '2025-01-01T00:00:00')
+
+    def test_ndjson_gzip_export_with_range(self):
+        """Test export NDJSON compressé sur une période"""
+        response, data = self._export('format=ndjson&gzip=1&start_date=2025-02-01&end_date=2025-02-28T23:59:59')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/gzip')
+        lignes = [json.loads(l) for l in gzip.decompress(data).decode('utf-8').splitlines()]
+        self.assertEqual(len(lignes), 28)
+        self.assertTrue(all(l['timestamp'].startswith('2025-02') for l in lignes))
+        self.assertEqual(json.loads(lignes[0]['sensor_metadata']), {'lot': 31})
+
+    @unittest.skipUnless(columnar_available(), 'pyarrow non installé')
+    def test_columnar_exports(self):
+        """Test exports Parquet et Arrow (flux IPC)"""
+        import pyarrow
+        import pyarrow.parquet
+
+        _, data = self._export('format=parquet&sensor_type=ph')
+        table = pyarrow.parquet.read_table(io.BytesIO(data))
+        self.assertEqual(table.num_rows, self.NOMBRE_MESURES // 2)
+        self.assertEqual(table.column_names, EXPORT_COLUMNS)
+        self.assertEqual(table.column('timestamp')[0].as_py(), datetime(2025, 1, 2))
+
+        _, data = self._export('format=arrow&gzip=1')
+        table = pyarrow.ipc.open_stream(gzip.decompress(data)).read_all()
+        self.assertEqual(table.column('value').to_pylist(), [float(v) for v in range(self.NOMBRE_MESURES)])
+
+    def test_invalid_format(self):
+        """Test format d'export inconnu"""
+        response, _ = self._export('format=xlsx')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cli_export(self):
+        """Test de la commande flask capteurs exporter"""
+        runner = app.test_cli_runner()
+        with app.app_context():
+            result = runner.invoke(args=['capteurs', 'exporter', '--format', 'ndjson', '--sensor-id', 'SENSOR_002',
+                                         '--debut', '2025-03-01'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        lignes = result.output.splitlines()
+        self.assertEqual(len(lignes), len(range(59, self.NOMBRE_MESURES, 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
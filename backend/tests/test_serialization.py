@@ -0,0 +1,239 @@
+"""
+Tests unitaires pour les profils de sérialisation
+"""
+import os
+import subprocess
+import sys
+import unittest
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from app import app, db
+from models.user import User, Role
+from models.exploitation import Exploitation, Parcelle
+from models.region import Region, Prefecture, Commune
+from services.geographie_service import clear_hierarchie_cache
+
+
+class TestSerializationProfiles(unittest.TestCase):
+    """Tests pour les listes d'exploitations (profils summary / full) et la géographie"""
+
+    NOMBRE_EXPLOITATIONS = 50
+    REQUETES_MAX = 10
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        # La base est recréée à chaque test (versions repartant de zéro) : vider la copie en mémoire
+        clear_hierarchie_cache()
+        with app.app_context():
+            db.create_all()
+            role = Role(nom='Agriculteur')
+            db.session.add(role)
+            db.session.commit()
+            user = User(username='serialuser', email='serial@example.com', role_id=role.id)
+            user.set_password('password123')
+            db.session.add(user)
+            db.session.commit()
+
+            regions = [Region(nom=f'Région {i}', code=f'R{i}') for i in range(3)]
+            db.session.add_all(regions)
+            db.session.commit()
+            prefectures = [Prefecture(nom=f'Préfecture {i}', code=f'P{i}', region_id=regions[i % 3].id) for i in range(6)]
+            db.session.add_all(prefectures)
+            db.session.commit()
+            communes = [Commune(nom=f'Commune {i}', code=f'C{i}', prefecture_id=prefectures[i % 6].id) for i in range(12)]
+            db.session.add_all(communes)
+            db.session.commit()
+
+            for i in range(self.NOMBRE_EXPLOITATIONS):
+                commune = communes[i % 12] if i % 5 else None
+                exploitation = Exploitation(
+                    nom=f'Ferme {i}', superficie_totale=1 + i, proprietaire_id=user.id,
+                    commune_id=commune.id if commune else None,
+                    prefecture_id=commune.prefecture_id if commune else None,
+                    region_id=commune.prefecture.region_id if commune else None
+                )
+                db.session.add(exploitation)
+                db.session.flush()
+                for j in range(i % 3):
+                    db.session.add(Parcelle(nom=f'Parcelle {j}', superficie=1, exploitation_id=exploitation.id))
+            db.session.commit()
+            self.token = create_access_token(identity=str(user.id))
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _get(self, url, headers=None):
+        requetes = []
+
+        def compter(conn, cursor, statement, parameters, context, executemany):
+            requetes.append(statement)
+
+        with app.app_context():
+            moteur = db.engine
+        event.listen(moteur, 'before_cursor_execute', compter)
+        try:
+            response = self.app.get(url, headers={'Authorization': f'Bearer {self.token}', **(headers or {})})
+        finally:
+            event.remove(moteur, 'before_cursor_execute', compter)
+        return response, len(requetes)
+
+    def test_full_profile_matches_to_dict_in_constant_queries(self):
+        """Test que le profil complet reproduit to_dict() en un nombre constant de requêtes"""
+        response, requetes = self._get(f'/api/exploitations?per_page={self.NOMBRE_EXPLOITATIONS}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json['items']), self.NOMBRE_EXPLOITATIONS)
+        self.assertLessEqual(requetes, self.REQUETES_MAX)
+        with app.app_context():
+            attendus = [e.to_dict() for e in Exploitation.query.order_by(Exploitation.id).all()]
+        self.assertEqual(sorted(response.json['items'], key=lambda e: e['id']), attendus)
+
+        # Une page plus petite ne coûte pas moins de requêtes groupées, et pas plus
+        _, requetes_page = self._get('/api/exploitations?per_page=10')
+        self.assertEqual(requetes_page, requetes)
+
+    def test_summary_profile(self):
+        """Test que le profil résumé ne contient que les colonnes"""
+        response, requetes = self._get('/api/exploitations?fields=summary&per_page=50')
+
+        self.assertEqual(response.status_code, 200)
+        item = response.json['items'][1]
+        self.assertIn('commune_id', item)
+        self.assertNotIn('commune', item)
+        self.assertNotIn('parcelles_count', item)
+        self.assertLessEqual(requetes, 4)
+
+    def test_invalid_profile(self):
+        """Test qu'un profil inconnu est refusé"""
+        response, _ = self._get('/api/exploitations?fields=tout')
+        self.assertEqual(response.status_code, 400)
+
+    def test_hierarchie_matches_to_dict_in_constant_queries(self):
+        """Test que la hiérarchie reproduit to_dict() en un nombre constant de requêtes"""
+        response, requetes = self._get('/api/geographie/hierarchie')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(requetes, self.REQUETES_MAX)
+        with app.app_context():
+            attendus = []
+            for region in Region.query.order_by(Region.id).all():
+                region_dict = region.to_dict()
+                region_dict['prefectures'] = []
+                for prefecture in sorted(region.prefectures, key=lambda p: p.id):
+                    prefecture_dict = prefecture.to_dict()
+                    prefecture_dict['communes'] = [c.to_dict() for c in sorted(prefecture.communes, key=lambda c: c.id)]
+                    region_dict['prefectures'].append(prefecture_dict)
+                attendus.append(region_dict)
+        self.assertEqual(response.json, attendus)
+
+        # Le nombre de requêtes ne dépend pas du nombre d'exploitations ni de communes
+        with app.app_context():
+            prefecture = Prefecture.query.first()
+            db.session.add_all([Commune(nom=f'Nouvelle {i}', prefecture_id=prefecture.id) for i in range(20)])
+            db.session.commit()
+        _, requetes_apres = self._get('/api/geographie/hierarchie')
+        self.assertEqual(requetes_apres, requetes)
+
+    def test_listes_matches_to_dict(self):
+        """Test que les listes régions / préfectures / communes reproduisent to_dict()"""
+        for url, model in (('/api/geographie/regions', Region),
+                           ('/api/geographie/prefectures', Prefecture),
+                           ('/api/geographie/communes', Commune)):
+            response, requetes = self._get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(requetes, self.REQUETES_MAX)
+            with app.app_context():
+                attendus = [o.to_dict() for o in model.query.order_by(model.id).all()]
+            self.assertEqual(sorted(response.json, key=lambda o: o['id']), attendus)
+
+        response, _ = self._get('/api/geographie/communes?region_id=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json)
+        self.assertTrue(all(c['region_id'] == 1 for c in response.json))
+
+
+    def test_hierarchie_cache_etag(self):
+        """Test du cache de la hiérarchie, des GET conditionnels et de l'invalidation"""
+        premiere, _ = self._get('/api/geographie/hierarchie')
+        etag = premiere.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+
+        # Servie depuis la mémoire (seule la version est lue en base), puis 304 sans corps avec l'ETag
+        seconde, requetes = self._get('/api/geographie/hierarchie')
+        self.assertEqual(requetes, 1)
+        self.assertEqual(seconde.headers['ETag'], etag)
+        self.assertEqual(seconde.json, premiere.json)
+        non_modifiee, _ = self._get('/api/geographie/hierarchie', {'If-None-Match': etag})
+        self.assertEqual(non_modifiee.status_code, 304)
+        self.assertEqual(non_modifiee.data, b'')
+
+        # La création d'une région par la route invalide l'arbre
+        creation = self.app.post('/api/geographie/regions', json={'nom': 'Savanes', 'code': 'SAV'},
+                                 headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(creation.status_code, 201)
+        apres_creation, _ = self._get('/api/geographie/hierarchie', {'If-None-Match': etag})
+        self.assertEqual(apres_creation.status_code, 200)
+        self.assertIn('Savanes', [r['nom'] for r in apres_creation.json])
+        self.assertGreater(int(apres_creation.headers['X-Hierarchie-Version']),
+                           int(premiere.headers['X-Hierarchie-Version']))
+
+        # Le déplacement d'une exploitation change les compteurs, donc l'ETag
+        etag = apres_creation.headers['ETag']
+        with app.app_context():
+            exploitation = Exploitation.query.filter(Exploitation.region_id.isnot(None)).first()
+            exploitation.region_id = Region.query.filter_by(code='SAV').one().id
+            db.session.commit()
+        apres_deplacement, _ = self._get('/api/geographie/hierarchie', {'If-None-Match': etag})
+        self.assertEqual(apres_deplacement.status_code, 200)
+        savanes = next(r for r in apres_deplacement.json if r['nom'] == 'Savanes')
+        self.assertEqual(savanes['exploitations_count'], 1)
+
+        # Une modification sans effet sur la géographie garde l'arbre en cache
+        etag = apres_deplacement.headers['ETag']
+        with app.app_context():
+            Exploitation.query.first().nom = 'Ferme renommée'
+            db.session.commit()
+        inchangee, requetes = self._get('/api/geographie/hierarchie', {'If-None-Match': etag})
+        self.assertEqual(inchangee.status_code, 304)
+        self.assertEqual(requetes, 1)
+
+    def test_hierarchie_cache_other_process(self):
+        """Test qu'une écriture validée par un autre processus rend l'arbre en cache obsolète"""
+        premiere, _ = self._get('/api/geographie/hierarchie')
+        etag = premiere.headers['ETag']
+        with app.app_context():
+            url = db.engine.url.render_as_string(hide_password=False)
+            exploitation = Exploitation.query.filter(Exploitation.region_id.isnot(None)).first()
+            exploitation_id, region_id = exploitation.id, exploitation.region_id
+            autre_region_id = Region.query.filter(Region.id != region_id).first().id
+
+        # Second processus (autre worker) : déplacement de l'exploitation par l'ORM
+        script = (
+            'from app import app, db\n'
+            'from models.exploitation import Exploitation\n'
+            'with app.app_context():\n'
+            f'    db.session.get(Exploitation, {exploitation_id}).region_id = {autre_region_id}\n'
+            '    db.session.commit()\n'
+        )
+        subprocess.run([sys.executable, '-c', script], check=True, cwd=os.path.dirname(os.path.dirname(__file__)),
+                       env={**os.environ, 'DATABASE_URL': url})
+
+        apres, _ = self._get('/api/geographie/hierarchie', {'If-None-Match': etag})
+        self.assertEqual(apres.status_code, 200)
+        self.assertNotEqual(apres.headers['ETag'], etag)
+        comptes = {r['id']: r['exploitations_count'] for r in apres.json}
+        avant = {r['id']: r['exploitations_count'] for r in premiere.json}
+        self.assertEqual(comptes[region_id], avant[region_id] - 1)
+        self.assertEqual(comptes[autre_region_id], avant[autre_region_id] + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,414 @@
+"""
+Tests unitaires pour les statistiques agrégées
+"""
+import time
+import unittest
+from datetime import date, datetime, timedelta
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, insert
+
+from app import app, db
+from models.user import User, Role
+from models.exploitation import Exploitation
+from models.analyse_sol import AnalyseSol
+from models.intrant import Intrant
+from models.recolte import Recolte
+from models.region import Region, Prefecture
+from models.sensor import SensorRollup
+from models.statistique import StatistiqueAgregee
+from services.statistique_service import (
+    aggregate_statistiques, evolution_cumulee, rebuild_statistiques, truncate_date
+)
+
+
+class TestStatistiquesAgregees(unittest.TestCase):
+    """Tests pour la maintenance incrémentale des statistiques agrégées"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        with app.app_context():
+            db.create_all()
+            role = Role(nom='Agent')
+            db.session.add(role)
+            db.session.commit()
+            user = User(username='statuser', email='stat@example.com', role_id=role.id)
+            user.set_password('password123')
+            db.session.add(user)
+            maritime = Region(nom='Maritime', code='MAR')
+            plateaux = Region(nom='Plateaux', code='PLA')
+            db.session.add_all([maritime, plateaux])
+            db.session.commit()
+            golfe = Prefecture(nom='Golfe', code='GOL', region_id=maritime.id)
+            db.session.add(golfe)
+            db.session.commit()
+
+            self.user_id = user.id
+            self.region_ids = (maritime.id, plateaux.id)
+            self.prefecture_id = golfe.id
+            self.token = create_access_token(identity=str(user.id))
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _exploitation(self, region_id, culture, superficie, **kwargs):
+        exploitation = Exploitation(
+            nom='Ferme', superficie_totale=superficie, proprietaire_id=self.user_id,
+            region_id=region_id, type_culture_principal=culture, **kwargs
+        )
+        db.session.add(exploitation)
+        db.session.flush()
+        return exploitation
+
+    def _snapshot(self):
+        """Compteurs non nuls de la table agrégée"""
+        return sorted(
+            (s.region_id, s.prefecture_id, s.commune_id, s.culture, s.nombre_exploitations,
+             round(s.superficie_totale, 6), s.nombre_analyses, s.nombre_intrants, s.nombre_recoltes)
+            for s in StatistiqueAgregee.query.all()
+            if s.nombre_exploitations or s.nombre_analyses or s.nombre_intrants or s.nombre_recoltes
+        )
+
+    def _assert_coherent(self):
+        """Vérifie que la maintenance incrémentale équivaut à un recalcul complet"""
+        incremental = self._snapshot()
+        rebuild_statistiques()
+        db.session.commit()
+        self.assertEqual(incremental, self._snapshot())
+
+    def test_incremental_matches_rebuild(self):
+        """Test que créations, modifications et suppressions tiennent les compteurs à jour"""
+        with app.app_context():
+            maritime, plateaux = self.region_ids
+            a = self._exploitation(maritime, 'Maïs', 10.0, prefecture_id=self.prefecture_id)
+            b = self._exploitation(maritime, 'Riz', 4.5)
+            c = self._exploitation(plateaux, 'Maïs', 2.0)
+            db.session.add_all([
+                AnalyseSol(date_prelevement=datetime.now().date(), ph=6.5, exploitation_id=a.id, technicien_id=self.user_id),
+                AnalyseSol(date_prelevement=datetime.now().date(), ph=6.0, exploitation_id=b.id, technicien_id=self.user_id),
+                Intrant(type_intrant='Engrais', quantite=1, date_application=datetime.now().date(), exploitation_id=a.id),
+                Recolte(exploitation_id=c.id, type_culture='Maïs', mois=6, annee=2025, quantite_recoltee=100),
+            ])
+            db.session.commit()
+            self._assert_coherent()
+
+            totaux = aggregate_statistiques()
+            self.assertEqual(totaux['nombre_exploitations'], 3)
+            self.assertAlmostEqual(totaux['superficie_totale'], 16.5)
+            self.assertEqual(totaux['nombre_analyses'], 2)
+
+            # Changement de région : l'exploitation et ses enregistrements changent de ligne
+            a = db.session.get(Exploitation, a.id)
+            a.region_id = plateaux
+            a.superficie_totale = 12.0
+            db.session.commit()
+            self.assertEqual(aggregate_statistiques(region_id=plateaux)['nombre_analyses'], 1)
+            self.assertEqual(aggregate_statistiques(region_id=plateaux)['nombre_intrants'], 1)
+            self._assert_coherent()
+
+            # Suppressions
+            db.session.delete(AnalyseSol.query.filter_by(exploitation_id=b.id).first())
+            db.session.commit()
+            db.session.delete(db.session.get(Exploitation, c.id))
+            db.session.delete(Recolte.query.filter_by(exploitation_id=c.id).first())
+            db.session.commit()
+            self._assert_coherent()
+            self.assertEqual(aggregate_statistiques()['nombre_exploitations'], 2)
+            self.assertEqual(aggregate_statistiques()['nombre_recoltes'], 0)
+
+    def test_rollback_discards_deltas(self):
+        """Test qu'un flush annulé ne modifie pas les compteurs"""
+        with app.app_context():
+            self._exploitation(self.region_ids[0], 'Maïs', 3.0)
+            db.session.rollback()
+            self._exploitation(self.region_ids[0], 'Maïs', 5.0)
+            db.session.commit()
+
+            self.assertEqual(aggregate_statistiques()['nombre_exploitations'], 1)
+            self.assertAlmostEqual(aggregate_statistiques()['superficie_totale'], 5.0)
+
+    def test_statistiques_endpoints(self):
+        """Test que les tableaux de bord sont servis depuis la table agrégée"""
+        with app.app_context():
+            maritime, plateaux = self.region_ids
+            self._exploitation(maritime, 'Maïs', 10.0, prefecture_id=self.prefecture_id)
+            self._exploitation(maritime, 'Maïs', 6.0, prefecture_id=self.prefecture_id)
+            self._exploitation(plateaux, 'Riz', 4.0)
+            db.session.commit()
+
+        headers = {'Authorization': f'Bearer {self.token}'}
+        response = self.app.get('/api/statistiques/nationales', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['total_exploitations'], 3)
+        self.assertEqual(response.json['superficie_totale_cultivee'], 20.0)
+        self.assertEqual(
+            {c['culture']: c['nombre_exploitations'] for c in response.json['repartition_par_culture']},
+            {'Maïs': 2, 'Riz': 1}
+        )
+
+        response = self.app.get(f'/api/statistiques/regionales/{maritime}', headers=headers)
+        self.assertEqual(response.json['total_exploitations'], 2)
+        self.assertEqual(response.json['repartition_par_prefecture'][0]['superficie_totale'], 16.0)
+
+        response = self.app.get('/api/statistiques/comparaison-regions', headers=headers)
+        comparaison = {c['region_id']: c for c in response.json['comparaison']}
+        self.assertEqual(comparaison[maritime]['culture_principale'], 'Maïs')
+        self.assertEqual(comparaison[plateaux]['superficie_moyenne_par_exploitation'], 4.0)
+        self.assertEqual(response.json['superficie_nationale_totale'], 20.0)
+
+        response = self.app.get(f'/api/statistiques/prefectures/{self.prefecture_id}', headers=headers)
+        self.assertEqual(response.json['total_exploitations'], 2)
+
+
+class TestStatistiquesBenchmark(unittest.TestCase):
+    """Benchmark des tableaux de bord sur 100 000 exploitations"""
+
+    NOMBRE_EXPLOITATIONS = 100000
+    REQUETES_MAX = 5
+    DUREE_MAX = 2.0  # secondes par tableau de bord
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        with app.app_context():
+            db.create_all()
+            role = Role(nom='Agent')
+            db.session.add(role)
+            db.session.commit()
+            user = User(username='benchuser', email='bench@example.com', role_id=role.id)
+            user.set_password('password123')
+            db.session.add(user)
+            db.session.commit()
+
+            # Insertion en masse hors ORM, suivie d'un recalcul des agrégats
+            db.session.execute(insert(Region), [{'nom': f'Région {i}', 'code': f'R{i}'} for i in range(5)])
+            db.session.execute(insert(Prefecture), [
+                {'nom': f'Préfecture {i}', 'code': f'P{i}', 'region_id': i % 5 + 1} for i in range(40)
+            ])
+            db.session.execute(insert(Exploitation), [
+                {
+                    'nom': f'Ferme {i}', 'superficie_totale': 1 + i % 7, 'proprietaire_id': user.id,
+                    'region_id': i % 5 + 1, 'prefecture_id': i % 40 + 1,
+                    'type_culture_principal': ('Maïs', 'Riz', 'Mil', None)[i % 4]
+                }
+                for i in range(self.NOMBRE_EXPLOITATIONS)
+            ])
+            rebuild_statistiques()
+            db.session.commit()
+            self.token = create_access_token(identity=str(user.id))
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_dashboards_bounded_queries_and_time(self):
+        """Test que chaque tableau de bord coûte un nombre borné de requêtes, quelle que soit la source"""
+        headers = {'Authorization': f'Bearer {self.token}'}
+        requetes = []
+        with app.app_context():
+            moteur = db.engine
+
+        def compter(conn, cursor, statement, parameters, context, executemany):
+            requetes.append(statement)
+
+        event.listen(moteur, 'before_cursor_execute', compter)
+        try:
+            for url in ('/nationales', '/comparaison-regions', '/regionales/1', '/prefectures/1'):
+                reponses = {}
+                for source in ('agregats', 'direct'):
+                    requetes.clear()
+                    debut = time.perf_counter()
+                    response = self.app.get(f'/api/statistiques{url}?source={source}', headers=headers)
+                    duree = time.perf_counter() - debut
+
+                    self.assertEqual(response.status_code, 200)
+                    self.assertLessEqual(len(requetes), self.REQUETES_MAX, f'{url} ({source})')
+                    self.assertLess(duree, self.DUREE_MAX, f'{url} ({source})')
+                    reponses[source] = {k: v for k, v in response.json.items() if k != 'date_calcul'}
+                # Les deux sources retournent le même JSON
+                self.assertEqual(reponses['agregats'], reponses['direct'])
+        finally:
+            event.remove(moteur, 'before_cursor_execute', compter)
+
+        response = self.app.get('/api/statistiques/nationales', headers=headers)
+        self.assertEqual(response.json['total_exploitations'], self.NOMBRE_EXPLOITATIONS)
+
+
+class TestEvolutionTemporelle(unittest.TestCase):
+    """Tests pour l'évolution temporelle par intervalles"""
+
+    def setUp(self):
+        """Configuration avant chaque test"""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app = app.test_client()
+        with app.app_context():
+            db.create_all()
+            role = Role(nom='Agent')
+            db.session.add(role)
+            db.session.commit()
+            user = User(username='evouser', email='evo@example.com', role_id=role.id)
+            user.set_password('password123')
+            db.session.add(user)
+            region = Region(nom='Maritime', code='MAR')
+            db.session.add(region)
+            db.session.commit()
+            self.user_id = user.id
+            self.region_id = region.id
+            self.token = create_access_token(identity=str(user.id))
+
+    def tearDown(self):
+        """Nettoyage après chaque test"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def _exploitations(self, dates, region_id=None):
+        for created_at in dates:
+            db.session.add(Exploitation(
+                nom='Ferme', superficie_totale=1, proprietaire_id=self.user_id,
+                region_id=region_id, created_at=created_at
+            ))
+        db.session.commit()
+
+    def test_monthly_buckets_with_initial_cumul(self):
+        """Test des intervalles mensuels, des mois vides et du cumul initial"""
+        with app.app_context():
+            self._exploitations([
+                datetime(2024, 12, 31, 23, 0),  # avant la période : cumul initial
+                datetime(2025, 1, 1, 0, 0), datetime(2025, 1, 31, 23, 59),
+                datetime(2025, 3, 15, 12, 0),
+                datetime(2025, 5, 1, 0, 0),  # après la période
+            ], region_id=self.region_id)
+            self._exploitations([datetime(2025, 1, 10)])
+
+            evolution = evolution_cumulee('exploitations', 'mois', date(2025, 1, 20), date(2025, 4, 2))
+            self.assertEqual(evolution, [
+                {'date': '2025-01-01', 'nombre': 3, 'cumul': 4},
+                {'date': '2025-02-01', 'nombre': 0, 'cumul': 4},
+                {'date': '2025-03-01', 'nombre': 1, 'cumul': 5},
+                {'date': '2025-04-01', 'nombre': 0, 'cumul': 5},
+            ])
+
+            par_region = evolution_cumulee('exploitations', 'mois', date(2025, 1, 1), date(2025, 1, 31),
+                                           region_id=self.region_id)
+            self.assertEqual(par_region[0]['cumul'], 3)
+
+    def test_sql_buckets_match_python(self):
+        """Test que les intervalles calculés en SQL correspondent à truncate_date"""
+        with app.app_context():
+            jours = [date(2023, 12, 25) + timedelta(days=9 * i) for i in range(60)]
+            for jour in jours:
+                db.session.add(AnalyseSol(date_prelevement=jour, exploitation_id=1, technicien_id=self.user_id))
+            db.session.commit()
+
+            for granularite in ('jour', 'semaine', 'mois', 'annee'):
+                evolution = evolution_cumulee('analyses', granularite, jours[0], jours[-1])
+                attendus = {}
+                for jour in jours:
+                    cle = truncate_date(jour, granularite).isoformat()
+                    attendus[cle] = attendus.get(cle, 0) + 1
+                obtenus = {p['date']: p['nombre'] for p in evolution if p['nombre']}
+                self.assertEqual(obtenus, attendus, granularite)
+                self.assertEqual(evolution[-1]['cumul'], len(jours))
+
+    def test_harvests_bucketed_by_period(self):
+        """Test que les récoltes sont comptées à leur période (annee, mois), pas à leur date de saisie"""
+        with app.app_context():
+            # Campagnes passées importées le même jour
+            saisie = datetime(2025, 6, 3, 10, 0)
+            for annee, mois in ((2022, 11), (2023, 2), (2023, 2), (2023, 7), (2024, 1)):
+                db.session.add(Recolte(exploitation_id=1, type_culture='Maïs', annee=annee, mois=mois,
+                                       quantite_recoltee=10, created_at=saisie))
+            db.session.commit()
+
+            evolution = evolution_cumulee('recoltes', 'mois', date(2023, 1, 15), date(2023, 7, 1))
+            self.assertEqual([(p['date'], p['nombre'], p['cumul']) for p in evolution if p['nombre']], [
+                ('2023-02-01', 2, 3),
+                ('2023-07-01', 1, 4),
+            ])
+            self.assertEqual(evolution[0], {'date': '2023-01-01', 'nombre': 0, 'cumul': 1})
+
+            # Bornes en milieu de mois : la période de février commence avant le 2 février
+            par_jour = evolution_cumulee('recoltes', 'jour', date(2023, 2, 2), date(2023, 7, 1))
+            self.assertEqual(par_jour[0]['cumul'], 3)
+            self.assertEqual(par_jour[-1], {'date': '2023-07-01', 'nombre': 1, 'cumul': 4})
+            par_annee = evolution_cumulee('recoltes', 'annee', date(2023, 1, 1), date(2025, 12, 31))
+            self.assertEqual([p['nombre'] for p in par_annee], [3, 1, 0])
+
+    def test_single_query_for_long_ranges(self):
+        """Test qu'une longue période ne coûte qu'une requête"""
+        with app.app_context():
+            self._exploitations([datetime(2020, 1, 1) + timedelta(days=i) for i in range(0, 1500, 7)])
+            requetes = []
+
+            def compter(conn, cursor, statement, parameters, context, executemany):
+                requetes.append(statement)
+
+            event.listen(db.engine, 'before_cursor_execute', compter)
+            try:
+                evolution = evolution_cumulee('exploitations', 'jour', date(2020, 1, 1), date(2024, 12, 31))
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', compter)
+
+            self.assertEqual(len(requetes), 1)
+            self.assertEqual(len(evolution), 1827)
+            self.assertEqual(evolution[-1]['cumul'], len(range(0, 1500, 7)))
+
+    def test_sensor_readings_from_daily_rollups(self):
+        """Test que l'évolution des mesures utilise les agrégats journaliers"""
+        with app.app_context():
+            for jour, nombre in ((1, 24), (2, 12), (9, 6)):
+                for resolution in ('1h', '1d'):
+                    db.session.add(SensorRollup(
+                        sensor_id='S1', sensor_type='temperature', resolution=resolution,
+                        bucket_start=datetime(2025, 6, jour), count=nombre, sum_value=0,
+                        min_value=0, max_value=0, last_value=0, last_timestamp=datetime(2025, 6, jour)
+                    ))
+            db.session.commit()
+
+            evolution = evolution_cumulee('mesures', 'semaine', date(2025, 6, 2), date(2025, 6, 9))
+            # Semaines du lundi 2 et du lundi 9 juin ; le 1er juin (dimanche) forme le cumul initial
+            self.assertEqual(evolution, [
+                {'date': '2025-06-02', 'nombre': 12, 'cumul': 36},
+                {'date': '2025-06-09', 'nombre': 6, 'cumul': 42},
+            ])
+
+    def test_evolution_endpoint(self):
+        """Test de l'endpoint d'évolution (paramètres actuels et anciens)"""
+        with app.app_context():
+            self._exploitations([datetime.now() - timedelta(days=1)])
+
+        headers = {'Authorization': f'Bearer {self.token}'}
+        response = self.app.get('/api/statistiques/evolution?periode=mois', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['granularite'], 'mois')
+        self.assertEqual(len(response.json['evolution']), 12)
+        self.assertEqual(response.json['evolution'][-1]['nombre_exploitations'], 1)
+
+        response = self.app.get(
+            '/api/statistiques/evolution?entite=analyses&granularite=jour&debut=2025-01-01&fin=2025-01-31',
+            headers=headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json['evolution']), 31)
+
+        response = self.app.get('/api/statistiques/evolution?granularite=heure', headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ Utilitaires pour l'historique des actions
 """
 from database import db
 from models.historique_action import HistoriqueAction
+from datetime import datetime
 import json
 
 def log_action(user_id, action, entite, entite_id, details=None):
@@ -22,6 +23,16 @@ def log_action(user_id, action, entite, entite_id, details=None):
         print(f"Erreur lors de l'enregistrement de l'historique: {e}")
         db.session.rollback()
 
-
-
-
+def action_values(user_id, action, entite, entite_id, details=None):
+    """
+    Valeurs d'une entrée d'historique, pour un INSERT groupé dans la
+    transaction en cours (sans commit séparé, contrairement à log_action)
+    """
+    return {
+        'action': action,
+        'entite': entite,
+        'entite_id': entite_id,
+        'details': json.dumps(details) if details else None,
+        'user_id': int(user_id),
+        'created_at': datetime.utcnow(),
+    }
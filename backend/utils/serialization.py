@@ -0,0 +1,174 @@
+"""
+Profils de sérialisation des listes (champs sélectionnables, chargements groupés)
+
+- summary : colonnes de l'objet uniquement, sans objets imbriqués ni compteurs
+- full : format complet de to_dict(), avec les relations chargées par jointure
+  et les compteurs (parcelles_count, exploitations_count...) calculés par des
+  requêtes groupées sur la page entière au lieu de charger les collections
+
+Le nombre de requêtes par page est ainsi constant, quelle que soit sa taille.
+"""
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, List
+
+from flask import request
+from sqlalchemy import func, inspect
+from sqlalchemy.orm import joinedload
+
+from database import db
+from models.exploitation import Exploitation, Parcelle
+from models.region import Region, Prefecture, Commune
+from models.user import User
+
+PROFIL_RESUME = 'summary'
+PROFIL_COMPLET = 'full'
+PROFILS = (PROFIL_RESUME, PROFIL_COMPLET)
+
+
+def get_serialization_profile(default: str = PROFIL_COMPLET) -> str:
+    """Profil demandé par le paramètre ?fields=summary|full"""
+    profil = request.args.get('fields', default)
+    if profil not in PROFILS:
+        raise ValueError(f"Paramètre fields invalide (attendu: {', '.join(PROFILS)})")
+    return profil
+
+
+def summary_dict(obj) -> Dict:
+    """Colonnes d'un objet (dates au format ISO), sans relations"""
+    resultat = {}
+    for colonne in inspect(obj).mapper.column_attrs:
+        valeur = getattr(obj, colonne.key)
+        resultat[colonne.key] = valeur.isoformat() if isinstance(valeur, (date, datetime)) else valeur
+    return resultat
+
+
+def count_by(colonne, ids: Iterable[int]) -> Dict[int, int]:
+    """Nombre de lignes par valeur d'une clé étrangère, en une requête groupée"""
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return {}
+    return dict(
+        db.session.query(colonne, func.count()).filter(colonne.in_(ids)).group_by(colonne).all()
+    )
+
+
+def exploitation_load_options(profil: str = PROFIL_COMPLET) -> List:
+    """Options de chargement des relations utilisées par le profil"""
+    if profil != PROFIL_COMPLET:
+        return []
+    return [
+        joinedload(Exploitation.proprietaire).joinedload(User.role),
+        joinedload(Exploitation.region),
+        joinedload(Exploitation.prefecture).joinedload(Prefecture.region),
+        joinedload(Exploitation.commune).joinedload(Commune.prefecture).joinedload(Prefecture.region),
+    ]
+
+
+def geographie_counts(regions: Iterable[Region] = (), prefectures: Iterable[Prefecture] = (),
+                      communes: Iterable[Commune] = ()) -> Dict:
+    """
+    Compteurs de to_dict() pour des régions, préfectures et communes, en une
+    requête groupée par compteur (au lieu de charger prefectures, communes et
+    exploitations de chaque objet)
+
+    Returns:
+        Dictionnaire {objet: arguments de comptage de son to_dict()}
+    """
+    regions, prefectures, communes = list(regions), list(prefectures), list(communes)
+    region_prefectures = count_by(Prefecture.region_id, [r.id for r in regions])
+    region_exploitations = count_by(Exploitation.region_id, [r.id for r in regions])
+    prefecture_communes = count_by(Commune.prefecture_id, [p.id for p in prefectures])
+    prefecture_exploitations = count_by(Exploitation.prefecture_id, [p.id for p in prefectures])
+    commune_exploitations = count_by(Exploitation.commune_id, [c.id for c in communes])
+
+    compteurs = {}
+    for region in regions:
+        compteurs[region] = {
+            'prefectures_count': region_prefectures.get(region.id, 0),
+            'exploitations_count': region_exploitations.get(region.id, 0),
+        }
+    for prefecture in prefectures:
+        compteurs[prefecture] = {
+            'communes_count': prefecture_communes.get(prefecture.id, 0),
+            'exploitations_count': prefecture_exploitations.get(prefecture.id, 0),
+        }
+    for commune in communes:
+        compteurs[commune] = {'exploitations_count': commune_exploitations.get(commune.id, 0)}
+    return compteurs
+
+
+def exploitation_counts(exploitations: List[Exploitation]) -> Dict:
+    """
+    Compteurs de to_dict() pour une liste d'exploitations et leurs références
+    géographiques, en une requête groupée par compteur
+
+    Returns:
+        Dictionnaire {objet: arguments de comptage de son to_dict()}
+    """
+    compteurs = geographie_counts(
+        {e.region for e in exploitations if e.region is not None},
+        {e.prefecture for e in exploitations if e.prefecture is not None},
+        {e.commune for e in exploitations if e.commune is not None},
+    )
+    parcelles = count_by(Parcelle.exploitation_id, [e.id for e in exploitations])
+    for exploitation in exploitations:
+        compteurs[exploitation] = {'parcelles_count': parcelles.get(exploitation.id, 0)}
+    return compteurs
+
+
+def serialize_exploitations(exploitations: List[Exploitation], profil: str = PROFIL_COMPLET) -> List[Dict]:
+    """Sérialise une liste d'exploitations selon le profil (même format que to_dict() pour full)"""
+    if profil == PROFIL_RESUME:
+        return [summary_dict(e) for e in exploitations]
+    compteurs = exploitation_counts(exploitations)
+    return [e.to_dict(compteurs) for e in exploitations]
+
+
+def exploitation_serializer(profil: str = PROFIL_COMPLET) -> Callable[[List[Exploitation]], List[Dict]]:
+    """Sérialiseur de page pour paginate_query"""
+    return lambda exploitations: serialize_exploitations(exploitations, profil)
+
+
+def serialize_geographie(objets: List) -> List[Dict]:
+    """Sérialise une liste de régions, préfectures ou communes (même format que to_dict())"""
+    objets = list(objets)
+    compteurs = geographie_counts(
+        [o for o in objets if isinstance(o, Region)],
+        [o for o in objets if isinstance(o, Prefecture)],
+        [o for o in objets if isinstance(o, Commune)],
+    )
+    return [o.to_dict(**compteurs[o]) for o in objets]
+
+
+def serialize_hierarchie() -> List[Dict]:
+    """
+    Hiérarchie complète régions > préfectures > communes, en un nombre constant
+    de requêtes : une par niveau et une par compteur
+    """
+    regions = Region.query.order_by(Region.id).all()
+    prefectures = Prefecture.query.options(joinedload(Prefecture.region)).order_by(Prefecture.id).all()
+    communes = (
+        Commune.query
+        .options(joinedload(Commune.prefecture).joinedload(Prefecture.region))
+        .order_by(Commune.id)
+        .all()
+    )
+    compteurs = geographie_counts(regions, prefectures, communes)
+
+    communes_par_prefecture: Dict[int, List[Dict]] = {}
+    for commune in communes:
+        communes_par_prefecture.setdefault(commune.prefecture_id, []).append(
+            commune.to_dict(**compteurs[commune])
+        )
+    prefectures_par_region: Dict[int, List[Dict]] = {}
+    for prefecture in prefectures:
+        prefecture_dict = prefecture.to_dict(**compteurs[prefecture])
+        prefecture_dict['communes'] = communes_par_prefecture.get(prefecture.id, [])
+        prefectures_par_region.setdefault(prefecture.region_id, []).append(prefecture_dict)
+
+    resultat = []
+    for region in regions:
+        region_dict = region.to_dict(**compteurs[region])
+        region_dict['prefectures'] = prefectures_par_region.get(region.id, [])
+        resultat.append(region_dict)
+    return resultat
@@ -128,3 +128,71 @@ def validate_intrant_data(data):
         errors.append('L\'exploitation est requise')
     
     return errors
+
+def validate_recolte_data(data):
+    """Valide les données d'une récolte"""
+    errors = []
+    
+    if not data.get('exploitation_id'):
+        errors.append('L\'exploitation est requise')
+    
+    if not data.get('type_culture'):
+        errors.append('Le type de culture est requis')
+    
+    if not data.get('mois'):
+        errors.append('Le mois est requis')
+    else:
+        try:
+            mois = int(data['mois'])
+            if mois < 1 or mois > 12:
+                errors.append('Le mois doit être entre 1 et 12')
+        except (ValueError, TypeError):
+            errors.append('Le mois doit être un entier valide')
+    
+    if not data.get('annee'):
+        errors.append('L\'année est requise')
+    
+    if not data.get('quantite_recoltee'):
+        errors.append('La quantité récoltée est requise')
+    else:
+        try:
+            quantite = float(data['quantite_recoltee'])
+            if quantite <= 0:
+                errors.append('La quantité récoltée doit être supérieure à 0')
+        except (ValueError, TypeError):
+            errors.append('La quantité récoltée doit être un nombre valide')
+    
+    return errors
+
+def validate_donnee_climatique_data(data):
+    """Valide les données d'une donnée climatique"""
+    errors = []
+    
+    if not data.get('date_debut'):
+        errors.append('La date de début est requise')
+    
+    if not data.get('date_fin'):
+        errors.append('La date de fin est requise')
+    
+    if not data.get('exploitation_id'):
+        errors.append('L\'exploitation est requise')
+    
+    # Validation températures
+    for champ in ['temperature_min', 'temperature_max']:
+        if data.get(champ) is not None:
+            try:
+                temperature = float(data[champ])
+                if temperature < -60 or temperature > 60:
+                    errors.append(f'La {champ} doit être entre -60 et 60 °C')
+            except (ValueError, TypeError):
+                errors.append(f'La {champ} doit être un nombre valide')
+    
+    # Validation pluviométrie
+    if data.get('pluviometrie') is not None:
+        try:
+            if float(data['pluviometrie']) < 0:
+                errors.append('La pluviométrie doit être positive')
+        except (ValueError, TypeError):
+            errors.append('La pluviométrie doit être un nombre valide')
+    
+    return errors